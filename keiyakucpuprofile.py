@@ -0,0 +1,40 @@
+import os
+import json
+import socket
+import multiprocessing
+
+class KeiyakuCpuProfile:
+    #keiyakugroup_tuneで計測した現在のホストで最も予測が速い設定(TensorFlowをimportせずに読込めるよう別モジュール)
+    PROFILE_PATH = os.path.join(os.path.dirname(__file__), r"data", r"model", r"cpu_profile.json")
+    ENV_ONEDNN = "TF_ENABLE_ONEDNN_OPTS"
+
+    @classmethod
+    def load(cls, profile_path=None):
+        #別ホストで作成した設定は使用しないため、CPUコア数が異なる場合はNone
+        profile_path = profile_path if profile_path is not None else cls.PROFILE_PATH
+        if os.path.isfile(profile_path) == False:
+            return None
+
+        with open(profile_path, encoding="utf-8") as f:
+            profile = json.load(f)
+
+        if profile.get("cpu_num") != multiprocessing.cpu_count():
+            return None
+
+        return profile
+
+    @classmethod
+    def save(cls, profile, profile_path=None) -> None:
+        profile_path = profile_path if profile_path is not None else cls.PROFILE_PATH
+        profile = dict(profile, host=socket.gethostname(), cpu_num=multiprocessing.cpu_count())
+
+        os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+        with open(profile_path, "w", encoding="utf-8") as f:
+            json.dump(profile, f, ensure_ascii=False, indent=4)
+
+    @classmethod
+    def apply_environ(cls, profile_path=None) -> None:
+        #oneDNNの有無は環境変数で指定するため、TensorFlowのimport前に呼出す必要あり(環境変数指定済の場合は環境変数を優先)
+        profile = cls.load(profile_path)
+        if profile is not None:
+            os.environ.setdefault(cls.ENV_ONEDNN, "1" if profile["onednn"] == True else "0")
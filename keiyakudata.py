@@ -1,90 +1,176 @@
-import pandas as pd
-import threading
-import os
-import subprocess
-from transformersbase import TransformersTokenizerBase
-
-class KeiyakuData:
-    _CSV_HEADER_CHECK = ["ファイル", "行数", "カテゴリ", "文章グループ", "分類", "条文分類", "文章"]
-    _CSV_HEADER = ["ファイル", "行数", "カテゴリ", "文章グループ", "分類", "条文分類", "文章", "前文章", "グループ判定"]
-
-    create_keiyaku_data_mutex = threading.Lock()
-
-    def __init__(self, file_path):
-        self.file_path = file_path
-
-        self.df = pd.read_csv(self.file_path, sep=',')
-        
-        header = list(self.df.columns.values)
-        if header != self._CSV_HEADER_CHECK:
-            raise ValueError("csvfile header error(path={})".format(self.file_path))
-        
-        self.__data_group_set(self.df)
-        
-
-    def get_header(self):
-        return self._CSV_HEADER
-
-    def get_datas(self):
-        return self.df.values
-
-    def get_group_datas(self, tokenizer: TransformersTokenizerBase, seq_len):
-        group_datas = []
-        for data in self.get_datas():
-            input_ids = tokenizer.get_keiyaku_indexes(data[6], data[7], seq_len)
-            outputs = [ data[8], data[4], data[5] ]
-            group_datas.append((input_ids, outputs))
-
-        return group_datas
-
-    def get_study_group_datas(self, tokenizer: TransformersTokenizerBase, seq_len):
-        group_datas = self.get_group_datas(tokenizer, seq_len)
-        return list(filter(lambda x: x[1][0] != -1 and x[1][1] != -1, group_datas))
-
-    def __data_group_set(self, df):
-        df["前文章"] = ""
-        df["グループ判定"] = 1
-
-        bef_data = None
-        for index, data in df.iterrows():
-            if bef_data is None:
-                pass
-            elif pd.isnull(data["カテゴリ"]) or pd.isnull(data["文章グループ"]):
-                df.iat[index, 7] = bef_data["文章"]
-                df.iat[index, 8] = -1
-            else:
-                df.iat[index, 7] = bef_data["文章"]
-                if data["ファイル"] == bef_data["ファイル"] and data["カテゴリ"] == bef_data["カテゴリ"] and data["文章グループ"] == bef_data["文章グループ"]:
-                    df.iat[index, 8] = 0
-
-            if pd.isnull(data["分類"]):
-                df.iat[index, 4] = -1
-
-            if pd.isnull(data["条文分類"]):
-                df.iat[index, 5] = -1
-
-            if pd.isnull(data["文章"]):
-                df.iat[index, 6] = ""
-                data["文章"] = ""
-
-            bef_data = data
-
-    @classmethod
-    def create_keiyaku_data(cls, srcfilepath, desttxtpath, destcsvpath):
-        cls.create_keiyaku_data_mutex.acquire()
-
-        tool_path=os.path.join(os.path.dirname(__file__), "tool", "xdoc2txt.exe")
-        with open(desttxtpath, "w") as f:
-            proc = subprocess.Popen([tool_path, srcfilepath], shell=True, stdout=f, stderr=subprocess.DEVNULL)
-            proc.communicate()
-
-        cls.create_keiyaku_data_mutex.release()
-
-        datas = []
-        with open(desttxtpath) as f:
-            for col, line in enumerate(f):
-                line=line.rstrip('\n')
-                datas.append([desttxtpath, col+1, "", "", "", "", line])
-        
-        df = pd.DataFrame(datas, columns=cls._CSV_HEADER_CHECK)
-        df.to_csv(destcsvpath, encoding="UTF-8", index=False)
\ No newline at end of file
+import pandas as pd
+import numpy as np
+import threading
+import os
+import subprocess
+import time
+import difflib
+from transformersbase import TransformersTokenizerBase
+
+class KeiyakuData:
+    _CSV_HEADER_CHECK = ["ファイル", "行数", "カテゴリ", "文章グループ", "分類", "条文分類", "文章"]
+    _CSV_HEADER = ["ファイル", "行数", "カテゴリ", "文章グループ", "分類", "条文分類", "文章", "前文章", "グループ判定"]
+
+    #xdoc2txtの同時実行数
+    create_keiyaku_data_semaphore = threading.BoundedSemaphore(os.cpu_count() or 1)
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        #処理時間(秒)
+        self.elapsed = {}
+
+        starttime = time.perf_counter()
+        self.df = pd.read_csv(self.file_path, sep=',')
+        self.elapsed["read_csv"] = time.perf_counter() - starttime
+        
+        header = list(self.df.columns.values)
+        if header != self._CSV_HEADER_CHECK:
+            raise ValueError("csvfile header error(path={})".format(self.file_path))
+        
+        starttime = time.perf_counter()
+        self.__data_group_set(self.df)
+        self.elapsed["data_group_set"] = time.perf_counter() - starttime
+        
+
+    def get_header(self):
+        return self._CSV_HEADER
+
+    def get_datas(self):
+        return self.df.values
+
+    def get_group_datas(self, tokenizer: TransformersTokenizerBase, seq_len):
+        group_datas = []
+        for data in self.get_datas():
+            input_ids = tokenizer.get_keiyaku_indexes(data[6], data[7], seq_len)
+            outputs = [ data[8], data[4], data[5] ]
+            group_datas.append((input_ids, outputs))
+
+        return group_datas
+
+    def get_study_group_datas(self, tokenizer: TransformersTokenizerBase, seq_len):
+        group_datas = self.get_group_datas(tokenizer, seq_len)
+        return list(filter(lambda x: x[1][0] != -1 and x[1][1] != -1, group_datas))
+
+    def get_reuse_indexes(self, base_keiyakudata: "KeiyakuData"):
+        #各行について文章・前文章とも一致するbase_keiyakudataの行番号を返す(一致しない行は-1)
+        datas = self.get_datas()
+        base_datas = base_keiyakudata.get_datas()
+
+        matcher = difflib.SequenceMatcher(None, [ data[6] for data in base_datas ], [ data[6] for data in datas ], autojunk=False)
+        reuse_indexes = [-1] * len(datas)
+        for tag, base_start, base_end, start, end in matcher.get_opcodes():
+            if tag != "equal":
+                continue
+
+            for i in range(end - start):
+                if datas[start + i][7] == base_datas[base_start + i][7]:
+                    reuse_indexes[start + i] = base_start + i
+
+        return reuse_indexes
+
+    def __data_group_set(self, df):
+        df["前文章"] = ""
+        df["グループ判定"] = 1
+
+        bef_data = None
+        for index, data in df.iterrows():
+            if bef_data is None:
+                pass
+            elif pd.isnull(data["カテゴリ"]) or pd.isnull(data["文章グループ"]):
+                df.iat[index, 7] = bef_data["文章"]
+                df.iat[index, 8] = -1
+            else:
+                df.iat[index, 7] = bef_data["文章"]
+                if data["ファイル"] == bef_data["ファイル"] and data["カテゴリ"] == bef_data["カテゴリ"] and data["文章グループ"] == bef_data["文章グループ"]:
+                    df.iat[index, 8] = 0
+
+            if pd.isnull(data["分類"]):
+                df.iat[index, 4] = -1
+
+            if pd.isnull(data["条文分類"]):
+                df.iat[index, 5] = -1
+
+            if pd.isnull(data["文章"]):
+                df.iat[index, 6] = ""
+                data["文章"] = ""
+
+            bef_data = data
+
+    @classmethod
+    def create_keiyaku_data(cls, srcfilepath, desttxtpath, destcsvpath):
+        cls.create_keiyaku_data_semaphore.acquire()
+
+        tool_path=os.path.join(os.path.dirname(__file__), "tool", "xdoc2txt.exe")
+        with open(desttxtpath, "w") as f:
+            proc = subprocess.Popen([tool_path, srcfilepath], shell=True, stdout=f, stderr=subprocess.DEVNULL)
+            proc.communicate()
+
+        cls.create_keiyaku_data_semaphore.release()
+
+        datas = []
+        with open(desttxtpath) as f:
+            for col, line in enumerate(f):
+                line=line.rstrip('\n')
+                datas.append([desttxtpath, col+1, "", "", "", "", line])
+        
+        df = pd.DataFrame(datas, columns=cls._CSV_HEADER_CHECK)
+        df.to_csv(destcsvpath, encoding="UTF-8", index=False)
+
+class KeiyakuTokenizedDatas:
+    #get_group_datas等の結果(入力index・教師値)をseq_len長の配列でファイル保存し、メモリマップで参照する
+    #複数プロセスで同じファイルを参照するため、トークナイズは1回のみ・メモリ上のデータも共有される
+    IDS_FILE = "ids.npy"
+    LENGTHS_FILE = "lengths.npy"
+    OUTPUTS_FILE = "outputs.npy"
+
+    def __init__(self, save_dir, indexes=None):
+        self.save_dir = save_dir
+        self.ids = np.load(os.path.join(save_dir, self.IDS_FILE), mmap_mode="r")
+        self.lengths = np.load(os.path.join(save_dir, self.LENGTHS_FILE), mmap_mode="r")
+        self.outputs = np.load(os.path.join(save_dir, self.OUTPUTS_FILE), mmap_mode="r")
+        self.indexes = np.arange(len(self.ids)) if indexes is None else np.array(indexes, dtype=np.int64)
+
+    @classmethod
+    def create(cls, datas, seq_len, save_dir) -> "KeiyakuTokenizedDatas":
+        os.makedirs(save_dir, exist_ok=True)
+
+        ids = np.zeros((len(datas), seq_len), dtype=np.int32)
+        lengths = np.zeros((len(datas),), dtype=np.int32)
+        outputs = np.zeros((len(datas), 3), dtype=np.int32)
+        for i, data in enumerate(datas):
+            ids[i, :len(data[0])] = data[0]
+            lengths[i] = len(data[0])
+            outputs[i, :] = data[1]
+
+        np.save(os.path.join(save_dir, cls.IDS_FILE), ids)
+        np.save(os.path.join(save_dir, cls.LENGTHS_FILE), lengths)
+        np.save(os.path.join(save_dir, cls.OUTPUTS_FILE), outputs)
+
+        return cls(save_dir)
+
+    def get_subset(self, indexes) -> "KeiyakuTokenizedDatas":
+        #indexesは本データ内の位置
+        subset = KeiyakuTokenizedDatas.__new__(KeiyakuTokenizedDatas)
+        subset.save_dir = self.save_dir
+        subset.ids = self.ids
+        subset.lengths = self.lengths
+        subset.outputs = self.outputs
+        subset.indexes = self.indexes[np.array(indexes, dtype=np.int64)]
+        return subset
+
+    def shuffle(self, seed=None) -> None:
+        #seed指定時は常に同じ順序(分散学習で全ワーカーの順序を揃える場合に使用)
+        if seed is not None:
+            np.random.RandomState(seed).shuffle(self.indexes)
+        else:
+            np.random.shuffle(self.indexes)
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.get_subset(np.arange(len(self.indexes))[key])
+
+        index = self.indexes[key]
+        return self.ids[index, :self.lengths[index]].tolist(), self.outputs[index].tolist()
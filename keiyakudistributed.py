@@ -0,0 +1,265 @@
+import io
+import json
+import threading
+import time
+import urllib.request
+import urllib.error
+from collections import deque
+from http.server import HTTPServer, ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+from keiyakudata import KeiyakuData
+from keiyakuscorecache import KeiyakuScoreCache
+
+def post_json(url, data, timeout):
+    request = urllib.request.Request(url, data=json.dumps(data).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+class KeiyakuPredictWorker:
+    REGISTER_INTERVAL_SEC = 10
+
+    def __init__(self, keiyakumodel, tokenizer, seq_len, model_version="", host="127.0.0.1", port=0, score_cache: KeiyakuScoreCache=None):
+        self.keiyakumodel = keiyakumodel
+        self.tokenizer = tokenizer
+        self.seq_len = seq_len
+        self.model_version = model_version
+        self.score_cache = score_cache
+        self.stop_event = threading.Event()
+
+        worker = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                worker._handle_predict(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        #予測は1件ずつ処理するためシングルスレッドで待受け
+        self.server = HTTPServer((host, port), Handler)
+        self.url = "http://{}:{}".format(host, self.server.server_port)
+
+    def serve(self, coordinator_url=None) -> None:
+        if coordinator_url is not None:
+            threading.Thread(target=self._register_loop, args=(coordinator_url,), daemon=True).start()
+
+        self.server.serve_forever()
+
+    def start(self, coordinator_url=None) -> None:
+        threading.Thread(target=self.serve, args=(coordinator_url,), daemon=True).start()
+
+    def shutdown(self) -> None:
+        self.stop_event.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def predict(self, datas):
+        #datasは(文章, 前文章)のリスト
+        predict_datas = [ (self.tokenizer.get_keiyaku_indexes(now, prev, self.seq_len), [0, 0, 0]) for now, prev in datas ]
+        if self.score_cache is not None:
+            return self.score_cache.predict(self.keiyakumodel, self.model_version, predict_datas, [ KeiyakuScoreCache.get_key(now, prev) for now, prev in datas ])
+
+        return self.keiyakumodel.predict(predict_datas)
+
+    def _register_loop(self, coordinator_url) -> None:
+        #コーディネータ再起動時や登録解除後も復帰できるよう定期的に登録
+        while True:
+            try:
+                post_json(coordinator_url + "/register", {"url": self.url, "model_version": self.model_version}, self.REGISTER_INTERVAL_SEC)
+            except (urllib.error.URLError, OSError):
+                pass
+
+            if self.stop_event.wait(self.REGISTER_INTERVAL_SEC):
+                return
+
+    def _handle_predict(self, handler: BaseHTTPRequestHandler) -> None:
+        try:
+            request = json.loads(handler.rfile.read(int(handler.headers.get("Content-Length", 0))))
+            if request.get("model_version", "") not in ["", self.model_version]:
+                handler.send_error(409, "model_version mismatch")
+                return
+
+            scores = self.predict(request["datas"])
+        except Exception as e:
+            handler.send_error(500, str(e))
+            return
+
+        buffer = io.BytesIO()
+        np.savez(buffer, score1=scores[0], score2=scores[1])
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/octet-stream")
+        handler.send_header("Content-Length", str(buffer.tell()))
+        handler.end_headers()
+        handler.wfile.write(buffer.getvalue())
+
+class KeiyakuPredictCoordinator:
+
+    def __init__(self, model_version="", host="127.0.0.1", port=0, batch_num=1000, max_retry=3, timeout_sec=600, worker_wait_sec=60):
+        self.model_version = model_version
+        self.batch_num = batch_num
+        self.max_retry = max_retry
+        self.timeout_sec = timeout_sec
+        self.worker_wait_sec = worker_wait_sec
+
+        self.mutex = threading.Lock()
+        self.workers = []
+
+        coordinator = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                coordinator._handle_register(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.url = "http://{}:{}".format(host, self.server.server_port)
+
+    def start(self) -> None:
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def shutdown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def register(self, url, model_version="") -> bool:
+        #重みの異なるワーカーは結果が混在するため登録しない
+        if self.model_version != "" and model_version != self.model_version:
+            return False
+
+        self.mutex.acquire()
+        if url not in self.workers:
+            self.workers.append(url)
+        self.mutex.release()
+        return True
+
+    def unregister(self, url) -> None:
+        self.mutex.acquire()
+        if url in self.workers:
+            self.workers.remove(url)
+        self.mutex.release()
+
+    def get_workers(self):
+        self.mutex.acquire()
+        workers = list(self.workers)
+        self.mutex.release()
+        return workers
+
+    def predict(self, datas):
+        #datasをbatch_num件ずつ登録済ワーカーへ分配し、入力順に結合した予測結果を返す
+        job = KeiyakuPredictJob(datas, self.batch_num, self.max_retry)
+        threads = {}
+        worker_time = time.time()
+        while job.wait(0.5) != True:
+            workers = self.get_workers()
+            for url in workers:
+                if url not in threads or threads[url].is_alive() != True:
+                    threads[url] = threading.Thread(target=self._run_worker, args=(url, job), daemon=True)
+                    threads[url].start()
+
+            if len(workers) > 0:
+                worker_time = time.time()
+            elif time.time() - worker_time > self.worker_wait_sec:
+                job.cancel(RuntimeError("no predict worker registered({}sec)".format(self.worker_wait_sec)))
+
+        return job.get_result()
+
+    def predict_keiyakudata(self, keiyakudata: KeiyakuData):
+        return self.predict([ (data[6], data[7]) for data in keiyakudata.get_datas() ])
+
+    def _run_worker(self, url, job: "KeiyakuPredictJob") -> None:
+        while True:
+            task = job.get_task()
+            if task is None:
+                return
+
+            try:
+                response = post_json(url + "/predict", {"model_version": self.model_version, "datas": task[1]}, self.timeout_sec)
+                with np.load(io.BytesIO(response)) as scores:
+                    result = [ scores["score1"], scores["score2"] ]
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                #失敗したワーカーは登録解除し(再登録まで使用しない)、タスクは他のワーカーで再実行
+                self.unregister(url)
+                job.retry(task, e)
+                return
+
+            job.set_result(task, result)
+
+    def _handle_register(self, handler: BaseHTTPRequestHandler) -> None:
+        try:
+            request = json.loads(handler.rfile.read(int(handler.headers.get("Content-Length", 0))))
+            registered = self.register(request["url"], request.get("model_version", ""))
+        except (ValueError, KeyError):
+            handler.send_error(400)
+            return
+
+        if registered != True:
+            handler.send_error(409, "model_version mismatch")
+            return
+
+        body = json.dumps({"workers": len(self.get_workers())}).encode()
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+class KeiyakuPredictJob:
+    def __init__(self, datas, batch_num, max_retry):
+        self.condition = threading.Condition()
+        self.tasks = deque([ (start, [ list(data) for data in datas[start:start+batch_num] ], 0) for start in range(0, len(datas), batch_num) ])
+        self.task_num = len(self.tasks)
+        self.max_retry = max_retry
+        self.results = {}
+        self.error = None
+
+    def get_task(self):
+        #未処理タスクが無くても、処理中タスクの再実行に備えて完了まで待機
+        self.condition.acquire()
+        while len(self.tasks) == 0 and self._is_done() != True:
+            self.condition.wait()
+
+        task = self.tasks.popleft() if self._is_done() != True else None
+        self.condition.release()
+        return task
+
+    def set_result(self, task, result) -> None:
+        self.condition.acquire()
+        self.results[task[0]] = result
+        self.condition.notify_all()
+        self.condition.release()
+
+    def retry(self, task, error) -> None:
+        self.condition.acquire()
+        start, datas, retry_num = task
+        if retry_num >= self.max_retry:
+            self.error = RuntimeError("predict retry over(start={}, retry={}): {}".format(start, retry_num, error))
+        else:
+            self.tasks.append((start, datas, retry_num + 1))
+        self.condition.notify_all()
+        self.condition.release()
+
+    def cancel(self, error) -> None:
+        self.condition.acquire()
+        self.error = error
+        self.condition.notify_all()
+        self.condition.release()
+
+    def wait(self, timeout) -> bool:
+        self.condition.acquire()
+        self.condition.wait_for(self._is_done, timeout)
+        done = self._is_done()
+        self.condition.release()
+        return done
+
+    def get_result(self):
+        if self.error is not None:
+            raise self.error
+
+        if self.task_num == 0:
+            return [ np.zeros((0, 1), dtype=np.float32), np.zeros((0, 0), dtype=np.float32) ]
+
+        starts = sorted(self.results.keys())
+        return [ np.concatenate([ self.results[start][0] for start in starts ]), np.concatenate([ self.results[start][1] for start in starts ]) ]
+
+    def _is_done(self) -> bool:
+        return self.error is not None or len(self.results) == self.task_num
@@ -0,0 +1,327 @@
+import os
+import sqlite3
+import threading
+import numpy as np
+
+class KeiyakuEmbeddingIndex:
+    #解析済文章の埋込みの近傍検索用インデックス(1モデルバージョンにつき1ディレクトリ)
+    #埋込みはfloat16でEMBEDDING_FILEへ追記しメモリマップで参照、文書・行番号等はsqliteで管理
+    #近傍候補はランダム超平面のLSH(table_num個のハッシュテーブル)で絞込み、候補のみコサイン類似度を計算
+    #削除済の行がCOMPACT_MIN_NUM件以上かつ有効な行以上となった場合は、削除済の行を除いて埋込みを別ファイルへ書直す(世代を更新)
+    EMBEDDING_FILE = "embedding.f16"
+    INDEX_FILE = "index.db"
+    SEED = 0
+    COMPACT_MIN_NUM = 1000
+
+    def __init__(self, index_dir, bit_num=12, table_num=8):
+        self.index_dir = index_dir
+        self.index_path = os.path.join(index_dir, self.INDEX_FILE)
+        self.bit_num = bit_num
+        self.table_num = table_num
+
+        self.mutex = threading.Lock()
+        self.dim = 0
+        self.mean = None
+        self.planes = None
+        self.embeddings = None
+        self.item_num = 0
+        self.buckets = [ {} for _ in range(table_num) ]
+        self.deleted = np.zeros((0,), dtype=bool)
+        self.delete_num = -1
+        self.generation = 0
+
+        self.init_mutex = threading.Lock()
+        self.initialized = False
+
+    def add(self, doc_id, keys, embeddings, texts) -> int:
+        #文書の全行を登録(登録済の文書は置換え)、embeddingsがNoneの行は同じ文章・前文章の登録済の埋込みを使用
+        #埋込みを取得できない行は登録しない
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._delete_doc(conn, doc_id)
+
+            rows = []
+            add_embeddings = []
+            for row, (key, embedding, text) in enumerate(zip(keys, embeddings, texts)):
+                if embedding is None:
+                    embedding = self._get_key_embedding(conn, key)
+                if embedding is not None:
+                    rows.append((doc_id, row, key[0], key[1], str(text)))
+                    add_embeddings.append(np.asarray(embedding, dtype=np.float32))
+
+            if len(rows) > 0:
+                add_embeddings = np.stack(add_embeddings)
+                if self._get_param(conn, "dim") is None:
+                    #LSHの超平面はインデックス作成時の平均を中心とする(BERTの出力は特定方向に偏るため)
+                    self._set_param(conn, "dim", add_embeddings.shape[1])
+                    np.save(os.path.join(self.index_dir, "mean.npy"), add_embeddings.mean(axis=0))
+
+                start = conn.execute("SELECT COUNT(*) FROM item").fetchone()[0]
+                self._write_embeddings(conn, start, add_embeddings)
+                conn.executemany("INSERT INTO item(id, doc_id, row_no, now_hash, prev_hash, text, deleted) VALUES(?, ?, ?, ?, ?, ?, 0)",
+                    [ (start + i,) + row for i, row in enumerate(rows) ])
+
+            self._compact(conn)
+            conn.execute("COMMIT")
+        except:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        return len(rows)
+
+    def delete(self, doc_id) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._delete_doc(conn, doc_id)
+            self._compact(conn)
+            conn.execute("COMMIT")
+        except:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def compact(self) -> None:
+        #削除済の行の件数に関わらず書直す
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._compact(conn, force=True)
+            conn.execute("COMMIT")
+        except:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def get_embedding(self, doc_id, row):
+        #行の番号は書直しで変わるため、同じトランザクションで取得した世代のファイルから読込む
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            item = conn.execute("SELECT id FROM item WHERE doc_id = ? AND row_no = ? AND deleted = 0", [ doc_id, row ]).fetchone()
+            embedding = self._read_embedding(conn, item[0]) if item is not None else None
+        finally:
+            conn.execute("COMMIT")
+            conn.close()
+
+        return embedding
+
+    def search(self, embedding, top_k=10, exact=False):
+        #コサイン類似度の高い順に(類似度, 文書ID, 行番号, 文章)を最大top_k件返す
+        #LSHの候補がtop_k件未満の場合は全件から検索
+        self._refresh()
+
+        self.mutex.acquire()
+        try:
+            if self.item_num == 0:
+                return []
+
+            embedding = np.asarray(embedding, dtype=np.float32)
+            candidates = None
+            if exact != True:
+                codes = self._get_codes(embedding[np.newaxis, :])[0]
+                candidates = set()
+                for table, code in enumerate(codes):
+                    candidates.update(self.buckets[table].get(code, []))
+                candidates = np.array(sorted(candidates), dtype=np.int64)
+                candidates = candidates[self.deleted[candidates] == False]
+
+            if candidates is None or len(candidates) < top_k:
+                candidates = np.where(self.deleted[:self.item_num] == False)[0]
+
+            targets = np.asarray(self.embeddings[candidates], dtype=np.float32)
+            generation = self.generation
+        finally:
+            self.mutex.release()
+
+        norms = np.linalg.norm(targets, axis=1) * np.linalg.norm(embedding)
+        similarities = targets @ embedding / np.maximum(norms, 1e-12)
+        order = np.argsort(-similarities)[:top_k]
+
+        ids = [ int(candidates[i]) for i in order ]
+        conn = self._connect()
+        conn.execute("BEGIN")
+        items = {}
+        for id in ids:
+            item = conn.execute("SELECT doc_id, row_no, text FROM item WHERE id = ?", [ id ]).fetchone()
+            items[id] = item
+        now_generation = int(self._get_param(conn, "generation") or 0)
+        conn.execute("COMMIT")
+        conn.close()
+
+        #検索中に他プロセスが書直した場合は行の番号が変わるため再検索
+        if now_generation != generation:
+            return self.search(embedding, top_k, exact)
+
+        return [ (float(similarities[i]), items[id][0], items[id][1], items[id][2]) for i, id in zip(order, ids) ]
+
+    def get_count(self) -> int:
+        conn = self._connect()
+        count = conn.execute("SELECT COUNT(*) FROM item WHERE deleted = 0").fetchone()[0]
+        conn.close()
+        return count
+
+    def get_doc_counts(self):
+        #登録済の文書毎の行数
+        conn = self._connect()
+        rows = conn.execute("SELECT doc_id, COUNT(*) FROM item WHERE deleted = 0 GROUP BY doc_id").fetchall()
+        conn.close()
+        return { row[0]: row[1] for row in rows }
+
+    def _refresh(self) -> None:
+        #他プロセスが追加・削除した内容を反映
+        conn = self._connect()
+        conn.execute("BEGIN")
+        item_num = conn.execute("SELECT COUNT(*) FROM item").fetchone()[0]
+        generation = int(self._get_param(conn, "generation") or 0)
+        delete_num = int(self._get_param(conn, "delete_num") or 0)
+        deleted_ids = None
+        if delete_num != self.delete_num or generation != self.generation:
+            deleted_ids = [ row[0] for row in conn.execute("SELECT id FROM item WHERE deleted = 1").fetchall() ]
+        dim = self._get_param(conn, "dim")
+        conn.execute("COMMIT")
+        conn.close()
+
+        self.mutex.acquire()
+        try:
+            if generation != self.generation:
+                #書直し後は全行を読込み直す
+                self.embeddings = None
+                self.item_num = 0
+                self.buckets = [ {} for _ in range(self.table_num) ]
+                self.deleted = np.zeros((0,), dtype=bool)
+                self.generation = generation
+
+            if item_num > self.item_num:
+                self._load(int(dim), item_num)
+
+            if deleted_ids is not None:
+                self.deleted = np.zeros((len(self.deleted),), dtype=bool)
+                self.deleted[[ id for id in deleted_ids if id < len(self.deleted) ]] = True
+                self.delete_num = delete_num
+        finally:
+            self.mutex.release()
+
+    def _load(self, dim, item_num) -> None:
+        if self.planes is None:
+            self.dim = dim
+            self.mean = np.load(os.path.join(self.index_dir, "mean.npy")).astype(np.float32)
+            self.planes = np.random.RandomState(self.SEED).randn(dim, self.bit_num * self.table_num).astype(np.float32)
+
+        self.embeddings = np.memmap(self._get_embedding_path(self.generation), dtype=np.float16, mode="r", shape=(item_num, self.dim))
+
+        codes = self._get_codes(np.asarray(self.embeddings[self.item_num:item_num], dtype=np.float32))
+        for id, item_codes in enumerate(codes, self.item_num):
+            for table, code in enumerate(item_codes):
+                self.buckets[table].setdefault(code, []).append(id)
+
+        self.deleted = np.concatenate([self.deleted, np.zeros((item_num - self.item_num,), dtype=bool)])
+        self.item_num = item_num
+
+    def _get_codes(self, embeddings):
+        bits = ((embeddings - self.mean) @ self.planes) > 0
+        bits = bits.reshape((len(embeddings), self.table_num, self.bit_num))
+        return (bits * (1 << np.arange(self.bit_num))).sum(axis=2).tolist()
+
+    def _get_embedding_path(self, generation):
+        if generation == 0:
+            return os.path.join(self.index_dir, self.EMBEDDING_FILE)
+
+        name, ext = os.path.splitext(self.EMBEDDING_FILE)
+        return os.path.join(self.index_dir, "{}.{}{}".format(name, generation, ext))
+
+    def _write_embeddings(self, conn, start, embeddings) -> None:
+        #追記位置以降のみ書込み(読込側はitemの件数までしか参照しない)
+        with open(self._get_embedding_path(int(self._get_param(conn, "generation") or 0)), "ab") as f:
+            f.truncate(start * embeddings.shape[1] * 2)
+            f.write(embeddings.astype(np.float16).tobytes())
+
+    def _get_key_embedding(self, conn, key):
+        item = conn.execute("SELECT id FROM item WHERE now_hash = ? AND prev_hash = ? LIMIT 1", [ key[0], key[1] ]).fetchone()
+        if item is None:
+            return None
+
+        return self._read_embedding(conn, item[0])
+
+    def _read_embedding(self, conn, id):
+        dim = int(self._get_param(conn, "dim"))
+        embeddings = np.memmap(self._get_embedding_path(int(self._get_param(conn, "generation") or 0)), dtype=np.float16, mode="r", offset=id * dim * 2, shape=(1, dim))
+        return np.array(embeddings[0], dtype=np.float32)
+
+    def _delete_doc(self, conn, doc_id) -> None:
+        cursor = conn.execute("UPDATE item SET deleted = 1 WHERE doc_id = ? AND deleted = 0", [ doc_id ])
+        if cursor.rowcount > 0:
+            self._set_param(conn, "delete_num", int(self._get_param(conn, "delete_num") or 0) + 1)
+            self._set_param(conn, "delete_row_num", int(self._get_param(conn, "delete_row_num") or 0) + cursor.rowcount)
+
+    def _compact(self, conn, force=False) -> None:
+        #削除済の行を除いた埋込みを次の世代のファイルへ書込み、行の番号を詰める
+        #読込中の他プロセスのため1つ前の世代のファイルは残し、2つ以上前の世代のファイルを削除
+        delete_row_num = int(self._get_param(conn, "delete_row_num") or 0)
+        item_num = conn.execute("SELECT COUNT(*) FROM item").fetchone()[0]
+        if delete_row_num == 0 or (force != True and (delete_row_num < self.COMPACT_MIN_NUM or delete_row_num * 2 < item_num)):
+            return
+
+        dim = int(self._get_param(conn, "dim"))
+        generation = int(self._get_param(conn, "generation") or 0)
+        for old_generation in range(generation):
+            if os.path.isfile(self._get_embedding_path(old_generation)):
+                os.remove(self._get_embedding_path(old_generation))
+
+        ids = [ row[0] for row in conn.execute("SELECT id FROM item WHERE deleted = 0 ORDER BY id").fetchall() ]
+        embeddings = np.memmap(self._get_embedding_path(generation), dtype=np.float16, mode="r", shape=(item_num, dim))
+        with open(self._get_embedding_path(generation + 1), "wb") as f:
+            for start in range(0, len(ids), 10000):
+                f.write(np.asarray(embeddings[ids[start:start + 10000]], dtype=np.float16).tobytes())
+        del embeddings
+
+        #昇順に詰めるため未更新の行の番号とは重複しない
+        conn.execute("DELETE FROM item WHERE deleted = 1")
+        conn.executemany("UPDATE item SET id = ? WHERE id = ?", [ (new_id, id) for new_id, id in enumerate(ids) if new_id != id ])
+        self._set_param(conn, "generation", generation + 1)
+        self._set_param(conn, "delete_row_num", 0)
+
+    def _get_param(self, conn, name):
+        row = conn.execute("SELECT value FROM param WHERE name = ?", [ name ]).fetchone()
+        return row[0] if row is not None else None
+
+    def _set_param(self, conn, name, value) -> None:
+        conn.execute("INSERT OR REPLACE INTO param(name, value) VALUES(?, ?)", [ name, str(value) ])
+
+    def _connect(self):
+        if self.initialized == False:
+            self._init_index()
+
+        return sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+
+    def _init_index(self) -> None:
+        self.init_mutex.acquire()
+
+        if self.initialized == False:
+            os.makedirs(self.index_dir, exist_ok=True)
+
+            conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("CREATE TABLE IF NOT EXISTS param(name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute("""CREATE TABLE IF NOT EXISTS item(
+                id INTEGER PRIMARY KEY,
+                doc_id TEXT NOT NULL,
+                row_no INTEGER NOT NULL,
+                now_hash TEXT NOT NULL,
+                prev_hash TEXT NOT NULL,
+                text TEXT NOT NULL,
+                deleted INTEGER NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS item_doc ON item(doc_id, row_no)")
+            conn.execute("CREATE INDEX IF NOT EXISTS item_key ON item(now_hash, prev_hash)")
+            conn.execute("COMMIT")
+            conn.close()
+
+            self.initialized = True
+
+        self.init_mutex.release()
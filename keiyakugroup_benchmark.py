@@ -0,0 +1,321 @@
+import argparse
+import os
+import sys
+import time
+import random
+import subprocess
+import glob
+import json
+import multiprocessing
+import urllib.request
+import urllib.parse
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import tensorflow as tf
+from keiyakudata import KeiyakuData, KeiyakuTokenizedDatas
+from keiyakumodel import KeiyakuModel
+from keiyakumodelfactory import KeiyakuModelFactory
+from transformersbase import TransformersBase
+import keiyakugroup_train_distributed
+
+def post_form(url, params):
+    data = urllib.parse.urlencode(params).encode()
+    with urllib.request.urlopen(urllib.request.Request(url, data=data), timeout=600) as response:
+        return response.read()
+
+def wait_server(url, timeout_sec):
+    endtime = time.time() + timeout_sec
+    while time.time() < endtime:
+        try:
+            with urllib.request.urlopen(url, timeout=5):
+                return True
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(1)
+
+    return False
+
+def benchmark_web(args):
+    #ワーカー数毎に本番サーバを起動し、解析APIのスループットを計測
+    baseurl = "http://127.0.0.1:{}/keiyaku_group".format(args.port)
+    analyze_params = {"seqid": args.seqid, "cache": 0}
+    if args.limit is not None:
+        analyze_params["limit"] = args.limit
+
+    print("workers,concurrency,requests,seconds,requests_per_sec")
+    for worker_num in args.workers:
+        proc = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(__file__), "keiyakugroup_web.py"), "production", str(worker_num), str(args.port)])
+        try:
+            if wait_server(baseurl + "/api/list", 600) != True:
+                raise RuntimeError("server start timeout(workers={})".format(worker_num))
+
+            #全ワーカーのモデル読込を待つため、ワーカー数分の解析を先行実行
+            with ThreadPoolExecutor(max_workers=worker_num) as executor:
+                list(executor.map(lambda _: post_form(baseurl + "/api/analyze_json", analyze_params), range(worker_num)))
+
+            starttime = time.time()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                list(executor.map(lambda _: post_form(baseurl + "/api/analyze_json", analyze_params), range(args.requests)))
+            elapsed = time.time() - starttime
+
+            print("{},{},{},{:.2f},{:.3f}".format(worker_num, args.concurrency, args.requests, elapsed, args.requests / elapsed))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+def predict_time(keiyakumodel: KeiyakuModel, datas):
+    #初回実行のグラフ構築時間を除くため、1バッチ分を先行実行
+    keiyakumodel.predict(datas[:keiyakumodel.batch_size])
+
+    starttime = time.perf_counter()
+    scores = keiyakumodel.predict(datas)
+    return scores, time.perf_counter() - starttime
+
+def get_score_summary(datas, scores):
+    #正解付きの行のみでoutput1のF値、output2の正解率を算出
+    labels1 = np.array([ data[1][0] for data in datas ])
+    labels2 = np.array([ data[1][1] for data in datas ])
+    predicts1 = (scores[0][:, 0] >= 0.5).astype(np.int32)
+    predicts2 = scores[1].argmax(axis=1)
+
+    targets1 = labels1 != -1
+    tp = np.sum((labels1 == 1) & (predicts1 == 1) & targets1)
+    fp = np.sum((labels1 != 1) & (predicts1 == 1) & targets1)
+    fn = np.sum((labels1 == 1) & (predicts1 != 1) & targets1)
+    fvalue1 = 2 * tp / max(2 * tp + fp + fn, 1)
+
+    targets2 = labels2 != -1
+    accuracy2 = np.sum((labels2 == predicts2) & targets2) / max(np.sum(targets2), 1)
+
+    return fvalue1, accuracy2
+
+def benchmark_tflite(args):
+    #学習済モデルをTFLite形式へ変換し、元モデルとの精度差・予測速度を比較
+    KeiyakuModelFactory.set_thread_num(args.threads, 1)
+    keiyakumodel, model, tokenizer = KeiyakuModelFactory.get_keiyakumodel(args.model)
+
+    datas = KeiyakuData(args.csvpath).get_group_datas(tokenizer, model.seq_len)
+    random.Random(0).shuffle(datas)
+    calibration_datas = datas[:args.calibration_num]
+    evaluate_datas = datas[args.calibration_num:args.calibration_num + args.evaluate_num]
+    if len(evaluate_datas) == 0:
+        evaluate_datas = datas[:args.evaluate_num]
+
+    scores, seconds = predict_time(keiyakumodel, evaluate_datas)
+    save_path = KeiyakuModelFactory.export_tflite(args.model, args.quantize, calibration_datas)
+
+    KeiyakuModelFactory.set_backend(KeiyakuModelFactory.BACKEND_TFLITE)
+    tflite_model, _, _ = KeiyakuModelFactory.get_keiyakumodel(args.model)
+    tflite_scores, tflite_seconds = predict_time(tflite_model, evaluate_datas)
+
+    print("backend,quantize,size_mb,rows,seconds,rows_per_sec,speedup,output1_max_diff,output1_agreement,output2_agreement,output1_fvalue,output2_accuracy")
+    weight_size = sum([ os.path.getsize(path) for path in glob.glob(KeiyakuModelFactory._get_weight_path(KeiyakuModelFactory.BACKEND_KERAS) + ".*") ])
+    for backend, quantize, size, result, elapsed in [ (KeiyakuModelFactory.BACKEND_KERAS, KeiyakuModel.QUANTIZE_NONE, weight_size, scores, seconds),
+        (KeiyakuModelFactory.BACKEND_TFLITE, args.quantize, os.path.getsize(save_path), tflite_scores, tflite_seconds) ]:
+        fvalue1, accuracy2 = get_score_summary(evaluate_datas, result)
+        print("{},{},{:.1f},{},{:.2f},{:.2f},{:.2f},{:.4f},{:.4f},{:.4f},{:.4f},{:.4f}".format(backend, quantize, size / 1024 / 1024,
+            len(evaluate_datas), elapsed, len(evaluate_datas) / elapsed, seconds / elapsed,
+            np.abs(result[0] - scores[0]).max(), np.mean((result[0] >= 0.5) == (scores[0] >= 0.5)),
+            np.mean(result[1].argmax(axis=1) == scores[1].argmax(axis=1)), fvalue1, accuracy2))
+
+def benchmark_layers(args):
+    #モデル種類・使用層数毎に学習時間・予測速度・精度を計測(epochs=0は予測速度のみ)
+    print("model,layers,pooling,train_seconds,rows_per_sec,output1_fvalue,output2_accuracy")
+    for model_name in args.models:
+        for layer_num in args.layers:
+            tf.keras.backend.clear_session()
+            KeiyakuModelFactory.set_layer_num(layer_num, args.pooling)
+            keiyakumodel, model, tokenizer = KeiyakuModelFactory.get_keiyakumodel(model_name, loadweight=False)
+
+            datas = KeiyakuData(args.csvpath).get_study_group_datas(tokenizer, model.seq_len)
+            random.Random(0).shuffle(datas)
+            evaluate_num = min(int(len(datas) * 0.2), args.evaluate_num)
+            train_datas = datas[evaluate_num:]
+            evaluate_datas = datas[:evaluate_num]
+
+            train_seconds = 0.0
+            fvalue1 = ""
+            accuracy2 = ""
+            if args.epochs > 0:
+                starttime = time.perf_counter()
+                keiyakumodel.train_model(train_datas, args.epochs, os.path.join(args.save_dir, "{}_{}".format(model_name, KeiyakuModelFactory.weight_name)))
+                train_seconds = time.perf_counter() - starttime
+
+            scores, seconds = predict_time(keiyakumodel, evaluate_datas)
+            if args.epochs > 0:
+                fvalue1, accuracy2 = [ "{:.4f}".format(value) for value in get_score_summary(evaluate_datas, scores) ]
+
+            print("{},{},{},{:.1f},{:.2f},{},{}".format(model_name, layer_num, args.pooling, train_seconds, len(evaluate_datas) / seconds, fvalue1, accuracy2))
+
+def train_freeze(task):
+    #学習する層の設定毎に新しいプロセスで学習(同じモデルを再利用しないため)
+    args, train_params, save_dir = task
+    KeiyakuModelFactory.set_thread_num(args.threads, 1)
+    keiyakumodel, model, tokenizer = KeiyakuModelFactory.get_keiyakumodel(args.model, loadweight=False)
+    keiyakumodel.set_train_params(train_params)
+
+    datas = KeiyakuData(args.csvpath).get_study_group_datas(tokenizer, model.seq_len)
+    random.Random(0).shuffle(datas)
+    evaluate_num = min(int(len(datas) * 0.2), args.evaluate_num)
+
+    keiyakumodel.train_model(datas[evaluate_num:], args.epochs, save_dir)
+    with open(os.path.join(save_dir, "train_time.json"), encoding="utf-8") as f:
+        train_time = json.load(f)
+
+    scores, _ = predict_time(keiyakumodel, datas[:evaluate_num])
+    return train_time, get_score_summary(datas[:evaluate_num], scores)
+
+def benchmark_freeze(args):
+    #学習する層数・段階的な層の追加毎に1エポックの学習時間・精度を比較(エポック時間は段階毎のグラフ構築の影響を抑えるため中央値)
+    print("model,train_layers,unfreeze_epoch,freeze_embeddings,epochs,train_seconds,seconds_per_epoch,output1_fvalue,output2_accuracy")
+    context = multiprocessing.get_context("spawn")
+    for train_layer_num in args.train_layers:
+        for unfreeze_epoch in (args.unfreeze_epochs if train_layer_num > 0 else [0]):
+            train_params = { "train_layer_num": train_layer_num, "unfreeze_epoch": unfreeze_epoch, "freeze_embeddings": args.freeze_embeddings,
+                "pre_epoch": args.pre_epochs }
+            save_dir = os.path.join(args.save_dir, "{}_freeze_l{}_u{}".format(args.model, train_layer_num, unfreeze_epoch))
+            with context.Pool(1) as pool:
+                train_time, (fvalue1, accuracy2) = pool.apply(train_freeze, ((args, train_params, save_dir),))
+
+            print("{},{},{},{},{},{:.1f},{:.1f},{:.4f},{:.4f}".format(args.model, train_layer_num, unfreeze_epoch, args.freeze_embeddings,
+                train_time["run_epoch_num"], train_time["train_seconds"], np.median(train_time["epoch_train_seconds"]), fvalue1, accuracy2))
+
+def train_memory(task):
+    #全層の学習をsteps回実行し、学習時間とプロセスの最大RSSを返す(resourceはLinuxのみ)
+    import resource
+    args, batch_size, recompute = task
+    KeiyakuModelFactory.set_thread_num(args.threads, 1)
+    keiyakumodel, model, tokenizer = KeiyakuModelFactory.get_keiyakumodel(args.model, loadweight=False)
+
+    datas = KeiyakuData(args.csvpath).get_study_group_datas(tokenizer, model.seq_len)
+    datas = (datas * (batch_size * (args.steps + 1) // len(datas) + 1))[:batch_size * (args.steps + 1)]
+
+    model.set_trainable(True)
+    model.set_recompute_grad(recompute)
+    keiyakumodel.model.compile(optimizer=keiyakumodel.optimizer, loss=keiyakumodel.loss)
+
+    #初回のグラフ構築時間を除くため、1ステップ分を先行実行
+    generator = keiyakumodel._generator_data(datas, batch_size)
+    keiyakumodel.model.fit(generator, steps_per_epoch=1, epochs=1, verbose=0)
+    starttime = time.perf_counter()
+    keiyakumodel.model.fit(generator, steps_per_epoch=args.steps, epochs=1, verbose=0)
+    seconds = time.perf_counter() - starttime
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, seconds
+
+def benchmark_memory(args):
+    #batch_size・再計算の有無毎に新しいプロセスで学習し、最大RSS・学習速度を比較(メモリ不足で終了した場合はerror)
+    print("model,seq_len,recompute_grad,batch_size,peak_rss_mb,steps,seconds,rows_per_sec")
+    context = multiprocessing.get_context("spawn")
+    for batch_size in args.batch_sizes:
+        for recompute in [False, True]:
+            try:
+                with ProcessPoolExecutor(1, mp_context=context) as executor:
+                    peak_rss, seconds = executor.submit(train_memory, (args, batch_size, recompute)).result()
+                print("{},{},{},{},{:.0f},{},{:.2f},{:.2f}".format(args.model, KeiyakuModelFactory.get_seq_len(args.model), recompute, batch_size, peak_rss,
+                    args.steps, seconds, batch_size * args.steps / seconds))
+            except (BrokenProcessPool, tf.errors.ResourceExhaustedError, MemoryError) as e:
+                print("{},{},{},{},error,{},,".format(args.model, KeiyakuModelFactory.get_seq_len(args.model), recompute, batch_size, args.steps))
+                print("batch_size={} recompute_grad={} error={}".format(batch_size, recompute, repr(e)), file=sys.stderr)
+            sys.stdout.flush()
+
+def benchmark_scaling(args):
+    #同じマシンのワーカー数毎にデータ並列学習し、1エポックの学習速度を比較(コア数は全ワーカーで等分、ワーカー毎のbatch_sizeは固定)
+    #エポック時間はグラフ構築を含む初回を除いた中央値
+    print("model,workers,threads,global_batch_size,epochs,seconds_per_epoch,rows_per_sec,speedup,efficiency,loss")
+    model, tokenizer = KeiyakuModelFactory.get_tokenizer(args.model)
+    tokenized_dir = os.path.join(args.save_dir, "{}_scaling".format(args.model), "tokenized")
+    datas = KeiyakuTokenizedDatas.create(KeiyakuData(args.csvpath).get_study_group_datas(tokenizer, model.seq_len), model.seq_len, tokenized_dir)
+    train_num = int(len(datas) * KeiyakuModel(tokenizer).train_data_split)
+
+    base_worker_num, base_rows_per_sec = None, None
+    for worker_num in args.workers:
+        thread_num = max(multiprocessing.cpu_count() // worker_num, 1)
+        save_dir = os.path.join(args.save_dir, "{}_scaling".format(args.model), "w{}".format(worker_num))
+        train_params = { "batch_size": args.batch_size, "pre_epoch": 0 }
+        results = keiyakugroup_train_distributed.train_local(args.model, tokenized_dir, worker_num, thread_num, args.port, args.epochs, save_dir,
+            None, TransformersBase.POOLING_POOLER, train_params)
+        with open(os.path.join(save_dir, "train_time.json"), encoding="utf-8") as f:
+            train_time = json.load(f)
+
+        global_batch_size = args.batch_size * worker_num
+        epoch_seconds = train_time["epoch_train_seconds"]
+        seconds = np.median(epoch_seconds[1:] if len(epoch_seconds) > 1 else epoch_seconds)
+        rows_per_sec = (train_num // global_batch_size) * global_batch_size / seconds
+        #速度向上率・効率は先頭のワーカー数との比較
+        if base_rows_per_sec is None:
+            base_worker_num, base_rows_per_sec = worker_num, rows_per_sec
+        speedup = rows_per_sec / base_rows_per_sec
+        print("{},{},{},{},{},{:.1f},{:.2f},{:.2f},{:.2f},{:.4f}".format(args.model, worker_num, thread_num, global_batch_size, train_time["run_epoch_num"], seconds,
+            rows_per_sec, speedup, speedup * base_worker_num / worker_num, results[0][1]["loss"]))
+        sys.stdout.flush()
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_web = subparsers.add_parser("web", help="本番サーバのワーカー数毎のスループット計測")
+    parser_web.add_argument("seqid", help="解析対象のアップロード済seqid")
+    parser_web.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser_web.add_argument("--concurrency", type=int, default=8)
+    parser_web.add_argument("--requests", type=int, default=32)
+    parser_web.add_argument("--limit", type=int, default=None, help="1リクエストで解析する行数")
+    parser_web.add_argument("--port", type=int, default=8080)
+    parser_web.set_defaults(func=benchmark_web)
+
+    parser_tflite = subparsers.add_parser("tflite", help="TFLite形式への変換と元モデルとの精度・速度比較")
+    parser_tflite.add_argument("csvpath", help="キャリブレーション・評価用の契約書CSV")
+    parser_tflite.add_argument("--model", default=KeiyakuModelFactory.DEFAULT_MODEL_NAME)
+    parser_tflite.add_argument("--quantize", choices=[KeiyakuModel.QUANTIZE_NONE, KeiyakuModel.QUANTIZE_DYNAMIC, KeiyakuModel.QUANTIZE_INT8], default=KeiyakuModel.QUANTIZE_DYNAMIC)
+    parser_tflite.add_argument("--calibration-num", type=int, default=200, help="int8のキャリブレーション行数")
+    parser_tflite.add_argument("--evaluate-num", type=int, default=1000, help="比較に使用する行数")
+    parser_tflite.add_argument("--threads", type=int, default=0, help="演算スレッド数(0はTensorFlowが自動設定)")
+    parser_tflite.set_defaults(func=benchmark_tflite)
+
+    parser_layers = subparsers.add_parser("layers", help="使用層数毎の学習時間・予測速度・精度比較")
+    parser_layers.add_argument("csvpath", help="学習・評価用の契約書CSV(2割を評価に使用)")
+    parser_layers.add_argument("--models", nargs="+", default=[KeiyakuModelFactory.MODEL_NAME_BERT, KeiyakuModelFactory.MODEL_NAME_BERTCOLORFUL, KeiyakuModelFactory.MODEL_NAME_ROBERTA])
+    parser_layers.add_argument("--layers", type=int, nargs="+", default=[2, 4, 6, 8, 12])
+    parser_layers.add_argument("--pooling", choices=[TransformersBase.POOLING_POOLER, TransformersBase.POOLING_CLS], default=TransformersBase.POOLING_POOLER)
+    parser_layers.add_argument("--epochs", type=int, default=0, help="学習エポック数(0は学習せず予測速度のみ計測)")
+    parser_layers.add_argument("--evaluate-num", type=int, default=1000, help="評価に使用する最大行数")
+    parser_layers.add_argument("--save-dir", default="savedir")
+    parser_layers.set_defaults(func=benchmark_layers)
+
+    parser_freeze = subparsers.add_parser("freeze", help="学習する層数毎の学習時間・精度比較")
+    parser_freeze.add_argument("csvpath", help="学習・評価用の契約書CSV(2割を評価に使用)")
+    parser_freeze.add_argument("--model", default=KeiyakuModelFactory.DEFAULT_MODEL_NAME)
+    parser_freeze.add_argument("--train-layers", type=int, nargs="+", default=[0, 2, 4, 6], help="学習する上位の層数(0は全層)")
+    parser_freeze.add_argument("--unfreeze-epochs", type=int, nargs="+", default=[0], help="学習する層を1層広げるエポック間隔(0は広げない)")
+    parser_freeze.add_argument("--freeze-embeddings", action="store_true", help="全層学習時も埋込み層を固定")
+    parser_freeze.add_argument("--epochs", type=int, default=5)
+    parser_freeze.add_argument("--pre-epochs", type=int, default=1, help="全結合層のみの学習エポック数")
+    parser_freeze.add_argument("--evaluate-num", type=int, default=1000, help="評価に使用する最大行数")
+    parser_freeze.add_argument("--threads", type=int, default=0, help="演算スレッド数(0はTensorFlowが自動設定)")
+    parser_freeze.add_argument("--save-dir", default="savedir")
+    parser_freeze.set_defaults(func=benchmark_freeze)
+
+    parser_memory = subparsers.add_parser("memory", help="batch_size毎の再計算有無による最大メモリ・学習速度比較(Linuxのみ)")
+    parser_memory.add_argument("csvpath", help="学習用の契約書CSV")
+    parser_memory.add_argument("--model", default=KeiyakuModelFactory.DEFAULT_MODEL_NAME)
+    parser_memory.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 20, 32, 64])
+    parser_memory.add_argument("--steps", type=int, default=5, help="計測する学習ステップ数")
+    parser_memory.add_argument("--threads", type=int, default=0, help="演算スレッド数(0はTensorFlowが自動設定)")
+    parser_memory.set_defaults(func=benchmark_memory)
+
+    parser_scaling = subparsers.add_parser("scaling", help="同じマシンのワーカー数毎のデータ並列学習の速度比較")
+    parser_scaling.add_argument("csvpath", help="学習用の契約書CSV(2割を評価に使用)")
+    parser_scaling.add_argument("--model", default=KeiyakuModelFactory.DEFAULT_MODEL_NAME)
+    parser_scaling.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser_scaling.add_argument("--batch-size", type=int, default=20, help="1ワーカーあたりのバッチサイズ")
+    parser_scaling.add_argument("--epochs", type=int, default=3)
+    parser_scaling.add_argument("--port", type=int, default=23456, help="ワーカーが使用する先頭のポート番号")
+    parser_scaling.add_argument("--save-dir", default="savedir")
+    parser_scaling.set_defaults(func=benchmark_scaling)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
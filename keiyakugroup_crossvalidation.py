@@ -0,0 +1,122 @@
+from keiyakudata import KeiyakuData, KeiyakuTokenizedDatas
+from keiyakumodelfactory import KeiyakuModelFactory
+from transformersbase import TransformersBase
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+import numpy as np
+
+SUMMARY_FILE = "cv_summary.json"
+TOKENIZED_DIR = "tokenized"
+
+def get_fold_indexes(data_num, fold_num, seed):
+    #シャッフルした行をfold_num分割し、各分割を評価用・残りを学習用とする
+    indexes = np.random.RandomState(seed).permutation(data_num)
+    folds = np.array_split(indexes, fold_num)
+    return [ (np.concatenate(folds[:i] + folds[i+1:]), folds[i]) for i in range(fold_num) ]
+
+def init_worker(thread_num, layer_num, pooling):
+    KeiyakuModelFactory.set_thread_num(thread_num, 1)
+    KeiyakuModelFactory.set_layer_num(layer_num, pooling)
+
+def train_fold(task):
+    fold, model_name, tokenized_dir, train_indexes, test_indexes, epoch_num, save_dir, train_params = task
+    starttime = time.perf_counter()
+    try:
+        keiyakumodel, _, _ = KeiyakuModelFactory.get_keiyakumodel(model_name, loadweight=False)
+        keiyakumodel.set_train_params(train_params)
+
+        #各プロセスは同じトークナイズ済ファイルをメモリマップで参照
+        datas = KeiyakuTokenizedDatas(tokenized_dir)
+        score = keiyakumodel.train_model(datas.get_subset(train_indexes), epoch_num, save_dir, datas.get_subset(test_indexes))
+
+        return fold, { key: float(value) for key, value in score.items() }, time.perf_counter() - starttime, None
+    except Exception:
+        return fold, {}, time.perf_counter() - starttime, traceback.format_exc()
+
+def get_summary(fold_scores):
+    #各評価値のfold間の平均・標準偏差・最小・最大
+    summary = {}
+    for key in sorted(set([ key for score in fold_scores for key in score.keys() ])):
+        values = np.array([ score[key] for score in fold_scores if key in score ])
+        summary[key] = { "mean": float(values.mean()), "std": float(values.std()), "min": float(values.min()), "max": float(values.max()) }
+
+    return summary
+
+def main():
+    cpu_num = multiprocessing.cpu_count()
+
+    parser = argparse.ArgumentParser(description="K分割交差検証(各foldを別プロセスで並行学習)")
+    parser.add_argument("csvpath", help="学習用の契約書CSV")
+    parser.add_argument("--model", default=KeiyakuModelFactory.DEFAULT_MODEL_NAME)
+    parser.add_argument("--layers", type=int, default=None, help="使用層数(未指定時は全層)")
+    parser.add_argument("--pooling", choices=[TransformersBase.POOLING_POOLER, TransformersBase.POOLING_CLS], default=TransformersBase.POOLING_POOLER)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--parallel", type=int, default=None, help="同時に学習するfold数(未指定時はfold数とコア数/threadsの小さい方)")
+    parser.add_argument("--threads", type=int, default=None, help="1プロセスあたりの演算スレッド数(未指定時はコアをプロセスで等分)")
+    parser.add_argument("--patience", type=int, default=0, help="改善しないエポック数がpatienceに達した場合に打切り(0の場合は打切らない)")
+    parser.add_argument("--validation-samples", type=int, default=0, help="学習中の評価に使用する評価データの抽出件数(0の場合は全件)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-dir", default="savedir")
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        parallel = args.parallel if args.parallel is not None else max(min(args.folds, cpu_num // args.threads), 1)
+        thread_num = args.threads
+    else:
+        parallel = args.parallel if args.parallel is not None else args.folds
+        thread_num = max(cpu_num // parallel, 1)
+
+    KeiyakuModelFactory.set_layer_num(args.layers, args.pooling)
+    model, tokenizer = KeiyakuModelFactory.get_tokenizer(args.model)
+    save_dir = os.path.join(args.save_dir, "{}_cv_{}_{}".format(datetime.datetime.now().strftime('%Y%m%d%H%M%S'), model.model_name, KeiyakuModelFactory.get_weight_name(args.model)))
+
+    #トークナイズは1回のみ行い、全foldで共有
+    tokenized_dir = os.path.join(save_dir, TOKENIZED_DIR)
+    datas = KeiyakuTokenizedDatas.create(KeiyakuData(args.csvpath).get_study_group_datas(tokenizer, model.seq_len), model.seq_len, tokenized_dir)
+
+    train_params = { "early_stopping_patience": args.patience, "validation_sample_num": args.validation_samples }
+    tasks = []
+    for fold, (train_indexes, test_indexes) in enumerate(get_fold_indexes(len(datas), args.folds, args.seed)):
+        tasks.append((fold, args.model, tokenized_dir, train_indexes, test_indexes, args.epochs, os.path.join(save_dir, "fold{}".format(fold)), train_params))
+
+    print("rows={} folds={} parallel={} threads={} save_dir={}".format(len(datas), args.folds, parallel, thread_num, save_dir), file=sys.stderr)
+
+    #TensorFlowはfork後の子プロセスで動作しないため、spawnでプロセスを起動
+    results = {}
+    starttime = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(parallel, initializer=init_worker, initargs=(thread_num, args.layers, args.pooling), maxtasksperchild=1) as pool:
+        for fold, score, elapsed, error in pool.imap_unordered(train_fold, tasks):
+            results[fold] = { "fold": fold, "train_rows": len(tasks[fold][3]), "test_rows": len(tasks[fold][4]), "seconds": round(elapsed, 3), "score": score, "error": error }
+            if error is not None:
+                print("fold{} error\n{}".format(fold, error), file=sys.stderr)
+            else:
+                print("fold{} loss={:.4f} {:.1f}s".format(fold, score.get("loss", 0.0), elapsed), file=sys.stderr)
+
+    folds = [ results[fold] for fold in sorted(results.keys()) ]
+    summary = { "model": args.model, "weight_name": KeiyakuModelFactory.get_weight_name(args.model), "csvpath": args.csvpath, "rows": len(datas),
+        "folds": args.folds, "epochs": args.epochs, "patience": args.patience, "validation_samples": args.validation_samples, "parallel": parallel, "threads": thread_num, "seed": args.seed,
+        "seconds": round(time.perf_counter() - starttime, 3), "fold_results": folds,
+        "summary": get_summary([ fold["score"] for fold in folds if fold["error"] is None ]) }
+
+    summary_path = os.path.join(save_dir, SUMMARY_FILE)
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=4)
+
+    print("summary={}".format(summary_path), file=sys.stderr)
+    for key in ["loss", "output1_fvalue", "output2_fvalue"]:
+        if key in summary["summary"]:
+            print("{} mean={:.4f} std={:.4f}".format(key, summary["summary"][key]["mean"], summary["summary"][key]["std"]), file=sys.stderr)
+
+    if any([ fold["error"] is not None for fold in folds ]):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+from keiyakudata import KeiyakuData
+from keiyakumodelfactory import KeiyakuModelFactory
+import os
+import datetime
+import sys
+
+starttime=datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+
+keiyakudata_path = r".\data\keiyakudata.csv"
+save_dir = r".\savedir"
+epoch_num = 20
+alpha = 0.5
+
+#[生徒モデル名] [教師モデル名]
+student_model_name = KeiyakuModelFactory.MODEL_NAME_BERT_STUDENT
+if len(sys.argv) >= 2:
+    student_model_name = sys.argv[1]
+
+teacher_model_name = KeiyakuModelFactory.DEFAULT_MODEL_NAME
+if len(sys.argv) >= 3:
+    teacher_model_name = sys.argv[2]
+
+teacher_keiyakumodel, teacher_model, tokenizer = KeiyakuModelFactory.get_keiyakumodel(teacher_model_name)
+
+keiyakudata = KeiyakuData(keiyakudata_path)
+datas = keiyakudata.get_study_group_datas(tokenizer, teacher_model.seq_len)
+
+student_keiyakumodel, student_model, _ = KeiyakuModelFactory.get_keiyakumodel(student_model_name, loadweight=False)
+
+save_dir = os.path.join(save_dir, starttime + "_distill_" + student_model_name)
+student_keiyakumodel.train_distill_model(teacher_keiyakumodel, datas, epoch_num, save_dir, alpha)
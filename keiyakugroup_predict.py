@@ -1,47 +1,232 @@
-from keiyakudata import KeiyakuData
-from keiyakumodel import KeiyakuModel
-from keiyakumodelfactory import KeiyakuModelFactory
-import numpy as np
-import sys
-
-keiyakudata_path = r".\data\keiyakudata.csv"
-save_dir = r".\savedir"
-score_threshold = 0.5
-
-model_name = KeiyakuModelFactory.DEFAULT_MODEL_NAME
-if len(sys.argv) >= 2:
-    model_name = sys.argv[1]
-
-keiyakumodel, model, tokenizer = KeiyakuModelFactory.get_keiyakumodel(model_name)
-
-keiyakudata = KeiyakuData(keiyakudata_path)
-datas = keiyakudata.get_datas()
-predict_datas = keiyakudata.get_group_datas(tokenizer, model.seq_len)
-
-np.set_printoptions(precision=2, floatmode='fixed')
-
-bef_file = ""
-for i in range(0, len(datas), 1000):
-    targets = datas[i:i+1000]
-    predict_targets = predict_datas[i:i+1000]
-    scores = keiyakumodel.predict(predict_targets)
-
-    for target, score1, score2 in zip(targets, scores[0], scores[1]):
-        file = target[0]
-        sentense = target[6]
-        kind1 = score2.argmax()
-
-        if bef_file != file:
-            print("{}*********************************************".format(file))
-
-        if score1 >= score_threshold:
-            print("{}---------------------------------------------".format(score1))
-            
-        print("{}-{:0.2f}:{}".format(kind1, score2[kind1], sentense))
-        
-        bef_file = file
-
-
-    
-
-
+from keiyakudata import KeiyakuData
+from keiyakumodelfactory import KeiyakuModelFactory
+from keiyakudistributed import KeiyakuPredictCoordinator
+from keiyakuscorecache import KeiyakuScoreCache
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+
+INPUT_FILE_EXTENSION = [ ".csv", ".pdf", ".doc", ".docx" ]
+OUTPUT_FORMATS = [ "jsonl", "parquet" ]
+PROGRESS_FILE = "progress.jsonl"
+SENTENCE_CACHE_FILE = "sentence_cache.db"
+
+worker_model_name = KeiyakuModelFactory.DEFAULT_MODEL_NAME
+worker_score_cache = KeiyakuScoreCache()
+
+def get_input_files(inputs):
+    #ディレクトリ指定時は配下の全ファイル、それ以外はglobとして展開
+    paths = set()
+    for input in inputs:
+        if os.path.isdir(input):
+            candidates = glob.glob(os.path.join(input, "**", "*"), recursive=True)
+        else:
+            candidates = glob.glob(input, recursive=True)
+
+        for path in candidates:
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in INPUT_FILE_EXTENSION:
+                paths.add(os.path.abspath(path))
+
+    return sorted(paths)
+
+def get_progress_key(path, model_version):
+    #ファイル更新または重み更新時は再解析
+    stat = os.stat(path)
+    return "{}:{}:{}:{}".format(path, stat.st_size, stat.st_mtime_ns, model_version)
+
+def get_output_path(output_dir, path, output_format):
+    basename = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(output_dir, "{}_{}.{}".format(basename, hashlib.sha1(path.encode()).hexdigest()[:8], output_format))
+
+def load_progress(progress_path):
+    keys = set()
+    if os.path.isfile(progress_path):
+        with open(progress_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    keys.add(json.loads(line)["key"])
+                except (ValueError, KeyError):
+                    #書込中に停止した行は未完了扱い
+                    pass
+
+    return keys
+
+def init_worker(model_name, backend, thread_num, cache_path):
+    global worker_model_name
+    global worker_score_cache
+    worker_model_name = model_name
+    worker_score_cache = KeiyakuScoreCache(cache_path if cache_path != "" else None)
+
+    KeiyakuModelFactory.set_backend(backend)
+    KeiyakuModelFactory.set_thread_num(thread_num, 1)
+    KeiyakuModelFactory.get_keiyakumodel(model_name)
+
+def read_keiyaku_data(path, work_path):
+    if os.path.splitext(path)[1].lower() == ".csv":
+        return KeiyakuData(path)
+
+    try:
+        KeiyakuData.create_keiyaku_data(path, work_path + ".txt", work_path + ".csv")
+        return KeiyakuData(work_path + ".csv")
+    finally:
+        for tmp_path in [ work_path + ".txt", work_path + ".csv" ]:
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+
+def create_rows(path, datas, start, scores):
+    rows = []
+    for col, (score1, score2) in enumerate(zip(scores[0], scores[1]), start):
+        rows.append({ "path": path, "index": col, "file": str(datas[col][0]), "line": str(datas[col][1]),
+            "sentence": str(datas[col][6]), "score1": float(score1[0]), "kind": int(score2.argmax()),
+            "score2": [ float(score) for score in score2 ] })
+
+    return rows
+
+def save_rows(rows, output_path, output_format):
+    #途中停止時に不完全な出力を残さないよう一時ファイルから置換
+    tmp_path = output_path + ".tmp"
+    if output_format == "parquet":
+        pd.DataFrame(rows, columns=[ "path", "index", "file", "line", "sentence", "score1", "kind", "score2" ]).to_parquet(tmp_path, index=False)
+    else:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, output_path)
+
+def predict_file(task):
+    path, output_path, output_format, batch_num = task
+    starttime = time.perf_counter()
+    try:
+        keiyakumodel, model, tokenizer = KeiyakuModelFactory.get_keiyakumodel(worker_model_name)
+
+        keiyakudata = read_keiyaku_data(path, output_path + ".work")
+        datas = keiyakudata.get_datas()
+        predict_datas = keiyakudata.get_group_datas(tokenizer, model.seq_len)
+        model_version = KeiyakuModelFactory.get_model_version()
+
+        rows = []
+        hit_num = 0
+        for start, scores, batch_hit_num in worker_score_cache.predict_batches(keiyakumodel, model_version, predict_datas, KeiyakuScoreCache.get_keys(keiyakudata), batch_num):
+            rows.extend(create_rows(path, datas, start, scores))
+            hit_num += batch_hit_num
+        save_rows(rows, output_path, output_format)
+
+        return path, len(rows), time.perf_counter() - starttime, None, hit_num
+    except Exception:
+        return path, 0, time.perf_counter() - starttime, traceback.format_exc(), 0
+
+def predict_file_distributed(coordinator: KeiyakuPredictCoordinator, task):
+    #文章の予測はコーディネータ経由でワーカーへ分配
+    path, output_path, output_format, _ = task
+    starttime = time.perf_counter()
+    try:
+        keiyakudata = read_keiyaku_data(path, output_path + ".work")
+        rows = create_rows(path, keiyakudata.get_datas(), 0, coordinator.predict_keiyakudata(keiyakudata))
+        save_rows(rows, output_path, output_format)
+
+        return path, len(rows), time.perf_counter() - starttime, None, 0
+    except Exception:
+        return path, 0, time.perf_counter() - starttime, traceback.format_exc(), 0
+
+def run_local(args, tasks, thread_num):
+    #TensorFlowはfork後の子プロセスで動作しないため、spawnでプロセスを起動
+    cache_path = args.sentence_cache if args.sentence_cache is not None else os.path.join(args.output, SENTENCE_CACHE_FILE)
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(args.workers, initializer=init_worker, initargs=(args.model, args.backend, thread_num, cache_path)) as pool:
+        yield from pool.imap_unordered(predict_file, tasks)
+
+def run_distributed(args, tasks, model_version):
+    #keiyakugroup_predict_worker.pyで起動したワーカーの登録を待受け、workers件のファイルを並行して解析
+    coordinator = KeiyakuPredictCoordinator(model_version, host=args.coordinator_host, port=args.coordinator_port, batch_num=args.batch_num)
+    coordinator.start()
+    print("coordinator={}".format(coordinator.url), file=sys.stderr)
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = [ executor.submit(predict_file_distributed, coordinator, task) for task in tasks ]
+            for future in as_completed(futures):
+                yield future.result()
+    finally:
+        coordinator.shutdown()
+
+def main():
+    cpu_num = multiprocessing.cpu_count()
+
+    parser = argparse.ArgumentParser(description="契約書CSV・文書ファイルの一括解析")
+    parser.add_argument("inputs", nargs="+", help="入力ディレクトリまたはglob(.csv/.pdf/.doc/.docx)")
+    parser.add_argument("--output", required=True, help="出力ディレクトリ")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="jsonl", help="parquetはpyarrowが必要")
+    parser.add_argument("--model", default=KeiyakuModelFactory.DEFAULT_MODEL_NAME)
+    parser.add_argument("--backend", choices=[KeiyakuModelFactory.BACKEND_KERAS, KeiyakuModelFactory.BACKEND_TFLITE], default=KeiyakuModelFactory.BACKEND_KERAS)
+    parser.add_argument("--workers", type=int, default=max(cpu_num // 4, 1), help="解析プロセス数")
+    parser.add_argument("--threads", type=int, default=None, help="1プロセスあたりの演算スレッド数(未指定時はコアをプロセスで等分)")
+    parser.add_argument("--batch-num", type=int, default=1000, help="1回の予測行数")
+    parser.add_argument("--restart", action="store_true", help="進捗を破棄して全ファイルを再解析")
+    parser.add_argument("--sentence-cache", default=None, help="文章単位の予測結果キャッシュ(未指定時は出力ディレクトリ内、空文字はメモリのみ)")
+    parser.add_argument("--coordinator-port", type=int, default=None, help="指定時は登録されたワーカーへ予測を分配(workersは並行ファイル数)")
+    parser.add_argument("--coordinator-host", default="127.0.0.1")
+    args = parser.parse_args()
+
+    thread_num = args.threads if args.threads is not None else max(cpu_num // args.workers, 1)
+    os.makedirs(args.output, exist_ok=True)
+    progress_path = os.path.join(args.output, PROGRESS_FILE)
+    if args.restart and os.path.isfile(progress_path):
+        os.remove(progress_path)
+
+    KeiyakuModelFactory.set_backend(args.backend)
+    model_version = KeiyakuModelFactory.get_weight_version(args.model)
+    done_keys = load_progress(progress_path)
+
+    tasks = []
+    keys = {}
+    skip_num = 0
+    for path in get_input_files(args.inputs):
+        key = get_progress_key(path, model_version)
+        if key in done_keys:
+            skip_num += 1
+            continue
+
+        keys[path] = key
+        tasks.append((path, get_output_path(args.output, path, args.format), args.format, args.batch_num))
+
+    print("files={} skip={} workers={} threads={} model={}".format(len(tasks), skip_num, args.workers, thread_num, model_version), file=sys.stderr)
+    if len(tasks) == 0:
+        return
+
+    if args.coordinator_port is not None:
+        results = run_distributed(args, tasks, model_version)
+    else:
+        results = run_local(args, tasks, thread_num)
+
+    error_num = 0
+    total_row_num = 0
+    total_hit_num = 0
+    starttime = time.perf_counter()
+    with open(progress_path, "a", encoding="utf-8") as progress:
+        for num, (path, row_num, elapsed, error, hit_num) in enumerate(results, 1):
+            if error is not None:
+                error_num += 1
+                print("[{}/{}] error {}\n{}".format(num, len(tasks), path, error), file=sys.stderr)
+                continue
+
+            total_row_num += row_num
+            total_hit_num += hit_num
+            progress.write(json.dumps({ "key": keys[path], "path": path, "output": get_output_path(args.output, path, args.format),
+                "rows": row_num, "cache_hit": hit_num, "seconds": round(elapsed, 3) }, ensure_ascii=False) + "\n")
+            progress.flush()
+            print("[{}/{}] {} rows={} hit={} {:.2f}s".format(num, len(tasks), path, row_num, hit_num, elapsed), file=sys.stderr)
+
+    hit_ratio = total_hit_num / total_row_num if total_row_num > 0 else 0.0
+    print("done files={} errors={} cache_hit_ratio={:.3f} {:.2f}s".format(len(tasks) - error_num, error_num, hit_ratio, time.perf_counter() - starttime), file=sys.stderr)
+    if error_num > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+from keiyakumodelfactory import KeiyakuModelFactory
+from keiyakudistributed import KeiyakuPredictWorker
+from keiyakuscorecache import KeiyakuScoreCache
+import argparse
+
+def main():
+    parser = argparse.ArgumentParser(description="分散解析ワーカー(keiyakugroup_predict.py --coordinator-portへ登録)")
+    parser.add_argument("coordinator", help="コーディネータURL(例: http://127.0.0.1:8500)")
+    parser.add_argument("--host", default="127.0.0.1", help="待受けアドレス(コーディネータから接続可能なアドレス)")
+    parser.add_argument("--port", type=int, default=0, help="待受けポート(0は自動割当)")
+    parser.add_argument("--model", default=KeiyakuModelFactory.DEFAULT_MODEL_NAME)
+    parser.add_argument("--backend", choices=[KeiyakuModelFactory.BACKEND_KERAS, KeiyakuModelFactory.BACKEND_TFLITE], default=KeiyakuModelFactory.BACKEND_KERAS)
+    parser.add_argument("--threads", type=int, default=0, help="演算スレッド数(0はTensorFlowが自動設定)")
+    parser.add_argument("--sentence-cache", default="", help="文章単位の予測結果キャッシュのファイル(空文字はメモリのみ)")
+    args = parser.parse_args()
+
+    KeiyakuModelFactory.set_backend(args.backend)
+    KeiyakuModelFactory.set_thread_num(args.threads, 1)
+    keiyakumodel, model, tokenizer = KeiyakuModelFactory.get_keiyakumodel(args.model)
+
+    score_cache = KeiyakuScoreCache(args.sentence_cache if args.sentence_cache != "" else None)
+    worker = KeiyakuPredictWorker(keiyakumodel, tokenizer, model.seq_len, KeiyakuModelFactory.get_model_version(), args.host, args.port, score_cache)
+    print("worker={} model={}".format(worker.url, KeiyakuModelFactory.get_model_version()))
+    worker.serve(args.coordinator)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+from keiyakucpuprofile import KeiyakuCpuProfile
+#oneDNNの設定はTensorFlowのimport前に適用
+KeiyakuCpuProfile.apply_environ()
+
+from keiyakumodelfactory import KeiyakuModelFactory
+from web.keiyakuweb import keiyaku_reindex
+import argparse
+import time
+
+def main():
+    #Web画面でアップロード済の文書を類似検索インデックスへ登録(本番起動中も実行可能)
+    parser = argparse.ArgumentParser(description="アップロード済の文書の類似検索インデックスを作成")
+    parser.add_argument("--rebuild", action="store_true", help="登録済の文書も含めて全文書を再登録")
+    parser.add_argument("--model", default=KeiyakuModelFactory.DEFAULT_MODEL_NAME)
+    parser.add_argument("--backend", choices=[KeiyakuModelFactory.BACKEND_KERAS, KeiyakuModelFactory.BACKEND_TFLITE], default=KeiyakuModelFactory.BACKEND_KERAS)
+    args = parser.parse_args()
+
+    KeiyakuModelFactory.apply_cpu_profile()
+    KeiyakuModelFactory.set_backend(args.backend)
+    KeiyakuModelFactory.set_default_model_name(args.model)
+
+    starttime = time.perf_counter()
+    index_num = keiyaku_reindex(args.rebuild)
+    print("index:{} elapsed:{:.1f}s".format(index_num, time.perf_counter() - starttime))
+
+if __name__ == "__main__":
+    main()
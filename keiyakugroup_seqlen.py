@@ -0,0 +1,77 @@
+from keiyakudata import KeiyakuData
+from keiyakumodelfactory import KeiyakuModelFactory
+import argparse
+import sys
+import numpy as np
+
+#get_keiyaku_indexesで切詰めが発生しない入力長
+UNLIMITED_SEQ_LEN = 10 ** 9
+PERCENTILES = [50, 90, 95, 99]
+
+def get_sentence_lens(keiyakudata: KeiyakuData, tokenizer):
+    #各行の文章・前文章のトークン数(切詰め前、[CLS][SEP]を除く)
+    now_lens = []
+    prev_lens = []
+    for input_ids, _ in keiyakudata.get_group_datas(tokenizer, UNLIMITED_SEQ_LEN):
+        now_ids, prev_ids = tokenizer.split_keiyaku_indexes(input_ids)
+        now_lens.append(len(now_ids) - 2)
+        prev_lens.append(len(prev_ids) - 2)
+
+    return np.array(now_lens, dtype=np.int64), np.array(prev_lens, dtype=np.int64)
+
+def get_truncated_rates(now_lens, prev_lens, seq_len):
+    #get_keiyaku_indexesは文章・前文章それぞれcut_lenを超える場合に先頭・末尾のcut_len/2ずつを残す
+    #(文章・前文章のいずれかが切詰められる行の割合, 切詰めで失われるトークンの割合)
+    cut_len = int((seq_len - 3) / 2)
+    keep_len = int(cut_len / 2) * 2
+    truncated = (now_lens > cut_len) | (prev_lens > cut_len)
+    kept_num = np.where(now_lens > cut_len, keep_len, now_lens).sum() + np.where(prev_lens > cut_len, keep_len, prev_lens).sum()
+    total_num = now_lens.sum() + prev_lens.sum()
+
+    return float(truncated.mean()) if len(truncated) > 0 else 0.0, float(1.0 - kept_num / total_num) if total_num > 0 else 0.0
+
+def get_recommend_seq_len(now_lens, prev_lens, max_seq_len, step, max_truncated_rate):
+    #切詰められる行の割合がmax_truncated_rate以下となるstep単位の最小の入力長(max_seq_lenを超えない)
+    for seq_len in range(step, max_seq_len, step):
+        if get_truncated_rates(now_lens, prev_lens, seq_len)[0] <= max_truncated_rate:
+            return seq_len
+
+    return max_seq_len
+
+def main():
+    parser = argparse.ArgumentParser(description="契約書データのトークン数の分布から入力長(seq_len)を推奨")
+    parser.add_argument("csvpath", help="解析対象の契約書CSV")
+    parser.add_argument("--models", nargs="+", default=[KeiyakuModelFactory.MODEL_NAME_BERT, KeiyakuModelFactory.MODEL_NAME_BERTCOLORFUL, KeiyakuModelFactory.MODEL_NAME_ROBERTA])
+    parser.add_argument("--max-truncated", type=float, default=0.05, help="許容する切詰められる行の割合")
+    parser.add_argument("--step", type=int, default=32, help="推奨する入力長の単位")
+    parser.add_argument("--apply", action="store_true", help="推奨した入力長を保存し、以降のモデル作成時に使用")
+    args = parser.parse_args()
+
+    keiyakudata = KeiyakuData(args.csvpath)
+    recommends = {}
+    print("model,seq_len,truncated_rate,truncated_token_rate,linear_cost,attention_cost")
+    for model_name in args.models:
+        _, tokenizer = KeiyakuModelFactory.get_tokenizer(model_name)
+        now_lens, prev_lens = get_sentence_lens(keiyakudata, tokenizer)
+        pair_lens = now_lens + prev_lens + 3
+        percentiles = np.percentile(pair_lens, PERCENTILES) if len(pair_lens) > 0 else [0] * len(PERCENTILES)
+        print("{} rows={} pair_len {} max={}".format(model_name, len(pair_lens),
+            " ".join([ "p{}={:.0f}".format(p, value) for p, value in zip(PERCENTILES, percentiles) ]), pair_lens.max() if len(pair_lens) > 0 else 0), file=sys.stderr)
+
+        #計算量は線形(全結合層)・2乗(注意機構)の部分それぞれ現在の入力長との比
+        seq_len = KeiyakuModelFactory.get_seq_len(model_name)
+        recommend = get_recommend_seq_len(now_lens, prev_lens, KeiyakuModelFactory.DEFAULT_SEQ_LEN, args.step, args.max_truncated)
+        for candidate in sorted(set(list(range(args.step, KeiyakuModelFactory.DEFAULT_SEQ_LEN, args.step)) + [KeiyakuModelFactory.DEFAULT_SEQ_LEN, seq_len])):
+            truncated_rate, truncated_token_rate = get_truncated_rates(now_lens, prev_lens, candidate)
+            print("{},{},{:.4f},{:.4f},{:.2f},{:.2f}".format(model_name, candidate, truncated_rate, truncated_token_rate, candidate / seq_len, (candidate / seq_len) ** 2))
+
+        print("{} seq_len={} recommend={} truncated_rate={:.4f}".format(model_name, seq_len, recommend, get_truncated_rates(now_lens, prev_lens, recommend)[0]), file=sys.stderr)
+        recommends[model_name] = recommend
+
+    if args.apply:
+        for model_name, recommend in recommends.items():
+            KeiyakuModelFactory.save_seq_len(KeiyakuModelFactory.SEQ_LEN_MODEL_NAMES.get(model_name, model_name), recommend)
+            print("{} seq_len={} saved".format(model_name, recommend), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+from keiyakudata import KeiyakuData, KeiyakuTokenizedDatas
+from keiyakumodel import KeiyakuModel
+from keiyakumodelfactory import KeiyakuModelFactory
+from transformersbase import TransformersBase
+import argparse
+import datetime
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+import traceback
+import pandas as pd
+
+SWEEP_PARAMS = ["seq_len"] + KeiyakuModel.TRAIN_PARAMS
+LEADERBOARD_FILE = "leaderboard.csv"
+PROGRESS_DIR = "progress"
+TOKENIZED_DIR = "tokenized"
+
+def parse_param(text):
+    #name=値1,値2,... または name=最小値:最大値(ランダム探索のみ)
+    name, _, values = text.partition("=")
+    if name not in SWEEP_PARAMS or values == "":
+        raise argparse.ArgumentTypeError("param error(param={}, names={})".format(text, SWEEP_PARAMS))
+
+    if ":" in values:
+        low, high = values.split(":")
+        return name, (to_value(low), to_value(high))
+
+    return name, [ to_value(value) for value in values.split(",") ]
+
+def to_value(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+def get_trial_params(params, trial_num, seed):
+    #trial_num未指定時は全組合せ(グリッド探索)、指定時はtrial_num件をランダムに選択
+    #範囲指定の値は整数は一様分布、小数は対数一様分布から選択
+    if trial_num is None:
+        if any([ isinstance(values, tuple) for _, values in params ]):
+            raise ValueError("range param is random search only")
+
+        return [ dict(zip([ name for name, _ in params ], values)) for values in itertools.product(*[ values for _, values in params ]) ]
+
+    rand = random.Random(seed)
+    trial_params = []
+    for _ in range(trial_num):
+        trial_param = {}
+        for name, values in params:
+            if isinstance(values, list):
+                trial_param[name] = rand.choice(values)
+            elif isinstance(values[0], int) and isinstance(values[1], int):
+                trial_param[name] = rand.randint(values[0], values[1])
+            else:
+                trial_param[name] = math.exp(rand.uniform(math.log(values[0]), math.log(values[1])))
+        trial_params.append(trial_param)
+
+    return trial_params
+
+def init_worker(thread_num, layer_num, pooling):
+    KeiyakuModelFactory.set_thread_num(thread_num, 1)
+    KeiyakuModelFactory.set_layer_num(layer_num, pooling)
+
+def train_trial(task):
+    trial, model_name, params, tokenized_dir, epoch_num, save_dir, progress_dir, stop_args = task
+    starttime = time.perf_counter()
+    try:
+        KeiyakuModelFactory.set_seq_len(params.get("seq_len"))
+        keiyakumodel, _, _ = KeiyakuModelFactory.get_keiyakumodel(model_name, loadweight=False)
+        keiyakumodel.set_train_params({ name: value for name, value in params.items() if name != "seq_len" })
+
+        callback = KeiyakuModel.MedianStoppingCallback(progress_dir, "trial{:03d}".format(trial), **stop_args)
+        score = keiyakumodel.train_model(KeiyakuTokenizedDatas(tokenized_dir), epoch_num, save_dir, callbacks=[callback])
+
+        return trial, { key: float(value) for key, value in score.items() }, len(callback.history), callback.stopped_epoch, time.perf_counter() - starttime, None
+    except Exception:
+        return trial, {}, 0, 0, time.perf_counter() - starttime, traceback.format_exc()
+
+def create_leaderboard(results, metric, mode):
+    #各試行のparameter.jsonと評価値を1行にまとめ、metricの良い順に並べる
+    rows = []
+    for result in results:
+        row = { "trial": result["trial"], "save_dir": result["save_dir"], "epochs": result["epochs"], "stopped_epoch": result["stopped_epoch"],
+            "seconds": result["seconds"], "error": result["error"] is not None }
+        parameter_path = os.path.join(result["save_dir"], "parameter.json")
+        if os.path.isfile(parameter_path):
+            with open(parameter_path, encoding="utf-8") as f:
+                row.update(json.load(f))
+        else:
+            row.update(result["params"])
+        row.update(result["score"])
+        rows.append(row)
+
+    df = pd.DataFrame(rows)
+    if metric in df.columns:
+        df = df.sort_values(metric, ascending=(mode == "min"), na_position="last")
+
+    return df
+
+def main():
+    cpu_num = multiprocessing.cpu_count()
+
+    parser = argparse.ArgumentParser(description="学習設定のパラメータ探索(各試行を別プロセスで並行学習)")
+    parser.add_argument("csvpath", help="学習用の契約書CSV")
+    parser.add_argument("--param", type=parse_param, action="append", required=True,
+        help="探索するパラメータ(name=値1,値2,... / name=最小値:最大値) name: {}".format(",".join(SWEEP_PARAMS)))
+    parser.add_argument("--trials", type=int, default=None, help="ランダム探索の試行数(未指定時は全組合せ)")
+    parser.add_argument("--model", default=KeiyakuModelFactory.DEFAULT_MODEL_NAME)
+    parser.add_argument("--layers", type=int, default=None, help="使用層数(未指定時は全層)")
+    parser.add_argument("--pooling", choices=[TransformersBase.POOLING_POOLER, TransformersBase.POOLING_CLS], default=TransformersBase.POOLING_POOLER)
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--parallel", type=int, default=None, help="同時に学習する試行数(未指定時はコア数/threads)")
+    parser.add_argument("--threads", type=int, default=None, help="1試行あたりの演算スレッド数(未指定時はコアを試行で等分)")
+    parser.add_argument("--metric", default="loss", help="順位付けする評価値(評価データのevaluate結果)")
+    parser.add_argument("--mode", choices=["min", "max"], default="min")
+    parser.add_argument("--stop-monitor", default="val_loss", help="打切り判定に使用するエポック毎の値")
+    parser.add_argument("--stop-mode", choices=["min", "max"], default="min")
+    parser.add_argument("--grace-epochs", type=int, default=2, help="打切り判定を行わないエポック数")
+    parser.add_argument("--min-trials", type=int, default=3, help="打切り判定に必要な比較対象の試行数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-dir", default="savedir")
+    args = parser.parse_args()
+
+    try:
+        trial_params = get_trial_params(args.param, args.trials, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.threads is not None:
+        parallel = args.parallel if args.parallel is not None else max(min(len(trial_params), cpu_num // args.threads), 1)
+        thread_num = args.threads
+    else:
+        parallel = args.parallel if args.parallel is not None else max(min(len(trial_params), cpu_num), 1)
+        thread_num = max(cpu_num // parallel, 1)
+
+    KeiyakuModelFactory.set_layer_num(args.layers, args.pooling)
+    model, tokenizer = KeiyakuModelFactory.get_tokenizer(args.model)
+    save_dir = os.path.join(args.save_dir, "{}_sweep_{}_{}".format(datetime.datetime.now().strftime('%Y%m%d%H%M%S'), model.model_name, KeiyakuModelFactory.get_weight_name(args.model)))
+    progress_dir = os.path.join(save_dir, PROGRESS_DIR)
+
+    #トークナイズは入力長毎に1回のみ行い、同じ入力長の試行で共有
+    keiyakudata = KeiyakuData(args.csvpath)
+    tokenized_dirs = {}
+    for seq_len in sorted(set([ params.get("seq_len", model.seq_len) for params in trial_params ])):
+        tokenized_dirs[seq_len] = os.path.join(save_dir, TOKENIZED_DIR, str(seq_len))
+        KeiyakuTokenizedDatas.create(keiyakudata.get_study_group_datas(tokenizer, seq_len), seq_len, tokenized_dirs[seq_len])
+
+    stop_args = { "monitor": args.stop_monitor, "mode": args.stop_mode, "grace_epoch": args.grace_epochs, "min_trials": args.min_trials }
+    tasks = []
+    for trial, params in enumerate(trial_params):
+        tokenized_dir = tokenized_dirs[params.get("seq_len", model.seq_len)]
+        tasks.append((trial, args.model, params, tokenized_dir, args.epochs, os.path.join(save_dir, "trial{:03d}".format(trial)), progress_dir, stop_args))
+
+    print("trials={} parallel={} threads={} save_dir={}".format(len(tasks), parallel, thread_num, save_dir), file=sys.stderr)
+
+    #TensorFlowはfork後の子プロセスで動作しないため、spawnでプロセスを起動
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(parallel, initializer=init_worker, initargs=(thread_num, args.layers, args.pooling), maxtasksperchild=1) as pool:
+        for trial, score, epochs, stopped_epoch, elapsed, error in pool.imap_unordered(train_trial, tasks):
+            results.append({ "trial": trial, "params": tasks[trial][2], "save_dir": tasks[trial][5], "epochs": epochs, "stopped_epoch": stopped_epoch,
+                "seconds": round(elapsed, 3), "score": score, "error": error })
+            if error is not None:
+                print("trial{:03d} error\n{}".format(trial, error), file=sys.stderr)
+            else:
+                print("trial{:03d} {}={:.4f} epochs={}{} {:.1f}s {}".format(trial, args.metric, score.get(args.metric, float("nan")), epochs,
+                    "(stopped)" if stopped_epoch > 0 else "", elapsed, tasks[trial][2]), file=sys.stderr)
+
+            #途中経過も確認できるよう試行完了毎に更新
+            leaderboard = create_leaderboard(results, args.metric, args.mode)
+            leaderboard.to_csv(os.path.join(save_dir, LEADERBOARD_FILE), index=False)
+
+    print(leaderboard.head(10).to_string(index=False))
+
+    if any([ result["error"] is not None for result in results ]):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+from keiyakudata import KeiyakuData, KeiyakuTokenizedDatas
+from keiyakumodelfactory import KeiyakuModelFactory
+from transformersbase import TransformersBase
+import argparse
+import datetime
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+TOKENIZED_DIR = "tokenized"
+
+def get_local_hosts(worker_num, port):
+    return [ "localhost:{}".format(port + i) for i in range(worker_num) ]
+
+def train_worker(task):
+    #TensorFlowの初回実行前にスレッド数・分散学習の設定が必要なため、各ワーカーは新しいプロセスで実行
+    worker_hosts, task_index, model_name, tokenized_dir, epoch_num, save_dir, thread_num, layer_num, pooling, train_params = task
+    starttime = time.perf_counter()
+    try:
+        KeiyakuModelFactory.set_thread_num(thread_num, 1)
+        KeiyakuModelFactory.set_distributed(worker_hosts, task_index)
+        KeiyakuModelFactory.set_layer_num(layer_num, pooling)
+        keiyakumodel, _, _ = KeiyakuModelFactory.get_keiyakumodel(model_name, loadweight=False)
+        keiyakumodel.set_train_params(train_params)
+
+        score = keiyakumodel.train_model(KeiyakuTokenizedDatas(tokenized_dir), epoch_num, save_dir)
+        return task_index, { key: float(value) for key, value in score.items() }, time.perf_counter() - starttime, None
+    except Exception:
+        return task_index, {}, time.perf_counter() - starttime, traceback.format_exc()
+
+def train_local(model_name, tokenized_dir, worker_num, thread_num, port, epoch_num, save_dir, layer_num, pooling, train_params):
+    #同じマシンでworker_num個のワーカーを起動して学習し、ワーカー毎の(task_index, 評価値, 処理時間)を返す
+    #1ワーカーでも異常終了すると他のワーカーが勾配の集約で待ち続けるため、全ワーカーを終了してRuntimeError
+    worker_hosts = get_local_hosts(worker_num, port)
+    tasks = [ (worker_hosts, i, model_name, tokenized_dir, epoch_num, save_dir, thread_num, layer_num, pooling, train_params) for i in range(worker_num) ]
+
+    #TensorFlowはfork後の子プロセスで動作しないため、spawnでプロセスを起動
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(worker_num, maxtasksperchild=1) as pool:
+        for task_index, score, elapsed, error in pool.imap_unordered(train_worker, tasks):
+            if error is not None:
+                pool.terminate()
+                raise RuntimeError("worker{} error\n{}".format(task_index, error))
+            results.append((task_index, score, elapsed))
+
+    return sorted(results)
+
+def main():
+    cpu_num = multiprocessing.cpu_count()
+
+    parser = argparse.ArgumentParser(description="複数ワーカーでのデータ並列学習(各ワーカーのバッチの勾配を集約して重みを更新)")
+    parser.add_argument("csvpath", help="学習用の契約書CSV")
+    parser.add_argument("--model", default=KeiyakuModelFactory.DEFAULT_MODEL_NAME)
+    parser.add_argument("--layers", type=int, default=None, help="使用層数(未指定時は全層)")
+    parser.add_argument("--pooling", choices=[TransformersBase.POOLING_POOLER, TransformersBase.POOLING_CLS], default=TransformersBase.POOLING_POOLER)
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=2, help="同じマシンで起動するワーカー数(--cluster指定時は無視)")
+    parser.add_argument("--port", type=int, default=23456, help="同じマシンのワーカーが使用する先頭のポート番号")
+    parser.add_argument("--cluster", nargs="+", default=None, help="複数マシンで学習する場合の全ワーカーのhost:port(各マシンで同じ順に指定)")
+    parser.add_argument("--task-index", type=int, default=0, help="--cluster指定時の自マシンの順番(0のワーカーがchiefとして結果を出力)")
+    parser.add_argument("--threads", type=int, default=None, help="1ワーカーあたりの演算スレッド数(未指定時はコアを同じマシンのワーカーで等分)")
+    parser.add_argument("--batch-size", type=int, default=None, help="1ワーカーあたりのバッチサイズ(全体のバッチはbatch_size×ワーカー数)")
+    parser.add_argument("--patience", type=int, default=0, help="改善しないエポック数がpatienceに達した場合に打切り(0の場合は打切らない)")
+    parser.add_argument("--validation-samples", type=int, default=0, help="学習中の評価に使用する評価データの抽出件数(0の場合は全件)")
+    parser.add_argument("--save-dir", default="savedir")
+    args = parser.parse_args()
+
+    local_worker_num = args.workers if args.cluster is None else 1
+    thread_num = args.threads if args.threads is not None else max(cpu_num // local_worker_num, 1)
+
+    KeiyakuModelFactory.set_layer_num(args.layers, args.pooling)
+    model, tokenizer = KeiyakuModelFactory.get_tokenizer(args.model)
+    save_dir = os.path.join(args.save_dir, "{}_{}_{}".format(datetime.datetime.now().strftime('%Y%m%d%H%M%S'), model.model_name, KeiyakuModelFactory.get_weight_name(args.model)))
+
+    #トークナイズは1回のみ行い、同じマシンの全ワーカーで共有
+    tokenized_dir = os.path.join(save_dir, TOKENIZED_DIR)
+    datas = KeiyakuTokenizedDatas.create(KeiyakuData(args.csvpath).get_study_group_datas(tokenizer, model.seq_len), model.seq_len, tokenized_dir)
+
+    train_params = { "early_stopping_patience": args.patience, "validation_sample_num": args.validation_samples }
+    if args.batch_size is not None:
+        train_params["batch_size"] = args.batch_size
+
+    starttime = time.perf_counter()
+    if args.cluster is None:
+        print("rows={} workers={} threads={} save_dir={}".format(len(datas), args.workers, thread_num, save_dir), file=sys.stderr)
+        try:
+            results = train_local(args.model, tokenized_dir, args.workers, thread_num, args.port, args.epochs, save_dir, args.layers, args.pooling, train_params)
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        score = results[0][1]
+    else:
+        print("rows={} workers={} task_index={} threads={} save_dir={}".format(len(datas), len(args.cluster), args.task_index, thread_num, save_dir), file=sys.stderr)
+        _, score, _, error = train_worker((args.cluster, args.task_index, args.model, tokenized_dir, args.epochs, save_dir, thread_num, args.layers, args.pooling, train_params))
+        if error is not None:
+            print(error, file=sys.stderr)
+            sys.exit(1)
+
+    print("loss={:.4f} output1_fvalue={:.4f} output2_fvalue={:.4f} {:.1f}s".format(score.get("loss", 0.0), score.get("output1_fvalue", 0.0), score.get("output2_fvalue", 0.0),
+        time.perf_counter() - starttime), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
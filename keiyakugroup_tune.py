@@ -0,0 +1,97 @@
+from keiyakucpuprofile import KeiyakuCpuProfile
+from keiyakudata import KeiyakuData
+from keiyakumodelfactory import KeiyakuModelFactory
+import argparse
+import datetime
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+def get_default_intra_op_nums(cpu_num):
+    return sorted(set([ max(cpu_num // i, 1) for i in [1, 2, 4] ]), reverse=True)
+
+def measure_predict(task):
+    #スレッド数はTensorFlowの初回実行前のみ設定可能なため、設定毎に新しいプロセスで計測し、batch_size毎の(1秒あたりの予測行数)を返す
+    model_name, backend, csvpath, row_num, repeat, intra_op_num, inter_op_num, batch_sizes = task
+    KeiyakuModelFactory.set_thread_num(intra_op_num, inter_op_num)
+    KeiyakuModelFactory.set_backend(backend)
+    #速度は重みの値に依存しないため、TFLite以外は重みを読込まない
+    keiyakumodel, model, tokenizer = KeiyakuModelFactory.get_keiyakumodel(model_name, loadweight=(backend == KeiyakuModelFactory.BACKEND_TFLITE))
+
+    datas = KeiyakuData(csvpath).get_group_datas(tokenizer, model.seq_len)
+    datas = (datas * (row_num // len(datas) + 1))[:row_num]
+
+    results = []
+    for batch_size in batch_sizes:
+        keiyakumodel.predict_batch_size = batch_size
+        #初回はグラフ構築を含むため除き、repeat回の最短時間
+        keiyakumodel.predict(datas)
+        seconds = []
+        for _ in range(repeat):
+            starttime = time.perf_counter()
+            keiyakumodel.predict(datas)
+            seconds.append(time.perf_counter() - starttime)
+        results.append((batch_size, len(datas) / min(seconds)))
+
+    return results
+
+def main():
+    cpu_num = multiprocessing.cpu_count()
+
+    parser = argparse.ArgumentParser(description="現在のホストで予測が最も速いTensorFlowの実行設定(演算スレッド数・バッチサイズ・oneDNN)を計測し保存")
+    parser.add_argument("csvpath", help="計測に使用する契約書CSV")
+    parser.add_argument("--model", default=KeiyakuModelFactory.DEFAULT_MODEL_NAME)
+    parser.add_argument("--backend", choices=[KeiyakuModelFactory.BACKEND_KERAS, KeiyakuModelFactory.BACKEND_TFLITE], default=KeiyakuModelFactory.BACKEND_KERAS)
+    parser.add_argument("--intra", type=int, nargs="+", default=get_default_intra_op_nums(cpu_num), help="演算内の並列スレッド数")
+    parser.add_argument("--inter", type=int, nargs="+", default=[1, 2], help="演算間の並列スレッド数")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 20, 32, 64])
+    parser.add_argument("--onednn", type=int, nargs="+", choices=[0, 1], default=[1, 0], help="oneDNNの有無(1:有効、0:無効)")
+    parser.add_argument("--rows", type=int, default=200, help="1回の計測で予測する行数")
+    parser.add_argument("--repeat", type=int, default=3, help="計測回数(最短時間を使用)")
+    parser.add_argument("--dry-run", action="store_true", help="計測結果を表示するのみで設定を保存しない")
+    args = parser.parse_args()
+
+    print("onednn,intra_op_num,inter_op_num,batch_size,rows_per_sec")
+    best = None
+    context = multiprocessing.get_context("spawn")
+    environ = os.environ.get(KeiyakuCpuProfile.ENV_ONEDNN)
+    for onednn in args.onednn:
+        #oneDNNの有無はTensorFlowのimport時に決まるため、環境変数を指定して子プロセスを起動
+        os.environ[KeiyakuCpuProfile.ENV_ONEDNN] = str(onednn)
+        for intra_op_num in args.intra:
+            for inter_op_num in args.inter:
+                task = (args.model, args.backend, args.csvpath, args.rows, args.repeat, intra_op_num, inter_op_num, args.batch_sizes)
+                try:
+                    with ProcessPoolExecutor(1, mp_context=context) as executor:
+                        results = executor.submit(measure_predict, task).result()
+                except Exception:
+                    print("onednn={} intra_op_num={} inter_op_num={} error\n{}".format(onednn, intra_op_num, inter_op_num, traceback.format_exc()), file=sys.stderr)
+                    continue
+
+                for batch_size, rows_per_sec in results:
+                    print("{},{},{},{},{:.2f}".format(onednn, intra_op_num, inter_op_num, batch_size, rows_per_sec))
+                    if best is None or rows_per_sec > best["rows_per_sec"]:
+                        best = { "onednn": onednn == 1, "intra_op_num": intra_op_num, "inter_op_num": inter_op_num, "batch_size": batch_size, "rows_per_sec": rows_per_sec }
+                sys.stdout.flush()
+
+    if environ is not None:
+        os.environ[KeiyakuCpuProfile.ENV_ONEDNN] = environ
+    else:
+        os.environ.pop(KeiyakuCpuProfile.ENV_ONEDNN, None)
+
+    if best is None:
+        print("no result", file=sys.stderr)
+        sys.exit(1)
+
+    best.update({ "model": args.model, "backend": args.backend, "seq_len": KeiyakuModelFactory.get_seq_len(args.model),
+        "created": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S') })
+    print("best {}".format(best), file=sys.stderr)
+    if args.dry_run == False:
+        KeiyakuCpuProfile.save(best)
+        print("saved {}".format(KeiyakuCpuProfile.PROFILE_PATH), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
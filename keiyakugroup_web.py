@@ -1,11 +1,34 @@
-import web.keiyakuweb
-from keiyakumodelfactory import KeiyakuModelFactory
-from web.keiyakuweb import init_web
-import sys
-
-if __name__ == "__main__":
-    debugmode = True
-    if len(sys.argv) >= 2 and sys.argv[1] == "release":
-        debugmode = False
-
-    init_web(debugmode)
\ No newline at end of file
+from keiyakucpuprofile import KeiyakuCpuProfile
+#oneDNNの設定はTensorFlowのimport前に適用
+KeiyakuCpuProfile.apply_environ()
+
+import web.keiyakuweb
+from keiyakumodelfactory import KeiyakuModelFactory
+from web.keiyakuweb import init_web
+import sys
+
+if __name__ == "__main__":
+    #production [ワーカー数] [ポート] [keras|tflite] [モデル名]: 複数ワーカーでの本番起動、reload: 本番起動中ワーカーの再起動
+    if len(sys.argv) >= 2 and sys.argv[1] == "production":
+        from web.keiyakuwebserver import init_web_server
+        worker_num = int(sys.argv[2]) if len(sys.argv) >= 3 else None
+        port = int(sys.argv[3]) if len(sys.argv) >= 4 else 80
+        if len(sys.argv) >= 5:
+            KeiyakuModelFactory.set_backend(sys.argv[4])
+        if len(sys.argv) >= 6:
+            KeiyakuModelFactory.set_default_model_name(sys.argv[5])
+        init_web_server(worker_num, port)
+    elif len(sys.argv) >= 2 and sys.argv[1] == "reload":
+        from web.keiyakuwebserver import reload_web_server
+        reload_web_server()
+    else:
+        #release [keras|tflite] [モデル名]
+        debugmode = True
+        if len(sys.argv) >= 2 and sys.argv[1] == "release":
+            debugmode = False
+            if len(sys.argv) >= 3:
+                KeiyakuModelFactory.set_backend(sys.argv[2])
+            if len(sys.argv) >= 4:
+                KeiyakuModelFactory.set_default_model_name(sys.argv[3])
+
+        init_web(debugmode)
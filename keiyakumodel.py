@@ -1,224 +1,585 @@
-import numpy as np
-import pandas as pd
-import random
-import os
-import tensorflow as tf
-import matplotlib.pyplot as plt
-import japanize_matplotlib
-import json
-from kerasscore import KerasScore
-from transformersbase import TransformersBase, TransformersTokenizerBase
-
-class KeiyakuModel:
-    def __init__(self, tokenizer: TransformersTokenizerBase, output_class1_num=6):
-        self.bert_model = None
-        self.model = None
-        self.tokenizer = tokenizer
-        
-        self.seq_len = 0
-        self.output_class1_num = output_class1_num
-
-        #学習設定
-        self.pre_epoch = 5
-        self.train_data_split = 0.8
-        self.batch_size = 20
-        self.learn_rate_init= 0.0001
-        self.learn_rate_epoch = 2
-        self.learn_rate_percent = 0.5
-        
-        self.optimizer="adam"
-        self.loss=["binary_crossentropy", "categorical_crossentropy"]
-        self.metrics=[
-            [KerasScore(KerasScore.TYPE_TP), KerasScore(KerasScore.TYPE_TN),
-            KerasScore(KerasScore.TYPE_FP), KerasScore(KerasScore.TYPE_FN), 
-            KerasScore(KerasScore.TYPE_ACCURACY), KerasScore(KerasScore.TYPE_PRECISION),
-            KerasScore(KerasScore.TYPE_RECALL), KerasScore(KerasScore.TYPE_FVALUE)],
-            [KerasScore(KerasScore.TYPE_TP, self.output_class1_num), KerasScore(KerasScore.TYPE_TN, self.output_class1_num),
-            KerasScore(KerasScore.TYPE_FP, self.output_class1_num), KerasScore(KerasScore.TYPE_FN, self.output_class1_num), 
-            KerasScore(KerasScore.TYPE_ACCURACY, self.output_class1_num), KerasScore(KerasScore.TYPE_PRECISION, self.output_class1_num),
-            KerasScore(KerasScore.TYPE_RECALL, self.output_class1_num), KerasScore(KerasScore.TYPE_FVALUE, self.output_class1_num)],
-            ]
-
-    def init_model(self, bert: TransformersBase):
-        self.seq_len = bert.seq_len
-        self.bert_model = bert
-
-        bert_layer = self.bert_model.get_transformers_output()
-        output_tensor = tf.keras.layers.Dropout(0.5)(bert_layer)
-        output_tensor1 = tf.keras.layers.Dense(1, activation='sigmoid', name="output1")(output_tensor)
-        output_tensor2 = tf.keras.layers.Dense(self.output_class1_num, activation='softmax', name="output2")(output_tensor)
-        self.model = tf.keras.models.Model(self.bert_model.get_inputs(), [output_tensor1, output_tensor2])
-
-    def load_weight(self, weight_path):
-        self.model.load_weights(weight_path)
-        
-    def train_model(self, datas, epoch_num, save_dir):
-        #データ準備
-        train_data_num = int(len(datas) * self.train_data_split)
-        train_datas = datas[:train_data_num]
-        test_datas = datas[train_data_num:]
-
-        random.shuffle(train_datas)
-        
-        train_steps_per_epoch = len(train_datas) // self.batch_size
-        test_steps_per_epoch = len(test_datas) // self.batch_size
-        
-        #モデル情報保存
-        os.makedirs(save_dir, exist_ok=True)
-        with open(os.path.join(save_dir, 'model_summary.txt'), "w") as fp:
-            self.model.summary(print_fn=lambda x: fp.write(x + "\n"))
-
-        try:
-            open(os.path.join(save_dir, 'model.json'), 'w').write(self.model.to_json())
-        except NotImplementedError:
-            print("to_json is NotImplemented")
-
-        #モデル学習(全結合層)
-        self.bert_model.set_trainable(False)
-        self.model.compile(optimizer=self.optimizer, loss=self.loss, metrics='accuracy')
-
-        self.model.fit(self._generator_data(train_datas, self.batch_size), 
-            validation_data=self._generator_data(test_datas, self.batch_size),
-            steps_per_epoch=train_steps_per_epoch, validation_steps=test_steps_per_epoch,
-            batch_size=self.batch_size, epochs=self.pre_epoch)
-
-        #モデル学習(全体)
-        self.bert_model.set_trainable(True)
-        self.model.compile(optimizer=self.optimizer, loss=self.loss, metrics=self.metrics)
-
-        self.model.fit(self._generator_data(train_datas, self.batch_size), 
-            validation_data=self._generator_data(test_datas, self.batch_size),
-            steps_per_epoch=train_steps_per_epoch, validation_steps=test_steps_per_epoch,
-            batch_size=self.batch_size, epochs=epoch_num, callbacks=self._get_callbacks(save_dir))
-
-        #モデル結果保存
-        testscore = self.model.evaluate(self._generator_data(test_datas, self.batch_size),
-            steps=test_steps_per_epoch, batch_size=self.batch_size, verbose=2)
-
-        self.model.save_weights(os.path.join(save_dir, 'weights_last-{:.2f}'.format(testscore[0])))
-        self._create_paramfile(os.path.join(save_dir, 'parameter.json'))
-
-    def predict(self, datas):
-        steps_per_epoch = (len(datas) // self.batch_size)
-        
-        mod_data_num = len(datas) % self.batch_size
-
-        result = self.model.predict(self._generator_data(datas, self.batch_size),
-            steps=steps_per_epoch, batch_size=self.batch_size)
-
-        if mod_data_num > 0:
-            mod_result = self.model.predict(self._generator_data(datas[-mod_data_num:], mod_data_num), steps=1, batch_size=mod_data_num)
-            result[0] = np.concatenate([result[0], mod_result[0]])
-            result[1] = np.concatenate([result[1], mod_result[1]])
-
-        return result
-
-    def _get_learn_rate(self, epoch):
-        return self.learn_rate_init * (self.learn_rate_percent ** (epoch // self.learn_rate_epoch))
-
-    class ResultOutputCallback(tf.keras.callbacks.Callback):
-        SAVE_ROWS = ["epoch", "loss",
-            "output1_loss", "output1_tp", "output1_tn", "output1_fp", "output1_fn", "output1_accuracy", "output1_precision", "output1_recall", "output1_fvalue",
-            "output2_loss", "output2_tp", "output2_tn", "output2_fp", "output2_fn", "output2_accuracy", "output2_precision", "output2_recall", "output2_fvalue",
-            "val_loss",
-            "val_output1_loss", "val_output1_tp", "val_output1_tn", "val_output1_fp", "val_output1_fn", "val_output1_accuracy", "val_output1_precision", "val_output1_recall", "val_output1_fvalue",
-            "val_output2_loss", "val_output2_tp", "val_output2_tn", "val_output2_fp", "val_output2_fn", "val_output2_accuracy", "val_output2_precision", "val_output2_recall", "val_output2_fvalue",
-            ]
-
-        def __init__(self, save_dir):
-            self.df = pd.DataFrame(columns=self.SAVE_ROWS)
-            self.save_dir = save_dir
-            self.save_csv = os.path.join(self.save_dir, "result_data.csv")
-
-        def on_epoch_end(self, epoch, logs={}):
-            values = [epoch+1] + [logs[key] for key in self.SAVE_ROWS if key != "epoch" and key in logs]
-
-            self.df = self.df.append(pd.Series(values, index = self.SAVE_ROWS), ignore_index = True)
-            self.df.to_csv(self.save_csv, index = False)
-
-        def on_train_end(self, logs={}):
-            self._create_graph("文章グループ化", self.df, "epoch", ["val_output1_fvalue", "val_output1_precision", "val_output1_recall"], ["output1_loss", "val_output1_loss"], os.path.join(self.save_dir, "result_graph1.png"))
-            self._create_graph("文章分類", self.df, "epoch", ["val_output2_fvalue", "val_output2_precision", "val_output2_recall"], ["output2_loss", "val_output2_loss"], os.path.join(self.save_dir, "result_graph2.png"))
-        
-        def _create_graph(self, title, datas, xlabel, ylabels1, ylabels2, savefile):
-            # GPU環境でnp.dotがabortするため機能削除し、空ファイル作成に変更(原因不明)
-            # xvalue = datas[xlabel].values
-            # yvalues1 = [ datas[label].values for label in ylabels1 ]
-            # yvalues2 = [ datas[label].values for label in ylabels2 ]
-            
-            # fig = plt.figure()
-            # ax1 = fig.add_subplot(1, 1, 1)
-            # ax2 = ax1.twinx()
-
-            # for yvalue, ylabel in zip(yvalues1, ylabels1):
-            #     ax1.plot(xvalue, yvalue, marker='*', label=ylabel)
-
-            # for yvalue, ylabel in zip(yvalues2, ylabels2):
-            #     ax2.plot(xvalue, yvalue, marker='o', label=ylabel)
-
-            # ax1.set_ylim(0, 1)
-            # ax1.set_yticks(np.arange(0, 1.01, step=0.1))
-            # handler1, label1 = ax1.get_legend_handles_labels()
-
-            # ax2.set_ylim(0, 1.5)
-            # ax2.set_yticks(np.arange(0, 1.51, step=0.1))
-            # handler2, label2 = ax2.get_legend_handles_labels()
-
-            # ax1.set_title(title)
-            # ax1.set_xticks(xvalue)
-            # ax1.legend(handler1 + handler2, label1 + label2, loc='upper left', borderaxespad=0.)
-            
-            # plt.savefig(savefile)
-            import pathlib
-            pathlib.Path(savefile).touch()
-
-    def _get_callbacks(self, save_dir):
-        callbacks = []
-
-        callbacks.append(tf.keras.callbacks.ModelCheckpoint(
-                filepath=os.path.join(save_dir, 'weights_{epoch:03d}-{loss:.2f}-{output1_fvalue:.2f}-{output2_fvalue:.2f}-{val_loss:.2f}-{val_output1_fvalue:.2f}-{val_output2_fvalue:.2f}'),
-                monitor='val_loss',
-                verbose=1,
-                save_weights_only=True,
-                save_best_only=True,
-                mode='auto'))
-        
-        callbacks.append(self.ResultOutputCallback(save_dir))
-        callbacks.append(tf.keras.callbacks.LearningRateScheduler(self._get_learn_rate))
-
-        return callbacks
-
-    def _generator_data(self, all_datas, batch_size):
-        dummy_inputs = self.tokenizer.keiyaku_encode(all_datas[0][0], self.seq_len)
-        input_num = len(dummy_inputs)
-
-        while True:
-            for step in range(len(all_datas) // batch_size):
-                datas = all_datas[step*batch_size:(step+1)*batch_size]
-
-                x_outs = [ np.zeros((batch_size, self.seq_len), dtype=np.int32) for _ in range(input_num)]
-                y_out1 = np.zeros((batch_size,))
-                y_out2 = np.zeros((batch_size, self.output_class1_num))
-
-                for i in range(batch_size):
-                    datas_inputs = self.tokenizer.keiyaku_encode(datas[i][0], self.seq_len)
-                    datas_outputs = datas[i][1]
-
-                    for j, datas_input in enumerate(datas_inputs):
-                        x_outs[j][i, :] = datas_input[:]
-
-                    y_out1[i] = datas_outputs[0]
-                    y_out2[i, :] = tf.keras.utils.to_categorical(datas_outputs[1], num_classes=self.output_class1_num)
-                        
-                yield x_outs, [y_out1, y_out2]
-
-    def _create_paramfile(self, savefile):
-        with open(savefile, "w", encoding="utf-8") as f:
-            data = {}
-            data["batch_size"] = self.batch_size
-            data["seq_len"] = self.seq_len
-            data["pre_epoch"] = self.pre_epoch
-            data["learn_rate_init"] = self.learn_rate_init
-            data["learn_rate_epoch"] = self.learn_rate_epoch
-            data["learn_rate_percent"] = self.learn_rate_percent
+import numpy as np
+import pandas as pd
+import random
+import os
+import tensorflow as tf
+import matplotlib.pyplot as plt
+import japanize_matplotlib
+import json
+import time
+import shutil
+import tempfile
+from kerasscore import KerasScore
+from keiyakudata import KeiyakuTokenizedDatas
+from transformersbase import TransformersBase, TransformersTokenizerBase
+
+class KeiyakuModel:
+    QUANTIZE_NONE="none"
+    QUANTIZE_DYNAMIC="dynamic"
+    QUANTIZE_INT8="int8"
+
+    #set_train_paramsで変更可能な学習設定
+    TRAIN_PARAMS=["batch_size", "pre_epoch", "learn_rate_init", "learn_rate_epoch", "learn_rate_percent", "early_stopping_patience", "validation_sample_num",
+        "train_layer_num", "unfreeze_epoch", "freeze_embeddings", "recompute_grad"]
+
+    def __init__(self, tokenizer: TransformersTokenizerBase, output_class1_num=6):
+        self.bert_model = None
+        self.model = None
+        self.embedding_model = None
+        self.tokenizer = tokenizer
+        
+        self.seq_len = 0
+        self.output_class1_num = output_class1_num
+        #予測時のバッチサイズ(0の場合はbatch_size)
+        self.predict_batch_size = 0
+
+        #学習設定
+        self.pre_epoch = 5
+        self.train_data_split = 0.8
+        self.batch_size = 20
+        self.learn_rate_init= 0.0001
+        self.learn_rate_epoch = 2
+        self.learn_rate_percent = 0.5
+        #early_stopping_patienceエポック改善しない場合に打切り、最良エポックの重みに戻す(0の場合は打切らない)
+        self.early_stopping_monitor = "val_loss"
+        self.early_stopping_patience = 0
+        #学習中の評価は評価データから分類毎に抽出した固定のvalidation_sample_num件で行い、全件の評価は学習後のみ行う(0の場合は毎回全件)
+        self.validation_sample_num = 0
+        #全体の学習は上位train_layer_num層とpoolerのみ行い、下位層・埋込み層は逆伝播しない(0の場合は全層)
+        #unfreeze_epoch指定時はunfreeze_epochエポック毎に学習する層を1層ずつ下位へ広げる(0の場合は広げない)
+        self.train_layer_num = 0
+        self.unfreeze_epoch = 0
+        #全層学習時も埋込み層は固定
+        self.freeze_embeddings = False
+        #全体の学習時にエンコーダ層の中間結果を逆伝播時に再計算(メモリ使用量を抑え、大きいbatch_sizeで学習する場合に使用)
+        self.recompute_grad = False
+        
+        self.optimizer="adam"
+        self.loss=["binary_crossentropy", "categorical_crossentropy"]
+
+    def _get_metrics(self):
+        #compile毎に新しいインスタンスが必要(同じインスタンスで再compileすると評価値の名前が変わる)
+        #分散学習時の評価値の変数はモデルと同じstrategyのスコープで作成する必要あり
+        with self.model.distribute_strategy.scope():
+            return [
+                [KerasScore(KerasScore.TYPE_TP), KerasScore(KerasScore.TYPE_TN),
+                KerasScore(KerasScore.TYPE_FP), KerasScore(KerasScore.TYPE_FN), 
+                KerasScore(KerasScore.TYPE_ACCURACY), KerasScore(KerasScore.TYPE_PRECISION),
+                KerasScore(KerasScore.TYPE_RECALL), KerasScore(KerasScore.TYPE_FVALUE)],
+                [KerasScore(KerasScore.TYPE_TP, self.output_class1_num), KerasScore(KerasScore.TYPE_TN, self.output_class1_num),
+                KerasScore(KerasScore.TYPE_FP, self.output_class1_num), KerasScore(KerasScore.TYPE_FN, self.output_class1_num), 
+                KerasScore(KerasScore.TYPE_ACCURACY, self.output_class1_num), KerasScore(KerasScore.TYPE_PRECISION, self.output_class1_num),
+                KerasScore(KerasScore.TYPE_RECALL, self.output_class1_num), KerasScore(KerasScore.TYPE_FVALUE, self.output_class1_num)],
+                ]
+
+    def init_model(self, bert: TransformersBase):
+        self.seq_len = bert.seq_len
+        self.bert_model = bert
+
+        bert_layer = self.bert_model.get_transformers_output()
+        output_tensor = tf.keras.layers.Dropout(0.5)(bert_layer)
+        output_tensor1 = tf.keras.layers.Dense(1, activation='sigmoid', name="output1")(output_tensor)
+        output_tensor2 = tf.keras.layers.Dense(self.output_class1_num, activation='softmax', name="output2")(output_tensor)
+        self.model = tf.keras.models.Model(self.bert_model.get_inputs(), [output_tensor1, output_tensor2])
+        #予測結果と合わせてtransformersの出力(文章の埋込み)を取得するモデル(重みは共有)
+        self.embedding_model = tf.keras.models.Model(self.bert_model.get_inputs(), [output_tensor1, output_tensor2, bert_layer])
+
+    def load_weight(self, weight_path):
+        self.model.load_weights(weight_path)
+
+    def set_train_params(self, params) -> None:
+        #学習設定(TRAIN_PARAMSのみ)を変更
+        for name, value in params.items():
+            if name not in self.TRAIN_PARAMS:
+                raise ValueError("train param error(name={})".format(name))
+
+            setattr(self, name, type(getattr(self, name))(value))
+        
+    def train_model(self, datas, epoch_num, save_dir, test_datas=None, callbacks=None):
+        #MultiWorkerMirroredStrategyのスコープで作成したモデルは各ワーカーで同じ学習を実行し、勾配を集約するデータ並列学習
+        #分散学習時のbatch_sizeはレプリカ毎の件数(全体のバッチはbatch_size×レプリカ数)
+        strategy = self.model.distribute_strategy
+        distributed = isinstance(strategy, tf.distribute.MultiWorkerMirroredStrategy)
+        batch_size = self.batch_size * strategy.num_replicas_in_sync
+
+        #チェックポイント・学習結果はchiefのみsave_dirへ出力(他のワーカーも保存処理には参加するため一時ディレクトリへ出力し、学習後に削除)
+        chief = self._is_chief(strategy)
+        output_dir = save_dir if chief == True else tempfile.mkdtemp(prefix="keiyakuworker")
+        verbose = "auto" if chief == True else 0
+
+        #データ準備(test_datas指定時はdatasを全て学習に使用)
+        if test_datas is None:
+            train_data_num = int(len(datas) * self.train_data_split)
+            train_datas = datas[:train_data_num]
+            test_datas = datas[train_data_num:]
+        else:
+            train_datas = datas[:]
+
+        #分散学習時は全ワーカーで同じ順序となるよう乱数を固定
+        shuffle_seed = 0 if distributed else None
+        if isinstance(train_datas, KeiyakuTokenizedDatas):
+            train_datas.shuffle(shuffle_seed)
+        elif shuffle_seed is not None:
+            random.Random(shuffle_seed).shuffle(train_datas)
+        else:
+            random.shuffle(train_datas)
+        
+        validation_datas = self._get_validation_datas(test_datas)
+
+        train_steps_per_epoch = len(train_datas) // batch_size
+        test_steps_per_epoch = len(test_datas) // batch_size
+        validation_steps_per_epoch = len(validation_datas) // batch_size
+        get_data = self._get_distributed_dataset if distributed else self._generator_data
+        
+        #モデル情報保存
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, 'model_summary.txt'), "w") as fp:
+            self.model.summary(print_fn=lambda x: fp.write(x + "\n"))
+
+        try:
+            open(os.path.join(output_dir, 'model.json'), 'w').write(self.model.to_json())
+        except NotImplementedError:
+            print("to_json is NotImplemented")
+
+        #モデル学習(全結合層)
+        self.bert_model.set_trainable(False)
+        self.model.compile(optimizer=self.optimizer, loss=self.loss, metrics='accuracy')
+
+        self.model.fit(get_data(train_datas, batch_size), 
+            validation_data=get_data(validation_datas, batch_size),
+            steps_per_epoch=train_steps_per_epoch, validation_steps=validation_steps_per_epoch,
+            epochs=self.pre_epoch, verbose=verbose)
+
+        #モデル学習(全体)
+        time_callback = self.TrainTimeCallback()
+        train_callbacks = self._get_callbacks(output_dir, chief) + [time_callback]
+        early_stopping = None
+        if self.early_stopping_patience > 0:
+            early_stopping = self.EarlyStoppingCallback(monitor=self.early_stopping_monitor, mode=self._get_monitor_mode(self.early_stopping_monitor),
+                patience=self.early_stopping_patience, restore_best_weights=True, verbose=1)
+            train_callbacks.append(early_stopping)
+
+        #学習する層を変更した場合は再compileが必要なため、段階毎にfitを実行
+        self.bert_model.set_recompute_grad(self.recompute_grad)
+        for start_epoch, end_epoch, train_layer_num in self._get_train_stages(epoch_num):
+            self.bert_model.set_trainable_layers(train_layer_num, self.freeze_embeddings)
+            self.model.compile(optimizer=self.optimizer, loss=self.loss, metrics=self._get_metrics())
+
+            history = self.model.fit(get_data(train_datas, batch_size), 
+                validation_data=get_data(validation_datas, batch_size),
+                steps_per_epoch=train_steps_per_epoch, validation_steps=validation_steps_per_epoch,
+                epochs=end_epoch, initial_epoch=start_epoch, verbose=verbose, callbacks=train_callbacks + (callbacks if callbacks is not None else []))
+
+            if len(history.epoch) < end_epoch - start_epoch:
+                break
+
+        self.bert_model.set_recompute_grad(False)
+        if early_stopping is not None:
+            early_stopping.restore_best()
+
+        #モデル結果保存
+        starttime = time.perf_counter()
+        testscore = self.model.evaluate(get_data(test_datas, batch_size),
+            steps=test_steps_per_epoch, verbose=2 if chief == True else 0, return_dict=True)
+        self._create_timefile(os.path.join(output_dir, 'train_time.json'), time_callback, epoch_num, time.perf_counter() - starttime, validation_datas is not test_datas)
+
+        self.model.save_weights(os.path.join(output_dir, 'weights_last-{:.2f}'.format(testscore["loss"])))
+        self._create_paramfile(os.path.join(output_dir, 'parameter.json'))
+
+        if chief == False:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+        return testscore
+
+    def predict(self, datas):
+        return self._predict_model(self.model, datas)
+
+    def predict_with_embedding(self, datas):
+        #[output1, output2, 文章の埋込み]を返す(埋込みを取得できないモデルはNone)
+        return self._predict_model(self.embedding_model, datas)
+
+    def _predict_model(self, model, datas):
+        batch_size = self._get_predict_batch_size()
+        steps_per_epoch = (len(datas) // batch_size)
+        
+        mod_data_num = len(datas) % batch_size
+
+        if steps_per_epoch > 0:
+            result = model.predict(self._generator_data(datas, batch_size),
+                steps=steps_per_epoch, batch_size=batch_size)
+        else:
+            result = [ np.zeros((0,) + tuple(output_shape[1:]), dtype=np.float32) for output_shape in model.output_shape ]
+
+        if mod_data_num > 0:
+            mod_result = model.predict(self._generator_data(datas[-mod_data_num:], mod_data_num), steps=1, batch_size=mod_data_num)
+            result = [ np.concatenate([output, mod_output]) for output, mod_output in zip(result, mod_result) ]
+
+        return result
+
+    def predict_batches(self, datas, batch_num):
+        #batch_num件ずつ予測し、(開始位置, 予測結果)を順次返す
+        batch_size = self._get_predict_batch_size()
+        batch_num = max(batch_num // batch_size, 1) * batch_size
+        for start in range(0, len(datas), batch_num):
+            yield start, self.predict(datas[start:start+batch_num])
+
+    def _get_predict_batch_size(self):
+        return self.predict_batch_size if self.predict_batch_size > 0 else self.batch_size
+
+    def train_distill_model(self, teacher: "KeiyakuModel", datas, epoch_num, save_dir, alpha=0.5, test_datas=None):
+        #teacherの予測値(soft target)と正解(hard target)をalpha:1-alphaで混合した値を教師として学習
+        #交差エントロピーは教師値に対して線形のため、hard・softそれぞれの損失の加重和と同じ
+        #評価は正解で行うため、混合は学習データのみ(test_datas指定時はdatasを全て学習に使用)
+        if self.seq_len != teacher.seq_len:
+            raise ValueError("seq_len error(student={}, teacher={})".format(self.seq_len, teacher.seq_len))
+
+        #teacherの重みで初期化(層数が少ない場合は先頭の層のみ)
+        self.bert_model.copy_weights(teacher.bert_model)
+        for layer_name in ["output1", "output2"]:
+            self.model.get_layer(layer_name).set_weights(teacher.model.get_layer(layer_name).get_weights())
+
+        if test_datas is None:
+            train_data_num = int(len(datas) * self.train_data_split)
+            test_datas = datas[train_data_num:]
+            datas = datas[:train_data_num]
+
+        soft_scores = teacher.predict(datas)
+        distill_datas = []
+        for data, soft_score1, soft_score2 in zip(datas, soft_scores[0], soft_scores[1]):
+            hard_score2 = tf.keras.utils.to_categorical(data[1][1], num_classes=self.output_class1_num)
+            distill_outputs = [ alpha * data[1][0] + (1 - alpha) * soft_score1[0], alpha * hard_score2 + (1 - alpha) * soft_score2 ] + list(data[1][2:])
+            distill_datas.append((data[0], distill_outputs))
+
+        return self.train_model(distill_datas, epoch_num, save_dir, test_datas)
+
+    def export_tflite(self, save_path, quantize=QUANTIZE_DYNAMIC, calibration_datas=None):
+        #output1/output2を含むモデル全体をTFLite形式で保存
+        #dynamic:重みのみint8、int8:calibration_datasで活性値の範囲を計測し演算もint8(未対応の演算はfloat)
+        converter = tf.lite.TFLiteConverter.from_keras_model(self.model)
+        if quantize != self.QUANTIZE_NONE:
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+        if quantize == self.QUANTIZE_INT8:
+            if calibration_datas is None or len(calibration_datas) == 0:
+                raise ValueError("int8 quantize requires calibration_datas")
+            converter.representative_dataset = lambda: self._generator_calibration_data(calibration_datas)
+
+        tflite_model = converter.convert()
+        with open(save_path, "wb") as f:
+            f.write(tflite_model)
+
+        with open(save_path + ".json", "w", encoding="utf-8") as f:
+            json.dump({"input_names": self.model.input_names, "seq_len": self.seq_len, "quantize": quantize}, f)
+
+    def _generator_calibration_data(self, datas):
+        generator = self._generator_data(datas, 1)
+        for _ in range(len(datas)):
+            x_outs, _ = next(generator)
+            yield x_outs
+
+    def _get_validation_datas(self, test_datas):
+        #正解(グループ判定・分類)の組毎に件数比で抽出(各組最低1件)、毎回同じデータで評価するため乱数は固定
+        sample_num = max(self.validation_sample_num, self.batch_size)
+        if self.validation_sample_num <= 0 or len(test_datas) <= sample_num:
+            return test_datas
+
+        groups = {}
+        for i in range(len(test_datas)):
+            outputs = test_datas[i][1]
+            output2 = int(np.argmax(outputs[1])) if np.ndim(outputs[1]) > 0 else int(outputs[1])
+            groups.setdefault((int(outputs[0]), output2), []).append(i)
+
+        rand = random.Random(0)
+        indexes = []
+        for key in sorted(groups.keys()):
+            group_num = max(round(len(groups[key]) * sample_num / len(test_datas)), 1)
+            indexes.extend(rand.sample(groups[key], min(group_num, len(groups[key]))))
+        indexes = sorted(indexes)
+
+        if isinstance(test_datas, KeiyakuTokenizedDatas):
+            return test_datas.get_subset(indexes)
+
+        return [ test_datas[i] for i in indexes ]
+
+    def _get_train_stages(self, epoch_num):
+        #(開始エポック, 終了エポック, 学習する層数(Noneは全層))のリスト
+        if self.train_layer_num <= 0 or self.train_layer_num >= self.bert_model.get_layer_num():
+            return [ (0, epoch_num, None) ]
+
+        if self.unfreeze_epoch <= 0:
+            return [ (0, epoch_num, self.train_layer_num) ]
+
+        stages = []
+        train_layer_num = self.train_layer_num
+        start_epoch = 0
+        while start_epoch < epoch_num:
+            if train_layer_num >= self.bert_model.get_layer_num():
+                stages.append((start_epoch, epoch_num, None))
+                break
+
+            end_epoch = min(start_epoch + self.unfreeze_epoch, epoch_num)
+            stages.append((start_epoch, end_epoch, train_layer_num))
+            start_epoch = end_epoch
+            train_layer_num += 1
+
+        return stages
+
+    def _get_monitor_mode(self, monitor):
+        return "min" if monitor.endswith("loss") or monitor.endswith("_fp") or monitor.endswith("_fn") else "max"
+
+    def _get_learn_rate(self, epoch):
+        return self.learn_rate_init * (self.learn_rate_percent ** (epoch // self.learn_rate_epoch))
+
+    class ResultOutputCallback(tf.keras.callbacks.Callback):
+        SAVE_ROWS = ["epoch", "loss",
+            "output1_loss", "output1_tp", "output1_tn", "output1_fp", "output1_fn", "output1_accuracy", "output1_precision", "output1_recall", "output1_fvalue",
+            "output2_loss", "output2_tp", "output2_tn", "output2_fp", "output2_fn", "output2_accuracy", "output2_precision", "output2_recall", "output2_fvalue",
+            "val_loss",
+            "val_output1_loss", "val_output1_tp", "val_output1_tn", "val_output1_fp", "val_output1_fn", "val_output1_accuracy", "val_output1_precision", "val_output1_recall", "val_output1_fvalue",
+            "val_output2_loss", "val_output2_tp", "val_output2_tn", "val_output2_fp", "val_output2_fn", "val_output2_accuracy", "val_output2_precision", "val_output2_recall", "val_output2_fvalue",
+            ]
+
+        def __init__(self, save_dir):
+            self.df = pd.DataFrame(columns=self.SAVE_ROWS)
+            self.save_dir = save_dir
+            self.save_csv = os.path.join(self.save_dir, "result_data.csv")
+
+        def on_epoch_end(self, epoch, logs={}):
+            values = [epoch+1] + [logs[key] for key in self.SAVE_ROWS if key != "epoch" and key in logs]
+
+            self.df = self.df.append(pd.Series(values, index = self.SAVE_ROWS), ignore_index = True)
+            self.df.to_csv(self.save_csv, index = False)
+
+        def on_train_end(self, logs={}):
+            self._create_graph("文章グループ化", self.df, "epoch", ["val_output1_fvalue", "val_output1_precision", "val_output1_recall"], ["output1_loss", "val_output1_loss"], os.path.join(self.save_dir, "result_graph1.png"))
+            self._create_graph("文章分類", self.df, "epoch", ["val_output2_fvalue", "val_output2_precision", "val_output2_recall"], ["output2_loss", "val_output2_loss"], os.path.join(self.save_dir, "result_graph2.png"))
+        
+        def _create_graph(self, title, datas, xlabel, ylabels1, ylabels2, savefile):
+            # GPU環境でnp.dotがabortするため機能削除し、空ファイル作成に変更(原因不明)
+            # xvalue = datas[xlabel].values
+            # yvalues1 = [ datas[label].values for label in ylabels1 ]
+            # yvalues2 = [ datas[label].values for label in ylabels2 ]
+            
+            # fig = plt.figure()
+            # ax1 = fig.add_subplot(1, 1, 1)
+            # ax2 = ax1.twinx()
+
+            # for yvalue, ylabel in zip(yvalues1, ylabels1):
+            #     ax1.plot(xvalue, yvalue, marker='*', label=ylabel)
+
+            # for yvalue, ylabel in zip(yvalues2, ylabels2):
+            #     ax2.plot(xvalue, yvalue, marker='o', label=ylabel)
+
+            # ax1.set_ylim(0, 1)
+            # ax1.set_yticks(np.arange(0, 1.01, step=0.1))
+            # handler1, label1 = ax1.get_legend_handles_labels()
+
+            # ax2.set_ylim(0, 1.5)
+            # ax2.set_yticks(np.arange(0, 1.51, step=0.1))
+            # handler2, label2 = ax2.get_legend_handles_labels()
+
+            # ax1.set_title(title)
+            # ax1.set_xticks(xvalue)
+            # ax1.legend(handler1 + handler2, label1 + label2, loc='upper left', borderaxespad=0.)
+            
+            # plt.savefig(savefile)
+            import pathlib
+            pathlib.Path(savefile).touch()
+
+    class EarlyStoppingCallback(tf.keras.callbacks.EarlyStopping):
+        #段階毎にfitを複数回呼出すため、初回のfit開始時のみ初期化
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.started = False
+
+        def on_train_begin(self, logs=None):
+            if self.started == False:
+                super().on_train_begin(logs)
+                self.started = True
+
+        def restore_best(self) -> None:
+            #打切らずに最終エポックまで学習した場合も最良エポックの重みに戻す
+            if self.stopped_epoch == 0 and self.restore_best_weights and self.best_weights is not None:
+                self.model.set_weights(self.best_weights)
+
+    class TrainTimeCallback(tf.keras.callbacks.Callback):
+        #エポック毎の学習・評価の処理時間(秒)
+        def __init__(self):
+            super().__init__()
+            self.train_seconds = []
+            self.validation_seconds = []
+
+        def on_epoch_begin(self, epoch, logs={}):
+            self.epoch_starttime = time.perf_counter()
+            self.validation_starttime = None
+
+        def on_test_begin(self, logs={}):
+            self.validation_starttime = time.perf_counter()
+
+        def on_epoch_end(self, epoch, logs={}):
+            endtime = time.perf_counter()
+            validation_starttime = self.validation_starttime if self.validation_starttime is not None else endtime
+            self.train_seconds.append(validation_starttime - self.epoch_starttime)
+            self.validation_seconds.append(endtime - validation_starttime)
+
+    class MedianStoppingCallback(tf.keras.callbacks.Callback):
+        #並行学習中の他の試行と比較し、grace_epoch以降で最良値が他の試行の同エポックまでの最良値の中央値より悪い場合に学習を打切る
+        #各試行のエポック毎の値はprogress_dir/{trial_name}.jsonで共有(比較対象がmin_trials件未満の場合は打切らない)
+        def __init__(self, progress_dir, trial_name, monitor="val_loss", mode="min", grace_epoch=2, min_trials=3):
+            super().__init__()
+            self.progress_dir = progress_dir
+            self.progress_file = os.path.join(progress_dir, "{}.json".format(trial_name))
+            self.monitor = monitor
+            self.sign = 1.0 if mode == "min" else -1.0
+            self.grace_epoch = grace_epoch
+            self.min_trials = min_trials
+            self.history = []
+            self.stopped_epoch = 0
+
+        def on_epoch_end(self, epoch, logs={}):
+            self.history.append(float(logs[self.monitor]))
+            self._save_history()
+
+            if len(self.history) <= self.grace_epoch:
+                return
+
+            others = [ history for history in self._load_histories() if len(history) >= len(self.history) ]
+            if len(others) < self.min_trials:
+                return
+
+            best = min([ self.sign * value for value in self.history ])
+            median = np.median([ min([ self.sign * value for value in history[:len(self.history)] ]) for history in others ])
+            if best > median:
+                self.model.stop_training = True
+                self.stopped_epoch = len(self.history)
+
+        def _save_history(self) -> None:
+            #読込側が書込途中のファイルを読まないよう、一時ファイルから置換え
+            os.makedirs(self.progress_dir, exist_ok=True)
+            tmp_file = self.progress_file + ".tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump({ "monitor": self.monitor, "history": self.history }, f)
+            os.replace(tmp_file, self.progress_file)
+
+        def _load_histories(self):
+            histories = []
+            for filename in sorted(os.listdir(self.progress_dir)):
+                path = os.path.join(self.progress_dir, filename)
+                if filename.endswith(".json") and path != self.progress_file:
+                    with open(path, encoding="utf-8") as f:
+                        progress = json.load(f)
+                    if progress["monitor"] == self.monitor:
+                        histories.append(progress["history"])
+
+            return histories
+
+    def _get_callbacks(self, save_dir, chief=True):
+        callbacks = []
+
+        callbacks.append(tf.keras.callbacks.ModelCheckpoint(
+                filepath=os.path.join(save_dir, 'weights_{epoch:03d}-{loss:.2f}-{output1_fvalue:.2f}-{output2_fvalue:.2f}-{val_loss:.2f}-{val_output1_fvalue:.2f}-{val_output2_fvalue:.2f}'),
+                monitor='val_loss',
+                verbose=1,
+                save_weights_only=True,
+                save_best_only=True,
+                mode='auto'))
+        
+        if chief == True:
+            callbacks.append(self.ResultOutputCallback(save_dir))
+        callbacks.append(tf.keras.callbacks.LearningRateScheduler(self._get_learn_rate))
+
+        return callbacks
+
+    def _generator_data(self, all_datas, batch_size):
+        dummy_inputs = self.tokenizer.keiyaku_encode(all_datas[0][0], self.seq_len)
+        input_num = len(dummy_inputs)
+
+        while True:
+            for step in range(len(all_datas) // batch_size):
+                datas = all_datas[step*batch_size:(step+1)*batch_size]
+
+                x_outs = [ np.zeros((batch_size, self.seq_len), dtype=np.int32) for _ in range(input_num)]
+
+                for i in range(batch_size):
+                    datas_inputs = self.tokenizer.keiyaku_encode(datas[i][0], self.seq_len)
+
+                    for j, datas_input in enumerate(datas_inputs):
+                        x_outs[j][i, :] = datas_input[:]
+                        
+                yield x_outs, self._get_outputs(datas)
+
+    def _get_distributed_dataset(self, all_datas, batch_size):
+        #各ワーカーは同じ順序で全体のバッチを生成し、データセットの自動分割(DATA)で自ワーカーのレプリカ分のみ取出す
+        x_outs, y_outs = next(self._generator_data(all_datas[:1], 1))
+        output_signature = (tuple([ tf.TensorSpec((batch_size,) + x_out.shape[1:], tf.as_dtype(x_out.dtype)) for x_out in x_outs ]),
+            tuple([ tf.TensorSpec((batch_size,) + y_out.shape[1:], tf.as_dtype(y_out.dtype)) for y_out in y_outs ]))
+
+        dataset = tf.data.Dataset.from_generator(lambda: ((tuple(x_outs), tuple(y_outs)) for x_outs, y_outs in self._generator_data(all_datas, batch_size)),
+            output_signature=output_signature)
+        options = tf.data.Options()
+        options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.DATA
+        return dataset.with_options(options)
+
+    def _is_chief(self, strategy):
+        #単一プロセス、またはchief(未指定時はworkerの0番)
+        resolver = getattr(strategy, "cluster_resolver", None)
+        if resolver is None or resolver.task_type in [None, "chief"]:
+            return True
+
+        return resolver.task_type == "worker" and resolver.task_id == 0 and "chief" not in resolver.cluster_spec().as_dict()
+
+    def _get_outputs(self, datas):
+        y_out1 = np.zeros((len(datas),))
+        y_out2 = np.zeros((len(datas), self.output_class1_num))
+
+        for i, data in enumerate(datas):
+            datas_outputs = data[1]
+
+            y_out1[i] = datas_outputs[0]
+            if np.ndim(datas_outputs[1]) > 0:
+                #蒸留学習時は各分類の確率を教師値とする
+                y_out2[i, :] = datas_outputs[1]
+            else:
+                y_out2[i, :] = tf.keras.utils.to_categorical(datas_outputs[1], num_classes=self.output_class1_num)
+
+        return [y_out1, y_out2]
+
+    def _create_timefile(self, savefile, time_callback, epoch_num, full_validation_seconds, sampled):
+        #打切ったエポック・評価データの抽出で削減した処理時間(全件評価の時間は学習後の評価時間で推定)
+        run_epoch_num = len(time_callback.train_seconds)
+        epoch_seconds = np.mean(time_callback.train_seconds) + full_validation_seconds if run_epoch_num > 0 else 0.0
+        saved_stopping = (epoch_num - run_epoch_num) * epoch_seconds
+        saved_validation = sum([ full_validation_seconds - seconds for seconds in time_callback.validation_seconds ]) if sampled else 0.0
+
+        data = {}
+        data["epoch_num"] = epoch_num
+        data["run_epoch_num"] = run_epoch_num
+        data["train_seconds"] = sum(time_callback.train_seconds)
+        data["epoch_train_seconds"] = time_callback.train_seconds
+        data["validation_seconds"] = sum(time_callback.validation_seconds)
+        data["full_validation_seconds"] = full_validation_seconds
+        data["saved_seconds_early_stopping"] = saved_stopping
+        data["saved_seconds_validation"] = saved_validation
+        data["saved_seconds"] = saved_stopping + saved_validation
+        with open(savefile, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+
+        print("epochs={}/{} saved_seconds={:.1f}(early_stopping={:.1f}, validation={:.1f})".format(run_epoch_num, epoch_num, data["saved_seconds"], saved_stopping, saved_validation))
+
+    def _create_paramfile(self, savefile):
+        with open(savefile, "w", encoding="utf-8") as f:
+            data = {}
+            data["batch_size"] = self.batch_size
+            data["seq_len"] = self.seq_len
+            data["pre_epoch"] = self.pre_epoch
+            data["learn_rate_init"] = self.learn_rate_init
+            data["learn_rate_epoch"] = self.learn_rate_epoch
+            data["learn_rate_percent"] = self.learn_rate_percent
+            data["early_stopping_monitor"] = self.early_stopping_monitor
+            data["early_stopping_patience"] = self.early_stopping_patience
+            data["validation_sample_num"] = self.validation_sample_num
+            data["train_layer_num"] = self.train_layer_num
+            data["unfreeze_epoch"] = self.unfreeze_epoch
+            data["freeze_embeddings"] = self.freeze_embeddings
+            data["recompute_grad"] = self.recompute_grad
             json.dump(data, f, ensure_ascii=False, indent=4)
\ No newline at end of file
@@ -0,0 +1,103 @@
+import numpy as np
+import tensorflow as tf
+from keiyakumodel import KeiyakuModel
+from transformersbase import TransformersBase, TransformersTokenizerBase
+
+class KeiyakuModelBiEncoder(KeiyakuModel):
+    #文章・前文章を別々にエンコードし、隣接する文章の埋込みを組合せてoutput1、文章単独の埋込みでoutput2を予測
+    #予測時は同じ文章を1回のみエンコードする(入力データはKeiyakuModelと同じget_keiyaku_indexesの結果)
+    def __init__(self, tokenizer: TransformersTokenizerBase, output_class1_num=6):
+        super().__init__(tokenizer, output_class1_num)
+        self.sentence_seq_len = 0
+        self.encoder_model = None
+        self.head_model = None
+
+    def init_model(self, bert: TransformersBase):
+        self.seq_len = bert.seq_len
+        self.sentence_seq_len = self.tokenizer.get_sentence_seq_len(bert.seq_len)
+        self.bert_model = bert
+
+        #1文章のみの入力で、get_keiyaku_indexesで1文章に割当てられる長さのエンコーダを作成
+        input_num = len(bert.get_inputs())
+        sentence_inputs = self._create_inputs(input_num)
+        self.encoder_model = tf.keras.models.Model(sentence_inputs, bert.get_sentence_output(sentence_inputs), name="encoder")
+        hidden_size = self.encoder_model.output_shape[-1]
+
+        dropout1 = tf.keras.layers.Dropout(0.5)
+        dropout2 = tf.keras.layers.Dropout(0.5)
+        concatenate = tf.keras.layers.Concatenate()
+        dense1 = tf.keras.layers.Dense(1, activation='sigmoid', name="output1")
+        dense2 = tf.keras.layers.Dense(self.output_class1_num, activation='softmax', name="output2")
+
+        def create_outputs(now_embedding, prev_embedding):
+            pair_embedding = concatenate([now_embedding, prev_embedding, tf.abs(now_embedding - prev_embedding), now_embedding * prev_embedding])
+            return [dense1(dropout1(pair_embedding)), dense2(dropout2(now_embedding))]
+
+        #学習用(文章・前文章の入力から予測)
+        now_inputs = self._create_inputs(input_num)
+        prev_inputs = self._create_inputs(input_num)
+        self.model = tf.keras.models.Model(now_inputs + prev_inputs, create_outputs(self.encoder_model(now_inputs), self.encoder_model(prev_inputs)))
+
+        #予測用(エンコード済の埋込みから予測、重みは学習用と共有)
+        now_embedding = tf.keras.layers.Input((hidden_size,))
+        prev_embedding = tf.keras.layers.Input((hidden_size,))
+        self.head_model = tf.keras.models.Model([now_embedding, prev_embedding], create_outputs(now_embedding, prev_embedding))
+
+    def predict(self, datas):
+        return self.predict_with_embedding(datas)[:2]
+
+    def predict_with_embedding(self, datas):
+        #埋込みは文章単独(前文章を含まない)のエンコード結果
+        if len(datas) == 0:
+            hidden_size = self.encoder_model.output_shape[-1]
+            return [np.zeros((0, 1), dtype=np.float32), np.zeros((0, self.output_class1_num), dtype=np.float32), np.zeros((0, hidden_size), dtype=np.float32)]
+
+        #前文章は1つ前の文章と同じため、重複を除いた文章のみエンコード
+        sentence_indexes = {}
+        sentences = []
+        pairs = np.zeros((len(datas), 2), dtype=np.int32)
+        for i, data in enumerate(datas):
+            for j, ids in enumerate(self.tokenizer.split_keiyaku_indexes(data[0])):
+                key = tuple(ids)
+                if key not in sentence_indexes:
+                    sentence_indexes[key] = len(sentences)
+                    sentences.append(ids)
+                pairs[i, j] = sentence_indexes[key]
+
+        embeddings = self.encode_sentences(sentences)
+        result = self.head_model.predict([embeddings[pairs[:, 0]], embeddings[pairs[:, 1]]], batch_size=max(self._get_predict_batch_size(), 256), verbose=0)
+        return [result[0], result[1], embeddings[pairs[:, 0]]]
+
+    def encode_sentences(self, sentences):
+        #sentencesは[CLS] 文章 [SEP]のindexリスト
+        x_outs = self._encode_sentences(sentences)
+        return self.encoder_model.predict(x_outs, batch_size=self._get_predict_batch_size(), verbose=0)
+
+    def export_tflite(self, save_path, quantize=KeiyakuModel.QUANTIZE_DYNAMIC, calibration_datas=None):
+        raise NotImplementedError("tflite export is not supported for bi-encoder model")
+
+    def _create_inputs(self, input_num):
+        return [ tf.keras.layers.Input((self.sentence_seq_len,), dtype=tf.int32) for _ in range(input_num) ]
+
+    def _encode_sentences(self, sentences):
+        x_outs = None
+        for i, ids in enumerate(sentences):
+            sentence_inputs = self.tokenizer.keiyaku_encode(ids, self.sentence_seq_len)
+            if x_outs is None:
+                x_outs = [ np.zeros((len(sentences), self.sentence_seq_len), dtype=np.int32) for _ in sentence_inputs ]
+
+            for j, sentence_input in enumerate(sentence_inputs):
+                x_outs[j][i, :] = sentence_input[:]
+
+        return x_outs
+
+    def _generator_data(self, all_datas, batch_size):
+        while True:
+            for step in range(len(all_datas) // batch_size):
+                datas = all_datas[step*batch_size:(step+1)*batch_size]
+
+                splits = [ self.tokenizer.split_keiyaku_indexes(data[0]) for data in datas ]
+                x_nows = self._encode_sentences([ split[0] for split in splits ])
+                x_prevs = self._encode_sentences([ split[1] for split in splits ])
+
+                yield x_nows + x_prevs, self._get_outputs(datas)
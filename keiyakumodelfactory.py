@@ -1,83 +1,342 @@
-import os
-import threading
-from keiyakumodel import KeiyakuModel
-from transformersbase import TransformersBase, TransformersTokenizerBase
-from transformersbert import TransformersBert, TransformersTokenizerBert
-from transformersbertcolorful import TransformersBertColorful, TransformersTokenizerBertColorful
-from transformersroberta import TransformersRoberta, TransformersTokenizerRoberta
-
-class KeiyakuModelFactory:
-    MODEL_NAME_BERT="bert"
-    MODEL_NAME_BERTCOLORFUL="bertcolorful"
-    MODEL_NAME_ROBERTA="roberta"
-
-    MODEL_FULL_NAME_BERT=r"cl-tohoku/bert-base-japanese-v2"
-    MODEL_FULL_NAME_BERTCOLORFUL=r"colorfulscoop/bert-base-ja"
-    MODEL_FULL_NAME_ROBERTA=r"rinna/japanese-roberta-base"
-
-    DEFAULT_MODEL_NAME="bert"
-    now_model_name:str = ""
-
-    seq_len = 256
-
-    model: TransformersBase = None
-    tokenizer: TransformersTokenizerBase = None
-    keiyakumodel: KeiyakuModel = None
-    model_full_name: str = ""
-
-    craete_transformers_mutex = threading.Lock()
-
-    @classmethod
-    def get_keiyakumodel(cls, model_name=DEFAULT_MODEL_NAME, loadweight=True, download=False):
-        if model_name != cls.now_model_name:
-            cls.get_transfomers(model_name, download)
-
-            cls.keiyakumodel = KeiyakuModel(cls.tokenizer)
-            cls.keiyakumodel.init_model(cls.model)
-            if loadweight == True:
-                weight_path = os.path.join(os.path.dirname(__file__), r"data", r"model", cls.model.model_name, r"weights")
-                cls.keiyakumodel.load_weight(weight_path)
-
-            cls.now_model_name = model_name
-
-        return cls.keiyakumodel, cls.model, cls.tokenizer
-
-    @classmethod
-    def get_transfomers(cls, model_name=DEFAULT_MODEL_NAME, download=False):
-        cls._craete_transformers(model_name)
-
-        modeldata_path = modeldata_path = os.path.join(os.path.dirname(__file__), r"data", r"model")
-        if download == True:
-            cls.model.download_save(cls.model_full_name, modeldata_path)
-            cls.tokenizer.download_save(cls.model_full_name, modeldata_path)
-
-        cls.model.init_model(modeldata_path)
-        cls.tokenizer.init_tokenizer(modeldata_path)
-
-        return cls.model, cls.tokenizer
-
-    @classmethod
-    def _craete_transformers(cls, model_name) -> None:
-        cls.craete_transformers_mutex.acquire()
-        cls.model = None
-        cls.tokenizer = None
-
-        if model_name == cls.MODEL_NAME_BERT:
-            cls.model = TransformersBert(seq_len=cls.seq_len)
-            cls.tokenizer = TransformersTokenizerBert()
-            cls.model_full_name = cls.MODEL_FULL_NAME_BERT
-        elif model_name == cls.MODEL_NAME_BERTCOLORFUL:
-            cls.model = TransformersBertColorful(seq_len=cls.seq_len)
-            cls.tokenizer = TransformersTokenizerBertColorful()
-            cls.model_full_name = cls.MODEL_FULL_NAME_BERTCOLORFUL
-        elif model_name == cls.MODEL_NAME_ROBERTA:
-            cls.model = TransformersRoberta(seq_len=cls.seq_len)
-            cls.tokenizer = TransformersTokenizerRoberta()
-            cls.model_full_name = cls.MODEL_FULL_NAME_ROBERTA
-        else:
-            raise NotImplementedError("model_name error(model_name={})".format(model_name))
-
-        cls.now_model_name = ""
-        cls.craete_transformers_mutex.release()
-
-
+import os
+import glob
+import json
+import hashlib
+import threading
+import contextlib
+import tensorflow as tf
+from keiyakumodel import KeiyakuModel
+from keiyakumodeltflite import KeiyakuModelTFLite
+from keiyakumodelbiencoder import KeiyakuModelBiEncoder
+from keiyakucpuprofile import KeiyakuCpuProfile
+from transformersbase import TransformersBase, TransformersTokenizerBase
+from transformersbert import TransformersBert, TransformersTokenizerBert
+from transformersbertcolorful import TransformersBertColorful, TransformersTokenizerBertColorful
+from transformersroberta import TransformersRoberta, TransformersTokenizerRoberta
+
+class KeiyakuModelFactory:
+    MODEL_NAME_BERT="bert"
+    MODEL_NAME_BERTCOLORFUL="bertcolorful"
+    MODEL_NAME_ROBERTA="roberta"
+    MODEL_NAME_BERT_STUDENT="bert-student"
+    MODEL_NAME_BERT_BIENCODER="bert-biencoder"
+
+    MODEL_FULL_NAME_BERT=r"cl-tohoku/bert-base-japanese-v2"
+    MODEL_FULL_NAME_BERTCOLORFUL=r"colorfulscoop/bert-base-ja"
+    MODEL_FULL_NAME_ROBERTA=r"rinna/japanese-roberta-base"
+
+    BACKEND_KERAS="keras"
+    BACKEND_TFLITE="tflite"
+
+    DEFAULT_MODEL_NAME="bert"
+    STUDENT_LAYER_NUM=4
+    now_model_name:str = ""
+    default_model_name:str = DEFAULT_MODEL_NAME
+
+    DEFAULT_SEQ_LEN=256
+    SEQ_LEN_FILE="seq_len.json"
+    #トークナイザが同じモデルはbertの入力長を使用(蒸留時は入力長の一致が必要)
+    SEQ_LEN_MODEL_NAMES={ MODEL_NAME_BERT_STUDENT: MODEL_NAME_BERT, MODEL_NAME_BERT_BIENCODER: MODEL_NAME_BERT }
+    #set_seq_lenで指定した入力長(Noneはget_seq_lenの値)
+    seq_len: int = None
+
+    model: TransformersBase = None
+    tokenizer: TransformersTokenizerBase = None
+    keiyakumodel: KeiyakuModel = None
+    keiyakumodel_class: type = KeiyakuModel
+    model_full_name: str = ""
+    weight_name: str = "weights"
+    model_version: str = ""
+    backend: str = BACKEND_KERAS
+    layer_num: int = None
+    pooling: str = TransformersBase.POOLING_POOLER
+    thread_num: int = 0
+    predict_batch_size: int = 0
+    strategy: tf.distribute.Strategy = None
+
+    craete_transformers_mutex = threading.Lock()
+
+    @classmethod
+    def get_keiyakumodel(cls, model_name=None, loadweight=True, download=False):
+        model_name = model_name if model_name is not None else cls.default_model_name
+        if model_name != cls.now_model_name:
+            if cls.backend == cls.BACKEND_TFLITE:
+                #TFLiteはtransformersのモデルを使用しないため、トークナイザのみ読込
+                cls._craete_transformers(model_name)
+                cls.tokenizer.init_tokenizer(os.path.join(os.path.dirname(__file__), r"data", r"model"))
+                cls.keiyakumodel = KeiyakuModelTFLite(cls.tokenizer, num_threads=cls.thread_num if cls.thread_num > 0 else None)
+                cls.keiyakumodel.init_model(cls.model)
+            else:
+                #分散学習時はモデルの変数をstrategyのスコープで作成
+                with cls.strategy.scope() if cls.strategy is not None else contextlib.nullcontext():
+                    cls.get_transfomers(model_name, download)
+                    cls.keiyakumodel = cls.keiyakumodel_class(cls.tokenizer)
+                    cls.keiyakumodel.init_model(cls.model)
+
+            cls.keiyakumodel.predict_batch_size = cls.predict_batch_size
+            cls.model_version = ""
+            if loadweight == True:
+                weight_path = cls._get_weight_path()
+                cls.keiyakumodel.load_weight(weight_path)
+                cls.model_version = cls._get_version(model_name, weight_path)
+
+            cls.now_model_name = model_name
+
+        return cls.keiyakumodel, cls.model, cls.tokenizer
+
+    @classmethod
+    def get_model_version(cls) -> str:
+        #重み未読込の場合は空文字(結果キャッシュ対象外)
+        return cls.model_version
+
+    @classmethod
+    def get_weight_version(cls, model_name=None) -> str:
+        #モデルを読込まずに、重み読込後のget_model_versionと同じ値を取得(読込済のモデルは変更しない)
+        model_name = model_name if model_name is not None else cls.default_model_name
+        model, _, _, weight_name, _ = cls._get_transformers_info(model_name)
+        return cls._get_version(model_name, cls._get_weight_path(model=model, weight_name=weight_name), model.seq_len)
+
+    @classmethod
+    def get_weight_name(cls, model_name=None) -> str:
+        #モデルを読込まずに重みのファイル名を取得(読込済のモデルは変更しない)
+        _, _, _, weight_name, _ = cls._get_transformers_info(model_name if model_name is not None else cls.default_model_name)
+        return weight_name
+
+    @classmethod
+    def set_default_model_name(cls, model_name=DEFAULT_MODEL_NAME) -> None:
+        #モデル名省略時(Web等)に使用するモデル
+        cls.default_model_name = model_name
+
+    @classmethod
+    def set_layer_num(cls, layer_num=None, pooling=TransformersBase.POOLING_POOLER) -> None:
+        #bert/bertcolorful/robertaで先頭layer_num層のみ使用(重みはweights_l{layer_num}_{pooling}へ別保存)
+        if pooling not in [TransformersBase.POOLING_POOLER, TransformersBase.POOLING_CLS]:
+            raise NotImplementedError("pooling error(pooling={})".format(pooling))
+
+        if layer_num != cls.layer_num or pooling != cls.pooling:
+            cls.layer_num = layer_num
+            cls.pooling = pooling
+            cls.now_model_name = ""
+            cls.model_version = ""
+
+    @classmethod
+    def set_seq_len(cls, seq_len=None) -> None:
+        #次回のget_keiyakumodelで指定の入力長のモデルを作成(学習済重みは入力長に依存しない、Noneはモデル毎の保存値)
+        if seq_len != cls.seq_len:
+            cls.seq_len = seq_len
+            cls.now_model_name = ""
+            cls.model_version = ""
+
+    @classmethod
+    def get_seq_len(cls, model_name=None) -> int:
+        #set_seq_len指定時はその値、未指定時はsave_seq_lenで保存したモデル毎の値(未保存の場合はDEFAULT_SEQ_LEN)
+        if cls.seq_len is not None:
+            return cls.seq_len
+
+        model_name = model_name if model_name is not None else cls.default_model_name
+        return cls._load_seq_lens().get(cls.SEQ_LEN_MODEL_NAMES.get(model_name, model_name), cls.DEFAULT_SEQ_LEN)
+
+    @classmethod
+    def save_seq_len(cls, model_name, seq_len=None) -> None:
+        #次回以降のget_keiyakumodelで作成するモデルの入力長を保存(Noneは保存値を削除しDEFAULT_SEQ_LENに戻す)
+        seq_lens = cls._load_seq_lens()
+        if seq_len is not None:
+            seq_lens[model_name] = seq_len
+        else:
+            seq_lens.pop(model_name, None)
+
+        seq_len_path = cls._get_seq_len_path()
+        os.makedirs(os.path.dirname(seq_len_path), exist_ok=True)
+        with open(seq_len_path, "w", encoding="utf-8") as f:
+            json.dump(seq_lens, f, ensure_ascii=False, indent=4)
+
+        cls.now_model_name = ""
+        cls.model_version = ""
+
+    @classmethod
+    def set_backend(cls, backend=BACKEND_KERAS) -> None:
+        #次回のget_keiyakumodelで指定の推論方式のモデルを読込む
+        if backend not in [cls.BACKEND_KERAS, cls.BACKEND_TFLITE]:
+            raise NotImplementedError("backend error(backend={})".format(backend))
+
+        if backend != cls.backend:
+            cls.backend = backend
+            cls.now_model_name = ""
+            cls.model_version = ""
+
+    @classmethod
+    def export_tflite(cls, model_name=None, quantize=KeiyakuModel.QUANTIZE_DYNAMIC, calibration_datas=None) -> str:
+        #学習済重みのモデルをTFLite形式に変換し、set_backend(BACKEND_TFLITE)で読込むパスへ保存
+        backend = cls.backend
+        cls.set_backend(cls.BACKEND_KERAS)
+        keiyakumodel, _, _ = cls.get_keiyakumodel(model_name)
+
+        save_path = cls._get_weight_path(cls.BACKEND_TFLITE)
+        keiyakumodel.export_tflite(save_path, quantize, calibration_datas)
+
+        cls.set_backend(backend)
+        return save_path
+
+    @classmethod
+    def get_transfomers(cls, model_name=DEFAULT_MODEL_NAME, download=False):
+        cls._craete_transformers(model_name)
+
+        modeldata_path = modeldata_path = os.path.join(os.path.dirname(__file__), r"data", r"model")
+        if download == True:
+            cls.model.download_save(cls.model_full_name, modeldata_path)
+            cls.tokenizer.download_save(cls.model_full_name, modeldata_path)
+
+        cls.model.init_model(modeldata_path)
+        cls.tokenizer.init_tokenizer(modeldata_path)
+
+        return cls.model, cls.tokenizer
+
+    @classmethod
+    def get_tokenizer(cls, model_name=None):
+        #モデルを読込まずにトークナイザのみ読込む(seq_lenは戻り値のモデルから取得可、読込済のモデルは変更しない)
+        model, tokenizer, _, _, _ = cls._get_transformers_info(model_name if model_name is not None else cls.default_model_name)
+        tokenizer.init_tokenizer(os.path.join(os.path.dirname(__file__), r"data", r"model"))
+
+        return model, tokenizer
+
+    @classmethod
+    def set_thread_num(cls, intra_op_num=0, inter_op_num=0) -> None:
+        #TensorFlowの初回実行前に呼出す必要あり(0の場合はTensorFlowが自動設定)
+        cls.thread_num = intra_op_num
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_num)
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_num)
+
+    @classmethod
+    def apply_cpu_profile(cls):
+        #keiyakugroup_tuneで保存した現在のホストの設定(演算スレッド数・予測時のバッチサイズ)を適用し、適用した設定を返す(未保存の場合はNone)
+        #TensorFlowの初回実行前に呼出す必要あり(oneDNNの有無はKeiyakuCpuProfile.apply_environで適用)
+        profile = KeiyakuCpuProfile.load()
+        if profile is not None:
+            cls.set_thread_num(profile["intra_op_num"], profile["inter_op_num"])
+            cls.predict_batch_size = profile["batch_size"]
+
+        return profile
+
+    @classmethod
+    def set_distributed(cls, worker_hosts=None, task_index=0) -> None:
+        #worker_hosts(host:portのリスト)の各ワーカーで同じ学習を実行し、勾配を集約するデータ並列学習(Noneは単一プロセス)
+        #TensorFlowの初回実行前(set_thread_numの後)に全ワーカーで呼出し、task_indexは0(chief)から順に指定
+        if worker_hosts is not None:
+            os.environ["TF_CONFIG"] = json.dumps({ "cluster": { "worker": list(worker_hosts) }, "task": { "type": "worker", "index": task_index } })
+            cls.strategy = tf.distribute.MultiWorkerMirroredStrategy()
+        else:
+            cls.strategy = None
+
+        cls.now_model_name = ""
+        cls.model_version = ""
+
+    @classmethod
+    def preload_files(cls, model_name=None) -> None:
+        #TensorFlowはfork後の子プロセスで動作しないため、モデルファイルをページキャッシュへ読込むのみ行う
+        model, _, _, _, _ = cls._get_transformers_info(model_name if model_name is not None else cls.default_model_name)
+
+        model_path = os.path.join(os.path.dirname(__file__), r"data", r"model", model.model_name)
+        for dirpath, _, filenames in os.walk(model_path):
+            for filename in filenames:
+                with open(os.path.join(dirpath, filename), "rb") as f:
+                    while f.read(16 * 1024 * 1024):
+                        pass
+
+    @classmethod
+    def _get_weight_path(cls, backend=None, model: TransformersBase = None, weight_name=None) -> str:
+        #model・weight_name省略時は読込済のモデルの値
+        backend = backend if backend is not None else cls.backend
+        model = model if model is not None else cls.model
+        weight_name = weight_name if weight_name is not None else cls.weight_name
+        weight_name = weight_name + r".tflite" if backend == cls.BACKEND_TFLITE else weight_name
+        return os.path.join(os.path.dirname(__file__), r"data", r"model", model.model_name, weight_name)
+
+    @classmethod
+    def _get_version(cls, model_name, weight_path, seq_len=None) -> str:
+        #入力長により予測結果が変わるため、DEFAULT_SEQ_LEN以外の場合は入力長を含める
+        seq_len = seq_len if seq_len is not None else cls.model.seq_len
+        if seq_len != cls.DEFAULT_SEQ_LEN:
+            model_name = "{}-s{}".format(model_name, seq_len)
+
+        if cls.backend == cls.BACKEND_TFLITE:
+            return "{}-{}-{}".format(model_name, cls.backend, cls._get_weight_hash(weight_path))
+
+        return "{}-{}".format(model_name, cls._get_weight_hash(weight_path))
+
+    @classmethod
+    def _get_seq_len_path(cls) -> str:
+        return os.path.join(os.path.dirname(__file__), r"data", r"model", cls.SEQ_LEN_FILE)
+
+    @classmethod
+    def _load_seq_lens(cls):
+        seq_len_path = cls._get_seq_len_path()
+        if os.path.isfile(seq_len_path) == False:
+            return {}
+
+        with open(seq_len_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    @classmethod
+    def _get_weight_hash(cls, weight_path) -> str:
+        #チェックポイントのindexに各テンソルのチェックサムが含まれるため、indexのみハッシュ化する
+        sha1 = hashlib.sha1()
+        index_path = weight_path + ".index"
+        if os.path.isfile(index_path):
+            with open(index_path, "rb") as f:
+                sha1.update(f.read())
+        else:
+            for path in sorted(glob.glob(weight_path + "*")):
+                stat = os.stat(path)
+                sha1.update("{}:{}:{}".format(os.path.basename(path), stat.st_size, stat.st_mtime_ns).encode())
+
+        return sha1.hexdigest()[:16]
+
+    @classmethod
+    def _craete_transformers(cls, model_name) -> None:
+        cls.craete_transformers_mutex.acquire()
+        try:
+            cls.model, cls.tokenizer, cls.model_full_name, cls.weight_name, cls.keiyakumodel_class = cls._get_transformers_info(model_name)
+            cls.now_model_name = ""
+            cls.model_version = ""
+        finally:
+            cls.craete_transformers_mutex.release()
+
+    @classmethod
+    def _get_transformers_info(cls, model_name):
+        #model_nameの(モデル, トークナイザ, 事前学習モデル名, 重みのファイル名, KeiyakuModelのクラス)を作成(クラスの状態は変更しない)
+        weight_name = r"weights"
+        keiyakumodel_class = KeiyakuModel
+        seq_len = cls.get_seq_len(model_name)
+
+        if model_name == cls.MODEL_NAME_BERT:
+            model = TransformersBert(seq_len=seq_len, layer_num=cls.layer_num, pooling=cls.pooling)
+            tokenizer = TransformersTokenizerBert()
+            model_full_name = cls.MODEL_FULL_NAME_BERT
+        elif model_name == cls.MODEL_NAME_BERTCOLORFUL:
+            model = TransformersBertColorful(seq_len=seq_len, layer_num=cls.layer_num, pooling=cls.pooling)
+            tokenizer = TransformersTokenizerBertColorful()
+            model_full_name = cls.MODEL_FULL_NAME_BERTCOLORFUL
+        elif model_name == cls.MODEL_NAME_ROBERTA:
+            model = TransformersRoberta(seq_len=seq_len, layer_num=cls.layer_num, pooling=cls.pooling)
+            tokenizer = TransformersTokenizerRoberta()
+            model_full_name = cls.MODEL_FULL_NAME_ROBERTA
+        elif model_name == cls.MODEL_NAME_BERT_STUDENT:
+            #bertの先頭STUDENT_LAYER_NUM層のみの蒸留用モデル(事前学習モデル・トークナイザはbertと共用)
+            model = TransformersBert(seq_len=seq_len, layer_num=cls.STUDENT_LAYER_NUM)
+            tokenizer = TransformersTokenizerBert()
+            model_full_name = cls.MODEL_FULL_NAME_BERT
+            weight_name = r"weights_student"
+        elif model_name == cls.MODEL_NAME_BERT_BIENCODER:
+            #文章毎に1回のみエンコードするモデル(事前学習モデル・トークナイザはbertと共用)
+            model = TransformersBert(seq_len=seq_len, layer_num=cls.layer_num, pooling=cls.pooling)
+            tokenizer = TransformersTokenizerBert()
+            model_full_name = cls.MODEL_FULL_NAME_BERT
+            keiyakumodel_class = KeiyakuModelBiEncoder
+            weight_name = r"weights_biencoder"
+        else:
+            raise NotImplementedError("model_name error(model_name={})".format(model_name))
+
+        if model_name != cls.MODEL_NAME_BERT_STUDENT and (cls.layer_num is not None or cls.pooling != TransformersBase.POOLING_POOLER):
+            weight_name = r"{}_l{}_{}".format(weight_name, cls.layer_num if cls.layer_num is not None else "all", cls.pooling)
+
+        return model, tokenizer, model_full_name, weight_name, keiyakumodel_class
@@ -0,0 +1,65 @@
+import json
+import threading
+import numpy as np
+import tensorflow as tf
+from keiyakumodel import KeiyakuModel
+from transformersbase import TransformersBase, TransformersTokenizerBase
+
+class KeiyakuModelTFLite(KeiyakuModel):
+    #KeiyakuModel.export_tfliteで保存したモデルで予測する(推論専用)
+    def __init__(self, tokenizer: TransformersTokenizerBase, output_class1_num=6, num_threads=None):
+        super().__init__(tokenizer, output_class1_num)
+        self.num_threads = num_threads
+        self.quantize = ""
+
+        self.interpreter = None
+        self.runner = None
+        self.input_names = []
+        self.predict_mutex = threading.Lock()
+
+    def init_model(self, bert: TransformersBase):
+        #トークナイズ用にseq_lenのみ使用するため、TransformersBaseのinit_modelは不要
+        self.seq_len = bert.seq_len
+        self.bert_model = bert
+
+    def load_weight(self, weight_path):
+        with open(weight_path + ".json", "r", encoding="utf-8") as f:
+            param = json.load(f)
+
+        if param["seq_len"] != self.seq_len:
+            raise ValueError("seq_len error(model={}, tflite={})".format(self.seq_len, param["seq_len"]))
+
+        self.input_names = param["input_names"]
+        self.quantize = param["quantize"]
+        self.interpreter = tf.lite.Interpreter(model_path=weight_path, num_threads=self.num_threads)
+        self.runner = self.interpreter.get_signature_runner()
+
+    def predict_with_embedding(self, datas):
+        #出力に埋込みを含まないため取得不可
+        return self.predict(datas) + [None]
+
+    def train_model(self, datas, epoch_num, save_dir, test_datas=None, callbacks=None):
+        raise NotImplementedError("tflite model is predict only")
+
+    def predict(self, datas):
+        if len(datas) == 0:
+            return [np.zeros((0, 1), dtype=np.float32), np.zeros((0, self.output_class1_num), dtype=np.float32)]
+
+        #中間テンソルのメモリを抑えるためbatch_size件ずつ実行
+        batch_size = self._get_predict_batch_size()
+        scores1 = []
+        scores2 = []
+        for start in range(0, len(datas), batch_size):
+            batch_datas = datas[start:start+batch_size]
+            x_outs, _ = next(self._generator_data(batch_datas, len(batch_datas)))
+
+            self.predict_mutex.acquire()
+            try:
+                outputs = self.runner(**{ name: x_out for name, x_out in zip(self.input_names, x_outs) })
+            finally:
+                self.predict_mutex.release()
+
+            scores1.append(outputs["output1"])
+            scores2.append(outputs["output2"])
+
+        return [np.concatenate(scores1), np.concatenate(scores2)]
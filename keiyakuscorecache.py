@@ -0,0 +1,209 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from keiyakudata import KeiyakuData
+
+class KeiyakuScoreCache:
+    #文章・前文章の組毎の予測結果をモデルバージョン単位で保持(メモリ上は最大max_num件のLRU、db_path指定時はsqliteにも保存)
+    #定型条項(準拠法・秘密保持等)は多くの契約書で同じ文章となるため、予測済の組は再予測しない
+    #sqliteは最近保存したmax_version_num個のモデルバージョンの結果のみ保持(重み更新前のモデルの結果は削除)
+    #1回のSELECTで検索するキーの数
+    SELECT_KEY_NUM = 500
+
+    def __init__(self, db_path=None, max_num=100000, max_version_num=2):
+        self.db_path = db_path
+        self.max_num = max_num
+        self.max_version_num = max_version_num
+
+        self.mutex = threading.Lock()
+        self.scores = OrderedDict()
+        self.hit_num = 0
+        self.miss_num = 0
+
+        self.init_mutex = threading.Lock()
+        self.initialized = False
+
+    @classmethod
+    def get_key(cls, now_text, prev_text):
+        return hashlib.sha1(now_text.encode()).hexdigest(), hashlib.sha1(prev_text.encode()).hexdigest()
+
+    @classmethod
+    def get_keys(cls, keiyakudata: KeiyakuData):
+        #KeiyakuData.get_group_datasと同じ順序のキー
+        return [ cls.get_key(str(data[6]), str(data[7])) for data in keiyakudata.get_datas() ]
+
+    def predict(self, keiyakumodel, model_version, predict_datas, keys):
+        #キャッシュに無い行のみkeiyakumodelで予測(model_versionが空の場合はキャッシュしない)
+        scores, _ = self._predict(keiyakumodel, model_version, predict_datas, keys)
+        return scores
+
+    def predict_batches(self, keiyakumodel, model_version, predict_datas, keys, batch_num, with_embedding=False):
+        #(開始位置, 予測結果, キャッシュヒット件数)を順次返す
+        #with_embedding指定時は予測結果の3番目に各行の埋込み(キャッシュヒット等で取得できない行はNone)のリストを含める
+        for start in range(0, len(predict_datas), batch_num):
+            scores, hit_num = self._predict(keiyakumodel, model_version, predict_datas[start:start+batch_num], keys[start:start+batch_num], with_embedding)
+            yield start, scores, hit_num
+
+    def get_hit_ratio(self) -> float:
+        self.mutex.acquire()
+        total_num = self.hit_num + self.miss_num
+        hit_ratio = self.hit_num / total_num if total_num > 0 else 0.0
+        self.mutex.release()
+        return hit_ratio
+
+    def get_stats(self):
+        self.mutex.acquire()
+        stats = { "hit": self.hit_num, "miss": self.miss_num, "memory": len(self.scores) }
+        self.mutex.release()
+        return stats
+
+    def _predict(self, keiyakumodel, model_version, predict_datas, keys, with_embedding=False):
+        if model_version == "" and with_embedding:
+            result = keiyakumodel.predict_with_embedding(predict_datas)
+            return [result[0], result[1], self._to_embeddings(result[2], len(predict_datas))], 0
+        elif model_version == "":
+            return keiyakumodel.predict(predict_datas), 0
+
+        cache_scores = self._get_scores(model_version, keys)
+
+        #同じ組が複数ある場合は1回のみ予測
+        targets = {}
+        for i, score in enumerate(cache_scores):
+            if score is None:
+                targets.setdefault(keys[i], []).append(i)
+
+        scores1 = np.zeros((len(predict_datas), 1), dtype=np.float32)
+        scores2 = np.zeros((len(predict_datas), keiyakumodel.output_class1_num), dtype=np.float32)
+        for i, score in enumerate(cache_scores):
+            if score is not None:
+                scores1[i] = score[0]
+                scores2[i] = score[1]
+
+        embeddings = [ None ] * len(predict_datas)
+        if len(targets) > 0:
+            target_keys = list(targets.keys())
+            target_datas = [ predict_datas[targets[key][0]] for key in target_keys ]
+            result = keiyakumodel.predict_with_embedding(target_datas) if with_embedding else keiyakumodel.predict(target_datas)
+            target_embeddings = self._to_embeddings(result[2] if with_embedding else None, len(target_keys))
+            for key, score1, score2, embedding in zip(target_keys, result[0], result[1], target_embeddings):
+                scores1[targets[key]] = score1
+                scores2[targets[key]] = score2
+                for target in targets[key]:
+                    embeddings[target] = embedding
+            self._set_scores(model_version, target_keys, result[0], result[1])
+
+        self.mutex.acquire()
+        self.hit_num += len(predict_datas) - len(targets)
+        self.miss_num += len(targets)
+        self.mutex.release()
+
+        if with_embedding:
+            return [scores1, scores2, embeddings], len(predict_datas) - len(targets)
+
+        return [scores1, scores2], len(predict_datas) - len(targets)
+
+    def _to_embeddings(self, embeddings, num):
+        return list(embeddings) if embeddings is not None else [ None ] * num
+
+    def _get_scores(self, model_version, keys):
+        cache_scores = [ None ] * len(keys)
+        disk_targets = []
+
+        self.mutex.acquire()
+        for i, key in enumerate(keys):
+            score = self.scores.get((model_version,) + key)
+            if score is not None:
+                self.scores.move_to_end((model_version,) + key)
+                cache_scores[i] = score
+            else:
+                disk_targets.append(i)
+        self.mutex.release()
+
+        if self.db_path is not None and len(disk_targets) > 0:
+            #now_hashでまとめて検索し、prev_hashの一致する行のみ使用
+            conn = self._connect()
+            disk_scores = {}
+            for start in range(0, len(disk_targets), self.SELECT_KEY_NUM):
+                now_hashes = list(set([ keys[target][0] for target in disk_targets[start:start + self.SELECT_KEY_NUM] ]))
+                rows = conn.execute("SELECT now_hash, prev_hash, score1, score2 FROM score WHERE model_version = ? AND now_hash IN ({})".format(",".join(["?"] * len(now_hashes))),
+                    [ model_version ] + now_hashes).fetchall()
+                for row in rows:
+                    disk_scores[(row[0], row[1])] = (np.frombuffer(row[2], dtype=np.float32), np.frombuffer(row[3], dtype=np.float32))
+            conn.close()
+
+            disk_scores = { key: disk_scores[key] for key in [ keys[target] for target in disk_targets ] if key in disk_scores }
+            for target in disk_targets:
+                cache_scores[target] = disk_scores.get(keys[target])
+
+            self._set_memory_scores(model_version, disk_scores)
+
+        return cache_scores
+
+    def _set_scores(self, model_version, keys, scores1, scores2) -> None:
+        scores = { key: (np.array(score1, dtype=np.float32), np.array(score2, dtype=np.float32)) for key, score1, score2 in zip(keys, scores1, scores2) }
+        self._set_memory_scores(model_version, scores)
+
+        if self.db_path is not None:
+            conn = self._connect()
+            with conn:
+                self._purge_versions(conn, model_version)
+                conn.executemany("INSERT OR REPLACE INTO score(model_version, now_hash, prev_hash, score1, score2) VALUES(?, ?, ?, ?, ?)",
+                    [ (model_version, key[0], key[1], score[0].tobytes(), score[1].tobytes()) for key, score in scores.items() ])
+            conn.close()
+
+    def _purge_versions(self, conn, model_version) -> None:
+        #結果の保存と同じトランザクションでモデルバージョンの保存日時を更新し、最近保存したmax_version_num個以外のモデルバージョンの結果を削除
+        #(他プロセスに削除されたモデルバージョンも保存時に再登録されるため、削除対象から漏れる結果は残らない)
+        conn.execute("INSERT OR REPLACE INTO version(model_version, used) VALUES(?, ?)", [ model_version, time.time() ])
+        old_versions = [ row[0] for row in conn.execute("SELECT model_version FROM version ORDER BY used DESC LIMIT -1 OFFSET ?", [ self.max_version_num ]).fetchall() ]
+        conn.executemany("DELETE FROM score WHERE model_version = ?", [ (old_version,) for old_version in old_versions ])
+        conn.executemany("DELETE FROM version WHERE model_version = ?", [ (old_version,) for old_version in old_versions ])
+
+    def _set_memory_scores(self, model_version, scores) -> None:
+        self.mutex.acquire()
+        for key, score in scores.items():
+            self.scores[(model_version,) + key] = score
+            self.scores.move_to_end((model_version,) + key)
+
+        while len(self.scores) > self.max_num:
+            self.scores.popitem(last=False)
+        self.mutex.release()
+
+    def _connect(self):
+        if self.initialized == False:
+            self._init_db()
+
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _init_db(self) -> None:
+        self.init_mutex.acquire()
+
+        if self.initialized == False:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS score(
+                model_version TEXT NOT NULL,
+                now_hash TEXT NOT NULL,
+                prev_hash TEXT NOT NULL,
+                score1 BLOB NOT NULL,
+                score2 BLOB NOT NULL,
+                PRIMARY KEY(model_version, now_hash, prev_hash)) WITHOUT ROWID""")
+
+            #versionの導入前に保存したモデルバージョンは最も古い扱い
+            conn.execute("BEGIN IMMEDIATE")
+            exists = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='version'").fetchone()
+            if exists is None:
+                conn.execute("CREATE TABLE version(model_version TEXT PRIMARY KEY, used REAL NOT NULL)")
+                conn.execute("INSERT INTO version(model_version, used) SELECT DISTINCT model_version, 0 FROM score")
+            conn.execute("COMMIT")
+            conn.close()
+
+            self.initialized = True
+
+        self.init_mutex.release()
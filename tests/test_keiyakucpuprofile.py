@@ -0,0 +1,36 @@
+import pytest
+import os
+from keiyakucpuprofile import KeiyakuCpuProfile
+
+class TestKeiyakuCpuProfile:
+    def test_load(self, tmpdir, mocker):
+        profile_path = os.path.join(str(tmpdir), "model", "cpu_profile.json")
+        assert KeiyakuCpuProfile.load(profile_path) is None
+
+        mocker.patch("multiprocessing.cpu_count").return_value = 8
+        KeiyakuCpuProfile.save({ "onednn": False, "intra_op_num": 4, "inter_op_num": 1, "batch_size": 20 }, profile_path)
+        profile = KeiyakuCpuProfile.load(profile_path)
+        assert profile["intra_op_num"] == 4
+        assert profile["batch_size"] == 20
+        assert profile["cpu_num"] == 8
+
+        #CPUコア数の異なるホストでは使用しない
+        mocker.patch("multiprocessing.cpu_count").return_value = 16
+        assert KeiyakuCpuProfile.load(profile_path) is None
+
+    def test_apply_environ(self, tmpdir, mocker):
+        profile_path = os.path.join(str(tmpdir), "cpu_profile.json")
+        mocker.patch.dict(os.environ, clear=False)
+        os.environ.pop(KeiyakuCpuProfile.ENV_ONEDNN, None)
+
+        KeiyakuCpuProfile.apply_environ(profile_path)
+        assert KeiyakuCpuProfile.ENV_ONEDNN not in os.environ
+
+        KeiyakuCpuProfile.save({ "onednn": False, "intra_op_num": 1, "inter_op_num": 1, "batch_size": 8 }, profile_path)
+        KeiyakuCpuProfile.apply_environ(profile_path)
+        assert os.environ[KeiyakuCpuProfile.ENV_ONEDNN] == "0"
+
+        #環境変数指定済の場合は環境変数を優先
+        os.environ[KeiyakuCpuProfile.ENV_ONEDNN] = "1"
+        KeiyakuCpuProfile.apply_environ(profile_path)
+        assert os.environ[KeiyakuCpuProfile.ENV_ONEDNN] == "1"
@@ -1,144 +1,212 @@
-import pytest
-import shutil
-import os
-import pandas as pd
-from keiyakudata import KeiyakuData
-
-class TestKeiyakuData:
-	
-    """
-    fixture
-    契約文章データ
-    """
-    @pytest.fixture(scope="class")
-    def keiyaku_file(self, tmpdir_factory):
-        tmpdir_path = tmpdir_factory.mktemp("TestKeiyakuData")
-        file_path = tmpdir_path.join("keiyaku_file.csv")
-        with open(file_path, 'w', encoding="utf-8") as f:
-            f.write("ファイル,行数,カテゴリ,文章グループ,分類,条文分類,文章\n")
-            f.write("D11,D12,D13,D14,0,1,D15\n")
-            f.write("D11,D12,D13,D14,1,2,D25\n")
-            f.write("D11,D12,D13,D24,2,3,D25\n")
-            f.write("D11,D12,D23,D24,3,4,D25\n")
-            f.write("D11,D22,D23,D24,4,5,D25\n")
-            f.write("D21,D22,D23,D24,5,6,D25\n")
-            f.write("D21,D22,,D24,2,7,D25\n")
-            f.write("D21,D22,D23,,2,3,D25\n")
-            f.write("D21,D22,D23,D24,2,3,D25\n")
-            f.write("D21,D22,D23,D24,2,3,\n")
-
-        yield file_path
-
-        shutil.rmtree(tmpdir_path)
-
-    """
-    fixture
-    エラー用契約文章データ
-    """
-    @pytest.fixture(scope="class")
-    def keiyaku_file_error(self, tmpdir_factory):
-        tmpdir_path = tmpdir_factory.mktemp("TestKeiyakuData")
-        file_path = tmpdir_path.join("keiyaku_file_error.csv")
-        with open(file_path, 'w', encoding="utf-8") as f:
-            f.write("ファイル,行数,カテゴリ,文章グループ,分類,条文分類,文章,ERROR\n")
-            f.write("D11,D12,D13,D14,1,2,D15,ERR\n")
-
-        yield file_path
-
-        shutil.rmtree(tmpdir_path)
-
-    def test_init_error(self, keiyaku_file_error):
-        with pytest.raises(ValueError):
-            KeiyakuData(keiyaku_file_error)
-
-
-    def test_get_header(self, keiyaku_file):
-        keiyaku_data = KeiyakuData(keiyaku_file)
-
-        datas = keiyaku_data.get_header()
-
-        assert len(datas) == 9
-        assert datas[0] == "ファイル"
-        assert datas[1] == "行数"
-        assert datas[2] == "カテゴリ"
-        assert datas[3] == "文章グループ"        
-        assert datas[4] == "分類"
-        assert datas[5] == "条文分類"
-        assert datas[6] == "文章"
-        assert datas[7] == "前文章"
-        assert datas[8] == "グループ判定"
-
-    def test_get_datas(self, keiyaku_file):
-        keiyaku_data = KeiyakuData(keiyaku_file)
-
-        datas = keiyaku_data.get_datas()
-
-        assert datas.shape == (10, 9)
-        assert datas[0][0] == "D11"
-        assert datas[1][1] == "D12"
-        assert datas[2][2] == "D13"
-        assert datas[3][3] == "D24"
-        assert datas[4][4] == 4
-        assert datas[5][5] == 6
-
-        assert datas[0][6] == "D15"
-        assert datas[0][7] == ""
-        assert datas[1][6] == "D25"
-        assert datas[1][7] == "D15"
-        assert datas[9][6] == ""
-        assert datas[9][7] == "D25"
-
-        assert datas[0][8] == 1
-        assert datas[1][8] == 0
-        assert datas[2][8] == 1
-        assert datas[3][8] == 1
-        assert datas[4][8] == 0
-        assert datas[5][8] == 1
-        assert datas[6][8] == -1
-        assert datas[7][8] == -1
-        assert datas[8][8] == 1
-        assert datas[9][8] == 0
-
-    def test_get_group_datas(self, test_keiyakudata: KeiyakuData, mocker):
-        tokenizer_mock = mocker.MagicMock()
-        tokenizer_mock.get_keiyaku_indexes = mocker.Mock(return_value=[1, 2, 3, 4, 5, 6, 7, 8])
-        
-        datas = test_keiyakudata.get_group_datas(tokenizer_mock, 8)
-
-        assert len(datas) == 1136
-        assert len(datas[0]) == 2
-        assert len(datas[0][1]) == 3
-        for data in datas:
-            assert data[0] == [1, 2, 3, 4, 5, 6, 7, 8]
-            assert data[1][0] == -1 or data[1][0] == 0 or data[1][0] == 1
-            assert -1 <= data[1][1] and data[1][1] <= 5
-            assert -1 <= data[1][2] and data[1][2] <= 6
-
-    def test_get_study_group_datas(self, test_keiyakudata: KeiyakuData, mocker):
-        tokenizer_mock = mocker.MagicMock()
-        tokenizer_mock.get_keiyaku_indexes = mocker.Mock(return_value=[1, 2, 3, 4, 5, 6, 7, 8])
-        datas = test_keiyakudata.get_study_group_datas(tokenizer_mock, 16)
-
-        assert len(datas) == 299
-        assert len(datas[0]) == 2
-        assert len(datas[0][1]) == 3
-        for data in datas:
-            assert data[0] == [1, 2, 3, 4, 5, 6, 7, 8]
-            assert data[1][0] == -1 or data[1][0] == 0 or data[1][0] == 1
-            assert -1 <= data[1][1] and data[1][1] <= 5
-            assert -1 <= data[1][2] and data[1][2] <= 6
-
-    def test_create_keiyaku_data(self, tmpdir):
-        testdatadir=os.path.join(os.path.dirname(__file__), "data")
-        srcfilepath=os.path.join(testdatadir, "test_keiyakudata.pdf")
-        desttxtpath=os.path.join(tmpdir, "testdata.txt")
-        destcsvpath=os.path.join(tmpdir, "testdata.csv")
-        KeiyakuData.create_keiyaku_data(srcfilepath, desttxtpath, destcsvpath)
-
-        assert os.path.exists(desttxtpath) == True
-        assert os.path.exists(destcsvpath) == True
-
-        df = pd.read_csv(destcsvpath, sep=',')
-        header = list(df.columns.values)
-        assert header == KeiyakuData._CSV_HEADER_CHECK
-        assert len(df.values) >= 1
+import pytest
+import shutil
+import os
+import pandas as pd
+from keiyakudata import KeiyakuData, KeiyakuTokenizedDatas
+
+class TestKeiyakuData:
+	
+    """
+    fixture
+    契約文章データ
+    """
+    @pytest.fixture(scope="class")
+    def keiyaku_file(self, tmpdir_factory):
+        tmpdir_path = tmpdir_factory.mktemp("TestKeiyakuData")
+        file_path = tmpdir_path.join("keiyaku_file.csv")
+        with open(file_path, 'w', encoding="utf-8") as f:
+            f.write("ファイル,行数,カテゴリ,文章グループ,分類,条文分類,文章\n")
+            f.write("D11,D12,D13,D14,0,1,D15\n")
+            f.write("D11,D12,D13,D14,1,2,D25\n")
+            f.write("D11,D12,D13,D24,2,3,D25\n")
+            f.write("D11,D12,D23,D24,3,4,D25\n")
+            f.write("D11,D22,D23,D24,4,5,D25\n")
+            f.write("D21,D22,D23,D24,5,6,D25\n")
+            f.write("D21,D22,,D24,2,7,D25\n")
+            f.write("D21,D22,D23,,2,3,D25\n")
+            f.write("D21,D22,D23,D24,2,3,D25\n")
+            f.write("D21,D22,D23,D24,2,3,\n")
+
+        yield file_path
+
+        shutil.rmtree(tmpdir_path)
+
+    """
+    fixture
+    エラー用契約文章データ
+    """
+    @pytest.fixture(scope="class")
+    def keiyaku_file_error(self, tmpdir_factory):
+        tmpdir_path = tmpdir_factory.mktemp("TestKeiyakuData")
+        file_path = tmpdir_path.join("keiyaku_file_error.csv")
+        with open(file_path, 'w', encoding="utf-8") as f:
+            f.write("ファイル,行数,カテゴリ,文章グループ,分類,条文分類,文章,ERROR\n")
+            f.write("D11,D12,D13,D14,1,2,D15,ERR\n")
+
+        yield file_path
+
+        shutil.rmtree(tmpdir_path)
+
+    def test_init_error(self, keiyaku_file_error):
+        with pytest.raises(ValueError):
+            KeiyakuData(keiyaku_file_error)
+
+
+    def test_elapsed(self, keiyaku_file):
+        keiyaku_data = KeiyakuData(keiyaku_file)
+
+        assert keiyaku_data.elapsed["read_csv"] >= 0
+        assert keiyaku_data.elapsed["data_group_set"] >= 0
+
+    def test_get_header(self, keiyaku_file):
+        keiyaku_data = KeiyakuData(keiyaku_file)
+
+        datas = keiyaku_data.get_header()
+
+        assert len(datas) == 9
+        assert datas[0] == "ファイル"
+        assert datas[1] == "行数"
+        assert datas[2] == "カテゴリ"
+        assert datas[3] == "文章グループ"        
+        assert datas[4] == "分類"
+        assert datas[5] == "条文分類"
+        assert datas[6] == "文章"
+        assert datas[7] == "前文章"
+        assert datas[8] == "グループ判定"
+
+    def test_get_datas(self, keiyaku_file):
+        keiyaku_data = KeiyakuData(keiyaku_file)
+
+        datas = keiyaku_data.get_datas()
+
+        assert datas.shape == (10, 9)
+        assert datas[0][0] == "D11"
+        assert datas[1][1] == "D12"
+        assert datas[2][2] == "D13"
+        assert datas[3][3] == "D24"
+        assert datas[4][4] == 4
+        assert datas[5][5] == 6
+
+        assert datas[0][6] == "D15"
+        assert datas[0][7] == ""
+        assert datas[1][6] == "D25"
+        assert datas[1][7] == "D15"
+        assert datas[9][6] == ""
+        assert datas[9][7] == "D25"
+
+        assert datas[0][8] == 1
+        assert datas[1][8] == 0
+        assert datas[2][8] == 1
+        assert datas[3][8] == 1
+        assert datas[4][8] == 0
+        assert datas[5][8] == 1
+        assert datas[6][8] == -1
+        assert datas[7][8] == -1
+        assert datas[8][8] == 1
+        assert datas[9][8] == 0
+
+    def test_get_reuse_indexes(self, tmpdir):
+        base_path = tmpdir.join("keiyaku_file_base.csv")
+        with open(base_path, 'w', encoding="utf-8") as f:
+            f.write("ファイル,行数,カテゴリ,文章グループ,分類,条文分類,文章\n")
+            for sentence in ["A1", "A2", "A3", "A4", "A5", "A6"]:
+                f.write("F1,1,C1,G1,0,1,{}\n".format(sentence))
+
+        edit_path = tmpdir.join("keiyaku_file_edit.csv")
+        with open(edit_path, 'w', encoding="utf-8") as f:
+            f.write("ファイル,行数,カテゴリ,文章グループ,分類,条文分類,文章\n")
+            for sentence in ["A1", "B2", "A3", "A4", "A6", "B7"]:
+                f.write("F1,1,C1,G1,0,1,{}\n".format(sentence))
+
+        keiyaku_data = KeiyakuData(base_path)
+        keiyaku_data_edit = KeiyakuData(edit_path)
+
+        #変更行と前文章が変わった次の行は再利用不可
+        assert keiyaku_data_edit.get_reuse_indexes(keiyaku_data) == [0, -1, -1, 3, -1, -1]
+        assert keiyaku_data.get_reuse_indexes(keiyaku_data) == list(range(6))
+
+    def test_get_group_datas(self, test_keiyakudata: KeiyakuData, mocker):
+        tokenizer_mock = mocker.MagicMock()
+        tokenizer_mock.get_keiyaku_indexes = mocker.Mock(return_value=[1, 2, 3, 4, 5, 6, 7, 8])
+        
+        datas = test_keiyakudata.get_group_datas(tokenizer_mock, 8)
+
+        assert len(datas) == 1136
+        assert len(datas[0]) == 2
+        assert len(datas[0][1]) == 3
+        for data in datas:
+            assert data[0] == [1, 2, 3, 4, 5, 6, 7, 8]
+            assert data[1][0] == -1 or data[1][0] == 0 or data[1][0] == 1
+            assert -1 <= data[1][1] and data[1][1] <= 5
+            assert -1 <= data[1][2] and data[1][2] <= 6
+
+    def test_get_study_group_datas(self, test_keiyakudata: KeiyakuData, mocker):
+        tokenizer_mock = mocker.MagicMock()
+        tokenizer_mock.get_keiyaku_indexes = mocker.Mock(return_value=[1, 2, 3, 4, 5, 6, 7, 8])
+        datas = test_keiyakudata.get_study_group_datas(tokenizer_mock, 16)
+
+        assert len(datas) == 299
+        assert len(datas[0]) == 2
+        assert len(datas[0][1]) == 3
+        for data in datas:
+            assert data[0] == [1, 2, 3, 4, 5, 6, 7, 8]
+            assert data[1][0] == -1 or data[1][0] == 0 or data[1][0] == 1
+            assert -1 <= data[1][1] and data[1][1] <= 5
+            assert -1 <= data[1][2] and data[1][2] <= 6
+
+    def test_create_keiyaku_data(self, tmpdir):
+        testdatadir=os.path.join(os.path.dirname(__file__), "data")
+        srcfilepath=os.path.join(testdatadir, "test_keiyakudata.pdf")
+        desttxtpath=os.path.join(tmpdir, "testdata.txt")
+        destcsvpath=os.path.join(tmpdir, "testdata.csv")
+        KeiyakuData.create_keiyaku_data(srcfilepath, desttxtpath, destcsvpath)
+
+        assert os.path.exists(desttxtpath) == True
+        assert os.path.exists(destcsvpath) == True
+
+        df = pd.read_csv(destcsvpath, sep=',')
+        header = list(df.columns.values)
+        assert header == KeiyakuData._CSV_HEADER_CHECK
+        assert len(df.values) >= 1
+
+class TestKeiyakuTokenizedDatas:
+    @pytest.fixture
+    def tokenized_datas(self, tmpdir):
+        datas = [ ([2, 10 + i] + [3] * (i % 3), [i % 2, i % 5, i % 4]) for i in range(6) ]
+        return datas, KeiyakuTokenizedDatas.create(datas, 8, os.path.join(tmpdir, "tokenized"))
+
+    def test_create(self, tokenized_datas):
+        datas, tokenized = tokenized_datas
+        assert len(tokenized) == 6
+        for i, data in enumerate(datas):
+            assert tokenized[i] == (data[0], data[1])
+
+        #保存済ファイルはメモリマップで参照
+        loaded = KeiyakuTokenizedDatas(tokenized.save_dir)
+        assert loaded[5] == (datas[5][0], datas[5][1])
+        assert loaded.ids.shape == (6, 8)
+
+    def test_get_subset(self, tokenized_datas):
+        datas, tokenized = tokenized_datas
+        subset = tokenized.get_subset([4, 1, 3])
+        assert len(subset) == 3
+        assert subset[0] == (datas[4][0], datas[4][1])
+
+        #部分集合の部分集合・スライスは部分集合内の位置で指定
+        assert subset.get_subset([2])[0] == (datas[3][0], datas[3][1])
+        assert [ data for data in subset[1:] ] == [ (datas[1][0], datas[1][1]), (datas[3][0], datas[3][1]) ]
+
+    def test_shuffle(self, tokenized_datas):
+        datas, tokenized = tokenized_datas
+        subset = tokenized.get_subset([0, 2, 4])
+        subset.shuffle()
+        assert sorted([ data[0] for data in subset ]) == sorted([ datas[i][0] for i in [0, 2, 4] ])
+        assert tokenized.indexes.tolist() == list(range(6))
+
+        #seed指定時は常に同じ順序
+        subset1 = tokenized.get_subset(list(range(6)))
+        subset2 = tokenized.get_subset(list(range(6)))
+        subset1.shuffle(0)
+        subset2.shuffle(0)
+        assert subset1.indexes.tolist() == subset2.indexes.tolist()
+        assert sorted(subset1.indexes.tolist()) == list(range(6))
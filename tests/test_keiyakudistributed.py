@@ -0,0 +1,121 @@
+import pytest
+import multiprocessing
+import time
+import numpy as np
+from keiyakudistributed import KeiyakuPredictWorker, KeiyakuPredictCoordinator, KeiyakuPredictJob
+
+class KeiyakuModelDummy:
+    def __init__(self, error=False):
+        self.error = error
+
+    def predict(self, datas):
+        if self.error:
+            raise ValueError("predict error")
+
+        score1 = np.array([ [data[0][0]] for data in datas ], dtype=np.float32)
+        score2 = np.array([ [data[0][1], 0.0] for data in datas ], dtype=np.float32)
+        return [score1, score2]
+
+class TokenizerDummy:
+    def get_keiyaku_indexes(self, now, prev, seq_len):
+        return [int(now), len(prev)]
+
+def run_worker_process(coordinator_url):
+    worker = KeiyakuPredictWorker(KeiyakuModelDummy(), TokenizerDummy(), 8, "v1")
+    worker.serve(coordinator_url)
+
+class TestKeiyakuDistributed:
+    @pytest.fixture
+    def coordinator(self):
+        coordinator = KeiyakuPredictCoordinator("v1", batch_num=3, max_retry=2, worker_wait_sec=10)
+        coordinator.start()
+
+        yield coordinator
+
+        coordinator.shutdown()
+
+    def get_datas(self, num):
+        return [ (str(i), "p" * (i % 3)) for i in range(num) ]
+
+    def test_predict(self, coordinator: KeiyakuPredictCoordinator):
+        workers = [ KeiyakuPredictWorker(KeiyakuModelDummy(), TokenizerDummy(), 8, "v1") for _ in range(3) ]
+        for worker in workers:
+            worker.start()
+            assert coordinator.register(worker.url, "v1")
+
+        scores = coordinator.predict(self.get_datas(20))
+        assert scores[0][:, 0].tolist() == list(range(20))
+        assert scores[1][:, 0].tolist() == [ i % 3 for i in range(20) ]
+
+        scores = coordinator.predict([])
+        assert len(scores[0]) == 0
+
+        for worker in workers:
+            worker.shutdown()
+
+    def test_predict_retry(self, coordinator: KeiyakuPredictCoordinator):
+        worker = KeiyakuPredictWorker(KeiyakuModelDummy(), TokenizerDummy(), 8, "v1")
+        error_worker = KeiyakuPredictWorker(KeiyakuModelDummy(error=True), TokenizerDummy(), 8, "v1")
+        worker.start()
+        error_worker.start()
+        coordinator.register(error_worker.url, "v1")
+        coordinator.register(worker.url, "v1")
+
+        scores = coordinator.predict(self.get_datas(10))
+        assert scores[0][:, 0].tolist() == list(range(10))
+        assert coordinator.get_workers() == [worker.url]
+
+        worker.shutdown()
+        error_worker.shutdown()
+
+    def test_predict_error(self, coordinator: KeiyakuPredictCoordinator):
+        error_worker = KeiyakuPredictWorker(KeiyakuModelDummy(error=True), TokenizerDummy(), 8, "v1")
+        error_worker.start()
+        coordinator.register(error_worker.url, "v1")
+        coordinator.worker_wait_sec = 1
+
+        with pytest.raises(RuntimeError):
+            coordinator.predict(self.get_datas(10))
+
+        error_worker.shutdown()
+
+    def test_register(self, coordinator: KeiyakuPredictCoordinator):
+        assert coordinator.register("http://127.0.0.1:1", "v2") == False
+        assert coordinator.register("http://127.0.0.1:1", "v1") == True
+        assert coordinator.register("http://127.0.0.1:1", "v1") == True
+        assert coordinator.get_workers() == ["http://127.0.0.1:1"]
+
+        coordinator.unregister("http://127.0.0.1:1")
+        assert coordinator.get_workers() == []
+
+    def test_predict_process(self, coordinator: KeiyakuPredictCoordinator):
+        context = multiprocessing.get_context("fork")
+        processes = [ context.Process(target=run_worker_process, args=(coordinator.url,), daemon=True) for _ in range(3) ]
+        for process in processes:
+            process.start()
+
+        try:
+            endtime = time.time() + 10
+            while len(coordinator.get_workers()) < 3 and time.time() < endtime:
+                time.sleep(0.1)
+            assert len(coordinator.get_workers()) == 3
+
+            scores = coordinator.predict(self.get_datas(50))
+            assert scores[0][:, 0].tolist() == list(range(50))
+        finally:
+            for process in processes:
+                process.terminate()
+                process.join()
+
+    def test_job(self):
+        job = KeiyakuPredictJob([ ("a", "") ] * 5, 2, 1)
+        tasks = [ job.get_task() for _ in range(3) ]
+        assert [ task[0] for task in tasks ] == [0, 2, 4]
+
+        job.retry(tasks[1], ValueError())
+        assert job.get_task()[2] == 1
+
+        job.retry((2, [], 1), ValueError())
+        assert job.wait(0) == True
+        with pytest.raises(RuntimeError):
+            job.get_result()
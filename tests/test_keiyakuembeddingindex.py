@@ -0,0 +1,92 @@
+import pytest
+import os
+import numpy as np
+from keiyakuembeddingindex import KeiyakuEmbeddingIndex
+
+class TestKeiyakuEmbeddingIndex:
+    @pytest.fixture
+    def embeddings(self):
+        return np.random.RandomState(1).randn(50, 16).astype(np.float32)
+
+    def get_keys(self, doc_id, num):
+        return [ ("{}-{}".format(doc_id, i), "") for i in range(num) ]
+
+    def test_search(self, embeddings, tmpdir):
+        index = KeiyakuEmbeddingIndex(os.path.join(tmpdir, "v1"), bit_num=4, table_num=4)
+        assert index.search(embeddings[0]) == []
+
+        assert index.add("00001", self.get_keys("00001", 30), list(embeddings[:30]), [ "a{}".format(i) for i in range(30) ]) == 30
+        assert index.add("00002", self.get_keys("00002", 20), list(embeddings[30:]), [ "b{}".format(i) for i in range(20) ]) == 20
+        assert index.get_count() == 50
+        assert os.path.getsize(os.path.join(tmpdir, "v1", KeiyakuEmbeddingIndex.EMBEDDING_FILE)) == 50 * 16 * 2
+
+        items = index.search(embeddings[35], 3)
+        assert len(items) == 3
+        assert items[0][1:] == ("00002", 5, "b5")
+        assert items[0][0] == pytest.approx(1.0, abs=1e-3)
+        assert items[0][0] >= items[1][0] >= items[2][0]
+
+        exact_items = index.search(embeddings[35], 3, exact=True)
+        assert exact_items[0][1:] == ("00002", 5, "b5")
+
+        assert np.abs(index.get_embedding("00001", 2) - embeddings[2]).max() < 1e-2
+        assert index.get_embedding("00001", 30) is None
+
+    def test_update(self, embeddings, tmpdir):
+        index = KeiyakuEmbeddingIndex(os.path.join(tmpdir, "v1"), bit_num=4, table_num=4)
+        index.add("00001", self.get_keys("00001", 10), list(embeddings[:10]), [ "a{}".format(i) for i in range(10) ])
+
+        #別インスタンス(別プロセス)の追加・削除を反映
+        other_index = KeiyakuEmbeddingIndex(os.path.join(tmpdir, "v1"), bit_num=4, table_num=4)
+        assert other_index.search(embeddings[3], 1)[0][1:] == ("00001", 3, "a3")
+
+        #埋込みがNoneの行は同じ文章・前文章の登録済の埋込みを使用
+        keys = self.get_keys("00001", 2) + [ ("new", "") ]
+        assert index.add("00002", keys, [ None, embeddings[11], None ], [ "b0", "b1", "b2" ]) == 2
+        assert other_index.search(embeddings[0], 2)[0][1] in ["00001", "00002"]
+        assert other_index.get_count() == 12
+
+        index.delete("00001")
+        items = other_index.search(embeddings[0], 5)
+        assert [ item[1] for item in items ] == ["00002", "00002"]
+        assert items[0][1:] == ("00002", 0, "b0")
+
+        #再登録時は置換え
+        index.add("00002", self.get_keys("00002", 1), [ embeddings[20] ], [ "c0" ])
+        assert [ item[3] for item in other_index.search(embeddings[20], 5) ] == ["c0"]
+
+    def test_compact(self, embeddings, tmpdir, mocker):
+        mocker.patch.object(KeiyakuEmbeddingIndex, 'COMPACT_MIN_NUM', 10)
+        index_dir = os.path.join(tmpdir, "v1")
+        index = KeiyakuEmbeddingIndex(index_dir, bit_num=4, table_num=4)
+        index.add("00001", self.get_keys("00001", 20), list(embeddings[:20]), [ "a{}".format(i) for i in range(20) ])
+        index.add("00002", self.get_keys("00002", 10), list(embeddings[20:30]), [ "b{}".format(i) for i in range(10) ])
+        other_index = KeiyakuEmbeddingIndex(index_dir, bit_num=4, table_num=4)
+        assert other_index.search(embeddings[25], 1)[0][1:] == ("00002", 5, "b5")
+
+        #削除済の行が有効な行未満の間は書直さない
+        index.add("00002", self.get_keys("00002", 10), list(embeddings[30:40]), [ "c{}".format(i) for i in range(10) ])
+        assert os.path.isfile(os.path.join(index_dir, "embedding.1.f16")) == False
+
+        #再登録の繰返しでも削除済の行は残らない
+        index.delete("00001")
+        assert os.path.getsize(os.path.join(index_dir, "embedding.1.f16")) == 10 * 16 * 2
+        index.add("00003", self.get_keys("00003", 10), list(embeddings[40:]), [ "d{}".format(i) for i in range(10) ])
+        assert index.get_count() == 20
+        assert index.get_doc_counts() == { "00002": 10, "00003": 10 }
+
+        #読込済の世代が書直し前のままでも書直し後の行の埋込みを返す
+        assert other_index.generation == 0
+        assert np.abs(other_index.get_embedding("00002", 5) - embeddings[35]).max() < 1e-2
+        assert other_index.generation == 0
+
+        items = other_index.search(embeddings[35], 3)
+        assert items[0][1:] == ("00002", 5, "c5")
+        assert [ item[1] for item in other_index.search(embeddings[0], 30) ].count("00001") == 0
+        assert np.abs(other_index.get_embedding("00003", 2) - embeddings[42]).max() < 1e-2
+
+        index.delete("00002")
+        index.compact()
+        assert os.path.isfile(os.path.join(index_dir, KeiyakuEmbeddingIndex.EMBEDDING_FILE)) == False
+        assert os.path.getsize(os.path.join(index_dir, "embedding.2.f16")) == 10 * 16 * 2
+        assert [ item[3] for item in other_index.search(embeddings[45], 1) ] == ["d5"]
@@ -1,130 +1,351 @@
-import pytest
-import tensorflow as tf
-from keiyakumodel import KeiyakuModel
-import tensorflow.keras.backend as K
-import os
-import shutil
-import pandas as pd
-import json
-from transformersbase import TransformersBase, TransformersTokenizerBase
-
-class TestKeiyakuModel:
-    @pytest.fixture(scope="class")
-    def tmpsave_dir(self, tmpdir_factory):
-        tmpdir_path = tmpdir_factory.mktemp("TestKeiyakuModel")
-
-        yield tmpdir_path
-
-        shutil.rmtree(tmpdir_path)
-
-    def test_init_model(self, test_transformers_empty: TransformersBase, test_transformers_tokenizer_empty: TransformersTokenizerBase):
-        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty, 10)
-        keiyaku_model.init_model(test_transformers_empty)
-        
-        assert keiyaku_model.seq_len == test_transformers_empty.seq_len
-        assert keiyaku_model.output_class1_num == 10
-
-        assert len(keiyaku_model.model.inputs) == len(test_transformers_empty.get_inputs())
-        for input in keiyaku_model.model.inputs:
-            assert K.int_shape(input) == (None, keiyaku_model.seq_len)
-
-        assert len(keiyaku_model.model.outputs) == 2
-        assert K.int_shape(keiyaku_model.model.outputs[0]) == (None, 1)
-        assert K.int_shape(keiyaku_model.model.outputs[1]) == (None, 10)
-
-    def test_generate_data(self, test_transformers_empty: TransformersBase, test_transformers_tokenizer_empty: TransformersTokenizerBase, mocker):
-        
-        mocker.patch.object(test_transformers_tokenizer_empty, 'get_pad_idx').return_value = 2
-        mocker.patch.object(test_transformers_tokenizer_empty, 'get_sep_idx').return_value = 3
-        
-        padidx = test_transformers_tokenizer_empty.get_pad_idx()
-        sepidx = test_transformers_tokenizer_empty.get_sep_idx()
-        datas = [([10, 11, 12, 13], [0, 3, 2]), ([11, 11, sepidx, 13], [1, 4, 3]), ([2, 1, 2, 3], [2, 5, 4])]
-
-        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty)
-        keiyaku_model.init_model(test_transformers_empty)
-
-        loop_num = 0
-        for x, y in keiyaku_model._generator_data(datas, 2):
-            assert len(x) == 3
-            assert len(y) == 2
-            
-            x1 = x[0]
-            x2 = x[1]
-            x3 = x[2]
-            y1 = y[0]
-            y2 = y[1]
-            assert len(x1) == 2
-            assert len(x2) == 2
-            assert len(x3) == 2
-            assert len(y1) == 2
-            assert len(y2) == 2
-
-            assert x1[0][:5].tolist() == [10, 11, 12, 13, padidx]
-            assert x1[1][:5].tolist() == [11, 11, sepidx, 13, padidx]
-            assert x2[0][:5].tolist() == [1, 1, 1, 1, 0]
-            assert x2[1][:5].tolist() == [1, 1, 1, 1, 0]
-            assert x3[0][:5].tolist() == [0, 0, 0, 0, 0]
-            assert x3[1][:5].tolist() == [0, 0, 0, 1, 1]
-            assert y1[0] == 0
-            assert y1[1] == 1
-            assert y2[0].tolist() == [0, 0, 0, 1, 0, 0]
-            assert y2[1].tolist() == [0, 0, 0, 0, 1, 0]
-
-            loop_num += 1
-            if loop_num > 3:
-                break
-
-    def test_get_learn_rate(self, test_transformers_tokenizer_empty: TransformersTokenizerBase):
-        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty)
-
-        assert keiyaku_model._get_learn_rate(keiyaku_model.learn_rate_epoch-1) == keiyaku_model.learn_rate_init
-        assert keiyaku_model._get_learn_rate(keiyaku_model.learn_rate_epoch) == keiyaku_model.learn_rate_init * keiyaku_model.learn_rate_percent
-        assert keiyaku_model._get_learn_rate(keiyaku_model.learn_rate_epoch*2-1) == keiyaku_model.learn_rate_init * keiyaku_model.learn_rate_percent
-        assert keiyaku_model._get_learn_rate(keiyaku_model.learn_rate_epoch*2) == keiyaku_model.learn_rate_init * keiyaku_model.learn_rate_percent * keiyaku_model.learn_rate_percent
-
-    def test_get_callbacks(self, test_transformers_tokenizer_empty: TransformersTokenizerBase, tmpsave_dir):
-        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty)
-
-        callbacks = keiyaku_model._get_callbacks(tmpsave_dir)
-        assert len(callbacks) == 3
-        assert type(callbacks[0]) is tf.keras.callbacks.ModelCheckpoint
-        assert type(callbacks[1]) is KeiyakuModel.ResultOutputCallback
-        assert type(callbacks[2]) is tf.keras.callbacks.LearningRateScheduler
-
-    def test_callback_create_graph(self, tmpsave_dir):
-        df = pd.DataFrame(columns=["epoch", "output1", "output2", "output3", "output4"])
-        df = df.append(pd.Series([1, 0.00, 0.25, 0.8, 1], index = ["epoch", "output1", "output2", "output3", "output4"]), ignore_index = True)
-        df = df.append(pd.Series([2, 0.25, 0.25, 0.7, 3], index = ["epoch", "output1", "output2", "output3", "output4"]), ignore_index = True)
-        df = df.append(pd.Series([3, 0.50, 0.5, 0.6, 2], index = ["epoch", "output1", "output2", "output3", "output4"]), ignore_index = True)
-        df = df.append(pd.Series([4, 0.75, 0.5, 0.5, 1], index = ["epoch", "output1", "output2", "output3", "output4"]), ignore_index = True)
-        df = df.append(pd.Series([5, 1.00, 0.5, 0.4, 0], index = ["epoch", "output1", "output2", "output3", "output4"]), ignore_index = True)
-
-        filepath = os.path.join(tmpsave_dir, "test.png")
-        callback = KeiyakuModel.ResultOutputCallback(tmpsave_dir)
-        callback._create_graph("title", df, "epoch", ["output1", "output2", "output3"], ["output4"], filepath)
-        assert os.path.exists(filepath) == True
-
-    def test_callback_create_paramfile(self, test_transformers_empty: TransformersBase, test_transformers_tokenizer_empty: TransformersTokenizerBase, tmpsave_dir):
-        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty)
-        keiyaku_model.init_model(test_transformers_empty)
-
-        filepath = os.path.join(tmpsave_dir, "test.json")
-        keiyaku_model._create_paramfile(filepath)
-        assert os.path.exists(filepath) == True
-
-        with open(filepath, 'r') as file:
-            jsondata = json.load(file)
-            assert jsondata["batch_size"] == keiyaku_model.batch_size
-            assert jsondata["seq_len"] == keiyaku_model.seq_len
-            assert jsondata["pre_epoch"] == keiyaku_model.pre_epoch
-            assert jsondata["learn_rate_init"] == keiyaku_model.learn_rate_init
-            assert jsondata["learn_rate_epoch"] == keiyaku_model.learn_rate_epoch
-            assert jsondata["learn_rate_percent"] == keiyaku_model.learn_rate_percent
-
-
-
-
-        
-
-
+import pytest
+import tensorflow as tf
+from keiyakumodel import KeiyakuModel
+import tensorflow.keras.backend as K
+import os
+import shutil
+import pandas as pd
+import json
+import numpy as np
+from transformersbase import TransformersBase, TransformersTokenizerBase
+
+class TestKeiyakuModel:
+    @pytest.fixture(scope="class")
+    def tmpsave_dir(self, tmpdir_factory):
+        tmpdir_path = tmpdir_factory.mktemp("TestKeiyakuModel")
+
+        yield tmpdir_path
+
+        shutil.rmtree(tmpdir_path)
+
+    def test_init_model(self, test_transformers_empty: TransformersBase, test_transformers_tokenizer_empty: TransformersTokenizerBase):
+        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty, 10)
+        keiyaku_model.init_model(test_transformers_empty)
+        
+        assert keiyaku_model.seq_len == test_transformers_empty.seq_len
+        assert keiyaku_model.output_class1_num == 10
+
+        assert len(keiyaku_model.model.inputs) == len(test_transformers_empty.get_inputs())
+        for input in keiyaku_model.model.inputs:
+            assert K.int_shape(input) == (None, keiyaku_model.seq_len)
+
+        assert len(keiyaku_model.model.outputs) == 2
+        assert K.int_shape(keiyaku_model.model.outputs[0]) == (None, 1)
+        assert K.int_shape(keiyaku_model.model.outputs[1]) == (None, 10)
+
+    def test_generate_data(self, test_transformers_empty: TransformersBase, test_transformers_tokenizer_empty: TransformersTokenizerBase, mocker):
+        
+        mocker.patch.object(test_transformers_tokenizer_empty, 'get_pad_idx').return_value = 2
+        mocker.patch.object(test_transformers_tokenizer_empty, 'get_sep_idx').return_value = 3
+        
+        padidx = test_transformers_tokenizer_empty.get_pad_idx()
+        sepidx = test_transformers_tokenizer_empty.get_sep_idx()
+        datas = [([10, 11, 12, 13], [0, 3, 2]), ([11, 11, sepidx, 13], [1, 4, 3]), ([2, 1, 2, 3], [2, 5, 4])]
+
+        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty)
+        keiyaku_model.init_model(test_transformers_empty)
+
+        loop_num = 0
+        for x, y in keiyaku_model._generator_data(datas, 2):
+            assert len(x) == 3
+            assert len(y) == 2
+            
+            x1 = x[0]
+            x2 = x[1]
+            x3 = x[2]
+            y1 = y[0]
+            y2 = y[1]
+            assert len(x1) == 2
+            assert len(x2) == 2
+            assert len(x3) == 2
+            assert len(y1) == 2
+            assert len(y2) == 2
+
+            assert x1[0][:5].tolist() == [10, 11, 12, 13, padidx]
+            assert x1[1][:5].tolist() == [11, 11, sepidx, 13, padidx]
+            assert x2[0][:5].tolist() == [1, 1, 1, 1, 0]
+            assert x2[1][:5].tolist() == [1, 1, 1, 1, 0]
+            assert x3[0][:5].tolist() == [0, 0, 0, 0, 0]
+            assert x3[1][:5].tolist() == [0, 0, 0, 1, 1]
+            assert y1[0] == 0
+            assert y1[1] == 1
+            assert y2[0].tolist() == [0, 0, 0, 1, 0, 0]
+            assert y2[1].tolist() == [0, 0, 0, 0, 1, 0]
+
+            loop_num += 1
+            if loop_num > 3:
+                break
+
+    def test_predict_with_embedding(self, test_transformers_empty: TransformersBase, test_transformers_tokenizer_empty: TransformersTokenizerBase, mocker):
+        mocker.patch.object(test_transformers_tokenizer_empty, 'get_pad_idx').return_value = 0
+        mocker.patch.object(test_transformers_tokenizer_empty, 'get_sep_idx').return_value = 3
+
+        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty)
+        keiyaku_model.init_model(test_transformers_empty)
+        keiyaku_model.batch_size = 4
+        datas = [([2, 10 + i, 3, 3], [0, 0, 0]) for i in range(6)]
+
+        result = keiyaku_model.predict_with_embedding(datas)
+        assert result[2].shape == (6, 20)
+        scores = keiyaku_model.predict(datas)
+        assert np.abs(result[0] - scores[0]).max() < 1e-6
+        assert np.abs(result[1] - scores[1]).max() < 1e-6
+
+        result = keiyaku_model.predict_with_embedding([])
+        assert result[2].shape == (0, 20)
+
+    def test_predict_batches(self, test_transformers_empty: TransformersBase, test_transformers_tokenizer_empty: TransformersTokenizerBase, mocker):
+        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty)
+        keiyaku_model.init_model(test_transformers_empty)
+        keiyaku_model.batch_size = 4
+
+        predict_mock = mocker.patch.object(keiyaku_model, 'predict')
+        predict_mock.side_effect = lambda datas: [len(datas)]
+        datas = [([i], [0, 0, 0]) for i in range(21)]
+
+        results = list(keiyaku_model.predict_batches(datas, 10))
+        assert [ start for start, _ in results ] == [0, 8, 16]
+        assert [ result[0] for _, result in results ] == [8, 8, 5]
+        assert predict_mock.call_args_list[2][0][0] == datas[16:]
+
+        results = list(keiyaku_model.predict_batches(datas, 1))
+        assert len(results) == 6
+
+        #predict_batch_size指定時は予測時のみbatch_sizeの代わりに使用
+        keiyaku_model.predict_batch_size = 3
+        results = list(keiyaku_model.predict_batches(datas, 10))
+        assert [ start for start, _ in results ] == [0, 9, 18]
+        assert keiyaku_model._get_predict_batch_size() == 3
+        keiyaku_model.predict_batch_size = 0
+        assert keiyaku_model._get_predict_batch_size() == 4
+
+    def test_generate_data_soft(self, test_transformers_empty: TransformersBase, test_transformers_tokenizer_empty: TransformersTokenizerBase, mocker):
+        mocker.patch.object(test_transformers_tokenizer_empty, 'get_pad_idx').return_value = 2
+        mocker.patch.object(test_transformers_tokenizer_empty, 'get_sep_idx').return_value = 3
+
+        soft_score2 = np.array([0.1, 0.2, 0.3, 0.4, 0.0, 0.0])
+        datas = [([10, 11, 12, 13], [0.25, soft_score2, 2]), ([11, 11, 3, 13], [1, 4, 3])]
+
+        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty)
+        keiyaku_model.init_model(test_transformers_empty)
+
+        _, y = next(keiyaku_model._generator_data(datas, 2))
+        assert y[0].tolist() == [0.25, 1]
+        assert y[1][0].tolist() == soft_score2.tolist()
+        assert y[1][1].tolist() == [0, 0, 0, 0, 1, 0]
+
+    def test_train_distill_model(self, test_transformers_empty: TransformersBase, test_transformers_tokenizer_empty: TransformersTokenizerBase, mocker):
+        teacher_model = KeiyakuModel(test_transformers_tokenizer_empty)
+        teacher_model.init_model(test_transformers_empty)
+        student_model = KeiyakuModel(test_transformers_tokenizer_empty)
+        student_model.init_model(test_transformers_empty)
+
+        mocker.patch.object(test_transformers_empty, 'copy_weights').return_value = 0
+        predict_mock = mocker.patch.object(teacher_model, 'predict')
+        predict_mock.return_value = [np.array([[0.5], [0.0]]), np.array([[0.0, 1.0, 0.0, 0.0, 0.0, 0.0], [0.5, 0.5, 0.0, 0.0, 0.0, 0.0]])]
+        train_mock = mocker.patch.object(student_model, 'train_model')
+
+        #学習データ(先頭2件)のみ混合し、評価データ(残り2件)は正解のまま
+        student_model.train_data_split = 0.5
+        datas = [([10], [1, 0, 2]), ([11], [0, 1, 3]), ([12], [1, 2, 0]), ([13], [0, 3, 1])]
+        student_model.train_distill_model(teacher_model, datas, 3, "savedir", 0.5)
+
+        assert predict_mock.call_args[0][0] == datas[:2]
+        distill_datas, epoch_num, save_dir, test_datas = train_mock.call_args[0]
+        assert epoch_num == 3
+        assert save_dir == "savedir"
+        assert len(distill_datas) == 2
+        assert test_datas == datas[2:]
+        assert distill_datas[0][0] == [10]
+        assert distill_datas[0][1][0] == 0.75
+        assert distill_datas[0][1][1].tolist() == [0.5, 0.5, 0.0, 0.0, 0.0, 0.0]
+        assert distill_datas[0][1][2] == 2
+        assert distill_datas[1][1][0] == 0.0
+        assert distill_datas[1][1][1].tolist() == [0.25, 0.75, 0.0, 0.0, 0.0, 0.0]
+
+        for layer_name in ["output1", "output2"]:
+            teacher_weights = teacher_model.model.get_layer(layer_name).get_weights()
+            student_weights = student_model.model.get_layer(layer_name).get_weights()
+            assert all([ (teacher_weight == student_weight).all() for teacher_weight, student_weight in zip(teacher_weights, student_weights) ])
+
+    def test_train_model(self, test_transformers_empty: TransformersBase, test_transformers_tokenizer_empty: TransformersTokenizerBase, tmpsave_dir, mocker):
+        mocker.patch.object(test_transformers_tokenizer_empty, 'get_pad_idx').return_value = 0
+        mocker.patch.object(test_transformers_tokenizer_empty, 'get_sep_idx').return_value = 3
+        mocker.patch.object(test_transformers_empty, 'set_trainable')
+        mocker.patch.object(test_transformers_empty, 'set_trainable_layers')
+
+        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty)
+        keiyaku_model.init_model(test_transformers_empty)
+        keiyaku_model.set_train_params({ "pre_epoch": 1, "batch_size": 4, "early_stopping_patience": 1, "validation_sample_num": 8, "learn_rate_init": 0.0 })
+
+        #学習率0のため改善せず、patience経過後に打切り
+        datas = [ ([2, 10 + i % 5, 3], [i % 2, i % 3, 0]) for i in range(40) ]
+        spy = mocker.spy(keiyaku_model, '_generator_data')
+        testscore = keiyaku_model.train_model(datas[:32], 10, tmpsave_dir, datas[32:] * 3)
+        assert "loss" in testscore
+        assert len(spy.call_args_list[1][0][0]) < 24
+        assert len(spy.call_args_list[-1][0][0]) == 24
+
+        with open(os.path.join(tmpsave_dir, "train_time.json")) as f:
+            train_time = json.load(f)
+        assert train_time["epoch_num"] == 10
+        assert train_time["run_epoch_num"] == 2
+        assert train_time["saved_seconds_early_stopping"] > 0
+
+    def test_get_train_stages(self, test_transformers_tokenizer_empty: TransformersTokenizerBase, mocker):
+        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty)
+        keiyaku_model.bert_model = mocker.Mock()
+        keiyaku_model.bert_model.get_layer_num.return_value = 4
+        assert keiyaku_model._get_train_stages(10) == [ (0, 10, None) ]
+
+        keiyaku_model.train_layer_num = 2
+        assert keiyaku_model._get_train_stages(10) == [ (0, 10, 2) ]
+
+        #2エポック毎に1層ずつ広げ、全層に達した後は最後まで全層を学習
+        keiyaku_model.unfreeze_epoch = 2
+        assert keiyaku_model._get_train_stages(10) == [ (0, 2, 2), (2, 4, 3), (4, 10, None) ]
+        assert keiyaku_model._get_train_stages(3) == [ (0, 2, 2), (2, 3, 3) ]
+
+        keiyaku_model.train_layer_num = 4
+        assert keiyaku_model._get_train_stages(10) == [ (0, 10, None) ]
+
+    def test_get_validation_datas(self, test_transformers_tokenizer_empty: TransformersTokenizerBase):
+        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty)
+        keiyaku_model.batch_size = 4
+
+        datas = [ ([i], [i % 2, 0 if i < 80 else 1, 0]) for i in range(100) ]
+        assert keiyaku_model._get_validation_datas(datas) is datas
+
+        #正解の組毎の件数比を維持して抽出(毎回同じデータ)
+        keiyaku_model.validation_sample_num = 20
+        validation_datas = keiyaku_model._get_validation_datas(datas)
+        assert len(validation_datas) == 20
+        assert len([ data for data in validation_datas if data[1][1] == 1 ]) == 4
+        assert len([ data for data in validation_datas if data[1][0] == 1 ]) == 10
+        assert validation_datas == keiyaku_model._get_validation_datas(datas)
+
+        #蒸留学習時の確率の教師値は最大の分類で抽出
+        datas = [ ([i], [0.0, np.eye(6)[i % 3], 0]) for i in range(30) ]
+        validation_datas = keiyaku_model._get_validation_datas(datas)
+        assert len(validation_datas) == 21
+        assert len([ data for data in validation_datas if data[1][1][2] == 1 ]) == 7
+
+    def test_get_distributed_dataset(self, test_transformers_empty: TransformersBase, test_transformers_tokenizer_empty: TransformersTokenizerBase, mocker):
+        mocker.patch.object(test_transformers_tokenizer_empty, 'get_pad_idx').return_value = 0
+        mocker.patch.object(test_transformers_tokenizer_empty, 'get_sep_idx').return_value = 3
+
+        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty)
+        keiyaku_model.init_model(test_transformers_empty)
+
+        #全体のバッチ単位で生成し、ワーカー間の分割はデータ単位
+        datas = [ ([2, 10 + i % 5, 3], [i % 2, i % 3, 0]) for i in range(20) ]
+        dataset = keiyaku_model._get_distributed_dataset(datas, 8)
+        assert dataset.options().experimental_distribute.auto_shard_policy == tf.data.experimental.AutoShardPolicy.DATA
+        x_outs, y_outs = next(iter(dataset))
+        assert [ x_out.shape for x_out in x_outs ] == [ (8, keiyaku_model.seq_len) ] * 3
+        assert y_outs[0].shape == (8,)
+        assert y_outs[1].shape == (8, 6)
+        assert x_outs[0].numpy().tolist() == next(keiyaku_model._generator_data(datas, 8))[0][0].tolist()
+
+    def test_is_chief(self, test_transformers_tokenizer_empty: TransformersTokenizerBase, mocker):
+        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty)
+        assert keiyaku_model._is_chief(tf.distribute.get_strategy()) == True
+
+        strategy = mocker.Mock()
+        strategy.cluster_resolver.cluster_spec.return_value.as_dict.return_value = { "worker": ["localhost:1", "localhost:2"] }
+        strategy.cluster_resolver.task_type = "worker"
+        strategy.cluster_resolver.task_id = 0
+        assert keiyaku_model._is_chief(strategy) == True
+        strategy.cluster_resolver.task_id = 1
+        assert keiyaku_model._is_chief(strategy) == False
+
+    def test_get_learn_rate(self, test_transformers_tokenizer_empty: TransformersTokenizerBase):
+        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty)
+
+        assert keiyaku_model._get_learn_rate(keiyaku_model.learn_rate_epoch-1) == keiyaku_model.learn_rate_init
+        assert keiyaku_model._get_learn_rate(keiyaku_model.learn_rate_epoch) == keiyaku_model.learn_rate_init * keiyaku_model.learn_rate_percent
+        assert keiyaku_model._get_learn_rate(keiyaku_model.learn_rate_epoch*2-1) == keiyaku_model.learn_rate_init * keiyaku_model.learn_rate_percent
+        assert keiyaku_model._get_learn_rate(keiyaku_model.learn_rate_epoch*2) == keiyaku_model.learn_rate_init * keiyaku_model.learn_rate_percent * keiyaku_model.learn_rate_percent
+
+    def test_set_train_params(self, test_transformers_tokenizer_empty: TransformersTokenizerBase):
+        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty)
+        keiyaku_model.set_train_params({ "batch_size": "16", "learn_rate_init": 5e-5 })
+        assert keiyaku_model.batch_size == 16
+        assert keiyaku_model.learn_rate_init == 5e-5
+
+        with pytest.raises(ValueError):
+            keiyaku_model.set_train_params({ "optimizer": "sgd" })
+
+    def test_callback_median_stopping(self, tmpsave_dir):
+        progress_dir = os.path.join(tmpsave_dir, "progress")
+        for i, history in enumerate([ [1.0, 0.5, 0.4], [1.0, 0.6, 0.5], [1.0, 0.7], [0.9] ]):
+            callback = KeiyakuModel.MedianStoppingCallback(progress_dir, "trial{}".format(i))
+            callback.history = history[:-1]
+            callback.model = tf.keras.Sequential()
+            callback.on_epoch_end(len(history) - 1, { "val_loss": history[-1] })
+
+        #2エポック目までは打切らない、比較対象(同エポックまで到達した試行)が3件未満は打切らない
+        callback = KeiyakuModel.MedianStoppingCallback(progress_dir, "target")
+        callback.model = tf.keras.Sequential()
+        callback.on_epoch_end(0, { "val_loss": 2.0 })
+        callback.on_epoch_end(1, { "val_loss": 1.9 })
+        assert callback.model.stop_training == False
+
+        callback.on_epoch_end(2, { "val_loss": 1.8 })
+        assert callback.model.stop_training == False
+
+        #3エポック目の最良値1.8が3エポック目まで到達した試行の最良値[0.4, 0.5]の中央値より悪い
+        callback.min_trials = 2
+        callback.history = callback.history[:-1]
+        callback.on_epoch_end(2, { "val_loss": 1.8 })
+        assert callback.model.stop_training == True
+        assert callback.stopped_epoch == 3
+
+        with open(os.path.join(progress_dir, "target.json")) as f:
+            assert json.load(f)["history"] == [2.0, 1.9, 1.8]
+
+    def test_get_callbacks(self, test_transformers_tokenizer_empty: TransformersTokenizerBase, tmpsave_dir):
+        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty)
+
+        callbacks = keiyaku_model._get_callbacks(tmpsave_dir)
+        assert len(callbacks) == 3
+        assert type(callbacks[0]) is tf.keras.callbacks.ModelCheckpoint
+        assert type(callbacks[1]) is KeiyakuModel.ResultOutputCallback
+        assert type(callbacks[2]) is tf.keras.callbacks.LearningRateScheduler
+
+    def test_callback_create_graph(self, tmpsave_dir):
+        df = pd.DataFrame(columns=["epoch", "output1", "output2", "output3", "output4"])
+        df = df.append(pd.Series([1, 0.00, 0.25, 0.8, 1], index = ["epoch", "output1", "output2", "output3", "output4"]), ignore_index = True)
+        df = df.append(pd.Series([2, 0.25, 0.25, 0.7, 3], index = ["epoch", "output1", "output2", "output3", "output4"]), ignore_index = True)
+        df = df.append(pd.Series([3, 0.50, 0.5, 0.6, 2], index = ["epoch", "output1", "output2", "output3", "output4"]), ignore_index = True)
+        df = df.append(pd.Series([4, 0.75, 0.5, 0.5, 1], index = ["epoch", "output1", "output2", "output3", "output4"]), ignore_index = True)
+        df = df.append(pd.Series([5, 1.00, 0.5, 0.4, 0], index = ["epoch", "output1", "output2", "output3", "output4"]), ignore_index = True)
+
+        filepath = os.path.join(tmpsave_dir, "test.png")
+        callback = KeiyakuModel.ResultOutputCallback(tmpsave_dir)
+        callback._create_graph("title", df, "epoch", ["output1", "output2", "output3"], ["output4"], filepath)
+        assert os.path.exists(filepath) == True
+
+    def test_callback_create_paramfile(self, test_transformers_empty: TransformersBase, test_transformers_tokenizer_empty: TransformersTokenizerBase, tmpsave_dir):
+        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty)
+        keiyaku_model.init_model(test_transformers_empty)
+
+        filepath = os.path.join(tmpsave_dir, "test.json")
+        keiyaku_model._create_paramfile(filepath)
+        assert os.path.exists(filepath) == True
+
+        with open(filepath, 'r') as file:
+            jsondata = json.load(file)
+            assert jsondata["batch_size"] == keiyaku_model.batch_size
+            assert jsondata["seq_len"] == keiyaku_model.seq_len
+            assert jsondata["pre_epoch"] == keiyaku_model.pre_epoch
+            assert jsondata["learn_rate_init"] == keiyaku_model.learn_rate_init
+            assert jsondata["learn_rate_epoch"] == keiyaku_model.learn_rate_epoch
+            assert jsondata["learn_rate_percent"] == keiyaku_model.learn_rate_percent
+
+
+
+
+        
+
+
@@ -0,0 +1,79 @@
+import pytest
+import numpy as np
+import tensorflow as tf
+import tensorflow.keras.backend as K
+import transformers
+from keiyakumodelbiencoder import KeiyakuModelBiEncoder
+from transformersbase import TransformersBase, TransformersTokenizerBase
+
+class TransfoermersTiny(TransformersBase):
+    def __init__(self):
+        super().__init__("tiny", 21)
+
+    def init_model(self, model_dir_path: str) -> None:
+        self.inputs = [ tf.keras.layers.Input((self.seq_len,), dtype=tf.int32) for _ in range(3) ]
+        self.transformers_model = transformers.TFBertModel(transformers.BertConfig(vocab_size=30, hidden_size=8, num_hidden_layers=1, num_attention_heads=2, intermediate_size=16))
+        self.outputs = self.transformers_model(self.inputs)
+
+    def download_save(self, model_full_name: str, model_dir_path: str) -> None:
+        pass
+
+class TestKeiyakuModelBiEncoder:
+    @pytest.fixture
+    def keiyaku_model(self, test_transformers_tokenizer_empty: TransformersTokenizerBase, mocker):
+        mocker.patch.object(test_transformers_tokenizer_empty, 'get_cls_idx').return_value = 2
+        mocker.patch.object(test_transformers_tokenizer_empty, 'get_sep_idx').return_value = 3
+        mocker.patch.object(test_transformers_tokenizer_empty, 'get_pad_idx').return_value = 0
+
+        bert = TransfoermersTiny()
+        bert.init_model("tiny")
+        keiyaku_model = KeiyakuModelBiEncoder(test_transformers_tokenizer_empty)
+        keiyaku_model.init_model(bert)
+        return keiyaku_model
+
+    @pytest.fixture
+    def predict_datas(self):
+        #文章i(10+iをi%4+1個)と前文章i-1の組
+        sentences = [ [] ] + [ [ 10 + i ] * (i % 4 + 1) for i in range(15) ]
+        return [ ([2] + sentences[i+1] + [3] + sentences[i] + [3], [i % 2, i % 6, 0]) for i in range(15) ]
+
+    def test_init_model(self, keiyaku_model: KeiyakuModelBiEncoder):
+        assert keiyaku_model.sentence_seq_len == 11
+        assert K.int_shape(keiyaku_model.encoder_model.inputs[0]) == (None, 11)
+        assert len(keiyaku_model.model.inputs) == 6
+        assert keiyaku_model.model.output_names == ["output1", "output2"]
+
+    def test_predict(self, keiyaku_model: KeiyakuModelBiEncoder, predict_datas, mocker):
+        spy = mocker.spy(keiyaku_model, 'encode_sentences')
+        scores = keiyaku_model.predict(predict_datas)
+        assert scores[0].shape == (15, 1)
+        assert scores[1].shape == (15, 6)
+
+        #前文章は1つ前の文章のエンコード結果を再利用
+        assert len(spy.call_args[0][0]) == 16
+
+        x_outs, _ = next(keiyaku_model._generator_data(predict_datas, 15))
+        model_scores = keiyaku_model.model.predict(x_outs)
+        assert np.abs(scores[0] - model_scores[0]).max() < 1e-5
+        assert np.abs(scores[1] - model_scores[1]).max() < 1e-5
+
+        result = keiyaku_model.predict_with_embedding(predict_datas)
+        assert result[2].shape == (15, 8)
+        assert np.abs(result[0] - scores[0]).max() < 1e-6
+
+        scores = keiyaku_model.predict([])
+        assert scores[0].shape == (0, 1)
+        assert scores[1].shape == (0, 6)
+
+    def test_generator_data(self, keiyaku_model: KeiyakuModelBiEncoder, predict_datas):
+        x_outs, y_outs = next(keiyaku_model._generator_data(predict_datas, 5))
+        assert len(x_outs) == 6
+        assert x_outs[0].shape == (5, 11)
+        assert x_outs[0][1].tolist() == [2, 11, 11, 3, 0, 0, 0, 0, 0, 0, 0]
+        assert x_outs[3][1].tolist() == [2, 10, 3, 0, 0, 0, 0, 0, 0, 0, 0]
+        assert y_outs[0].tolist() == [0, 1, 0, 1, 0]
+        assert y_outs[1].shape == (5, 6)
+
+    def test_export_tflite(self, keiyaku_model: KeiyakuModelBiEncoder):
+        with pytest.raises(NotImplementedError):
+            keiyaku_model.export_tflite("weights.tflite")
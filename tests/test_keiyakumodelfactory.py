@@ -1,89 +1,234 @@
-import pytest
-import glob
-import os
-from keiyakumodel import KeiyakuModel
-from keiyakumodelfactory import KeiyakuModelFactory
-from transformersbert import TransformersBert, TransformersTokenizerBert
-from transformersbertcolorful import TransformersBertColorful, TransformersTokenizerBertColorful
-from transformersroberta import TransformersRoberta, TransformersTokenizerRoberta
-
-class TestKeiyakuModelFactory:
-
-    def test_get_keiyakumodel(self):
-        keiyakumodel, model, tokenizer = KeiyakuModelFactory.get_keiyakumodel()
-        assert type(keiyakumodel) == KeiyakuModel
-        assert type(model) == TransformersBert
-        assert type(tokenizer) == TransformersTokenizerBert
-
-        keiyakumodel, model, tokenizer = KeiyakuModelFactory.get_keiyakumodel(KeiyakuModelFactory.MODEL_NAME_BERT, False)
-        assert type(keiyakumodel) == KeiyakuModel
-        assert type(model) == TransformersBert
-        assert type(tokenizer) == TransformersTokenizerBert
-
-        keiyakumodel, model, tokenizer = KeiyakuModelFactory.get_keiyakumodel(KeiyakuModelFactory.MODEL_NAME_BERTCOLORFUL, False)
-        assert type(keiyakumodel) == KeiyakuModel
-        assert type(model) == TransformersBertColorful
-        assert type(tokenizer) == TransformersTokenizerBertColorful
-
-        keiyakumodel, model, tokenizer = KeiyakuModelFactory.get_keiyakumodel(KeiyakuModelFactory.MODEL_NAME_ROBERTA, False)
-        assert type(keiyakumodel) == KeiyakuModel
-        assert type(model) == TransformersRoberta
-        assert type(tokenizer) == TransformersTokenizerRoberta
-
-        keiyakumodel, model2, tokenizer2 = KeiyakuModelFactory.get_keiyakumodel(KeiyakuModelFactory.MODEL_NAME_ROBERTA, False)
-        assert keiyakumodel == keiyakumodel
-        assert model == model2
-        assert tokenizer == tokenizer2
-
-        keiyakumode2, model2, tokenizer2 = KeiyakuModelFactory.get_keiyakumodel(KeiyakuModelFactory.MODEL_NAME_ROBERTA, True)
-        assert keiyakumodel == keiyakumode2
-        assert model == model2
-        assert tokenizer == tokenizer2
-
-        with pytest.raises(NotImplementedError):
-            _, _, _ = KeiyakuModelFactory.get_keiyakumodel("ERROR")
-
-    def test_get_transfomers(self):
-
-        model, tokenizer = KeiyakuModelFactory.get_transfomers()
-        assert type(model) == TransformersBert
-        assert type(tokenizer) == TransformersTokenizerBert
-
-        model, tokenizer = KeiyakuModelFactory.get_transfomers(KeiyakuModelFactory.MODEL_NAME_BERT)
-        assert type(model) == TransformersBert
-        assert type(tokenizer) == TransformersTokenizerBert
-
-        model, tokenizer = KeiyakuModelFactory.get_transfomers(KeiyakuModelFactory.MODEL_NAME_BERTCOLORFUL)
-        assert type(model) == TransformersBertColorful
-        assert type(tokenizer) == TransformersTokenizerBertColorful
-
-        model, tokenizer = KeiyakuModelFactory.get_transfomers(KeiyakuModelFactory.MODEL_NAME_ROBERTA)
-        assert type(model) == TransformersRoberta
-        assert type(tokenizer) == TransformersTokenizerRoberta
-
-        model2, tokenizer2 = KeiyakuModelFactory.get_transfomers(KeiyakuModelFactory.MODEL_NAME_ROBERTA)
-        assert model != model2
-        assert tokenizer != tokenizer2
-
-        with pytest.raises(NotImplementedError):
-            _, _ = KeiyakuModelFactory.get_transfomers("ERROR")
-
-    @pytest.mark.skip(reason='not testdata update')
-    def test_download_transformers(self):
-
-        model, tokenizer = KeiyakuModelFactory.get_transfomers(KeiyakuModelFactory.MODEL_NAME_BERT, True)
-        assert type(model) == TransformersBert
-        assert type(tokenizer) == TransformersTokenizerBert
-
-        model, tokenizer = KeiyakuModelFactory.get_transfomers(KeiyakuModelFactory.MODEL_NAME_BERTCOLORFUL, True)
-        assert type(model) == TransformersBertColorful
-        assert type(tokenizer) == TransformersTokenizerBertColorful
-
-        model, tokenizer = KeiyakuModelFactory.get_transfomers(KeiyakuModelFactory.MODEL_NAME_ROBERTA, True)
-        assert type(model) == TransformersRoberta
-        assert type(tokenizer) == TransformersTokenizerRoberta
-
-        model2, tokenizer2 = KeiyakuModelFactory.get_transfomers(KeiyakuModelFactory.MODEL_NAME_ROBERTA, True)
-        assert model != model2
-        assert tokenizer != tokenizer2
-        
+import pytest
+import glob
+import os
+from keiyakucpuprofile import KeiyakuCpuProfile
+from keiyakumodel import KeiyakuModel
+from keiyakumodelbiencoder import KeiyakuModelBiEncoder
+from keiyakumodelfactory import KeiyakuModelFactory
+from transformersbert import TransformersBert, TransformersTokenizerBert
+from transformersbertcolorful import TransformersBertColorful, TransformersTokenizerBertColorful
+from transformersroberta import TransformersRoberta, TransformersTokenizerRoberta
+from transformersbase import TransformersBase
+
+class TestKeiyakuModelFactory:
+
+    def test_get_keiyakumodel(self):
+        keiyakumodel, model, tokenizer = KeiyakuModelFactory.get_keiyakumodel()
+        assert type(keiyakumodel) == KeiyakuModel
+        assert type(model) == TransformersBert
+        assert type(tokenizer) == TransformersTokenizerBert
+
+        keiyakumodel, model, tokenizer = KeiyakuModelFactory.get_keiyakumodel(KeiyakuModelFactory.MODEL_NAME_BERT, False)
+        assert type(keiyakumodel) == KeiyakuModel
+        assert type(model) == TransformersBert
+        assert type(tokenizer) == TransformersTokenizerBert
+
+        keiyakumodel, model, tokenizer = KeiyakuModelFactory.get_keiyakumodel(KeiyakuModelFactory.MODEL_NAME_BERTCOLORFUL, False)
+        assert type(keiyakumodel) == KeiyakuModel
+        assert type(model) == TransformersBertColorful
+        assert type(tokenizer) == TransformersTokenizerBertColorful
+
+        keiyakumodel, model, tokenizer = KeiyakuModelFactory.get_keiyakumodel(KeiyakuModelFactory.MODEL_NAME_ROBERTA, False)
+        assert type(keiyakumodel) == KeiyakuModel
+        assert type(model) == TransformersRoberta
+        assert type(tokenizer) == TransformersTokenizerRoberta
+
+        keiyakumodel, model2, tokenizer2 = KeiyakuModelFactory.get_keiyakumodel(KeiyakuModelFactory.MODEL_NAME_ROBERTA, False)
+        assert keiyakumodel == keiyakumodel
+        assert model == model2
+        assert tokenizer == tokenizer2
+
+        keiyakumode2, model2, tokenizer2 = KeiyakuModelFactory.get_keiyakumodel(KeiyakuModelFactory.MODEL_NAME_ROBERTA, True)
+        assert keiyakumodel == keiyakumode2
+        assert model == model2
+        assert tokenizer == tokenizer2
+
+        with pytest.raises(NotImplementedError):
+            _, _, _ = KeiyakuModelFactory.get_keiyakumodel("ERROR")
+
+    def test_get_transfomers(self):
+
+        model, tokenizer = KeiyakuModelFactory.get_transfomers()
+        assert type(model) == TransformersBert
+        assert type(tokenizer) == TransformersTokenizerBert
+
+        model, tokenizer = KeiyakuModelFactory.get_transfomers(KeiyakuModelFactory.MODEL_NAME_BERT)
+        assert type(model) == TransformersBert
+        assert type(tokenizer) == TransformersTokenizerBert
+
+        model, tokenizer = KeiyakuModelFactory.get_transfomers(KeiyakuModelFactory.MODEL_NAME_BERTCOLORFUL)
+        assert type(model) == TransformersBertColorful
+        assert type(tokenizer) == TransformersTokenizerBertColorful
+
+        model, tokenizer = KeiyakuModelFactory.get_transfomers(KeiyakuModelFactory.MODEL_NAME_ROBERTA)
+        assert type(model) == TransformersRoberta
+        assert type(tokenizer) == TransformersTokenizerRoberta
+
+        model2, tokenizer2 = KeiyakuModelFactory.get_transfomers(KeiyakuModelFactory.MODEL_NAME_ROBERTA)
+        assert model != model2
+        assert tokenizer != tokenizer2
+
+        with pytest.raises(NotImplementedError):
+            _, _ = KeiyakuModelFactory.get_transfomers("ERROR")
+
+    def test_get_weight_hash(self, tmpdir):
+        weight_path = os.path.join(tmpdir, "weights")
+        with open(weight_path + ".index", "wb") as f:
+            f.write(b"index1")
+
+        hash1 = KeiyakuModelFactory._get_weight_hash(weight_path)
+        assert hash1 == KeiyakuModelFactory._get_weight_hash(weight_path)
+
+        with open(weight_path + ".index", "wb") as f:
+            f.write(b"index2")
+
+        hash2 = KeiyakuModelFactory._get_weight_hash(weight_path)
+        assert hash1 != hash2
+
+    def test_get_model_version(self):
+        _, _, _ = KeiyakuModelFactory.get_keiyakumodel(KeiyakuModelFactory.MODEL_NAME_BERT, False)
+        assert KeiyakuModelFactory.get_model_version() == ""
+
+        _, _, _ = KeiyakuModelFactory.get_keiyakumodel(KeiyakuModelFactory.MODEL_NAME_ROBERTA, True)
+        assert KeiyakuModelFactory.get_model_version().startswith(KeiyakuModelFactory.MODEL_NAME_ROBERTA + "-")
+
+    def test_get_weight_version(self):
+        version = KeiyakuModelFactory.get_weight_version(KeiyakuModelFactory.MODEL_NAME_ROBERTA)
+        assert version.startswith(KeiyakuModelFactory.MODEL_NAME_ROBERTA + "-")
+        assert version == KeiyakuModelFactory.get_weight_version(KeiyakuModelFactory.MODEL_NAME_ROBERTA)
+        assert KeiyakuModelFactory.get_model_version() == ""
+
+    def test_set_backend(self):
+        with pytest.raises(NotImplementedError):
+            KeiyakuModelFactory.set_backend("error")
+
+        KeiyakuModelFactory.set_backend(KeiyakuModelFactory.BACKEND_TFLITE)
+        version = KeiyakuModelFactory.get_weight_version(KeiyakuModelFactory.MODEL_NAME_ROBERTA)
+        assert version.startswith(KeiyakuModelFactory.MODEL_NAME_ROBERTA + "-tflite-")
+
+        KeiyakuModelFactory.set_backend(KeiyakuModelFactory.BACKEND_KERAS)
+        version = KeiyakuModelFactory.get_weight_version(KeiyakuModelFactory.MODEL_NAME_ROBERTA)
+        assert "tflite" not in version
+
+    def test_set_default_model_name(self):
+        KeiyakuModelFactory.set_default_model_name(KeiyakuModelFactory.MODEL_NAME_BERT_STUDENT)
+        version = KeiyakuModelFactory.get_weight_version()
+        assert version.startswith(KeiyakuModelFactory.MODEL_NAME_BERT_STUDENT + "-")
+        model, _, _, _, _ = KeiyakuModelFactory._get_transformers_info(KeiyakuModelFactory.MODEL_NAME_BERT_STUDENT)
+        assert model.layer_num == KeiyakuModelFactory.STUDENT_LAYER_NUM
+        assert KeiyakuModelFactory.get_weight_name() == "weights_student"
+
+        KeiyakuModelFactory.set_default_model_name()
+        assert KeiyakuModelFactory.get_weight_name() == "weights"
+
+    def test_biencoder(self):
+        _, _, _, weight_name, keiyakumodel_class = KeiyakuModelFactory._get_transformers_info(KeiyakuModelFactory.MODEL_NAME_BERT_BIENCODER)
+        assert keiyakumodel_class == KeiyakuModelBiEncoder
+        assert weight_name == "weights_biencoder"
+
+        _, _, _, _, keiyakumodel_class = KeiyakuModelFactory._get_transformers_info(KeiyakuModelFactory.MODEL_NAME_BERT)
+        assert keiyakumodel_class == KeiyakuModel
+
+    def test_set_seq_len(self):
+        KeiyakuModelFactory.set_seq_len(128)
+        model, _, _, _, _ = KeiyakuModelFactory._get_transformers_info(KeiyakuModelFactory.MODEL_NAME_ROBERTA)
+        assert model.seq_len == 128
+
+        KeiyakuModelFactory.set_seq_len()
+        model, _, _, _, _ = KeiyakuModelFactory._get_transformers_info(KeiyakuModelFactory.MODEL_NAME_ROBERTA)
+        assert model.seq_len == KeiyakuModelFactory.DEFAULT_SEQ_LEN
+
+    def test_save_seq_len(self, tmpdir, mocker):
+        mocker.patch.object(KeiyakuModelFactory, '_get_seq_len_path').return_value = os.path.join(str(tmpdir), "model", "seq_len.json")
+        assert KeiyakuModelFactory.get_seq_len(KeiyakuModelFactory.MODEL_NAME_BERT) == KeiyakuModelFactory.DEFAULT_SEQ_LEN
+
+        #トークナイザが同じモデルはbertの入力長を使用
+        KeiyakuModelFactory.save_seq_len(KeiyakuModelFactory.MODEL_NAME_BERT, 128)
+        KeiyakuModelFactory.save_seq_len(KeiyakuModelFactory.MODEL_NAME_ROBERTA, 192)
+        assert KeiyakuModelFactory.get_seq_len(KeiyakuModelFactory.MODEL_NAME_BERT) == 128
+        assert KeiyakuModelFactory.get_seq_len(KeiyakuModelFactory.MODEL_NAME_BERT_STUDENT) == 128
+        assert KeiyakuModelFactory.get_seq_len(KeiyakuModelFactory.MODEL_NAME_ROBERTA) == 192
+        assert KeiyakuModelFactory.get_seq_len(KeiyakuModelFactory.MODEL_NAME_BERTCOLORFUL) == KeiyakuModelFactory.DEFAULT_SEQ_LEN
+        version = KeiyakuModelFactory.get_weight_version(KeiyakuModelFactory.MODEL_NAME_BERT_BIENCODER)
+        model, _, _, _, _ = KeiyakuModelFactory._get_transformers_info(KeiyakuModelFactory.MODEL_NAME_BERT_BIENCODER)
+        assert model.seq_len == 128
+        assert version.startswith("bert-biencoder-s128-")
+
+        #set_seq_len指定時は保存値より優先
+        KeiyakuModelFactory.set_seq_len(64)
+        assert KeiyakuModelFactory.get_seq_len(KeiyakuModelFactory.MODEL_NAME_ROBERTA) == 64
+        KeiyakuModelFactory.set_seq_len()
+
+        KeiyakuModelFactory.save_seq_len(KeiyakuModelFactory.MODEL_NAME_BERT)
+        assert KeiyakuModelFactory.get_seq_len(KeiyakuModelFactory.MODEL_NAME_BERT) == KeiyakuModelFactory.DEFAULT_SEQ_LEN
+        assert KeiyakuModelFactory.get_seq_len(KeiyakuModelFactory.MODEL_NAME_ROBERTA) == 192
+
+    def test_apply_cpu_profile(self, mocker):
+        load_mock = mocker.patch.object(KeiyakuCpuProfile, 'load')
+        thread_mock = mocker.patch.object(KeiyakuModelFactory, 'set_thread_num')
+
+        load_mock.return_value = None
+        assert KeiyakuModelFactory.apply_cpu_profile() is None
+        assert thread_mock.call_count == 0
+        assert KeiyakuModelFactory.predict_batch_size == 0
+
+        load_mock.return_value = { "onednn": True, "intra_op_num": 4, "inter_op_num": 2, "batch_size": 32 }
+        assert KeiyakuModelFactory.apply_cpu_profile()["batch_size"] == 32
+        thread_mock.assert_called_once_with(4, 2)
+        assert KeiyakuModelFactory.predict_batch_size == 32
+        KeiyakuModelFactory.predict_batch_size = 0
+
+    def test_set_layer_num(self):
+        with pytest.raises(NotImplementedError):
+            KeiyakuModelFactory.set_layer_num(4, "error")
+
+        KeiyakuModelFactory.set_layer_num(4, TransformersBase.POOLING_CLS)
+        model, _, _, _, _ = KeiyakuModelFactory._get_transformers_info(KeiyakuModelFactory.MODEL_NAME_ROBERTA)
+        assert model.layer_num == 4
+        assert model.pooling == TransformersBase.POOLING_CLS
+        assert KeiyakuModelFactory.get_weight_name(KeiyakuModelFactory.MODEL_NAME_ROBERTA) == "weights_l4_cls"
+        assert KeiyakuModelFactory.get_weight_name(KeiyakuModelFactory.MODEL_NAME_BERT_STUDENT) == "weights_student"
+        assert KeiyakuModelFactory.get_weight_name(KeiyakuModelFactory.MODEL_NAME_BERT_BIENCODER) == "weights_biencoder_l4_cls"
+
+        KeiyakuModelFactory.set_layer_num()
+        model, _, _, _, _ = KeiyakuModelFactory._get_transformers_info(KeiyakuModelFactory.MODEL_NAME_ROBERTA)
+        assert model.layer_num is None
+        assert KeiyakuModelFactory.get_weight_name(KeiyakuModelFactory.MODEL_NAME_ROBERTA) == "weights"
+
+    def test_keep_loaded_model(self, mocker):
+        #バージョン・トークナイザ等の取得は読込済のモデルを変更しない
+        mocker.patch.object(TransformersTokenizerBert, 'init_tokenizer')
+        mocker.patch.object(TransformersTokenizerRoberta, 'init_tokenizer')
+        KeiyakuModelFactory._craete_transformers(KeiyakuModelFactory.MODEL_NAME_BERT_BIENCODER)
+        KeiyakuModelFactory.now_model_name = KeiyakuModelFactory.MODEL_NAME_BERT_BIENCODER
+        model = KeiyakuModelFactory.model
+
+        KeiyakuModelFactory.get_weight_version(KeiyakuModelFactory.MODEL_NAME_ROBERTA)
+        KeiyakuModelFactory.get_weight_name(KeiyakuModelFactory.MODEL_NAME_ROBERTA)
+        KeiyakuModelFactory.get_tokenizer(KeiyakuModelFactory.MODEL_NAME_ROBERTA)
+        KeiyakuModelFactory.preload_files(KeiyakuModelFactory.MODEL_NAME_ROBERTA)
+        assert KeiyakuModelFactory.model is model
+        assert KeiyakuModelFactory.weight_name == "weights_biencoder"
+        assert KeiyakuModelFactory.keiyakumodel_class == KeiyakuModelBiEncoder
+        assert KeiyakuModelFactory.now_model_name == KeiyakuModelFactory.MODEL_NAME_BERT_BIENCODER
+        KeiyakuModelFactory.now_model_name = ""
+
+    @pytest.mark.skip(reason='not testdata update')
+    def test_download_transformers(self):
+
+        model, tokenizer = KeiyakuModelFactory.get_transfomers(KeiyakuModelFactory.MODEL_NAME_BERT, True)
+        assert type(model) == TransformersBert
+        assert type(tokenizer) == TransformersTokenizerBert
+
+        model, tokenizer = KeiyakuModelFactory.get_transfomers(KeiyakuModelFactory.MODEL_NAME_BERTCOLORFUL, True)
+        assert type(model) == TransformersBertColorful
+        assert type(tokenizer) == TransformersTokenizerBertColorful
+
+        model, tokenizer = KeiyakuModelFactory.get_transfomers(KeiyakuModelFactory.MODEL_NAME_ROBERTA, True)
+        assert type(model) == TransformersRoberta
+        assert type(tokenizer) == TransformersTokenizerRoberta
+
+        model2, tokenizer2 = KeiyakuModelFactory.get_transfomers(KeiyakuModelFactory.MODEL_NAME_ROBERTA, True)
+        assert model != model2
+        assert tokenizer != tokenizer2
+        
@@ -0,0 +1,53 @@
+import pytest
+import os
+import numpy as np
+from keiyakumodel import KeiyakuModel
+from keiyakumodeltflite import KeiyakuModelTFLite
+from transformersbase import TransformersBase, TransformersTokenizerBase
+
+class TestKeiyakuModelTFLite:
+    @pytest.fixture(scope="class")
+    def keiyaku_model(self, test_transformers_empty: TransformersBase, test_transformers_tokenizer_empty: TransformersTokenizerBase):
+        keiyaku_model = KeiyakuModel(test_transformers_tokenizer_empty)
+        keiyaku_model.init_model(test_transformers_empty)
+        return keiyaku_model
+
+    @pytest.fixture
+    def predict_datas(self, test_transformers_tokenizer_empty: TransformersTokenizerBase, mocker):
+        mocker.patch.object(test_transformers_tokenizer_empty, 'get_pad_idx').return_value = 0
+        mocker.patch.object(test_transformers_tokenizer_empty, 'get_sep_idx').return_value = 3
+        return [ ([2] + [ 10 + i ] * (i % 5) + [3, 5, 3], [0, 0, 0]) for i in range(25) ]
+
+    @pytest.mark.parametrize("quantize", [KeiyakuModel.QUANTIZE_NONE, KeiyakuModel.QUANTIZE_DYNAMIC, KeiyakuModel.QUANTIZE_INT8])
+    def test_predict(self, keiyaku_model: KeiyakuModel, test_transformers_empty: TransformersBase, test_transformers_tokenizer_empty: TransformersTokenizerBase,
+        predict_datas, quantize, tmpdir):
+        save_path = os.path.join(tmpdir, "weights.tflite")
+        keiyaku_model.export_tflite(save_path, quantize, predict_datas)
+        assert os.path.isfile(save_path)
+        assert os.path.isfile(save_path + ".json")
+
+        tflite_model = KeiyakuModelTFLite(test_transformers_tokenizer_empty)
+        tflite_model.init_model(test_transformers_empty)
+        tflite_model.load_weight(save_path)
+        assert tflite_model.quantize == quantize
+
+        scores = keiyaku_model.predict(predict_datas)
+        tflite_scores = tflite_model.predict(predict_datas)
+        assert tflite_scores[0].shape == (25, 1)
+        assert tflite_scores[1].shape == (25, 6)
+
+        tolerance = 1e-4 if quantize == KeiyakuModel.QUANTIZE_NONE else 0.1
+        assert np.abs(scores[0] - tflite_scores[0]).max() < tolerance
+        assert np.abs(scores[1] - tflite_scores[1]).max() < tolerance
+
+        tflite_scores = tflite_model.predict([])
+        assert tflite_scores[0].shape == (0, 1)
+
+    def test_export_error(self, keiyaku_model: KeiyakuModel, tmpdir):
+        with pytest.raises(ValueError):
+            keiyaku_model.export_tflite(os.path.join(tmpdir, "weights.tflite"), KeiyakuModel.QUANTIZE_INT8)
+
+    def test_train_model(self, test_transformers_tokenizer_empty: TransformersTokenizerBase):
+        tflite_model = KeiyakuModelTFLite(test_transformers_tokenizer_empty)
+        with pytest.raises(NotImplementedError):
+            tflite_model.train_model([], 1, "")
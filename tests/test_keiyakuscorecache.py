@@ -0,0 +1,167 @@
+import pytest
+import os
+import sqlite3
+import numpy as np
+from keiyakuscorecache import KeiyakuScoreCache
+
+class KeiyakuModelDummy:
+    def __init__(self):
+        self.output_class1_num = 2
+        self.predict_datas = []
+
+    def predict(self, datas):
+        self.predict_datas.extend(datas)
+        score1 = np.array([ [data[0][0]] for data in datas ], dtype=np.float32)
+        score2 = np.array([ [data[0][1], 0.5] for data in datas ], dtype=np.float32)
+        return [score1, score2]
+
+    def predict_with_embedding(self, datas):
+        return self.predict(datas) + [ np.array([ [data[0][0], 1.0, 0.0] for data in datas ], dtype=np.float32) ]
+
+class TestKeiyakuScoreCache:
+    def get_datas(self, texts):
+        predict_datas = [ ([i, len(prev)], [0, 0, 0]) for i, (now, prev) in enumerate(texts) ]
+        keys = [ KeiyakuScoreCache.get_key(now, prev) for now, prev in texts ]
+        return predict_datas, keys
+
+    def test_predict(self):
+        score_cache = KeiyakuScoreCache()
+        model = KeiyakuModelDummy()
+
+        predict_datas, keys = self.get_datas([ ("a", ""), ("b", "a"), ("c", "b") ])
+        scores = score_cache.predict(model, "v1", predict_datas, keys)
+        assert scores[0][:, 0].tolist() == [0, 1, 2]
+        assert scores[1][:, 0].tolist() == [0, 1, 1]
+        assert len(model.predict_datas) == 3
+
+        #キャッシュ済の組は予測しない
+        predict_datas, keys = self.get_datas([ ("b", "a"), ("d", "b"), ("b", "a") ])
+        scores = score_cache.predict(model, "v1", predict_datas, keys)
+        assert scores[0][:, 0].tolist() == [1, 1, 1]
+        assert len(model.predict_datas) == 4
+        assert score_cache.get_stats() == { "hit": 2, "miss": 4, "memory": 4 }
+        assert score_cache.get_hit_ratio() == pytest.approx(2 / 6)
+
+        #モデルバージョンが異なる場合・空の場合は予測
+        score_cache.predict(model, "v2", predict_datas, keys)
+        assert len(model.predict_datas) == 6
+        score_cache.predict(model, "", predict_datas, keys)
+        assert len(model.predict_datas) == 9
+
+        scores = score_cache.predict(model, "v1", [], [])
+        assert scores[0].shape == (0, 1)
+
+    def test_predict_batches(self):
+        score_cache = KeiyakuScoreCache()
+        model = KeiyakuModelDummy()
+
+        predict_datas, keys = self.get_datas([ ("a", ""), ("b", "a") ] * 3)
+        results = list(score_cache.predict_batches(model, "v1", predict_datas, keys, 4))
+        assert [ start for start, _, _ in results ] == [0, 4]
+        assert [ hit_num for _, _, hit_num in results ] == [2, 2]
+        assert results[1][1][0][:, 0].tolist() == [0, 1]
+
+    def test_predict_with_embedding(self):
+        score_cache = KeiyakuScoreCache()
+        model = KeiyakuModelDummy()
+
+        predict_datas, keys = self.get_datas([ ("a", ""), ("b", "a") ])
+        results = list(score_cache.predict_batches(model, "v1", predict_datas, keys, 4, True))
+        assert [ embedding.tolist() for embedding in results[0][1][2] ] == [[0, 1, 0], [1, 1, 0]]
+
+        #キャッシュヒットした行の埋込みはNone
+        predict_datas, keys = self.get_datas([ ("b", "a"), ("c", "b"), ("c", "b") ])
+        results = list(score_cache.predict_batches(model, "v1", predict_datas, keys, 4, True))
+        embeddings = results[0][1][2]
+        assert embeddings[0] is None
+        assert embeddings[1].tolist() == [1, 1, 0]
+        assert embeddings[2].tolist() == [1, 1, 0]
+
+        results = list(score_cache.predict_batches(model, "", predict_datas, keys, 4, True))
+        assert len(results[0][1][2]) == 3
+
+    def test_max_num(self):
+        score_cache = KeiyakuScoreCache(max_num=2)
+        model = KeiyakuModelDummy()
+
+        predict_datas, keys = self.get_datas([ ("a", ""), ("b", "a"), ("c", "b") ])
+        score_cache.predict(model, "v1", predict_datas, keys)
+        assert score_cache.get_stats()["memory"] == 2
+
+        score_cache.predict(model, "v1", predict_datas[:1], keys[:1])
+        assert len(model.predict_datas) == 4
+
+    def test_db(self, tmpdir):
+        db_path = os.path.join(tmpdir, "cache", "sentence_cache.db")
+        model = KeiyakuModelDummy()
+        predict_datas, keys = self.get_datas([ ("a", ""), ("b", "a") ])
+        KeiyakuScoreCache(db_path).predict(model, "v1", predict_datas, keys)
+
+        score_cache = KeiyakuScoreCache(db_path)
+        scores = score_cache.predict(model, "v1", predict_datas, keys)
+        assert len(model.predict_datas) == 2
+        assert scores[0][:, 0].tolist() == [0, 1]
+        assert scores[1].tolist() == [[0, 0.5], [1, 0.5]]
+        assert score_cache.get_stats() == { "hit": 2, "miss": 0, "memory": 2 }
+
+    def test_db_batch(self, tmpdir, mocker):
+        #SELECT_KEY_NUMを超えるキーも分割して検索
+        mocker.patch.object(KeiyakuScoreCache, 'SELECT_KEY_NUM', 2)
+        db_path = os.path.join(tmpdir, "cache", "sentence_cache.db")
+        model = KeiyakuModelDummy()
+        predict_datas, keys = self.get_datas([ ("a", ""), ("b", "a"), ("c", "b"), ("a", "c"), ("d", "a") ])
+        KeiyakuScoreCache(db_path).predict(model, "v1", predict_datas[:4], keys[:4])
+
+        score_cache = KeiyakuScoreCache(db_path)
+        scores = score_cache.predict(model, "v1", predict_datas, keys)
+        assert len(model.predict_datas) == 5
+        assert scores[0][:, 0].tolist() == [0, 1, 2, 3, 4]
+        assert scores[1][:, 0].tolist() == [0, 1, 1, 1, 1]
+        assert score_cache.get_stats() == { "hit": 4, "miss": 1, "memory": 5 }
+
+    def test_db_versions(self, tmpdir):
+        #最近のmax_version_num個以外のモデルバージョンの結果は削除
+        db_path = os.path.join(tmpdir, "cache", "sentence_cache.db")
+        model = KeiyakuModelDummy()
+        predict_datas, keys = self.get_datas([ ("a", ""), ("b", "a") ])
+        for model_version in ["v1", "v2", "v3"]:
+            KeiyakuScoreCache(db_path, max_version_num=2).predict(model, model_version, predict_datas, keys)
+        assert len(model.predict_datas) == 6
+
+        for model_version, predict_num in [("v2", 6), ("v3", 6), ("v1", 8)]:
+            KeiyakuScoreCache(db_path, max_version_num=2).predict(model, model_version, predict_datas, keys)
+            assert len(model.predict_datas) == predict_num
+
+    def test_db_versions_other_process(self, tmpdir):
+        #他プロセスに削除されたモデルバージョンも保存時に再登録し、以降の削除対象とする
+        db_path = os.path.join(tmpdir, "cache", "sentence_cache.db")
+        model = KeiyakuModelDummy()
+        score_cache = KeiyakuScoreCache(db_path, max_version_num=2)
+        other_score_cache = KeiyakuScoreCache(db_path, max_version_num=2)
+        predict_datas, keys = self.get_datas([ ("a", ""), ("b", "a") ])
+        score_cache.predict(model, "v1", predict_datas[:1], keys[:1])
+        other_score_cache.predict(model, "v2", predict_datas, keys)
+        other_score_cache.predict(model, "v3", predict_datas, keys)
+        assert self.get_db_versions(db_path) == (["v3", "v2"], ["v2", "v3"])
+
+        score_cache.predict(model, "v1", predict_datas[1:], keys[1:])
+        assert self.get_db_versions(db_path) == (["v1", "v3"], ["v1", "v3"])
+
+        other_score_cache.predict(model, "v4", predict_datas, keys)
+        assert self.get_db_versions(db_path) == (["v4", "v1"], ["v1", "v4"])
+
+    def get_db_versions(self, db_path):
+        #(保存日時の新しい順のモデルバージョン, 結果を保存済のモデルバージョン)
+        conn = sqlite3.connect(db_path)
+        versions = [ row[0] for row in conn.execute("SELECT model_version FROM version ORDER BY used DESC").fetchall() ]
+        score_versions = [ row[0] for row in conn.execute("SELECT DISTINCT model_version FROM score ORDER BY model_version").fetchall() ]
+        conn.close()
+        return versions, score_versions
+
+    def test_get_keys(self, mocker):
+        keiyakudata = mocker.Mock()
+        keiyakudata.get_datas.return_value = [ [0, 0, 0, 0, 0, 0, "a", ""], [0, 0, 0, 0, 0, 0, "b", "a"] ]
+
+        keys = KeiyakuScoreCache.get_keys(keiyakudata)
+        assert keys == [ KeiyakuScoreCache.get_key("a", ""), KeiyakuScoreCache.get_key("b", "a") ]
+        assert keys[0] != keys[1]
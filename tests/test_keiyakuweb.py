@@ -0,0 +1,113 @@
+import pytest
+import os
+import io
+import zipfile
+import numpy as np
+import web.keiyakuweb as keiyakuweb
+from keiyakudata import KeiyakuData
+from keiyakumodelfactory import KeiyakuModelFactory
+from keiyakuscorecache import KeiyakuScoreCache
+from web.keiyakuwebcatalog import KeiyakuWebCatalog
+
+class TestKeiyakuWeb:
+    @pytest.fixture
+    def client(self, tmpdir, monkeypatch, mocker):
+        #アップロードデータ・カタログ等はtmpdirへ保存し、文章の抽出は内容が"fail"のファイルのみ失敗
+        data_dir = str(tmpdir)
+        monkeypatch.setattr(keiyakuweb, "DATA_DIR", data_dir)
+        monkeypatch.setattr(keiyakuweb, "CONTENTS_DIR", os.path.join(data_dir, "contents"))
+        monkeypatch.setattr(keiyakuweb, "INDEX_DIR", os.path.join(data_dir, "index"))
+        monkeypatch.setattr(keiyakuweb, "keiyaku_catalog", KeiyakuWebCatalog(data_dir))
+        monkeypatch.setattr(keiyakuweb, "keiyaku_score_cache", KeiyakuScoreCache())
+
+        def create_keiyaku_data(filepath, txtpath, csvpath):
+            with open(filepath, "rb") as f:
+                if f.read() == b"fail":
+                    raise ValueError()
+            for path in [txtpath, csvpath]:
+                with open(path, "w") as f:
+                    f.write("")
+        mocker.patch.object(KeiyakuData, "create_keiyaku_data", side_effect=create_keiyaku_data)
+
+        return keiyakuweb.app.test_client()
+
+    def get_zip(self):
+        #cp932のファイル名(UTF-8フラグ無し)・CRCの一致しないファイルを含むzip
+        stream = io.BytesIO()
+        with zipfile.ZipFile(stream, "w", zipfile.ZIP_STORED) as zipdata:
+            zipdata.writestr("abcd.pdf", b"ccc")
+            zipdata.writestr("dir/", b"")
+            zipdata.writestr("bad.pdf", b"broken")
+            zipdata.writestr("dir/d.docx", b"ddd")
+        content = stream.getvalue().replace(b"abcd.pdf", "契約.pdf".encode("cp932")).replace(b"broken", b"BROKEN")
+        return io.BytesIO(content)
+
+    def upload_batch(self, client, analyze=0):
+        files = [ (io.BytesIO(b"aaa"), "a.pdf"), (io.BytesIO(b"aaa"), "a.txt"), (self.get_zip(), "b.zip"),
+            (io.BytesIO(b"notzip"), "broken.zip"), (io.BytesIO(b"fail"), "e.pdf"), (io.BytesIO(b"aaa"), "a2.pdf") ]
+        return client.post("/keiyaku_group/api/upload_batch", data={ "file": files, "analyze": analyze }, content_type="multipart/form-data")
+
+    def test_upload_batch(self, client):
+        response = self.upload_batch(client)
+        assert response.status_code == 200
+
+        results = { item["filename"]: (item["seqid"], item["code"]) for item in response.get_json()["data"] }
+        assert results == { "a.pdf": ("00001", 0), "a.txt": (-1, 9), "契約.pdf": ("00002", 0), "bad.pdf": (-1, 9),
+            "d.docx": ("00003", 0), "broken.zip": (-1, 9), "e.pdf": (-1, 9), "a2.pdf": ("00005", 0) }
+
+        #抽出に失敗した文書は削除し、同一内容の文書は抽出済データを共有
+        catalog = keiyakuweb.keiyaku_catalog
+        assert [ seqid for seqid, _ in catalog.get_list() ] == ["00001", "00002", "00003", "00005"]
+        assert catalog.get("00004") is None
+        assert os.path.isdir(os.path.join(keiyakuweb.DATA_DIR, "00004")) == False
+        assert catalog.get_content_seqids(catalog.get("00001")["contenthash"]) == ["00001", "00005"]
+        assert KeiyakuData.create_keiyaku_data.call_count == 4
+
+    def test_upload_batch_error(self, client, mocker):
+        #登録前に例外となった場合は作成済の文書を残さない
+        mocker.patch.object(keiyakuweb, "keiyaku_analyze_batch_start", side_effect=ValueError())
+        response = self.upload_batch(client, 1)
+        assert response.status_code == 500
+
+        catalog = keiyakuweb.keiyaku_catalog
+        assert [ catalog.get(seqid) for seqid in ["00001", "00002", "00003", "00004", "00005"] ] == [ None ] * 5
+        assert os.listdir(keiyakuweb.CONTENTS_DIR) == []
+
+    def test_analyze_diff(self, mocker):
+        #編集前の文書の解析結果を再利用できない行(-1)のみ予測
+        keiyakumodel = mocker.Mock()
+        keiyakumodel.output_class1_num = 2
+        model = mocker.Mock()
+        model.seq_len = 8
+        mocker.patch.object(keiyakuweb, "keiyaku_get_model", return_value=(keiyakumodel, model, mocker.Mock()))
+        mocker.patch.object(KeiyakuModelFactory, "get_model_version", return_value="v1")
+        mocker.patch.object(keiyakuweb, "keiyaku_get_group_datas", return_value=[10.0, 11.0, 12.0, 13.0])
+        mocker.patch.object(keiyakuweb, "keiyaku_add_index")
+
+        predicted = []
+        def predict_batches(keiyakumodel, predict_datas, keys, model_version, with_embedding=False):
+            predicted.append((predict_datas, keys))
+            yield 0, [ np.array([ [data] for data in predict_datas ], dtype=np.float32),
+                np.array([ [data, data + 0.5] for data in predict_datas ], dtype=np.float32), [ None ] * len(predict_datas) ]
+        mocker.patch.object(keiyakuweb, "keiyaku_predict_batches", side_effect=predict_batches)
+
+        keiyakudata = mocker.Mock()
+        keiyakudata.get_datas.return_value = [ [0, 0, 0, 0, 0, 0, text, ""] for text in ["a", "b", "c", "d"] ]
+        keiyakudata.get_reuse_indexes.return_value = [1, -1, 0, -1]
+        mocker.patch.object(keiyakuweb, "keiyaku_read_data", return_value=mocker.Mock())
+
+        data = mocker.Mock()
+        data.load_scores.return_value = None
+        base_data = mocker.Mock()
+        base_data.load_scores.return_value = (np.array([[0.1], [0.2]], dtype=np.float32), np.array([[1, 1], [2, 2]], dtype=np.float32))
+        enter = mocker.spy(keiyakuweb.keiyaku_admission, "enter")
+
+        scores1, scores2 = keiyakuweb.keiyaku_analyze(data, keiyakudata=keiyakudata, base_data=base_data)
+        enter.assert_called_once_with(2)
+        assert len(predicted) == 1
+        assert predicted[0][0] == [11.0, 13.0]
+        assert predicted[0][1] == [ KeiyakuScoreCache.get_key("b", ""), KeiyakuScoreCache.get_key("d", "") ]
+        assert scores1[:, 0].tolist() == pytest.approx([0.2, 11.0, 0.1, 13.0])
+        assert scores2.tolist() == [[2, 2], [11, 11.5], [1, 1], [13, 13.5]]
+        data.save_scores.assert_called_once()
+        assert keiyakuweb.keiyaku_admission.get_pending() == (0, 0)
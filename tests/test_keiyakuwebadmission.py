@@ -0,0 +1,98 @@
+import pytest
+import threading
+from web.keiyakuwebadmission import KeiyakuWebAdmission, KeiyakuWebAdmissionError
+
+class TestKeiyakuWebAdmission:
+    def run_order(self, admission, tickets):
+        #先頭のticketを実行中としたまま残りを待たせ、先頭の解放後に実行された順序(ticketの位置)を返す
+        tickets[0].wait()
+
+        order = []
+        def run(index, ticket):
+            ticket.wait()
+            order.append(index)
+            ticket.release()
+
+        threads = [ threading.Thread(target=run, args=(index, ticket)) for index, ticket in enumerate(tickets) if index > 0 ]
+        for thread in threads:
+            thread.start()
+
+        tickets[0].release()
+        for thread in threads:
+            thread.join(10)
+
+        assert all([ thread.is_alive() == False for thread in threads ])
+        return order
+
+    def test_enter_docs(self):
+        admission = KeiyakuWebAdmission(max_pending_docs=2, max_pending_rows=100)
+        admission.enter(10)
+        admission.enter(10)
+        with pytest.raises(KeiyakuWebAdmissionError) as e:
+            admission.enter(1)
+        assert e.value.retry_after >= 1
+        assert admission.get_pending() == (2, 20)
+
+    def test_enter_rows(self):
+        admission = KeiyakuWebAdmission(max_pending_docs=10, max_pending_rows=100)
+
+        #待ちが無い場合は行数の上限を超える文書も受付ける
+        ticket = admission.enter(150)
+        with pytest.raises(KeiyakuWebAdmissionError):
+            admission.enter(1)
+        ticket.release()
+
+        admission.enter(60)
+        admission.enter(40)
+        with pytest.raises(KeiyakuWebAdmissionError):
+            admission.enter(1)
+        assert admission.get_pending() == (2, 100)
+
+    def test_small_priority(self):
+        admission = KeiyakuWebAdmission(max_pending_docs=10, max_pending_rows=1000, small_doc_rows=10, max_small_streak=10)
+        tickets = [ admission.enter(rows) for rows in [5, 100, 200, 5, 10] ]
+        assert self.run_order(admission, tickets) == [3, 4, 1, 2]
+        assert admission.get_pending() == (0, 0)
+
+    def test_small_streak(self):
+        #小さい文書がmax_small_streak回連続で大きい文書を追い越した場合は大きい文書を処理
+        admission = KeiyakuWebAdmission(max_pending_docs=10, max_pending_rows=1000, small_doc_rows=10, max_small_streak=2)
+        #実行中の先頭(小さい文書)も大きい文書の待ち中に実行したため1回目の追越しとなる
+        tickets = [ admission.enter(rows) for rows in [5, 100, 1, 2, 3, 4, 5, 200] ]
+        assert self.run_order(admission, tickets) == [2, 1, 3, 4, 7, 5, 6]
+
+    def test_release_exception(self):
+        admission = KeiyakuWebAdmission(max_pending_docs=1, max_pending_rows=100)
+        ticket = admission.enter(10)
+        with pytest.raises(ValueError):
+            try:
+                ticket.wait()
+                raise ValueError()
+            finally:
+                ticket.release()
+
+        assert admission.get_pending() == (0, 0)
+        assert admission.running is None
+
+        #実行前に解放した場合は待ち行列から外す
+        admission = KeiyakuWebAdmission(max_pending_docs=10, max_pending_rows=100)
+        tickets = [ admission.enter(rows) for rows in [1, 2, 3] ]
+        tickets[1].release()
+        assert admission.get_pending() == (2, 4)
+        assert self.run_order(admission, [tickets[0], tickets[2]]) == [1]
+
+    def test_release_twice(self):
+        admission = KeiyakuWebAdmission(max_pending_docs=10, max_pending_rows=100)
+        ticket1 = admission.enter(10)
+        ticket2 = admission.enter(20)
+        ticket1.wait()
+        ticket1.release()
+        ticket1.release()
+        assert admission.get_pending() == (1, 20)
+
+        ticket2.wait()
+        assert admission.running is ticket2
+        ticket1.release()
+        assert admission.running is ticket2
+        ticket2.release()
+        assert admission.get_pending() == (0, 0)
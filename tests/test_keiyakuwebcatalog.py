@@ -0,0 +1,85 @@
+import pytest
+import os
+import json
+from web.keiyakuwebcatalog import KeiyakuWebCatalog
+
+class TestKeiyakuWebCatalog:
+    def get_paradata(self, orgfilename, contenthash=""):
+        return { "orgfilename": orgfilename, "filename": orgfilename, "txtname": "txt_{}.txt".format(orgfilename), "csvname": "csv_{}.csv".format(orgfilename),
+            "mimetype": "multipart/form-data", "contenthash": contenthash }
+
+    def test_create(self, tmpdir):
+        catalog = KeiyakuWebCatalog(str(tmpdir))
+        assert catalog.create(self.get_paradata("a.pdf")) == "00001"
+        assert catalog.create(self.get_paradata("b.pdf")) == "00002"
+        assert catalog.get("00001")["orgfilename"] == "a.pdf"
+
+        #削除済の連番は再利用しない
+        catalog.delete("00002")
+        assert catalog.get("00002") is None
+        assert catalog.create(self.get_paradata("c.pdf")) == "00003"
+
+        #別インスタンス(別プロセス)からも参照可能
+        assert KeiyakuWebCatalog(str(tmpdir)).get("00003")["orgfilename"] == "c.pdf"
+
+    def test_get_invalid(self, tmpdir):
+        catalog = KeiyakuWebCatalog(str(tmpdir))
+        catalog.create(self.get_paradata("a.pdf"))
+        assert catalog.get("abc") is None
+        assert catalog.get("../00001") is None
+        assert catalog.get("") is None
+        assert catalog.get("99999") is None
+
+    def test_uploaded(self, tmpdir):
+        catalog = KeiyakuWebCatalog(str(tmpdir))
+        seqid1 = catalog.create(self.get_paradata("a.pdf", "hash1"))
+        seqid2 = catalog.create(self.get_paradata("b.pdf", "hash1"))
+
+        #アップロード完了前の文書は一覧に含めない
+        assert catalog.get_list() == []
+        assert catalog.get_count() == 0
+        assert catalog.get_content_count("hash1") == 2
+
+        catalog.set_uploaded(seqid2)
+        assert catalog.get_list() == [(seqid2, "b.pdf")]
+        assert catalog.get_count() == 1
+        assert catalog.get_content_seqids("hash1") == [seqid2]
+
+        catalog.set_uploaded(seqid1)
+        assert catalog.get_content_seqids("hash1") == [seqid1, seqid2]
+        assert catalog.get_content_seqids("hash2") == []
+
+        catalog.delete(seqid1)
+        assert catalog.get_content_count("hash1") == 1
+
+    def test_get_list(self, tmpdir):
+        catalog = KeiyakuWebCatalog(str(tmpdir))
+        for i in range(5):
+            catalog.set_uploaded(catalog.create(self.get_paradata("{}.pdf".format(i))))
+
+        assert [ seqid for seqid, _ in catalog.get_list() ] == ["00001", "00002", "00003", "00004", "00005"]
+        assert catalog.get_list(1, 2) == [("00002", "1.pdf"), ("00003", "2.pdf")]
+        assert catalog.get_list(4, 10) == [("00005", "4.pdf")]
+        assert catalog.get_list(5) == []
+        assert catalog.get_count() == 5
+
+    def test_import_datadir(self, tmpdir):
+        #カタログ導入前のアップロードデータ(アップロードファイルが無い場合は未完了)
+        for seqid, uploaded in [("00003", True), ("00007", False)]:
+            os.makedirs(os.path.join(str(tmpdir), seqid))
+            para = self.get_paradata("{}.pdf".format(seqid))
+            del para["contenthash"]
+            with open(os.path.join(str(tmpdir), seqid, KeiyakuWebCatalog.PARA_FILE), "w") as parafile:
+                json.dump(para, parafile)
+            if uploaded:
+                with open(os.path.join(str(tmpdir), seqid, para["filename"]), "wb") as f:
+                    f.write(b"data")
+        os.makedirs(os.path.join(str(tmpdir), "contents"))
+
+        catalog = KeiyakuWebCatalog(str(tmpdir))
+        assert catalog.get("00003")["contenthash"] == ""
+        assert catalog.get("00007")["orgfilename"] == "00007.pdf"
+        assert catalog.get_list() == [("00003", "00003.pdf")]
+
+        #取込んだ連番の続きから採番
+        assert catalog.create(self.get_paradata("a.pdf")) == "00008"
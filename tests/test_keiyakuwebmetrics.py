@@ -0,0 +1,71 @@
+import pytest
+import os
+import json
+from web.keiyakuwebmetrics import KeiyakuWebMetrics
+
+class TestKeiyakuWebMetrics:
+    def get_metrics(self, share_dir=None):
+        metrics = KeiyakuWebMetrics()
+        metrics.register("test_total", KeiyakuWebMetrics.TYPE_COUNTER, "test counter")
+        metrics.register("test_inflight", KeiyakuWebMetrics.TYPE_GAUGE, "test gauge")
+        metrics.register("test_seconds", KeiyakuWebMetrics.TYPE_HISTOGRAM, "test histogram")
+        if share_dir is not None:
+            metrics.set_share_dir(share_dir)
+        return metrics
+
+    def save_worker(self, share_dir, pid, total, inflight):
+        #他ワーカーの保存内容
+        datas = [ ["test_total", [["endpoint", "a"]], total], ["test_inflight", [], inflight],
+            ["test_seconds", [], { "buckets": [1] * len(KeiyakuWebMetrics.BUCKETS), "sum": 0.001, "count": 1 }] ]
+        with open(os.path.join(share_dir, "{}.json".format(pid)), "w") as f:
+            json.dump(datas, f)
+
+    def test_to_text(self):
+        metrics = self.get_metrics()
+        metrics.inc("test_total", endpoint="a")
+        metrics.inc("test_total", 2, endpoint="a")
+        metrics.inc("test_inflight")
+        metrics.observe("test_seconds", 0.02)
+
+        lines = metrics.to_text().splitlines()
+        assert 'test_total{endpoint="a"} 3' in lines
+        assert "test_inflight 1" in lines
+        assert 'test_seconds_bucket{le="0.01"} 0' in lines
+        assert 'test_seconds_bucket{le="0.025"} 1' in lines
+        assert "test_seconds_count 1" in lines
+
+    def test_dead_worker(self, tmpdir, mocker):
+        share_dir = str(tmpdir)
+        metrics = self.get_metrics(share_dir)
+        metrics.inc("test_total", endpoint="a")
+        metrics.inc("test_inflight")
+
+        mocker.patch.object(metrics, '_is_alive').side_effect = lambda pid: pid != 1000001
+        self.save_worker(share_dir, 1000001, 5, 2)
+        self.save_worker(share_dir, 1000002, 10, 1)
+        lines = metrics.to_text().splitlines()
+        assert 'test_total{endpoint="a"} 16' in lines
+        assert "test_inflight 2" in lines
+        assert "test_seconds_count 2" in lines
+
+        #終了したワーカーのカウンタは集計結果へ移し、ゲージは破棄
+        assert os.path.isfile(os.path.join(share_dir, "1000001.json")) == False
+        assert os.path.isfile(os.path.join(share_dir, KeiyakuWebMetrics.DEAD_FILE))
+
+        #再起動で終了したワーカーが増えてもカウンタは減少しない
+        mocker.patch.object(metrics, '_is_alive').side_effect = lambda pid: pid not in [1000001, 1000002]
+        lines = metrics.to_text().splitlines()
+        assert 'test_total{endpoint="a"} 16' in lines
+        assert "test_inflight 1" in lines
+        assert "test_seconds_count 2" in lines
+
+    def test_same_pid(self, tmpdir):
+        #同じPIDの終了済ワーカーの値は上書き前に集計
+        share_dir = str(tmpdir)
+        self.save_worker(share_dir, os.getpid(), 5, 1)
+        metrics = self.get_metrics(share_dir)
+        metrics.inc("test_total", endpoint="a")
+
+        lines = metrics.to_text().splitlines()
+        assert 'test_total{endpoint="a"} 6' in lines
+        assert [ line for line in lines if line.startswith("test_inflight ") ] == []
@@ -1,91 +1,184 @@
-import pytest
-import transformers
-import tensorflow.keras.backend as K
-from transformersbase import TransformersBase, TransformersTokenizerBase
-
-class TestTransformersBase:
-    def test_get_inputs(self, test_transformers_empty: TransformersBase):
-        inputs = test_transformers_empty.get_inputs()
-
-        assert len(inputs) == 3
-        assert K.int_shape(inputs[0]) == (None, test_transformers_empty.seq_len)
-        assert K.int_shape(inputs[1]) == (None, test_transformers_empty.seq_len)
-        assert K.int_shape(inputs[2]) == (None, test_transformers_empty.seq_len)
-
-    def test_get_transformers_model(self, test_transformers_empty: TransformersBase):
-        assert test_transformers_empty.get_transformers_model() == None
-
-    def test_get_transformers_output(self, test_transformers_empty: TransformersBase):
-        output = test_transformers_empty.get_transformers_output()
-        assert K.int_shape(output) == (None, test_transformers_empty.seq_len)
-    
-    def test_set_trainable(self, test_transformers_empty: TransformersBase, mocker):
-        mock = mocker.MagicMock()
-        test_transformers_empty.transformers_model = mock
-        test_transformers_empty.set_trainable(False)
-        assert mock.trainable == False
-        test_transformers_empty.set_trainable(True)
-        assert mock.trainable == True
-
-class TestTransformersTokenizerBase:
-
-    def test_get_index(self, test_transformers_tokenizer_empty: TransformersTokenizerBase, mocker):
-        def mock_encode(text, add_special_tokens):
-            if text == "イギリスグループ運動":
-                return [ 6302, 488, 542 ]
-            elif text == "イギリス":
-                return [6302]
-            else:
-                return [0]
-
-        mock = mocker.Mock(spec=transformers.PreTrainedTokenizerBase)
-        mock.encode = mocker.Mock(side_effect = mock_encode)     
-        test_transformers_tokenizer_empty.tokenizer = mock
-
-        idx = test_transformers_tokenizer_empty.get_index('イギリス')
-        assert idx == 6302
-
-        idxes = test_transformers_tokenizer_empty.get_indexes('イギリスグループ運動')
-        assert idxes == [6302, 488, 542]
-
-    def test_get_vocab(self, test_transformers_tokenizer_empty: TransformersTokenizerBase, mocker):
-        def mock_convert_ids_to_tokens(ids, skip_special_tokens):
-            result = []
-            for id in ids:
-                if id == 6302:
-                    result.append("イギリス")
-                elif id == 488:
-                    result.append("グループ")
-                elif id == 542:
-                    result.append("運動")
-                else:
-                    result.append("")
-
-            return result
-        
-        mock = mocker.Mock(spec=transformers.PreTrainedTokenizerBase)
-        mock.convert_ids_to_tokens = mocker.Mock(side_effect = mock_convert_ids_to_tokens)        
-        test_transformers_tokenizer_empty.tokenizer = mock
-                    
-        vocab = test_transformers_tokenizer_empty.get_vocab(6302)
-        assert vocab == "イギリス"
-        vocab = test_transformers_tokenizer_empty.get_vocab(488)
-        assert vocab == "グループ"
-        vocab = test_transformers_tokenizer_empty.get_vocab(542)
-        assert vocab == "運動"
-
-        vocabs = test_transformers_tokenizer_empty.get_vocabs([6302, 488, 542])
-        assert vocabs == ["イギリス", "グループ", "運動"]
-
-    def test_get_special_idx(self, test_transformers_tokenizer_empty: TransformersTokenizerBase, mocker):
-        mock = mocker.Mock()
-        mock.pad_token_id = 1
-        mock.unk_token_id = 2
-        mock.cls_token_id = 3
-        mock.sep_token_id = 4
-        test_transformers_tokenizer_empty.tokenizer = mock
-
-        assert test_transformers_tokenizer_empty.get_pad_idx() == 1
-        assert test_transformers_tokenizer_empty.get_unk_idx() == 2
-        assert test_transformers_tokenizer_empty.get_cls_idx() == 3
-        assert test_transformers_tokenizer_empty.get_sep_idx() == 4
\ No newline at end of file
+import pytest
+import transformers
+import tensorflow as tf
+import tensorflow.keras.backend as K
+from transformersbase import TransformersBase, TransformersTokenizerBase
+
+class TestTransformersBase:
+    def test_get_inputs(self, test_transformers_empty: TransformersBase):
+        inputs = test_transformers_empty.get_inputs()
+
+        assert len(inputs) == 3
+        assert K.int_shape(inputs[0]) == (None, test_transformers_empty.seq_len)
+        assert K.int_shape(inputs[1]) == (None, test_transformers_empty.seq_len)
+        assert K.int_shape(inputs[2]) == (None, test_transformers_empty.seq_len)
+
+    def test_get_transformers_model(self, test_transformers_empty: TransformersBase):
+        assert test_transformers_empty.get_transformers_model() == None
+
+    def test_get_transformers_output(self, test_transformers_empty: TransformersBase):
+        output = test_transformers_empty.get_transformers_output()
+        assert K.int_shape(output) == (None, test_transformers_empty.seq_len)
+    
+    def test_get_transformers_output_cls(self, test_transformers_empty: TransformersBase, mocker):
+        last_hidden_state = tf.keras.layers.Input((test_transformers_empty.seq_len, 8))
+        mocker.patch.object(test_transformers_empty, 'outputs', { "last_hidden_state": last_hidden_state })
+        mocker.patch.object(test_transformers_empty, 'pooling', TransformersBase.POOLING_CLS)
+
+        output = test_transformers_empty.get_transformers_output()
+        assert K.int_shape(output) == (None, 8)
+
+    def test_get_pretrained_config(self, test_transformers_empty: TransformersBase, mocker):
+        assert test_transformers_empty._get_pretrained_config() == {}
+
+        mocker.patch.object(test_transformers_empty, 'layer_num', 4)
+        assert test_transformers_empty._get_pretrained_config() == { "num_hidden_layers": 4 }
+
+    def test_set_trainable(self, test_transformers_empty: TransformersBase, mocker):
+        mock = mocker.MagicMock()
+        test_transformers_empty.transformers_model = mock
+        test_transformers_empty.set_trainable(False)
+        assert mock.trainable == False
+        test_transformers_empty.set_trainable(True)
+        assert mock.trainable == True
+
+    def test_set_trainable_layers(self, test_transformers_empty: TransformersBase, mocker):
+        model = transformers.TFBertModel(transformers.BertConfig(vocab_size=30, hidden_size=8, num_hidden_layers=4, num_attention_heads=2, intermediate_size=16))
+        model(model.dummy_inputs)
+        mocker.patch.object(test_transformers_empty, 'transformers_model', model)
+        assert test_transformers_empty.get_layer_num() == 4
+
+        #上位2層とpoolerのみ学習、埋込み層は固定
+        test_transformers_empty.set_trainable_layers(2)
+        assert [ layer.trainable for layer in model.bert.encoder.layer ] == [False, False, True, True]
+        assert model.bert.embeddings.trainable == False
+        assert model.bert.pooler.trainable == True
+        trainable_names = [ weight.name for weight in model.trainable_weights ]
+        assert all([ "layer_._2/" in name or "layer_._3/" in name or "pooler" in name for name in trainable_names ])
+        assert len(model.non_trainable_weights) > 0
+
+        test_transformers_empty.set_trainable_layers(None, True)
+        assert all([ layer.trainable for layer in model.bert.encoder.layer ])
+        assert model.bert.embeddings.trainable == False
+
+        test_transformers_empty.set_trainable_layers()
+        assert len(model.trainable_weights) == len(model.weights)
+
+        test_transformers_empty.set_trainable(False)
+        assert len(model.trainable_weights) == 0
+        test_transformers_empty.set_trainable_layers(8)
+        assert len(model.trainable_weights) == len(model.weights)
+
+    def test_set_recompute_grad(self, test_transformers_empty: TransformersBase, mocker):
+        model = transformers.TFBertModel(transformers.BertConfig(vocab_size=30, hidden_size=8, num_hidden_layers=2, num_attention_heads=2, intermediate_size=16,
+            hidden_dropout_prob=0.0, attention_probs_dropout_prob=0.0))
+        model(model.dummy_inputs)
+        mocker.patch.object(test_transformers_empty, 'transformers_model', model)
+
+        def get_grads():
+            with tf.GradientTape() as tape:
+                loss = tf.reduce_sum(model(model.dummy_inputs, training=True)["pooler_output"])
+            return tape.gradient(loss, model.trainable_weights)
+
+        grads = get_grads()
+        predict = model(model.dummy_inputs)["pooler_output"]
+
+        #再計算しても勾配・推論結果は同じ
+        test_transformers_empty.set_recompute_grad(True)
+        assert len(test_transformers_empty.recompute_layers) == 2
+        assert all([ "call" in layer.__dict__ for layer in model.bert.encoder.layer ])
+        recompute_grads = get_grads()
+        assert all([ grad is not None for grad in recompute_grads ])
+        assert max([ float(tf.reduce_max(tf.abs(tf.convert_to_tensor(a) - tf.convert_to_tensor(b)))) for a, b in zip(grads, recompute_grads) ]) < 1e-5
+        assert float(tf.reduce_max(tf.abs(model(model.dummy_inputs)["pooler_output"] - predict))) < 1e-6
+
+        test_transformers_empty.set_recompute_grad(False)
+        assert len(test_transformers_empty.recompute_layers) == 0
+        assert all([ "call" not in layer.__dict__ for layer in model.bert.encoder.layer ])
+
+    def test_copy_weights(self, test_transformers_empty: TransformersBase, mocker):
+        src = mocker.MagicMock()
+        src.transformers_model = transformers.TFBertModel(transformers.BertConfig(vocab_size=30, hidden_size=8, num_hidden_layers=3, num_attention_heads=2, intermediate_size=16))
+        src.transformers_model(src.transformers_model.dummy_inputs)
+
+        dest_model = transformers.TFBertModel(transformers.BertConfig(vocab_size=30, hidden_size=8, num_hidden_layers=2, num_attention_heads=2, intermediate_size=16))
+        dest_model(dest_model.dummy_inputs)
+        mocker.patch.object(test_transformers_empty, 'transformers_model', dest_model)
+
+        copy_num = test_transformers_empty.copy_weights(src)
+        assert copy_num == len(dest_model.weights)
+
+        src_weights = { weight.name.split("/", 1)[-1]: weight for weight in src.transformers_model.weights }
+        for weight in dest_model.weights:
+            assert (weight.numpy() == src_weights[weight.name.split("/", 1)[-1]].numpy()).all()
+
+class TestTransformersTokenizerBase:
+
+    def test_get_index(self, test_transformers_tokenizer_empty: TransformersTokenizerBase, mocker):
+        def mock_encode(text, add_special_tokens):
+            if text == "イギリスグループ運動":
+                return [ 6302, 488, 542 ]
+            elif text == "イギリス":
+                return [6302]
+            else:
+                return [0]
+
+        mock = mocker.Mock(spec=transformers.PreTrainedTokenizerBase)
+        mock.encode = mocker.Mock(side_effect = mock_encode)     
+        test_transformers_tokenizer_empty.tokenizer = mock
+
+        idx = test_transformers_tokenizer_empty.get_index('イギリス')
+        assert idx == 6302
+
+        idxes = test_transformers_tokenizer_empty.get_indexes('イギリスグループ運動')
+        assert idxes == [6302, 488, 542]
+
+    def test_get_vocab(self, test_transformers_tokenizer_empty: TransformersTokenizerBase, mocker):
+        def mock_convert_ids_to_tokens(ids, skip_special_tokens):
+            result = []
+            for id in ids:
+                if id == 6302:
+                    result.append("イギリス")
+                elif id == 488:
+                    result.append("グループ")
+                elif id == 542:
+                    result.append("運動")
+                else:
+                    result.append("")
+
+            return result
+        
+        mock = mocker.Mock(spec=transformers.PreTrainedTokenizerBase)
+        mock.convert_ids_to_tokens = mocker.Mock(side_effect = mock_convert_ids_to_tokens)        
+        test_transformers_tokenizer_empty.tokenizer = mock
+                    
+        vocab = test_transformers_tokenizer_empty.get_vocab(6302)
+        assert vocab == "イギリス"
+        vocab = test_transformers_tokenizer_empty.get_vocab(488)
+        assert vocab == "グループ"
+        vocab = test_transformers_tokenizer_empty.get_vocab(542)
+        assert vocab == "運動"
+
+        vocabs = test_transformers_tokenizer_empty.get_vocabs([6302, 488, 542])
+        assert vocabs == ["イギリス", "グループ", "運動"]
+
+    def test_get_special_idx(self, test_transformers_tokenizer_empty: TransformersTokenizerBase, mocker):
+        mock = mocker.Mock()
+        mock.pad_token_id = 1
+        mock.unk_token_id = 2
+        mock.cls_token_id = 3
+        mock.sep_token_id = 4
+        test_transformers_tokenizer_empty.tokenizer = mock
+
+        assert test_transformers_tokenizer_empty.get_pad_idx() == 1
+        assert test_transformers_tokenizer_empty.get_unk_idx() == 2
+        assert test_transformers_tokenizer_empty.get_cls_idx() == 3
+        assert test_transformers_tokenizer_empty.get_sep_idx() == 4
+
+    def test_split_keiyaku_indexes(self, test_transformers_tokenizer_empty: TransformersTokenizerBase, mocker):
+        mocker.patch.object(test_transformers_tokenizer_empty, 'get_cls_idx').return_value = 3
+        mocker.patch.object(test_transformers_tokenizer_empty, 'get_sep_idx').return_value = 4
+
+        assert test_transformers_tokenizer_empty.split_keiyaku_indexes([3, 10, 11, 4, 12, 4]) == ([3, 10, 11, 4], [3, 12, 4])
+        assert test_transformers_tokenizer_empty.split_keiyaku_indexes([3, 10, 4, 4]) == ([3, 10, 4], [3, 4])
+        assert test_transformers_tokenizer_empty.get_sentence_seq_len(256) == 128
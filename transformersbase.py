@@ -1,129 +1,250 @@
-from abc import ABC, abstractmethod
-from typing import List, Dict, Any
-import tensorflow as tf
-import transformers
-import os
-
-class TransformersBase(ABC):
-    def __init__(self, model_name: str, seq_len: int):
-        self.model_name = model_name
-        self.seq_len = seq_len
-
-        self.inputs = None
-        self.outputs = None        
-        self.transformers_model: transformers.TFPreTrainedModel = None
-        
-    def get_transformers_model(self) -> transformers.TFPreTrainedModel:
-        return self.transformers_model
-
-    def get_inputs(self) -> List[tf.keras.layers.Layer]:
-        return self.inputs
-
-    def get_transformers_output(self) -> tf.keras.layers.Layer:
-        return self.outputs["pooler_output"]
-
-    def set_trainable(self, training: bool) -> None:
-        self.transformers_model.trainable = training
-
-    @abstractmethod
-    def init_model(self, model_dir_path: str) -> None:
-        pass
-
-    @abstractmethod
-    def download_save(self, model_full_name: str, model_dir_path: str) -> None:
-        pass
-
-    def _get_model_path(self, model_dir_path: str) -> str:
-        return os.path.join(model_dir_path, self.model_name)         
-
-class TransformersTokenizerBase(ABC):
-    def __init__(self, model_name: str):
-        self.model_name = model_name
-
-        self.tokenizer: transformers.PreTrainedTokenizerBase = None
-
-    def get_index(self, vocab: str) -> int:
-        return self.get_indexes(vocab)[0]
-
-    def get_indexes(self, text: str) -> List[int]:
-        return self.tokenizer.encode(text, add_special_tokens=False)
-
-    def get_vocab(self, index: int) -> str:
-        return self.get_vocabs([index])[0]
-        
-    def get_vocabs(self, indexes: List[int]) -> List[str]:
-        vocabs = self.tokenizer.convert_ids_to_tokens(indexes, skip_special_tokens=True)
-        return self._convert_vocabs(vocabs)
-
-    def get_cls_idx(self) -> int:
-        return self.tokenizer.cls_token_id
-
-    def get_sep_idx(self) -> int:
-        return self.tokenizer.sep_token_id
-
-    def get_pad_idx(self) -> int:
-        return self.tokenizer.pad_token_id
-
-    def get_unk_idx(self) -> int:
-        return self.tokenizer.unk_token_id
-
-    def encode(self, text1: str, text2: str = None) -> List[List[int]]:
-        encode = self.tokenizer(text1, text2)
-        result = []
-        if "input_ids" in encode:
-            result.append(encode['input_ids'])
-        if "attention_mask" in encode:
-            result.append(encode['attention_mask'])
-        if "token_type_ids" in encode:
-            result.append(encode['token_type_ids'])
-
-        # result.append(encode['input_ids'])
-        # result.append(encode['attention_mask'])
-        # result.append(encode['token_type_ids'])
-
-        return result
-
-    def get_keiyaku_indexes(self, text1: str, text2: str, max_seq_len: int) -> List[int]:
-        cls_idx = self.get_cls_idx()
-        sep_idx = self.get_sep_idx()
-        cut_len = int((max_seq_len - 3)/2)
-        cut_len_herf = int(cut_len / 2)
-        
-        now_text_idx = self.get_indexes(text1)
-        bef_text_idx = self.get_indexes(text2)
-
-        if len(now_text_idx) > cut_len:
-            now_text_idx = now_text_idx[:cut_len_herf] + now_text_idx[-cut_len_herf:]
-
-        if len(bef_text_idx) > cut_len:
-            bef_text_idx = bef_text_idx[:cut_len_herf] + bef_text_idx[-cut_len_herf:]
-
-        return [cls_idx] + now_text_idx + [sep_idx] + bef_text_idx + [sep_idx]
-
-    def keiyaku_encode(self, ids: List[int], seq_len: int) -> Any:
-        sep_idx = self.get_sep_idx()
-        pad_idx = self.get_pad_idx()
-
-        input_ids = ids + ([pad_idx] * (seq_len - len(ids)))
-        input_attention_mask = [ 1 if id != pad_idx else 0 for id in input_ids ]
-        token_type_ids = [1] * len(input_ids)
-        for i, id in enumerate(input_ids):
-            token_type_ids[i] = 0
-            if id == sep_idx:
-                break
-
-        return [input_ids, input_attention_mask, token_type_ids]
-
-    @abstractmethod
-    def init_tokenizer(self, model_dir_path: str) -> None:
-        pass
-
-    @abstractmethod
-    def download_save(cls, model_full_name: str, save_dir: str) -> None:
-        pass    
-
-    def _convert_vocabs(self, vocabs: List[str]) -> List[str]:
-        return vocabs
-        
-    def _get_model_path(self, model_dir_path: str) -> str:
-        return os.path.join(model_dir_path, self.model_name)
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Tuple
+import tensorflow as tf
+import transformers
+import os
+
+class TransformersBase(ABC):
+    POOLING_POOLER="pooler"
+    POOLING_CLS="cls"
+
+    def __init__(self, model_name: str, seq_len: int, layer_num: int = None, pooling: str = POOLING_POOLER):
+        self.model_name = model_name
+        self.seq_len = seq_len
+        #layer_num指定時は先頭からlayer_num層のみ使用、pooling=clsは最終層のCLSをそのまま出力
+        self.layer_num = layer_num
+        self.pooling = pooling
+
+        self.inputs = None
+        self.outputs = None        
+        self.transformers_model: transformers.TFPreTrainedModel = None
+        self.recompute_layers = []
+        
+    def get_transformers_model(self) -> transformers.TFPreTrainedModel:
+        return self.transformers_model
+
+    def get_inputs(self) -> List[tf.keras.layers.Layer]:
+        return self.inputs
+
+    def get_transformers_output(self) -> tf.keras.layers.Layer:
+        return self._get_pooling_output(self.outputs)
+
+    def get_sentence_output(self, inputs: List[tf.keras.layers.Layer]) -> tf.keras.layers.Layer:
+        #get_inputsと長さの異なる入力で同じtransformersモデルを呼出す(重みは共有)
+        return self._get_pooling_output(self.transformers_model(inputs))
+
+    def set_trainable(self, training: bool) -> None:
+        self.transformers_model.trainable = training
+
+    def set_trainable_layers(self, train_layer_num: int = None, freeze_embeddings: bool = False) -> None:
+        #上位train_layer_num層(Noneは全層)とpoolerのみ学習
+        #下位層を固定する場合は埋込み層まで逆伝播しないよう埋込み層も固定、全層学習時はfreeze_embeddings=Trueで埋込み層のみ固定
+        self.transformers_model.trainable = True
+
+        main_layer = self._get_main_layer()
+        freeze_num = max(len(main_layer.encoder.layer) - train_layer_num, 0) if train_layer_num is not None else 0
+        for i, layer in enumerate(main_layer.encoder.layer):
+            layer.trainable = i >= freeze_num
+
+        main_layer.embeddings.trainable = freeze_num == 0 and freeze_embeddings == False
+
+    def get_layer_num(self) -> int:
+        return len(self._get_main_layer().encoder.layer)
+
+    def set_recompute_grad(self, recompute: bool) -> None:
+        #学習時にエンコーダ層の中間結果を保持せず逆伝播時に再計算する(メモリ使用量を層の入出力のみに抑え、計算量は順伝播1回分増加)
+        #再計算時も同じdropoutとなるよう、層毎に生成したシードでstateless_dropoutを使用
+        for layer, dropouts in self.recompute_layers:
+            del layer.call
+            for dropout in dropouts:
+                del dropout.call
+        self.recompute_layers = []
+
+        if recompute == True:
+            for layer in self._get_main_layer().encoder.layer:
+                self.recompute_layers.append((layer, self._set_layer_recompute_grad(layer)))
+
+    def _set_layer_recompute_grad(self, layer: tf.keras.layers.Layer) -> List[tf.keras.layers.Layer]:
+        #layerとlayer内のdropoutのcallを置換え、置換えたdropoutを返す
+        layer_call = layer.call
+        state = { "seed": None }
+
+        def dropout_call(dropout, dropout_call, index):
+            def call(inputs, training=None):
+                if state["seed"] is None or training != True:
+                    return dropout_call(inputs, training=training)
+
+                return tf.nn.experimental.stateless_dropout(inputs, rate=dropout.rate, seed=state["seed"] + tf.constant([0, index]))
+
+            return call
+
+        dropouts = [ sublayer for sublayer in layer._flatten_layers(include_self=False) if isinstance(sublayer, tf.keras.layers.Dropout) ]
+        for index, dropout in enumerate(dropouts):
+            dropout.call = dropout_call(dropout, dropout.call, index)
+
+        @tf.recompute_grad
+        def forward(hidden_states, attention_mask, seed):
+            state["seed"] = seed
+            try:
+                return layer_call(hidden_states, attention_mask, None, None, None, None, False, training=True)[0]
+            finally:
+                state["seed"] = None
+
+        def call(hidden_states, attention_mask, head_mask, encoder_hidden_states, encoder_attention_mask, past_key_value, output_attentions, training=False):
+            #推論時・注意の重みの出力時等は通常の計算
+            if training != True or output_attentions == True or head_mask is not None or encoder_hidden_states is not None or past_key_value is not None:
+                return layer_call(hidden_states, attention_mask, head_mask, encoder_hidden_states, encoder_attention_mask, past_key_value, output_attentions, training=training)
+
+            seed = tf.random.uniform([2], maxval=tf.int32.max, dtype=tf.int32)
+            return (forward(hidden_states, attention_mask, seed),)
+
+        layer.call = call
+        return dropouts
+
+    def copy_weights(self, src: "TransformersBase") -> int:
+        #モデル名を除いた名前と形状が一致する重みをsrcからコピーし、コピーした数を返す
+        src_weights = { self._get_weight_key(weight.name): weight for weight in src.transformers_model.weights }
+
+        copy_num = 0
+        for weight in self.transformers_model.weights:
+            src_weight = src_weights.get(self._get_weight_key(weight.name))
+            if src_weight is not None and src_weight.shape == weight.shape:
+                weight.assign(src_weight)
+                copy_num += 1
+
+        return copy_num
+
+    @abstractmethod
+    def init_model(self, model_dir_path: str) -> None:
+        pass
+
+    @abstractmethod
+    def download_save(self, model_full_name: str, model_dir_path: str) -> None:
+        pass
+
+    def _get_model_path(self, model_dir_path: str) -> str:
+        return os.path.join(model_dir_path, self.model_name)         
+
+    def _get_main_layer(self) -> tf.keras.layers.Layer:
+        #TFBertModel.bert、TFRobertaModel.roberta等(embeddings・encoder・poolerを持つ層)
+        return getattr(self.transformers_model, self.transformers_model.base_model_prefix)
+
+    def _get_pooling_output(self, outputs) -> tf.keras.layers.Layer:
+        if self.pooling == self.POOLING_CLS:
+            return outputs["last_hidden_state"][:, 0, :]
+
+        return outputs["pooler_output"]
+
+    def _get_pretrained_config(self) -> Dict[str, Any]:
+        #from_pretrainedへ渡す設定(読込まない層の重みは無視される)
+        if self.layer_num is not None:
+            return { "num_hidden_layers": self.layer_num }
+
+        return {}
+
+    def _get_weight_key(self, weight_name: str) -> str:
+        return weight_name.split("/", 1)[-1]
+
+class TransformersTokenizerBase(ABC):
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+        self.tokenizer: transformers.PreTrainedTokenizerBase = None
+
+    def get_index(self, vocab: str) -> int:
+        return self.get_indexes(vocab)[0]
+
+    def get_indexes(self, text: str) -> List[int]:
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+    def get_vocab(self, index: int) -> str:
+        return self.get_vocabs([index])[0]
+        
+    def get_vocabs(self, indexes: List[int]) -> List[str]:
+        vocabs = self.tokenizer.convert_ids_to_tokens(indexes, skip_special_tokens=True)
+        return self._convert_vocabs(vocabs)
+
+    def get_cls_idx(self) -> int:
+        return self.tokenizer.cls_token_id
+
+    def get_sep_idx(self) -> int:
+        return self.tokenizer.sep_token_id
+
+    def get_pad_idx(self) -> int:
+        return self.tokenizer.pad_token_id
+
+    def get_unk_idx(self) -> int:
+        return self.tokenizer.unk_token_id
+
+    def encode(self, text1: str, text2: str = None) -> List[List[int]]:
+        encode = self.tokenizer(text1, text2)
+        result = []
+        if "input_ids" in encode:
+            result.append(encode['input_ids'])
+        if "attention_mask" in encode:
+            result.append(encode['attention_mask'])
+        if "token_type_ids" in encode:
+            result.append(encode['token_type_ids'])
+
+        # result.append(encode['input_ids'])
+        # result.append(encode['attention_mask'])
+        # result.append(encode['token_type_ids'])
+
+        return result
+
+    def get_keiyaku_indexes(self, text1: str, text2: str, max_seq_len: int) -> List[int]:
+        cls_idx = self.get_cls_idx()
+        sep_idx = self.get_sep_idx()
+        cut_len = int((max_seq_len - 3)/2)
+        cut_len_herf = int(cut_len / 2)
+        
+        now_text_idx = self.get_indexes(text1)
+        bef_text_idx = self.get_indexes(text2)
+
+        if len(now_text_idx) > cut_len:
+            now_text_idx = now_text_idx[:cut_len_herf] + now_text_idx[-cut_len_herf:]
+
+        if len(bef_text_idx) > cut_len:
+            bef_text_idx = bef_text_idx[:cut_len_herf] + bef_text_idx[-cut_len_herf:]
+
+        return [cls_idx] + now_text_idx + [sep_idx] + bef_text_idx + [sep_idx]
+
+    def split_keiyaku_indexes(self, ids: List[int]) -> Tuple[List[int], List[int]]:
+        #get_keiyaku_indexesの結果を文章・前文章それぞれ単独の[CLS] 文章 [SEP]に分割
+        cls_idx = self.get_cls_idx()
+        sep_idx = self.get_sep_idx()
+        split_pos = ids.index(sep_idx)
+
+        return [cls_idx] + ids[1:split_pos] + [sep_idx], [cls_idx] + ids[split_pos+1:-1] + [sep_idx]
+
+    def get_sentence_seq_len(self, max_seq_len: int) -> int:
+        #get_keiyaku_indexesで1文章に割当てられる最大長 + [CLS][SEP]
+        return int((max_seq_len - 3)/2) + 2
+
+    def keiyaku_encode(self, ids: List[int], seq_len: int) -> Any:
+        sep_idx = self.get_sep_idx()
+        pad_idx = self.get_pad_idx()
+
+        input_ids = ids + ([pad_idx] * (seq_len - len(ids)))
+        input_attention_mask = [ 1 if id != pad_idx else 0 for id in input_ids ]
+        token_type_ids = [1] * len(input_ids)
+        for i, id in enumerate(input_ids):
+            token_type_ids[i] = 0
+            if id == sep_idx:
+                break
+
+        return [input_ids, input_attention_mask, token_type_ids]
+
+    @abstractmethod
+    def init_tokenizer(self, model_dir_path: str) -> None:
+        pass
+
+    @abstractmethod
+    def download_save(cls, model_full_name: str, save_dir: str) -> None:
+        pass    
+
+    def _convert_vocabs(self, vocabs: List[str]) -> List[str]:
+        return vocabs
+        
+    def _get_model_path(self, model_dir_path: str) -> str:
+        return os.path.join(model_dir_path, self.model_name)
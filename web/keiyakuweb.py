@@ -1,314 +1,995 @@
-from flask import Flask, url_for, redirect, send_file
-from flask import request
-from flask import jsonify
-from flask import render_template
-from flask import flash
-from flask import Blueprint
-from werkzeug.utils import secure_filename
-import werkzeug
-import os
-import glob
-import re
-import threading
-import json
-import numpy as np
-import datetime
-from keiyakudata import KeiyakuData
-from keiyakumodelfactory import KeiyakuModelFactory
-
-DATA_DIR = os.path.join(os.path.dirname(__file__), r"data")
-ANALYZE_DIR = os.path.join(os.path.dirname(__file__), r"analyze")
-UPLOAD_FILE_EXTENSION = [ ".pdf", ".doc", ".docx" ]
-UPLOAD_FILE_MAX_SIZE_MB = 10
-
-keiyaku_analyze_mutex = threading.Lock()
-
-class KeiyakuWebData:
-    
-    PARA_FILE = "param.json"
-
-    create_seqid_mutex = threading.Lock()        
-
-    def __init__(self, seqid=None, orgfilename="", mimetype=""):
-        if seqid != None:
-            self.seqid = seqid
-            self.paradata = {}
-
-            with open(os.path.join(self.get_dirpath(), self.PARA_FILE), "r") as parafile:
-                para = json.load(parafile)
-                self.paradata["orgfilename"] = para["orgfilename"]
-                self.paradata["filename"] = para["filename"]
-                self.paradata["txtname"] = para["txtname"]
-                self.paradata["csvname"] = para["csvname"]
-                self.paradata["mimetype"] = para["mimetype"]
-        else:
-            if orgfilename == "" or mimetype == "":
-                raise AttributeError()
-
-            self.seqid = self._create_seqid()
-            self.paradata = {}
-            
-            basefilename = os.path.basename(secure_filename(orgfilename))
-            extension = os.path.splitext(orgfilename)[1]
-            filename = "{}_{}.{}".format(datetime.datetime.now().strftime('%Y%m%d%H%M%S'), basefilename, extension)
-            self.paradata["orgfilename"] = orgfilename
-            self.paradata["filename"] = filename
-            self.paradata["txtname"] = "txt_{}.txt".format(os.path.basename(filename))
-            self.paradata["csvname"] = "csv_{}.csv".format(os.path.basename(filename))
-            self.paradata["mimetype"] = mimetype
-            with open(os.path.join(self.get_dirpath(), self.PARA_FILE), "w") as parafile:
-                json.dump(self.paradata, parafile, ensure_ascii=False, indent=4)
-
-    def get_dirpath(self):
-        return os.path.join(DATA_DIR, self.seqid)
-
-    def get_orgfilename(self):
-        return self.paradata["orgfilename"]
-
-    def get_orgtxtname(self):
-        return os.path.basename(self.get_orgfilename()) + ".txt"
-
-    def get_filename(self):
-        return self.paradata["filename"]
-
-    def get_filepath(self):
-        return os.path.join(self.get_dirpath(), self.get_filename())
-
-    def get_txtname(self):
-        return self.paradata["txtname"]
-
-    def get_txtpath(self):
-        return os.path.join(self.get_dirpath(), self.get_txtname())
-
-    def get_csvname(self):
-        return self.paradata["csvname"]
-
-    def get_csvpath(self):
-        return os.path.join(self.get_dirpath(), self.get_csvname())
-
-    def get_mimetype(self):
-        return self.paradata["mimetype"]
-
-    def create_analyzepath(self):
-        analyze_dir = os.path.join(ANALYZE_DIR, self.seqid)
-        os.makedirs(analyze_dir, exist_ok=True)
-        return os.path.join(analyze_dir, datetime.datetime.now().strftime('%Y%m%d%H%M%S') + ".txt")
-
-    def _create_seqid(self):
-        self.create_seqid_mutex.acquire()
-
-        dirs = glob.glob(os.path.join(DATA_DIR, r"?????"))
-        dirs = [os.path.basename(dir) for dir in dirs if os.path.isdir(dir)]
-        seqs = [int(seq) for seq in dirs if re.match(r'[0-9]{5}', seq)]
-        seq = str(max(seqs) + 1) if len(seqs) != 0 else "0"
-
-        seqid = seq.zfill(5)
-        os.mkdir(os.path.join(DATA_DIR, seqid))
-
-        self.create_seqid_mutex.release()
-
-        return seqid
-
-def keiyaku_analyze(csvpath):
-    keiyaku_analyze_mutex.acquire()
-
-    keiyakumodel, model, tokenizer = KeiyakuModelFactory.get_keiyakumodel()    
-    keiyakudata = KeiyakuData(csvpath)
-    predict_datas = keiyakudata.get_group_datas(tokenizer, model.seq_len)
-    score1, score2 = keiyakumodel.predict(predict_datas)
-
-    keiyaku_analyze_mutex.release()
-    
-    return score1, score2
-
-view_app = Blueprint("view", __name__, static_url_path='/keiyaku_group/view', static_folder='./view/build')
-app = Flask(__name__)
-app.register_blueprint(view_app)
-
-app.config["SECRET_KEY"] = "keiyaku_group_cosmo"
-app.config['MAX_CONTENT_LENGTH'] = UPLOAD_FILE_MAX_SIZE_MB * 1024 * 1024
-
-def init_web(debugmode):
-    if debugmode == False:
-        KeiyakuModelFactory.get_keiyakumodel()
-        
-    app.run(debug=debugmode, host="0.0.0.0", port=80)
-    
-@app.route("/keiyaku_group/template/", methods=["GET"])
-def index():    
-    datas = []
-    for dir in glob.glob(os.path.join(DATA_DIR, r"?????")):
-        seqid = os.path.basename(dir)
-        data = KeiyakuWebData(seqid)
-
-        if os.path.isfile(data.get_filepath()):
-            datas.append((seqid, data.get_orgfilename()))
-
-    return render_template("index.html", datas=datas)
-
-@app.route("/keiyaku_group/", methods=["GET"])
-def view_index():
-    return view_app.send_static_file("index.html")
-
-@app.route("/keiyaku_group/api/list", methods=["GET"])
-def api_list():
-    result={"data": [], "code": 0}
-    for dir in glob.glob(os.path.join(DATA_DIR, r"?????")):
-        seqid = os.path.basename(dir)
-        data = KeiyakuWebData(seqid)
-
-        if os.path.isfile(data.get_filepath()):
-            result["data"].append({"seqid": seqid, "filename": data.get_orgfilename()})
-
-    return jsonify(result)
-
-@app.route("/keiyaku_group/upload", methods=["POST"])
-def upload():
-    try:
-        f = request.files["file"]
-    except werkzeug.exceptions.RequestEntityTooLarge:
-        flash("ファイルサイズが{}MBを超えるためアップロードできません".format(UPLOAD_FILE_MAX_SIZE_MB), category="flash_error")
-        return redirect(url_for("index"))
-
-    data = KeiyakuWebData(orgfilename=f.filename, mimetype=request.mimetype)
-    
-    extension = os.path.splitext(f.filename)[1].lower()
-    if extension not in UPLOAD_FILE_EXTENSION:
-        flash("拡張子{}はアップロードできません".format(extension if extension != "" else "無し"), category="flash_error")
-    else:
-        f.save(data.get_filepath())
-        KeiyakuData.create_keiyaku_data(data.get_filepath(), data.get_txtpath(), data.get_csvpath())
-
-    return redirect(url_for("index"))
-
-@app.route("/keiyaku_group/api/upload", methods=["POST"])
-def api_upload():
-    result={"data" : { "seqid":-1, "filename": ""}, "code": 0, "message": [] }
-
-    try:
-        f = request.files["file"]
-    except werkzeug.exceptions.RequestEntityTooLarge:
-        result["message"].append({"category": "error", "message": "ファイルサイズが{}MBを超えるためアップロードできません".format(UPLOAD_FILE_MAX_SIZE_MB)})
-        result["code"] = 9
-        return jsonify(result)
-
-    data = KeiyakuWebData(orgfilename=f.filename, mimetype=request.mimetype)
-    
-    extension = os.path.splitext(f.filename)[1].lower()
-    if extension not in UPLOAD_FILE_EXTENSION:
-        result["message"].append({"category": "error", "message": "拡張子{}はアップロードできません".format(extension if extension != "" else "無し")})
-        result["code"] = 9
-    else:
-        f.save(data.get_filepath())
-        KeiyakuData.create_keiyaku_data(data.get_filepath(), data.get_txtpath(), data.get_csvpath())
-        result["data"]["seqid"] = data.seqid
-        result["data"]["filename"] = data.get_orgfilename()
-        result["message"].append({"category": "info", "message": "{}をアップロードしました".format(data.get_orgfilename())})
-
-    return jsonify(result)
-
-@app.route("/keiyaku_group/download", methods=["POST"])
-def download():
-    seqid = request.form["seqid"]
-    data = KeiyakuWebData(seqid)
-    return send_file(data.get_filepath(), as_attachment=True, attachment_filename=data.get_orgfilename())
-
-@app.route("/keiyaku_group/api/download", methods=["POST"])
-def api_download():
-    return download()
-
-@app.route("/keiyaku_group/download_txt", methods=["POST"])
-def download_txt():
-    seqid = request.form["seqid"]
-    data = KeiyakuWebData(seqid)
-    return send_file(data.get_txtpath(), as_attachment=True, attachment_filename=data.get_orgtxtname())
-
-@app.route("/keiyaku_group/api/download_txt", methods=["POST"])
-def api_download_txt():
-    return download_txt();
-
-@app.route("/keiyaku_group/delete", methods=["POST"])
-def delete():
-    seqid = request.form["seqid"]
-    data = KeiyakuWebData(seqid)
-
-    dirpath = data.get_dirpath()
-    if os.path.isdir(dirpath) == True:
-        for delfile in os.listdir(dirpath):
-            os.remove(os.path.join(dirpath, delfile))
-
-        os.rmdir(dirpath)
-
-    return redirect(url_for("index"))
-
-@app.route("/keiyaku_group/api/delete", methods=["POST"])
-def api_delete():
-    seqid = request.form["seqid"]
-    result={"data" : { "seqid": seqid }, "code": 0, "message": [] }
-    
-    data = KeiyakuWebData(seqid)
-
-    dirpath = data.get_dirpath()
-    if os.path.isdir(dirpath) == True:
-        for delfile in os.listdir(dirpath):
-            os.remove(os.path.join(dirpath, delfile))
-
-        os.rmdir(dirpath)
-
-    return jsonify({})
-
-@app.route("/keiyaku_group/analyze", methods=["POST"])
-def analyze():
-    seqid = request.form["seqid"]
-    data = KeiyakuWebData(seqid)
-    
-    scores1, scores2 = keiyaku_analyze(data.get_csvpath())
-    keiyakudata = KeiyakuData(data.get_csvpath())
-    sentensedatas = keiyakudata.get_datas()
-    analyze_path = data.create_analyzepath()
-
-    np.set_printoptions(precision=2, floatmode='fixed')
-    with open(analyze_path, "w") as f:
-        for sentensedata, score1, score2 in zip(sentensedatas, scores1, scores2):
-            sentense = sentensedata[6]
-            kind1 = score2.argmax()
-            if score1 >= 0.5:
-                f.write("{}---------------------------------------------\n".format(score1))
-                
-            f.write("{}-{:0.2f}:{}\n".format(kind1, score2[kind1], sentense))
-
-    return send_file(analyze_path, as_attachment=True, attachment_filename=data.get_orgtxtname())
-
-@app.route("/keiyaku_group/api/analyze", methods=["POST"])
-def api_analyze():
-    return analyze()
-    
-@app.route("/keiyaku_group/api/analyze_json", methods=["POST"])
-def api_analyze_json():
-    seqid = request.form["seqid"]
-    result={"data" : {}, "code": 0, "message": [] }
-    
-    data = KeiyakuWebData(seqid)
-
-    scores1, scores2 = keiyaku_analyze(data.get_csvpath())
-    
-    jsondata = {}
-    for col, score in enumerate(zip(scores1, scores2)):
-        score1 = score[0]
-        score2 = score[1]
-        scoredata = {}
-        scoredata[1] = round(float(score1[0]), 2)
-        scoredata[2] = { i:round(float(score), 2) for i, score in enumerate(score2) }
-        jsondata[col] = scoredata
-
-    result["data"] = jsondata
-    return jsonify(result)
-    
-@app.after_request
-def after_request(response):
-    if app.debug:
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-        
+from flask import Flask, url_for, redirect, send_file
+from flask import request
+from flask import jsonify
+from flask import render_template
+from flask import flash
+from flask import Blueprint
+from flask import Response
+from flask import stream_with_context
+from flask import g
+from flask import Request
+from werkzeug.utils import secure_filename
+import werkzeug
+import os
+import glob
+import re
+import threading
+import json
+import numpy as np
+import datetime
+import hashlib
+import shutil
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from keiyakudata import KeiyakuData
+from keiyakumodelfactory import KeiyakuModelFactory
+from keiyakuscorecache import KeiyakuScoreCache
+from keiyakuembeddingindex import KeiyakuEmbeddingIndex
+from web.keiyakuwebcatalog import KeiyakuWebCatalog
+from web.keiyakuwebmetrics import KeiyakuWebMetrics
+from web.keiyakuwebadmission import KeiyakuWebAdmission, KeiyakuWebAdmissionError, KeiyakuWebAdmissionTicket
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), r"data")
+ANALYZE_DIR = os.path.join(os.path.dirname(__file__), r"analyze")
+CONTENTS_DIR = os.path.join(DATA_DIR, r"contents")
+METRICS_DIR = os.path.join(DATA_DIR, r"metrics")
+INDEX_DIR = os.path.join(DATA_DIR, r"index")
+UPLOAD_FILE_EXTENSION = [ ".pdf", ".doc", ".docx" ]
+UPLOAD_FILE_MAX_SIZE_MB = 10
+UPLOAD_BATCH_MAX_SIZE_MB = 500
+UPLOAD_BATCH_EXTRACT_NUM = os.cpu_count() or 1
+ANALYZE_BATCH_ROWS = 200
+#解析待ちの上限(文書数・文章行数)と優先処理する小さい文書の行数
+ANALYZE_MAX_PENDING_DOCS = 16
+ANALYZE_MAX_PENDING_ROWS = 50000
+ANALYZE_SMALL_DOC_ROWS = 300
+SEARCH_MAX_NUM = 100
+#文章単位の予測結果キャッシュ(メモリ上の件数)
+SENTENCE_CACHE_FILE = os.path.join(DATA_DIR, r"sentence_cache.db")
+SENTENCE_CACHE_MAX_NUM = 100000
+
+keiyaku_admission = KeiyakuWebAdmission(ANALYZE_MAX_PENDING_DOCS, ANALYZE_MAX_PENDING_ROWS, ANALYZE_SMALL_DOC_ROWS)
+keiyaku_catalog = KeiyakuWebCatalog(DATA_DIR)
+keiyaku_score_cache = KeiyakuScoreCache(SENTENCE_CACHE_FILE, SENTENCE_CACHE_MAX_NUM)
+keiyaku_embedding_indexes = {}
+keiyaku_embedding_indexes_mutex = threading.Lock()
+
+keiyaku_metrics = KeiyakuWebMetrics()
+keiyaku_metrics.register("keiyaku_stage_seconds", KeiyakuWebMetrics.TYPE_HISTOGRAM, "Latency of each processing stage in seconds")
+keiyaku_metrics.register("keiyaku_request_seconds", KeiyakuWebMetrics.TYPE_HISTOGRAM, "Request latency in seconds")
+keiyaku_metrics.register("keiyaku_requests_total", KeiyakuWebMetrics.TYPE_COUNTER, "Number of requests")
+keiyaku_metrics.register("keiyaku_inflight_requests", KeiyakuWebMetrics.TYPE_GAUGE, "Number of requests in progress")
+keiyaku_metrics.register("keiyaku_stage_rows_total", KeiyakuWebMetrics.TYPE_COUNTER, "Number of sentence rows processed by each stage")
+keiyaku_metrics.register("keiyaku_score_cache_total", KeiyakuWebMetrics.TYPE_COUNTER, "Number of analysis score cache lookups")
+keiyaku_metrics.register("keiyaku_sentence_cache_total", KeiyakuWebMetrics.TYPE_COUNTER, "Number of sentence score cache lookups")
+keiyaku_metrics.register("keiyaku_admission_rejected_total", KeiyakuWebMetrics.TYPE_COUNTER, "Number of analysis requests rejected by admission control")
+keiyaku_metrics.register("keiyaku_analyze_cancelled_total", KeiyakuWebMetrics.TYPE_COUNTER, "Number of analyses stopped before completion")
+keiyaku_metrics.register("keiyaku_model_load_total", KeiyakuWebMetrics.TYPE_COUNTER, "Number of model loads")
+keiyaku_metrics.register("keiyaku_model_load_seconds", KeiyakuWebMetrics.TYPE_HISTOGRAM, "Model load latency in seconds")
+
+class KeiyakuWebData:
+    
+    PARA_FILE = "param.json"
+    SCORE_FILE = "score_{}.npz"
+    CONTENT_TXT_FILE = "keiyaku.txt"
+    CONTENT_CSV_FILE = "keiyaku.csv"
+
+    def __init__(self, seqid=None, orgfilename="", mimetype="", contenthash=""):
+        if seqid != None:
+            self.seqid = seqid
+            self.paradata = keiyaku_catalog.get(seqid)
+
+            if self.paradata is None:
+                #カタログに無く、アップロードデータも無いseqidは404
+                parapath = os.path.join(self.get_dirpath(), self.PARA_FILE)
+                if re.fullmatch(r'[0-9]+', str(seqid)) is None or os.path.isfile(parapath) != True:
+                    raise werkzeug.exceptions.NotFound()
+
+                with open(parapath, "r") as parafile:
+                    para = json.load(parafile)
+                    self.paradata = {}
+                    self.paradata["orgfilename"] = para["orgfilename"]
+                    self.paradata["filename"] = para["filename"]
+                    self.paradata["txtname"] = para["txtname"]
+                    self.paradata["csvname"] = para["csvname"]
+                    self.paradata["mimetype"] = para["mimetype"]
+                    self.paradata["contenthash"] = para.get("contenthash", "")
+        else:
+            if orgfilename == "" or mimetype == "":
+                raise AttributeError()
+
+            self.paradata = {}
+            
+            basefilename = os.path.basename(secure_filename(orgfilename))
+            extension = os.path.splitext(orgfilename)[1]
+            filename = "{}_{}.{}".format(datetime.datetime.now().strftime('%Y%m%d%H%M%S'), basefilename, extension)
+            self.paradata["orgfilename"] = orgfilename
+            self.paradata["filename"] = filename
+            self.paradata["txtname"] = "txt_{}.txt".format(os.path.basename(filename))
+            self.paradata["csvname"] = "csv_{}.csv".format(os.path.basename(filename))
+            self.paradata["mimetype"] = mimetype
+            self.paradata["contenthash"] = contenthash
+
+            self.seqid = self._create_seqid()
+            with open(os.path.join(self.get_dirpath(), self.PARA_FILE), "w") as parafile:
+                json.dump(self.paradata, parafile, ensure_ascii=False, indent=4)
+
+    def get_dirpath(self):
+        return os.path.join(DATA_DIR, self.seqid)
+
+    def get_orgfilename(self):
+        return self.paradata["orgfilename"]
+
+    def get_orgtxtname(self):
+        return os.path.basename(self.get_orgfilename()) + ".txt"
+
+    def get_filename(self):
+        return self.paradata["filename"]
+
+    def get_filepath(self):
+        return os.path.join(self.get_dirpath(), self.get_filename())
+
+    def get_txtname(self):
+        return self.paradata["txtname"]
+
+    def get_txtpath(self):
+        if self.get_contenthash() != "":
+            return os.path.join(self.get_contentpath(), self.CONTENT_TXT_FILE)
+
+        return os.path.join(self.get_dirpath(), self.get_txtname())
+
+    def get_csvname(self):
+        return self.paradata["csvname"]
+
+    def get_csvpath(self):
+        if self.get_contenthash() != "":
+            return os.path.join(self.get_contentpath(), self.CONTENT_CSV_FILE)
+
+        return os.path.join(self.get_dirpath(), self.get_csvname())
+
+    def get_mimetype(self):
+        return self.paradata["mimetype"]
+
+    def get_contenthash(self):
+        return self.paradata["contenthash"]
+
+    def get_contentpath(self):
+        return os.path.join(CONTENTS_DIR, self.get_contenthash())
+
+    def get_index_docid(self):
+        #類似検索インデックスの文書ID(同一内容の文書は1件として登録)
+        return self.get_contenthash() or self.seqid
+
+    def get_scorepath(self, model_version):
+        #同一内容のファイルは解析結果も共有する
+        scoredir = self.get_contentpath() if self.get_contenthash() != "" else self.get_dirpath()
+        return os.path.join(scoredir, self.SCORE_FILE.format(model_version))
+
+    def load_scores(self, model_version):
+        scorepath = self.get_scorepath(model_version)
+        if model_version == "" or os.path.isfile(scorepath) != True:
+            return None
+
+        with np.load(scorepath) as scorefile:
+            return scorefile["score1"].astype(np.float32), scorefile["score2"].astype(np.float32)
+
+    def save_scores(self, model_version, scores1, scores2):
+        if model_version == "":
+            return
+
+        #別モデルの解析結果は無効のため削除
+        for oldpath in glob.glob(self.get_scorepath("*")):
+            os.remove(oldpath)
+
+        scorepath = self.get_scorepath(model_version)
+        tmppath = scorepath + ".tmp"
+        with open(tmppath, "wb") as scorefile:
+            np.savez_compressed(scorefile, score1=np.asarray(scores1, dtype=np.float16), score2=np.asarray(scores2, dtype=np.float16))
+
+        os.replace(tmppath, scorepath)
+
+    def create_analyzepath(self):
+        analyze_dir = os.path.join(ANALYZE_DIR, self.seqid)
+        os.makedirs(analyze_dir, exist_ok=True)
+        return os.path.join(analyze_dir, datetime.datetime.now().strftime('%Y%m%d%H%M%S') + ".txt")
+
+    def save_file(self, content):
+        with open(self.get_filepath(), "wb") as f:
+            f.write(content)
+
+    def create_keiyaku_data(self):
+        if self.get_contenthash() == "":
+            with keiyaku_metrics.time("keiyaku_stage_seconds", stage="extraction"):
+                KeiyakuData.create_keiyaku_data(self.get_filepath(), self.get_txtpath(), self.get_csvpath())
+            return
+
+        #同一内容の抽出済データがあれば再利用(csvの存在を抽出完了とする)
+        #同時に抽出しても途中のファイルを参照しないよう、seqid毎の一時ファイルへ抽出してtxt・csvの順に置換え
+        csvpath = self.get_csvpath()
+        if os.path.isfile(csvpath):
+            return
+
+        os.makedirs(self.get_contentpath(), exist_ok=True)
+        txtpath = self.get_txtpath()
+        tmptxtpath = "{}.{}.tmp".format(txtpath, self.seqid)
+        tmpcsvpath = "{}.{}.tmp".format(csvpath, self.seqid)
+        try:
+            with keiyaku_metrics.time("keiyaku_stage_seconds", stage="extraction"):
+                KeiyakuData.create_keiyaku_data(self.get_filepath(), tmptxtpath, tmpcsvpath)
+            os.replace(tmptxtpath, txtpath)
+            os.replace(tmpcsvpath, csvpath)
+        finally:
+            for tmppath in [tmptxtpath, tmpcsvpath]:
+                if os.path.isfile(tmppath):
+                    os.remove(tmppath)
+
+    def set_uploaded(self):
+        keiyaku_catalog.set_uploaded(self.seqid)
+
+    def delete(self):
+        dirpath = self.get_dirpath()
+        if os.path.isdir(dirpath) == True:
+            for delfile in os.listdir(dirpath):
+                os.remove(os.path.join(dirpath, delfile))
+
+            os.rmdir(dirpath)
+
+        keiyaku_catalog.delete(self.seqid)
+
+        #参照するアップロードが無くなった抽出データ・インデックスは削除
+        if self.get_contenthash() == "":
+            keiyaku_delete_index(self.seqid)
+        elif keiyaku_catalog.get_content_count(self.get_contenthash()) == 0:
+            keiyaku_delete_index(self.get_contenthash())
+            shutil.rmtree(self.get_contentpath(), ignore_errors=True)
+
+    def _create_seqid(self):
+        seqid = keiyaku_catalog.create(self.paradata)
+        os.makedirs(os.path.join(DATA_DIR, seqid), exist_ok=True)
+
+        return seqid
+
+def keiyaku_get_model():
+    if KeiyakuModelFactory.now_model_name != KeiyakuModelFactory.default_model_name:
+        with keiyaku_metrics.time("keiyaku_model_load_seconds"):
+            result = KeiyakuModelFactory.get_keiyakumodel()
+        keiyaku_metrics.inc("keiyaku_model_load_total", model=KeiyakuModelFactory.default_model_name)
+        return result
+
+    return KeiyakuModelFactory.get_keiyakumodel()
+
+def keiyaku_load_scores(data: KeiyakuWebData, model_version):
+    scores = data.load_scores(model_version)
+    keiyaku_metrics.inc("keiyaku_score_cache_total", result="hit" if scores is not None else "miss")
+    return scores
+
+def keiyaku_read_data(csvpath):
+    keiyakudata = KeiyakuData(csvpath)
+    keiyaku_metrics.observe("keiyaku_stage_seconds", keiyakudata.elapsed["read_csv"], stage="csv_parse")
+    keiyaku_metrics.observe("keiyaku_stage_seconds", keiyakudata.elapsed["data_group_set"], stage="link")
+    return keiyakudata
+
+def keiyaku_get_group_datas(keiyakudata: KeiyakuData, tokenizer, seq_len):
+    with keiyaku_metrics.time("keiyaku_stage_seconds", stage="tokenize"):
+        predict_datas = keiyakudata.get_group_datas(tokenizer, seq_len)
+    keiyaku_metrics.inc("keiyaku_stage_rows_total", len(predict_datas), stage="tokenize")
+    return predict_datas
+
+def keiyaku_predict_batches(keiyakumodel, predict_datas, keys, model_version, with_embedding=False):
+    #文章単位のキャッシュに無い行のみ予測(model_versionが空の場合は全行を予測)
+    batches = keiyaku_score_cache.predict_batches(keiyakumodel, model_version, predict_datas, keys, ANALYZE_BATCH_ROWS, with_embedding)
+    while True:
+        with keiyaku_metrics.time("keiyaku_stage_seconds", stage="predict"):
+            batch = next(batches, None)
+
+        if batch is None:
+            return
+
+        start, result, hit_num = batch
+        keiyaku_metrics.inc("keiyaku_stage_rows_total", len(result[0]) - hit_num, stage="predict")
+        if model_version != "":
+            keiyaku_metrics.inc("keiyaku_sentence_cache_total", hit_num, result="hit")
+            keiyaku_metrics.inc("keiyaku_sentence_cache_total", len(result[0]) - hit_num, result="miss")
+        yield start, result
+
+def keiyaku_analyze(data: KeiyakuWebData, keiyakudata: KeiyakuData=None, base_data: KeiyakuWebData=None):
+    scores1 = []
+    scores2 = []
+    ticket, results = keiyaku_analyze_start(data, keiyakudata=keiyakudata, base_data=base_data)
+    for _, batch_scores1, batch_scores2 in results:
+        scores1.append(batch_scores1)
+        scores2.append(batch_scores2)
+
+    if len(scores1) == 0:
+        return np.zeros((0, 1), dtype=np.float32), np.zeros((0, 0), dtype=np.float32)
+
+    return np.concatenate(scores1), np.concatenate(scores2)
+
+def keiyaku_analyze_start(data: KeiyakuWebData, offset=0, limit=None, usecache=True, keiyakudata: KeiyakuData=None, base_data: KeiyakuWebData=None):
+    #offset行目からlimit行分の解析結果をANALYZE_BATCH_ROWS行ずつ返すイテレータを作成
+    #解析待ちが上限を超える場合はKeiyakuWebAdmissionErrorとなる
+    #アップロード後の文書は不変のため、同一モデルの解析結果があれば再利用
+    model_version = KeiyakuModelFactory.get_model_version()
+    scores = data.load_scores(model_version) if usecache else None
+    if scores is not None:
+        keiyaku_metrics.inc("keiyaku_score_cache_total", result="hit")
+        return None, keiyaku_iter_scores(scores, offset, limit)
+
+    if keiyakudata is None:
+        keiyakudata = keiyaku_read_data(data.get_csvpath())
+
+    #編集前の文書(base_data)の解析結果があれば、変更行とその次の行のみ全行分を予測
+    reuse = None
+    base_scores = base_data.load_scores(model_version) if base_data is not None and usecache else None
+    if base_scores is not None:
+        reuse_indexes = keiyakudata.get_reuse_indexes(keiyaku_read_data(base_data.get_csvpath()))
+        reuse = (base_scores, reuse_indexes)
+        keiyaku_metrics.inc("keiyaku_stage_rows_total", len(reuse_indexes) - reuse_indexes.count(-1), stage="reuse")
+
+    row_num = len(keiyakudata.get_datas())
+    end = row_num if limit is None else min(offset + limit, row_num)
+    try:
+        if reuse is not None:
+            ticket = keiyaku_admission.enter(reuse[1].count(-1))
+        else:
+            ticket = keiyaku_admission.enter(max(end - offset, 0))
+    except KeiyakuWebAdmissionError:
+        keiyaku_metrics.inc("keiyaku_admission_rejected_total")
+        raise
+
+    return ticket, keiyaku_analyze_iter(data, keiyakudata, offset, limit, usecache, ticket, reuse)
+
+def keiyaku_analyze_iter(data: KeiyakuWebData, keiyakudata: KeiyakuData, offset, limit, usecache, ticket: KeiyakuWebAdmissionTicket, reuse=None):
+    completed = False
+    scores = None
+    try:
+        with keiyaku_metrics.time("keiyaku_stage_seconds", stage="lock_wait"):
+            ticket.wait()
+
+        keiyakumodel, model, tokenizer = keiyaku_get_model()
+        model_version = KeiyakuModelFactory.get_model_version() if usecache else ""
+        scores = keiyaku_load_scores(data, model_version) if usecache else None
+        if scores is None and reuse is not None:
+            predict_datas = keiyaku_get_group_datas(keiyakudata, tokenizer, model.seq_len)
+            keys = KeiyakuScoreCache.get_keys(keiyakudata)
+            scores1, scores2, embeddings = keiyaku_predict_diff(keiyakumodel, predict_datas, keys, model_version, reuse[0], reuse[1])
+            scores = (scores1, scores2)
+            data.save_scores(model_version, scores1, scores2)
+            keiyaku_add_index(data, keiyakudata, keys, embeddings, model_version)
+            completed = True
+        elif scores is None:
+            predict_datas = keiyaku_get_group_datas(keiyakudata, tokenizer, model.seq_len)
+            keys = KeiyakuScoreCache.get_keys(keiyakudata)
+            end = len(predict_datas) if limit is None else min(offset + limit, len(predict_datas))
+
+            scores1 = []
+            scores2 = []
+            embeddings = []
+            #クライアント切断時はyieldでGeneratorExitとなり、残りのバッチは予測しない
+            for start, result in keiyaku_predict_batches(keiyakumodel, predict_datas[offset:end], keys[offset:end], model_version, model_version != ""):
+                scores1.append(result[0])
+                scores2.append(result[1])
+                embeddings.extend(result[2] if len(result) > 2 else [])
+                yield offset + start, result[0], result[1]
+
+            #全行を解析した場合のみ結果を保存
+            if offset == 0 and end == len(predict_datas) and len(scores1) > 0:
+                data.save_scores(model_version, np.concatenate(scores1), np.concatenate(scores2))
+                keiyaku_add_index(data, keiyakudata, keys, embeddings, model_version)
+
+            completed = True
+            return
+    finally:
+        if completed != True and scores is None:
+            keiyaku_metrics.inc("keiyaku_analyze_cancelled_total")
+        ticket.release()
+
+    yield from keiyaku_iter_scores(scores, offset, limit)
+
+def keiyaku_predict_diff(keiyakumodel, predict_datas, keys, model_version, base_scores, reuse_indexes):
+    #再利用可能な行は編集前の解析結果をコピーし、それ以外の行のみ予測
+    reuse_indexes = np.array(reuse_indexes, dtype=np.int64)
+    reuse_flags = reuse_indexes >= 0
+    targets = np.where(reuse_flags == False)[0]
+
+    scores1 = np.zeros((len(predict_datas), 1), dtype=np.float32)
+    scores2 = np.zeros((len(predict_datas), keiyakumodel.output_class1_num), dtype=np.float32)
+    scores1[reuse_flags] = base_scores[0][reuse_indexes[reuse_flags]]
+    scores2[reuse_flags] = base_scores[1][reuse_indexes[reuse_flags]]
+    #再利用した行の埋込みはインデックス登録時に同じ文章・前文章の登録済の値を使用
+    embeddings = [ None ] * len(predict_datas)
+
+    for start, result in keiyaku_predict_batches(keiyakumodel, [ predict_datas[target] for target in targets ], [ keys[target] for target in targets ], model_version, model_version != ""):
+        batch_targets = targets[start:start + len(result[0])]
+        scores1[batch_targets] = result[0]
+        scores2[batch_targets] = result[1]
+        for target, embedding in zip(batch_targets, result[2] if len(result) > 2 else []):
+            embeddings[target] = embedding
+
+    return scores1, scores2, embeddings
+
+def keiyaku_get_embedding_index(model_version) -> KeiyakuEmbeddingIndex:
+    keiyaku_embedding_indexes_mutex.acquire()
+    if model_version not in keiyaku_embedding_indexes:
+        keiyaku_embedding_indexes[model_version] = KeiyakuEmbeddingIndex(os.path.join(INDEX_DIR, model_version))
+    embedding_index = keiyaku_embedding_indexes[model_version]
+    keiyaku_embedding_indexes_mutex.release()
+
+    return embedding_index
+
+def keiyaku_add_index(data: KeiyakuWebData, keiyakudata: KeiyakuData, keys, embeddings, model_version):
+    #解析した文書の文章をモデル毎の類似検索インデックスへ登録
+    if model_version == "" or len(embeddings) != len(keys):
+        return
+
+    with keiyaku_metrics.time("keiyaku_stage_seconds", stage="index"):
+        add_num = keiyaku_get_embedding_index(model_version).add(data.get_index_docid(), keys, embeddings, [ sentensedata[6] for sentensedata in keiyakudata.get_datas() ])
+    keiyaku_metrics.inc("keiyaku_stage_rows_total", add_num, stage="index")
+
+def keiyaku_delete_index(docid):
+    for index_dir in glob.glob(os.path.join(INDEX_DIR, "*")):
+        keiyaku_get_embedding_index(os.path.basename(index_dir)).delete(docid)
+
+def keiyaku_get_index_seqid(docid):
+    #インデックスの文書IDに対応するアップロード済のseqid(同一内容の文書は最初のアップロード)
+    seqids = keiyaku_catalog.get_content_seqids(docid)
+    return seqids[0] if len(seqids) > 0 else docid
+
+def keiyaku_reindex(rebuild=False):
+    #アップロード済の全文書を現在のモデルの類似検索インデックスへ登録(登録済の行数が文書の行数と異なる文書のみ、rebuild指定時は全文書)
+    #解析結果の保存前から存在する文書や、キャッシュから解析結果を返した文書も登録される
+    #アップロードが無くなった文書IDは削除し、削除済の行を除いて書直す
+    keiyakumodel, model, tokenizer = keiyaku_get_model()
+    model_version = KeiyakuModelFactory.get_model_version()
+    if model_version == "":
+        return 0
+
+    datas = {}
+    for seqid, _ in keiyaku_catalog.get_list():
+        data = KeiyakuWebData(seqid)
+        if os.path.isfile(data.get_csvpath()):
+            datas.setdefault(data.get_index_docid(), data)
+
+    embedding_index = keiyaku_get_embedding_index(model_version)
+    doc_counts = embedding_index.get_doc_counts()
+    for docid in doc_counts.keys():
+        if docid not in datas:
+            embedding_index.delete(docid)
+
+    index_num = 0
+    for docid, data in datas.items():
+        keiyakudata = keiyaku_read_data(data.get_csvpath())
+        if rebuild != True and doc_counts.get(docid) == len(keiyakudata.get_datas()):
+            continue
+
+        #文章単位のキャッシュにある行も埋込みが必要なため全行を予測
+        predict_datas = keiyaku_get_group_datas(keiyakudata, tokenizer, model.seq_len)
+        keys = KeiyakuScoreCache.get_keys(keiyakudata)
+        embeddings = []
+        for _, result in keiyaku_predict_batches(keiyakumodel, predict_datas, keys, "", True):
+            embeddings.extend(result[2])
+
+        keiyaku_add_index(data, keiyakudata, keys, embeddings, model_version)
+        index_num += 1
+
+    embedding_index.compact()
+    return index_num
+
+def keiyaku_iter_scores(scores, offset, limit):
+    end = len(scores[0]) if limit is None else min(offset + limit, len(scores[0]))
+    for start in range(offset, end, ANALYZE_BATCH_ROWS):
+        batch_end = min(start + ANALYZE_BATCH_ROWS, end)
+        yield start, scores[0][start:batch_end], scores[1][start:batch_end]
+
+def keiyaku_analyze_batch_start(datas):
+    #複数文書の文章をまとめてバッチ予測し、文書毎の(seqid, 解析結果)を返すイテレータを作成
+    #解析待ちが上限を超える場合はKeiyakuWebAdmissionErrorとなる
+    results = {}
+    targets = {}
+    model_version = KeiyakuModelFactory.get_model_version()
+    for data in datas:
+        scores = data.load_scores(model_version)
+        if scores is not None:
+            keiyaku_metrics.inc("keiyaku_score_cache_total", result="hit")
+            results[data.seqid] = scores
+        else:
+            #同一内容の文書は1回のみ解析
+            targets.setdefault(data.get_contenthash() or data.seqid, []).append(data)
+
+    if len(targets) == 0:
+        return None, iter(results.items())
+
+    keiyakudatas = { key: keiyaku_read_data(targetdatas[0].get_csvpath()) for key, targetdatas in targets.items() }
+    try:
+        ticket = keiyaku_admission.enter(sum([ len(keiyakudata.get_datas()) for keiyakudata in keiyakudatas.values() ]))
+    except KeiyakuWebAdmissionError:
+        keiyaku_metrics.inc("keiyaku_admission_rejected_total")
+        raise
+
+    return ticket, keiyaku_analyze_batch_iter(results, targets, keiyakudatas, ticket)
+
+def keiyaku_analyze_batch_iter(results, targets, keiyakudatas, ticket: KeiyakuWebAdmissionTicket):
+    try:
+        with keiyaku_metrics.time("keiyaku_stage_seconds", stage="lock_wait"):
+            ticket.wait()
+
+        keiyakumodel, model, tokenizer = keiyaku_get_model()
+        model_version = KeiyakuModelFactory.get_model_version()
+
+        predict_datas = []
+        keys = []
+        ranges = {}
+        for key, keiyakudata in keiyakudatas.items():
+            group_datas = keiyaku_get_group_datas(keiyakudata, tokenizer, model.seq_len)
+            ranges[key] = (len(predict_datas), len(predict_datas) + len(group_datas))
+            predict_datas.extend(group_datas)
+            keys.extend(KeiyakuScoreCache.get_keys(keiyakudata))
+
+        scores1 = []
+        scores2 = []
+        embeddings = []
+        for _, result in keiyaku_predict_batches(keiyakumodel, predict_datas, keys, model_version, model_version != ""):
+            scores1.append(result[0])
+            scores2.append(result[1])
+            embeddings.extend(result[2] if len(result) > 2 else [])
+
+        if len(scores1) > 0:
+            scores1 = np.concatenate(scores1)
+            scores2 = np.concatenate(scores2)
+        else:
+            scores1 = np.zeros((0, 1), dtype=np.float32)
+            scores2 = np.zeros((0, 0), dtype=np.float32)
+
+        for key, (start, end) in ranges.items():
+            targetdatas = targets[key]
+            targetdatas[0].save_scores(model_version, scores1[start:end], scores2[start:end])
+            keiyaku_add_index(targetdatas[0], keiyakudatas[key], keys[start:end], embeddings[start:end], model_version)
+            for data in targetdatas:
+                results[data.seqid] = (scores1[start:end], scores2[start:end])
+    finally:
+        ticket.release()
+
+    yield from results.items()
+
+def get_score_json(score1, score2):
+    scoredata = {}
+    scoredata[1] = round(float(score1[0]), 2)
+    scoredata[2] = { i:round(float(score), 2) for i, score in enumerate(score2) }
+    return scoredata
+
+view_app = Blueprint("view", __name__, static_url_path='/keiyaku_group/view', static_folder='./view/build')
+class KeiyakuWebRequest(Request):
+    @property
+    def max_content_length(self):
+        #一括アップロードのみ上限を拡大
+        if self.path == "/keiyaku_group/api/upload_batch":
+            return UPLOAD_BATCH_MAX_SIZE_MB * 1024 * 1024
+
+        return super().max_content_length
+
+app = Flask(__name__)
+app.request_class = KeiyakuWebRequest
+app.register_blueprint(view_app)
+
+app.config["SECRET_KEY"] = "keiyaku_group_cosmo"
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_FILE_MAX_SIZE_MB * 1024 * 1024
+
+def get_zip_filename(zipinfo):
+    #UTF-8フラグの無いファイル名はcp437として読込まれるため、日本語版Windowsで作成したzipのcp932として読直す
+    if zipinfo.flag_bits & 0x800 == 0:
+        return os.path.basename(zipinfo.filename.encode("cp437").decode("cp932", errors="replace"))
+
+    return os.path.basename(zipinfo.filename)
+
+def get_contenthash(content):
+    return hashlib.sha256(content).hexdigest()
+
+def get_range():
+    offset = request.values.get("offset", default=0, type=int)
+    limit = request.values.get("limit", default=None, type=int)
+    return max(offset, 0), (max(limit, 0) if limit is not None else None)
+
+def get_usecache():
+    return request.values.get("cache", default=1, type=int) != 0
+
+def get_base_data():
+    base_seqid = request.values.get("base_seqid", default="")
+    return KeiyakuWebData(base_seqid) if base_seqid != "" else None
+
+def init_web(debugmode):
+    KeiyakuModelFactory.apply_cpu_profile()
+    if debugmode == False:
+        keiyaku_get_model()
+        
+    app.run(debug=debugmode, host="0.0.0.0", port=80)
+    
+@app.route("/keiyaku_group/template/", methods=["GET"])
+def index():    
+    offset, limit = get_range()
+    datas = keiyaku_catalog.get_list(offset, limit)
+
+    return render_template("index.html", datas=datas, offset=offset)
+
+@app.route("/keiyaku_group/", methods=["GET"])
+def view_index():
+    return view_app.send_static_file("index.html")
+
+@app.route("/keiyaku_group/api/list", methods=["GET"])
+def api_list():
+    offset, limit = get_range()
+    result={"data": [], "total": keiyaku_catalog.get_count(), "code": 0}
+    for seqid, orgfilename in keiyaku_catalog.get_list(offset, limit):
+        result["data"].append({"seqid": seqid, "filename": orgfilename})
+
+    return jsonify(result)
+
+@app.route("/keiyaku_group/upload", methods=["POST"])
+def upload():
+    try:
+        f = request.files["file"]
+    except werkzeug.exceptions.RequestEntityTooLarge:
+        flash("ファイルサイズが{}MBを超えるためアップロードできません".format(UPLOAD_FILE_MAX_SIZE_MB), category="flash_error")
+        return redirect(url_for("index"))
+
+    #拡張子を確認してからカタログへ登録(登録済の行は抽出データの参照として扱われるため)
+    extension = os.path.splitext(f.filename)[1].lower()
+    if extension not in UPLOAD_FILE_EXTENSION:
+        flash("拡張子{}はアップロードできません".format(extension if extension != "" else "無し"), category="flash_error")
+    else:
+        content = f.read()
+        data = KeiyakuWebData(orgfilename=f.filename, mimetype=request.mimetype, contenthash=get_contenthash(content))
+        data.save_file(content)
+        data.create_keiyaku_data()
+        data.set_uploaded()
+
+    return redirect(url_for("index"))
+
+@app.route("/keiyaku_group/api/upload", methods=["POST"])
+def api_upload():
+    result={"data" : { "seqid":-1, "filename": ""}, "code": 0, "message": [] }
+
+    try:
+        f = request.files["file"]
+    except werkzeug.exceptions.RequestEntityTooLarge:
+        result["message"].append({"category": "error", "message": "ファイルサイズが{}MBを超えるためアップロードできません".format(UPLOAD_FILE_MAX_SIZE_MB)})
+        result["code"] = 9
+        return jsonify(result)
+
+    extension = os.path.splitext(f.filename)[1].lower()
+    if extension not in UPLOAD_FILE_EXTENSION:
+        result["message"].append({"category": "error", "message": "拡張子{}はアップロードできません".format(extension if extension != "" else "無し")})
+        result["code"] = 9
+    else:
+        content = f.read()
+        data = KeiyakuWebData(orgfilename=f.filename, mimetype=request.mimetype, contenthash=get_contenthash(content))
+        data.save_file(content)
+        data.create_keiyaku_data()
+        data.set_uploaded()
+        result["data"]["seqid"] = data.seqid
+        result["data"]["filename"] = data.get_orgfilename()
+        result["message"].append({"category": "info", "message": "{}をアップロードしました".format(data.get_orgfilename())})
+
+    return jsonify(result)
+
+@app.route("/keiyaku_group/api/upload_batch", methods=["POST"])
+def api_upload_batch():
+    #複数ファイル(zip含む)を一括アップロードし、analyze=1の場合はまとめて解析
+    result={"data" : [], "code": 0, "message": [] }
+
+    try:
+        files = request.files.getlist("file")
+    except werkzeug.exceptions.RequestEntityTooLarge:
+        result["message"].append({"category": "error", "message": "ファイルサイズの合計が{}MBを超えるためアップロードできません".format(UPLOAD_BATCH_MAX_SIZE_MB)})
+        result["code"] = 9
+        return jsonify(result)
+
+    #(ファイル名, ファイルサイズ, 読込関数)
+    contents = []
+    for f in files:
+        if os.path.splitext(f.filename)[1].lower() == ".zip":
+            try:
+                zipdata = zipfile.ZipFile(f.stream)
+            except zipfile.BadZipFile:
+                result["data"].append({ "seqid": -1, "filename": f.filename, "code": 9,
+                    "message": [{"category": "error", "message": "{}はzipファイルとして読込めません".format(f.filename)}] })
+                continue
+
+            for zipinfo in zipdata.infolist():
+                if zipinfo.is_dir() != True:
+                    contents.append((get_zip_filename(zipinfo), zipinfo.file_size, lambda zipdata=zipdata, zipinfo=zipinfo: zipdata.read(zipinfo)))
+        else:
+            content = f.read()
+            contents.append((f.filename, len(content), lambda content=content: content))
+
+    datas = []
+    filedatas = []
+    try:
+        for filename, filesize, read_content in contents:
+            fileresult = { "seqid": -1, "filename": filename, "code": 0, "message": [] }
+            result["data"].append(fileresult)
+
+            extension = os.path.splitext(filename)[1].lower()
+            if extension not in UPLOAD_FILE_EXTENSION:
+                fileresult["message"].append({"category": "error", "message": "拡張子{}はアップロードできません".format(extension if extension != "" else "無し")})
+                fileresult["code"] = 9
+                continue
+
+            if filesize > UPLOAD_FILE_MAX_SIZE_MB * 1024 * 1024:
+                fileresult["message"].append({"category": "error", "message": "ファイルサイズが{}MBを超えるためアップロードできません".format(UPLOAD_FILE_MAX_SIZE_MB)})
+                fileresult["code"] = 9
+                continue
+
+            #zip内のファイルは暗号化・破損・未対応の圧縮形式の場合に読込めない
+            try:
+                content = read_content()
+            except (RuntimeError, NotImplementedError, zipfile.BadZipFile, zlib.error):
+                fileresult["message"].append({"category": "error", "message": "{}を読込めません".format(filename)})
+                fileresult["code"] = 9
+                continue
+
+            data = KeiyakuWebData(orgfilename=filename, mimetype=request.mimetype, contenthash=get_contenthash(content))
+            datas.append(data)
+            data.save_file(content)
+            fileresult["seqid"] = data.seqid
+            filedatas.append((data, fileresult))
+
+        #同一内容のファイルは先頭のみ抽出し、残りは抽出済データを再利用(抽出に失敗した文書は登録しない)
+        with ThreadPoolExecutor(max_workers=UPLOAD_BATCH_EXTRACT_NUM) as executor:
+            futures = {}
+            for data in datas:
+                key = data.get_contenthash() or data.seqid
+                if key not in futures:
+                    futures[key] = executor.submit(data.create_keiyaku_data)
+
+            extracted = []
+            for data, fileresult in filedatas:
+                try:
+                    futures[data.get_contenthash() or data.seqid].result()
+                    extracted.append((data, fileresult))
+                except Exception:
+                    data.delete()
+                    fileresult["seqid"] = -1
+                    fileresult["code"] = 9
+                    fileresult["message"].append({"category": "error", "message": "{}から文章を抽出できません".format(data.get_orgfilename())})
+        filedatas = extracted
+        datas = [ data for data, _ in filedatas ]
+
+        #解析待ちに入れてから登録(混雑で解析できない場合は登録せず、再実行で重複しないようにする)
+        ticket = None
+        results = None
+        if request.values.get("analyze", default=0, type=int) != 0 and len(datas) > 0:
+            ticket, results = keiyaku_analyze_batch_start(datas)
+    except:
+        #登録前に中断した場合は作成済の文書を削除(未登録の文書も抽出データの参照数に含まれるため)
+        for data in datas:
+            data.delete()
+        raise
+
+    try:
+        for data, fileresult in filedatas:
+            data.set_uploaded()
+            fileresult["message"].append({"category": "info", "message": "{}をアップロードしました".format(data.get_orgfilename())})
+
+        if results is not None:
+            scores = dict(results)
+            with keiyaku_metrics.time("keiyaku_stage_seconds", stage="serialize"):
+                for data, fileresult in filedatas:
+                    scores1, scores2 = scores[data.seqid]
+                    fileresult["scores"] = { col: get_score_json(score1, score2) for col, (score1, score2) in enumerate(zip(scores1, scores2)) }
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+    return jsonify(result)
+
+@app.route("/keiyaku_group/download", methods=["POST"])
+def download():
+    seqid = request.form["seqid"]
+    data = KeiyakuWebData(seqid)
+    return send_file(data.get_filepath(), as_attachment=True, attachment_filename=data.get_orgfilename())
+
+@app.route("/keiyaku_group/api/download", methods=["POST"])
+def api_download():
+    return download()
+
+@app.route("/keiyaku_group/download_txt", methods=["POST"])
+def download_txt():
+    seqid = request.form["seqid"]
+    data = KeiyakuWebData(seqid)
+    return send_file(data.get_txtpath(), as_attachment=True, attachment_filename=data.get_orgtxtname())
+
+@app.route("/keiyaku_group/api/download_txt", methods=["POST"])
+def api_download_txt():
+    return download_txt();
+
+@app.route("/keiyaku_group/delete", methods=["POST"])
+def delete():
+    seqid = request.form["seqid"]
+    data = KeiyakuWebData(seqid)
+    data.delete()
+
+    return redirect(url_for("index"))
+
+@app.route("/keiyaku_group/api/delete", methods=["POST"])
+def api_delete():
+    seqid = request.form["seqid"]
+    result={"data" : { "seqid": seqid }, "code": 0, "message": [] }
+    
+    data = KeiyakuWebData(seqid)
+    data.delete()
+
+    return jsonify({})
+
+@app.route("/keiyaku_group/analyze", methods=["POST"])
+def analyze():
+    seqid = request.form["seqid"]
+    data = KeiyakuWebData(seqid)
+    
+    keiyakudata = keiyaku_read_data(data.get_csvpath())
+    scores1, scores2 = keiyaku_analyze(data, keiyakudata, get_base_data())
+    sentensedatas = keiyakudata.get_datas()
+    analyze_path = data.create_analyzepath()
+
+    np.set_printoptions(precision=2, floatmode='fixed')
+    with keiyaku_metrics.time("keiyaku_stage_seconds", stage="serialize"), open(analyze_path, "w") as f:
+        for sentensedata, score1, score2 in zip(sentensedatas, scores1, scores2):
+            sentense = sentensedata[6]
+            kind1 = score2.argmax()
+            if score1 >= 0.5:
+                f.write("{}---------------------------------------------\n".format(score1))
+                
+            f.write("{}-{:0.2f}:{}\n".format(kind1, score2[kind1], sentense))
+
+    return send_file(analyze_path, as_attachment=True, attachment_filename=data.get_orgtxtname())
+
+@app.route("/keiyaku_group/api/analyze", methods=["POST"])
+def api_analyze():
+    return analyze()
+    
+@app.route("/keiyaku_group/api/analyze_json", methods=["POST"])
+def api_analyze_json():
+    seqid = request.form["seqid"]
+    result={"data" : {}, "code": 0, "message": [] }
+    
+    data = KeiyakuWebData(seqid)
+
+    offset, limit = get_range()
+    usecache = get_usecache()
+    
+    jsondata = {}
+    ticket, results = keiyaku_analyze_start(data, offset, limit, usecache, base_data=get_base_data())
+    for start, scores1, scores2 in results:
+        with keiyaku_metrics.time("keiyaku_stage_seconds", stage="serialize"):
+            for col, score in enumerate(zip(scores1, scores2), start):
+                jsondata[col] = get_score_json(score[0], score[1])
+
+    with keiyaku_metrics.time("keiyaku_stage_seconds", stage="serialize"):
+        result["data"] = jsondata
+        return jsonify(result)
+
+@app.route("/keiyaku_group/api/analyze_ndjson", methods=["POST"])
+def api_analyze_ndjson():
+    seqid = request.form["seqid"]
+    offset, limit = get_range()
+    usecache = get_usecache()
+
+    data = KeiyakuWebData(seqid)
+    ticket, results = keiyaku_analyze_start(data, offset, limit, usecache, base_data=get_base_data())
+
+    def generate():
+        for start, scores1, scores2 in results:
+            lines = []
+            with keiyaku_metrics.time("keiyaku_stage_seconds", stage="serialize"):
+                for col, score in enumerate(zip(scores1, scores2), start):
+                    scoredata = get_score_json(score[0], score[1])
+                    scoredata["row"] = col
+                    lines.append(json.dumps(scoredata) + "\n")
+
+            yield "".join(lines)
+
+    response = Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+    if ticket is not None:
+        #送信開始前に切断された場合も解析待ちから外す
+        response.call_on_close(ticket.release)
+
+    return response
+    
+@app.route("/keiyaku_group/api/search", methods=["GET", "POST"])
+def api_search():
+    #text(または解析済文書のseqid・row)の文章と類似する文章を解析済の全文書から検索
+    starttime = time.perf_counter()
+    result={"data" : [], "code": 0, "message": [] }
+    top_k = min(max(request.values.get("k", default=10, type=int), 1), SEARCH_MAX_NUM)
+    text = request.values.get("text", default="")
+    seqid = request.values.get("seqid", default="")
+    row = request.values.get("row", default=-1, type=int)
+
+    #問合せ文章の予測・モデルの読込は解析と同じく解析待ちに並ぶ(1行の小さい文書として優先)
+    paradata = keiyaku_catalog.get(seqid) if seqid != "" else None
+    ticket = None
+    if (paradata is None and text != "") or KeiyakuModelFactory.get_model_version() == "" or KeiyakuModelFactory.now_model_name != KeiyakuModelFactory.default_model_name:
+        try:
+            ticket = keiyaku_admission.enter(1)
+        except KeiyakuWebAdmissionError:
+            keiyaku_metrics.inc("keiyaku_admission_rejected_total")
+            raise
+
+    try:
+        if ticket is not None:
+            with keiyaku_metrics.time("keiyaku_stage_seconds", stage="lock_wait"):
+                ticket.wait()
+
+        keiyakumodel, model, tokenizer = keiyaku_get_model()
+        model_version = KeiyakuModelFactory.get_model_version()
+        embedding_index = keiyaku_get_embedding_index(model_version) if model_version != "" else None
+
+        encodetime = time.perf_counter()
+        embedding = None
+        if model_version != "" and paradata is not None:
+            embedding = embedding_index.get_embedding(paradata["contenthash"] or seqid, row)
+        elif model_version != "" and text != "":
+            with keiyaku_metrics.time("keiyaku_stage_seconds", stage="encode"):
+                embedding = keiyakumodel.predict_with_embedding([ (tokenizer.get_keiyaku_indexes(text, "", model.seq_len), [0, 0, 0]) ])[2]
+            embedding = embedding[0] if embedding is not None else None
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+    if embedding is None:
+        result["code"] = 1
+        result["message"].append({"category": "error", "message": "検索対象の文章の埋込みを取得できません"})
+        return jsonify(result)
+
+    searchtime = time.perf_counter()
+    with keiyaku_metrics.time("keiyaku_stage_seconds", stage="search"):
+        items = embedding_index.search(embedding, top_k)
+    endtime = time.perf_counter()
+
+    for score, docid, item_row, sentence in items:
+        item_seqid = keiyaku_get_index_seqid(docid)
+        paradata = keiyaku_catalog.get(item_seqid)
+        result["data"].append({"seqid": item_seqid, "filename": paradata["orgfilename"] if paradata is not None else "",
+            "row": item_row, "sentence": sentence, "score": round(score, 4)})
+
+    result["elapsed_ms"] = { "encode": round((searchtime - encodetime) * 1000, 2), "search": round((endtime - searchtime) * 1000, 2),
+        "total": round((time.perf_counter() - starttime) * 1000, 2) }
+    return jsonify(result)
+
+@app.route("/keiyaku_group/metrics", methods=["GET"])
+def metrics():
+    return Response(keiyaku_metrics.to_text(), mimetype="text/plain; version=0.0.4")
+
+@app.errorhandler(KeiyakuWebAdmissionError)
+def admission_error(error):
+    result={"data" : {}, "code": 9, "message": [{"category": "error", "message": "解析待ちが混雑しています。{}秒後に再実行してください".format(error.retry_after)}] }
+    response = jsonify(result)
+    response.status_code = 503
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+@app.before_request
+def before_request():
+    g.request_starttime = time.perf_counter()
+    g.request_endpoint = str(request.endpoint)
+    keiyaku_metrics.inc("keiyaku_inflight_requests", endpoint=g.request_endpoint)
+
+@app.teardown_request
+def teardown_request(exception):
+    if "request_starttime" not in g:
+        return
+
+    keiyaku_metrics.dec("keiyaku_inflight_requests", endpoint=g.request_endpoint)
+    keiyaku_metrics.inc("keiyaku_requests_total", endpoint=g.request_endpoint, error="1" if exception is not None else "0")
+    keiyaku_metrics.observe("keiyaku_request_seconds", time.perf_counter() - g.request_starttime, endpoint=g.request_endpoint)
+    keiyaku_metrics.save()
+
+@app.after_request
+def after_request(response):
+    if app.debug:
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+        
     return response
\ No newline at end of file
@@ -0,0 +1,112 @@
+import math
+import heapq
+import itertools
+import threading
+import time
+
+class KeiyakuWebAdmissionError(Exception):
+    def __init__(self, retry_after):
+        super().__init__("analyze queue is full(retry_after={})".format(retry_after))
+        self.retry_after = retry_after
+
+class KeiyakuWebAdmission:
+
+    LANE_SMALL = 0
+    LANE_LARGE = 1
+
+    def __init__(self, max_pending_docs=16, max_pending_rows=50000, small_doc_rows=300, max_small_streak=4):
+        self.max_pending_docs = max_pending_docs
+        self.max_pending_rows = max_pending_rows
+        self.small_doc_rows = small_doc_rows
+        self.max_small_streak = max_small_streak
+
+        self.condition = threading.Condition()
+        self.waitings = { self.LANE_SMALL: [], self.LANE_LARGE: [] }
+        self.order = itertools.count()
+        self.running = None
+        self.small_streak = 0
+
+        self.pending_docs = 0
+        self.pending_rows = 0
+        #Retry-After算出用の1行あたり処理時間(秒)
+        self.row_sec = 0.01
+
+    def enter(self, row_num):
+        #上限超過時は待ち行列に入れずにエラー(文書1件は行数に関係なく受付ける)
+        self.condition.acquire()
+        try:
+            if self.pending_docs >= self.max_pending_docs or (self.pending_docs > 0 and self.pending_rows + row_num > self.max_pending_rows):
+                raise KeiyakuWebAdmissionError(max(math.ceil((self.pending_rows + row_num) * self.row_sec), 1))
+
+            lane = self.LANE_SMALL if row_num <= self.small_doc_rows else self.LANE_LARGE
+            ticket = KeiyakuWebAdmissionTicket(self, row_num, lane)
+            heapq.heappush(self.waitings[lane], (next(self.order), ticket))
+            self.pending_docs += 1
+            self.pending_rows += row_num
+        finally:
+            self.condition.release()
+
+        return ticket
+
+    def get_pending(self):
+        return self.pending_docs, self.pending_rows
+
+    def _wait(self, ticket) -> None:
+        self.condition.acquire()
+        while self.running is not None or self._get_next() is not ticket:
+            self.condition.wait()
+
+        heapq.heappop(self.waitings[ticket.lane])
+        if ticket.lane == self.LANE_SMALL and len(self.waitings[self.LANE_LARGE]) > 0:
+            self.small_streak += 1
+        else:
+            self.small_streak = 0
+
+        self.running = ticket
+        ticket.starttime = time.perf_counter()
+        self.condition.release()
+
+    def _release(self, ticket) -> None:
+        self.condition.acquire()
+        if self.running is ticket:
+            self.running = None
+            if ticket.row_num > 0:
+                row_sec = (time.perf_counter() - ticket.starttime) / ticket.row_num
+                self.row_sec = self.row_sec * 0.8 + row_sec * 0.2
+        else:
+            waitings = self.waitings[ticket.lane]
+            waitings[:] = [ waiting for waiting in waitings if waiting[1] is not ticket ]
+            heapq.heapify(waitings)
+
+        self.pending_docs -= 1
+        self.pending_rows -= ticket.row_num
+        self.condition.notify_all()
+        self.condition.release()
+
+    def _get_next(self):
+        #小さい文書を優先し、大きい文書が連続で追い越された場合は大きい文書を先に処理
+        small = self.waitings[self.LANE_SMALL]
+        large = self.waitings[self.LANE_LARGE]
+        if len(large) > 0 and (len(small) == 0 or self.small_streak >= self.max_small_streak):
+            return large[0][1]
+
+        return small[0][1] if len(small) > 0 else None
+
+class KeiyakuWebAdmissionTicket:
+    def __init__(self, admission: KeiyakuWebAdmission, row_num, lane):
+        self.admission = admission
+        self.row_num = row_num
+        self.lane = lane
+        self.starttime = 0.0
+        self.released = False
+
+    def __lt__(self, other):
+        return id(self) < id(other)
+
+    def wait(self) -> None:
+        self.admission._wait(self)
+
+    def release(self) -> None:
+        if self.released == False:
+            self.released = True
+            self.admission._release(self)
@@ -0,0 +1,156 @@
+import sqlite3
+import os
+import glob
+import re
+import json
+import datetime
+import threading
+
+class KeiyakuWebCatalog:
+
+    CATALOG_FILE = "catalog.db"
+    PARA_FILE = "param.json"
+    PARA_KEYS = [ "orgfilename", "filename", "txtname", "csvname", "mimetype", "contenthash" ]
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.catalog_path = os.path.join(data_dir, self.CATALOG_FILE)
+
+        self.init_mutex = threading.Lock()
+        self.initialized = False
+
+    def create(self, paradata) -> str:
+        conn = self._connect()
+        with conn:
+            #AUTOINCREMENTのため削除済みの連番も再利用しない
+            cursor = conn.execute("INSERT INTO upload(orgfilename, filename, txtname, csvname, mimetype, contenthash, uploaded, created) VALUES(?, ?, ?, ?, ?, ?, 0, ?)",
+                [ paradata[key] for key in self.PARA_KEYS ] + [ datetime.datetime.now().strftime('%Y%m%d%H%M%S') ])
+            seq = cursor.lastrowid
+        conn.close()
+
+        return self._to_seqid(seq)
+
+    def get(self, seqid):
+        #数字以外のseqidは存在しない扱い
+        if re.fullmatch(r'[0-9]+', str(seqid)) is None:
+            return None
+
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM upload WHERE seq = ?", [ int(seqid) ]).fetchone()
+        conn.close()
+
+        if row is None:
+            return None
+
+        return { key: row[key] for key in self.PARA_KEYS }
+
+    def set_uploaded(self, seqid) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute("UPDATE upload SET uploaded = 1 WHERE seq = ?", [ int(seqid) ])
+        conn.close()
+
+    def delete(self, seqid) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM upload WHERE seq = ?", [ int(seqid) ])
+        conn.close()
+
+    def get_list(self, offset=0, limit=None):
+        conn = self._connect()
+        rows = conn.execute("SELECT seq, orgfilename FROM upload WHERE uploaded = 1 ORDER BY seq LIMIT ? OFFSET ?",
+            [ limit if limit is not None else -1, offset ]).fetchall()
+        conn.close()
+
+        return [ (self._to_seqid(row["seq"]), row["orgfilename"]) for row in rows ]
+
+    def get_content_count(self, contenthash) -> int:
+        conn = self._connect()
+        count = conn.execute("SELECT COUNT(*) FROM upload WHERE contenthash = ?", [ contenthash ]).fetchone()[0]
+        conn.close()
+
+        return count
+
+    def get_content_seqids(self, contenthash):
+        #同一内容のアップロード済の文書
+        conn = self._connect()
+        rows = conn.execute("SELECT seq FROM upload WHERE contenthash = ? AND uploaded = 1 ORDER BY seq", [ contenthash ]).fetchall()
+        conn.close()
+
+        return [ self._to_seqid(row["seq"]) for row in rows ]
+
+    def get_count(self) -> int:
+        conn = self._connect()
+        count = conn.execute("SELECT COUNT(*) FROM upload WHERE uploaded = 1").fetchone()[0]
+        conn.close()
+
+        return count
+
+    def _to_seqid(self, seq) -> str:
+        return str(seq).zfill(5)
+
+    def _connect(self):
+        if self.initialized == False:
+            self._init_catalog()
+
+        conn = sqlite3.connect(self.catalog_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_catalog(self) -> None:
+        self.init_mutex.acquire()
+
+        if self.initialized == False:
+            os.makedirs(self.data_dir, exist_ok=True)
+
+            conn = sqlite3.connect(self.catalog_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("BEGIN IMMEDIATE")
+
+            exists = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='upload'").fetchone()
+            if exists is None:
+                conn.execute("""CREATE TABLE upload(
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    orgfilename TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    txtname TEXT NOT NULL,
+                    csvname TEXT NOT NULL,
+                    mimetype TEXT NOT NULL,
+                    contenthash TEXT NOT NULL DEFAULT '',
+                    uploaded INTEGER NOT NULL,
+                    created TEXT NOT NULL)""")
+                conn.execute("CREATE INDEX upload_uploaded ON upload(uploaded, seq)")
+                conn.execute("CREATE INDEX upload_contenthash ON upload(contenthash)")
+                self._import_datadir(conn)
+            else:
+                self._upgrade_catalog(conn)
+
+            conn.execute("COMMIT")
+            conn.close()
+
+            self.initialized = True
+
+        self.init_mutex.release()
+
+    def _upgrade_catalog(self, conn) -> None:
+        columns = [ row[1] for row in conn.execute("PRAGMA table_info(upload)").fetchall() ]
+        if "contenthash" not in columns:
+            conn.execute("ALTER TABLE upload ADD COLUMN contenthash TEXT NOT NULL DEFAULT ''")
+            conn.execute("CREATE INDEX upload_contenthash ON upload(contenthash)")
+
+    def _import_datadir(self, conn) -> None:
+        #カタログ導入前のアップロードデータを取込
+        for dir in sorted(glob.glob(os.path.join(self.data_dir, r"?????"))):
+            seqid = os.path.basename(dir)
+            parapath = os.path.join(dir, self.PARA_FILE)
+            if re.match(r'[0-9]{5}', seqid) is None or os.path.isfile(parapath) != True:
+                continue
+
+            with open(parapath, "r") as parafile:
+                para = json.load(parafile)
+
+            uploaded = 1 if os.path.isfile(os.path.join(dir, para["filename"])) else 0
+            created = datetime.datetime.fromtimestamp(os.stat(parapath).st_mtime).strftime('%Y%m%d%H%M%S')
+            para.setdefault("contenthash", "")
+            conn.execute("INSERT INTO upload(seq, orgfilename, filename, txtname, csvname, mimetype, contenthash, uploaded, created) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [ int(seqid) ] + [ para[key] for key in self.PARA_KEYS ] + [ uploaded, created ])
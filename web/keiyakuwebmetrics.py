@@ -0,0 +1,203 @@
+import os
+import glob
+import json
+import time
+import threading
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:
+    #複数ワーカー起動(gunicorn)に非対応の環境
+    fcntl = None
+
+class KeiyakuWebMetrics:
+
+    TYPE_COUNTER = "counter"
+    TYPE_GAUGE = "gauge"
+    TYPE_HISTOGRAM = "histogram"
+
+    BUCKETS = [ 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0 ]
+    SAVE_INTERVAL_SEC = 1.0
+    #終了したワーカーの値の集計結果
+    DEAD_FILE = "dead.json"
+    LOCK_FILE = "metrics.lock"
+
+    def __init__(self):
+        self.mutex = threading.Lock()
+        self.metrics = {}
+        self.helps = {}
+        self.types = {}
+
+        self.share_dir = None
+        self.save_time = 0.0
+
+    def register(self, name, metric_type, help) -> None:
+        self.types[name] = metric_type
+        self.helps[name] = help
+
+    def inc(self, name, value=1, **labels) -> None:
+        self._update(name, labels, lambda metric: metric + value, 0)
+
+    def dec(self, name, value=1, **labels) -> None:
+        self._update(name, labels, lambda metric: metric - value, 0)
+
+    def observe(self, name, value, **labels) -> None:
+        def update(metric):
+            for i, bucket in enumerate(self.BUCKETS):
+                if value <= bucket:
+                    metric["buckets"][i] += 1
+            metric["sum"] += value
+            metric["count"] += 1
+            return metric
+
+        self._update(name, labels, update, None)
+
+    @contextmanager
+    def time(self, name, **labels):
+        starttime = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - starttime, **labels)
+
+    def set_share_dir(self, share_dir) -> None:
+        #複数ワーカー起動時は各ワーカーの値をファイル経由で集計する
+        os.makedirs(share_dir, exist_ok=True)
+        self.share_dir = share_dir
+
+        #同じPIDの終了済ワーカーの値が残っている場合は上書き前に集計
+        savepath = self._get_savepath()
+        if os.path.isfile(savepath):
+            with self._lock():
+                self._fold(savepath)
+
+    def save(self, force=False) -> None:
+        if self.share_dir is None or (force == False and time.time() - self.save_time < self.SAVE_INTERVAL_SEC):
+            return
+
+        self.save_time = time.time()
+        self.mutex.acquire()
+        metrics = dict(self.metrics)
+        self.mutex.release()
+
+        self._dump(self._get_savepath(), metrics)
+
+    def to_text(self) -> str:
+        metrics = self._collect()
+
+        lines = []
+        for name in sorted(self.types.keys()):
+            lines.append("# HELP {} {}".format(name, self.helps[name]))
+            lines.append("# TYPE {} {}".format(name, self.types[name]))
+
+            for (metric_name, labels), metric in sorted(metrics.items()):
+                if metric_name != name:
+                    continue
+
+                if self.types[name] == self.TYPE_HISTOGRAM:
+                    for bucket, count in zip(self.BUCKETS, metric["buckets"]):
+                        lines.append("{}_bucket{} {}".format(name, self._to_label_text(labels, ("le", str(bucket))), count))
+                    lines.append("{}_bucket{} {}".format(name, self._to_label_text(labels, ("le", "+Inf")), metric["count"]))
+                    lines.append("{}_sum{} {}".format(name, self._to_label_text(labels), metric["sum"]))
+                    lines.append("{}_count{} {}".format(name, self._to_label_text(labels), metric["count"]))
+                else:
+                    lines.append("{}{} {}".format(name, self._to_label_text(labels), metric))
+
+        return "\n".join(lines) + "\n"
+
+    def _update(self, name, labels, update, initial) -> None:
+        key = (name, tuple(sorted(labels.items())))
+
+        self.mutex.acquire()
+        metric = self.metrics.get(key, initial)
+        if metric is None:
+            metric = { "buckets": [0] * len(self.BUCKETS), "sum": 0.0, "count": 0 }
+        self.metrics[key] = update(metric)
+        self.mutex.release()
+
+    def _collect(self):
+        self.mutex.acquire()
+        metrics = { key: json.loads(json.dumps(metric)) for key, metric in self.metrics.items() }
+        self.mutex.release()
+
+        if self.share_dir is None:
+            return metrics
+
+        self.save(force=True)
+        metrics = {}
+        with self._lock():
+            for loadpath in glob.glob(os.path.join(self.share_dir, "*.json")):
+                name = os.path.splitext(os.path.basename(loadpath))[0]
+                if name.isdigit() and self._is_alive(int(name)) != True:
+                    self._fold(loadpath)
+
+            for loadpath in glob.glob(os.path.join(self.share_dir, "*.json")):
+                for key, metric in self._load(loadpath).items():
+                    metrics[key] = self._merge(metrics.get(key), metric)
+
+        return metrics
+
+    def _fold(self, loadpath) -> None:
+        #終了したワーカーのカウンタ・ヒストグラムは集計結果へ加算し、ワーカーの再起動で減少しないようにする(ゲージは破棄)
+        deadpath = os.path.join(self.share_dir, self.DEAD_FILE)
+        metrics = self._load(deadpath)
+        for key, metric in self._load(loadpath).items():
+            if self.types.get(key[0]) != self.TYPE_GAUGE:
+                metrics[key] = self._merge(metrics.get(key), metric)
+
+        self._dump(deadpath, metrics)
+        os.remove(loadpath)
+
+    @contextmanager
+    def _lock(self):
+        #集計結果の更新・参照は複数ワーカーで同時に行わない
+        if fcntl is None:
+            yield
+            return
+
+        with open(os.path.join(self.share_dir, self.LOCK_FILE), "w") as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+    def _get_savepath(self) -> str:
+        return os.path.join(self.share_dir, "{}.json".format(os.getpid()))
+
+    def _load(self, loadpath):
+        if os.path.isfile(loadpath) != True:
+            return {}
+
+        with open(loadpath, "r") as f:
+            return { (name, tuple(tuple(label) for label in labels)): metric for name, labels, metric in json.load(f) }
+
+    def _dump(self, savepath, metrics) -> None:
+        with open(savepath + ".tmp", "w") as f:
+            json.dump([ [name, list(labels), metric] for (name, labels), metric in metrics.items() ], f)
+        os.replace(savepath + ".tmp", savepath)
+
+    def _merge(self, metric1, metric2):
+        if metric1 is None:
+            return metric2
+
+        if isinstance(metric1, dict):
+            return { "buckets": [ a + b for a, b in zip(metric1["buckets"], metric2["buckets"]) ],
+                "sum": metric1["sum"] + metric2["sum"], "count": metric1["count"] + metric2["count"] }
+
+        return metric1 + metric2
+
+    def _is_alive(self, pid) -> bool:
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return False
+
+        return True
+
+    def _to_label_text(self, labels, *extra_labels) -> str:
+        labels = list(labels) + list(extra_labels)
+        if len(labels) == 0:
+            return ""
+
+        return "{" + ",".join([ '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in labels ]) + "}"
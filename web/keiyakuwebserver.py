@@ -0,0 +1,68 @@
+import os
+import signal
+import multiprocessing
+import shutil
+from gunicorn.app.base import BaseApplication
+from keiyakumodelfactory import KeiyakuModelFactory
+from keiyakucpuprofile import KeiyakuCpuProfile
+from web.keiyakuweb import app, keiyaku_metrics, keiyaku_get_model, METRICS_DIR
+
+PID_FILE = os.path.join(os.path.dirname(__file__), r"keiyakuweb.pid")
+
+class KeiyakuWebServer(BaseApplication):
+
+    def __init__(self, worker_num=None, intra_op_num=None, inter_op_num=None, thread_num=4, port=80):
+        #ワーカー数未指定時はCPUコア4つにつき1ワーカー、演算スレッドはコアをワーカーで等分
+        #keiyakugroup_tuneの設定保存時は設定の演算スレッド数とし、ワーカー数未指定時はコアを演算スレッド数で等分
+        cpu_num = multiprocessing.cpu_count()
+        self.profile = KeiyakuCpuProfile.load()
+        if self.profile is not None:
+            intra_op_num = intra_op_num if intra_op_num is not None else self.profile["intra_op_num"]
+            inter_op_num = inter_op_num if inter_op_num is not None else self.profile["inter_op_num"]
+            worker_num = worker_num if worker_num is not None else max(cpu_num // max(intra_op_num, 1), 1)
+
+        self.worker_num = worker_num if worker_num is not None else max(cpu_num // 4, 1)
+        self.intra_op_num = intra_op_num if intra_op_num is not None else max(cpu_num // self.worker_num, 1)
+        self.inter_op_num = inter_op_num if inter_op_num is not None else 1
+        self.thread_num = thread_num
+        self.port = port
+
+        super().__init__()
+
+    def load_config(self):
+        self.cfg.set("bind", "0.0.0.0:{}".format(self.port))
+        self.cfg.set("workers", self.worker_num)
+        self.cfg.set("worker_class", "gthread")
+        self.cfg.set("threads", self.thread_num)
+        self.cfg.set("timeout", 600)
+        self.cfg.set("graceful_timeout", 600)
+        self.cfg.set("preload_app", True)
+        self.cfg.set("pidfile", PID_FILE)
+        self.cfg.set("on_starting", self._on_starting)
+        self.cfg.set("post_worker_init", self._post_worker_init)
+
+    def load(self):
+        return app
+
+    def _on_starting(self, server):
+        shutil.rmtree(METRICS_DIR, ignore_errors=True)
+        KeiyakuModelFactory.preload_files()
+
+    def _post_worker_init(self, worker):
+        #TensorFlowはfork前に初期化すると子プロセスで停止するため、モデルはワーカー毎に読込む
+        KeiyakuModelFactory.set_thread_num(self.intra_op_num, self.inter_op_num)
+        if self.profile is not None:
+            KeiyakuModelFactory.predict_batch_size = self.profile["batch_size"]
+        keiyaku_metrics.set_share_dir(METRICS_DIR)
+        keiyaku_get_model()
+        keiyaku_metrics.save(force=True)
+
+def init_web_server(worker_num=None, port=80):
+    KeiyakuWebServer(worker_num=worker_num, port=port).run()
+
+def reload_web_server():
+    #HUPで新ワーカー起動後に旧ワーカーを処理完了まで待って停止(モデル重みも再読込)
+    with open(PID_FILE, "r") as pidfile:
+        pid = int(pidfile.read().strip())
+
+    os.kill(pid, signal.SIGHUP)